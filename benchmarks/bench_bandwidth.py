@@ -0,0 +1,137 @@
+"""带宽整形基准测试：多个任务以不同连接数、不同权重同时下载，测量总速率是否贴近上限以及分配是否公平
+
+sim 模式不走网络，每个连接反复登记固定大小的数据块，只测调度本身；
+http 模式在本机启动支持Range的HTTP服务，用分段下载器实际下载，固定时长后取消。
+效率为实际总速率 / 限速，公平性为各任务 (速率/权重) 的 Jain 指数，1.0 表示完全按权重分配；
+CPU 占比接近0说明等待时没有空转。
+
+    python benchmarks/bench_bandwidth.py --rate-mb 32 --seconds 5
+    python benchmarks/bench_bandwidth.py --mode http --rate-mb 16
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bilidown.bandwidth import BandwidthShaper
+from bilidown.segmented import SegmentedDownloader
+from bench_download_engines import start_server
+
+# (任务名, 连接数, 权重)
+JOBS = [
+    ('大任务', 8, 1),
+    ('小任务', 1, 1),
+    ('高权重', 2, 2),
+]
+CHUNK_SIZE = 256 * 1024
+
+
+def jain_index(values):
+    """Jain 公平性指数：(Σx)² / (n·Σx²)"""
+    if not values or not any(values):
+        return 0.0
+    return sum(values) ** 2 / (len(values) * sum(v * v for v in values))
+
+
+def measured(body, seconds):
+    """执行 body(stop)，返回测量窗口内的 (墙钟时间, CPU时间)"""
+    stop = threading.Event()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    threads = body(stop)
+    time.sleep(seconds)
+    stop.set()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    for thread in threads:
+        thread.join()
+    return wall, cpu
+
+
+def run_sim(shaper, seconds):
+    shares = {name: shaper.job(name, weight) for name, _, weight in JOBS}
+
+    def connection(share):
+        while not stop.is_set():
+            share.consume(share.chunk_size(CHUNK_SIZE), stop.is_set)
+
+    def body(event):
+        nonlocal stop
+        stop = event
+        threads = [threading.Thread(target=connection, args=(shares[name],))
+                   for name, connections, _ in JOBS for _ in range(connections)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    stop = None
+    return (shares,) + measured(body, seconds)
+
+
+def run_http(shaper, seconds, size):
+    server, base = start_server(size, 0)
+    workdir = tempfile.mkdtemp(prefix='bilidown-bench-')
+    stop = None
+    shares = {name: shaper.job(name, weight) for name, _, weight in JOBS}
+    session = requests.Session()
+
+    def job(name, connections):
+        downloader = SegmentedDownloader(session, {}, connections, throttle=shares[name])
+        try:
+            downloader.download(f'{base}/stream', os.path.join(workdir, f'{name}.m4s'), should_cancel=stop.is_set)
+        except Exception as e:
+            print(f"{name} 下载失败：{e}")
+
+    def body(event):
+        nonlocal stop
+        stop = event
+        threads = [threading.Thread(target=job, args=(name, connections)) for name, connections, _ in JOBS]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    try:
+        return (shares,) + measured(body, seconds)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('sim', 'http'), default='sim')
+    parser.add_argument('--rate-mb', type=float, default=32, help='总限速(MB/s)')
+    parser.add_argument('--seconds', type=float, default=5, help='测量时长')
+    parser.add_argument('--size-mb', type=float, default=512, help='http 模式下每个流的大小(MB)，应大于时长内能下完的量')
+    args = parser.parse_args()
+
+    rate = int(args.rate_mb * 1024 * 1024)
+    shaper = BandwidthShaper(rate)
+    if args.mode == 'sim':
+        shares, wall, cpu = run_sim(shaper, args.seconds)
+    else:
+        shares, wall, cpu = run_http(shaper, args.seconds, int(args.size_mb * 1024 * 1024))
+
+    total_weight = sum(weight for _, _, weight in JOBS)
+    print(f"模式 {args.mode}，总限速 {args.rate_mb}MB/s，{args.seconds}s")
+    print(f"{'任务':<8}{'连接':>6}{'权重':>6}{'速率MB/s':>12}{'应得MB/s':>12}")
+    normalized = []
+    for name, connections, weight in JOBS:
+        speed = shares[name].granted / wall / 1024 / 1024
+        normalized.append(speed / weight)
+        print(f"{name:<8}{connections:>7}{weight:>8}{speed:>12.2f}{args.rate_mb * weight / total_weight:>12.2f}")
+    achieved = shaper.granted / wall / 1024 / 1024
+    print(f"总速率 {achieved:.2f}MB/s，效率 {achieved / args.rate_mb:.1%}，"
+          f"公平性 {jain_index(normalized):.4f}，CPU占比 {cpu / wall:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""弹幕基准测试：生成热门视频规模的弹幕，测量 protobuf 解码、排版和写入 ASS 的耗时与内存峰值
+
+弹幕按 protobuf 格式编码成每6分钟一段，由模拟会话返回（每段可加固定延迟模拟网络），
+完整走一遍 download_danmaku。每条弹幕的平均耗时不随条数增加而变大说明排版是线性的；
+内存峰值取决于同时在途的段数和每段的弹幕数，与输出文件大小无关。
+
+    python benchmarks/bench_danmaku.py
+    python benchmarks/bench_danmaku.py --comments 50000 200000 --minutes 30 --latency 0.05
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bilidown.danmaku import SEGMENT_SECONDS, download_danmaku, parse_segment
+
+WORDS = ['哈哈哈哈', '前方高能', '2333', 'awsl', '这也太好看了吧', '来了来了', '名场面', 'up主辛苦了',
+         '第一次看到这个视频的时候还是高中', 'Amazing!', '泪目', '？？？']
+COLORS = [0xFFFFFF] * 8 + [0xFE0302, 0xFFFF00, 0x00CD00, 0x000000]
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field(number, wire_type, payload):
+    key = _varint((number << 3) | wire_type)
+    if wire_type == 2:
+        return key + _varint(len(payload)) + payload
+    return key + _varint(payload)
+
+
+def encode_segment(comments):
+    """按 DmSegMobileReply 的格式编码 [(毫秒, 模式, 字号, 颜色, 文本)]"""
+    out = bytearray()
+    for i, (progress, mode, size, color, text) in enumerate(comments):
+        elem = (_field(1, 0, i + 1) + _field(2, 0, progress) + _field(3, 0, mode) + _field(4, 0, size) +
+                _field(5, 0, color) + _field(6, 2, b'a1b2c3d4') + _field(7, 2, text.encode('utf-8')) +
+                _field(8, 0, 1700000000) + _field(11, 0, 0))
+        out += _field(1, 2, elem)
+    return bytes(out)
+
+
+def make_segments(count, minutes, seed=1):
+    rng = random.Random(seed)
+    duration = minutes * 60
+    segments = [[] for _ in range(-(-duration // SEGMENT_SECONDS))]
+    for _ in range(count):
+        progress = rng.randrange(duration * 1000)
+        mode = rng.choice((1, 1, 1, 1, 1, 1, 4, 5))
+        size = rng.choice((25, 25, 25, 25, 18, 36))
+        segments[progress // (SEGMENT_SECONDS * 1000)].append(
+            (progress, mode, size, rng.choice(COLORS), rng.choice(WORDS)))
+    # 接口返回的段内弹幕并不严格按时间排序
+    for segment in segments:
+        rng.shuffle(segment)
+    return duration, [encode_segment(segment) for segment in segments]
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeSession:
+    def __init__(self, segments, latency):
+        self.segments = segments
+        self.latency = latency
+
+    def get(self, url, params=None, timeout=None):
+        if self.latency:
+            time.sleep(self.latency)
+        index = params['segment_index'] - 1
+        return FakeResponse(self.segments[index] if index < len(self.segments) else b'')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, nargs='+', default=[10000, 50000, 200000], help='弹幕条数')
+    parser.add_argument('--minutes', type=int, default=24, help='视频时长（分钟）')
+    parser.add_argument('--latency', type=float, default=0.0, help='每段的模拟网络延迟（秒）')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bilidown-danmaku-')
+    try:
+        print(f"{'条数':>8}{'解码ms':>10}{'总耗时ms':>10}{'微秒/条':>9}{'写入':>8}{'丢弃':>8}{'内存峰值MB':>11}")
+        for count in args.comments:
+            duration, segments = make_segments(count, args.minutes)
+            start = time.perf_counter()
+            for data in segments:
+                parse_segment(data)
+            decode = time.perf_counter() - start
+
+            session = FakeSession(segments, args.latency)
+            path = os.path.join(workdir, f'{count}.ass')
+            start = time.perf_counter()
+            written, dropped = download_danmaku(session, 1, duration, path)
+            elapsed = time.perf_counter() - start
+            # tracemalloc 会明显拖慢执行，内存峰值单独再跑一遍
+            tracemalloc.start()
+            download_danmaku(session, 1, duration, path)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{count:>10}{decode * 1000:>12.1f}{elapsed * 1000:>12.1f}{elapsed / count * 1e6:>11.2f}"
+                  f"{written:>10}{dropped:>10}{peak / 1024 / 1024:>13.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""下载引擎基准测试：对比原来的 iter_content 单连接循环、多线程分段下载和异步引擎
+
+在本机启动一个支持Range的HTTP服务，可以用 --rate 限制每个连接的速度来模拟CDN单连接限速。
+测试服务端运行在同一进程内，CPU时间和峰值线程数都包含服务端（每个连接一个线程），只适合横向比较。
+
+    python benchmarks/bench_download_engines.py --jobs 100 --size-mb 4 --rate 2048
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bilidown.async_engine import AsyncDownloadEngine
+from bilidown.segmented import SegmentedDownloader
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        data = self.server.payload
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        else:
+            start, end = 0, len(data) - 1
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+
+        rate = self.server.rate
+        chunk = 64 * 1024
+        try:
+            for offset in range(start, end + 1, chunk):
+                self.wfile.write(data[offset:min(offset + chunk, end + 1)])
+                if rate:
+                    time.sleep(chunk / rate)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_server(size, rate):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    server.daemon_threads = True
+    server.payload = os.urandom(size)
+    server.rate = rate
+    server.handle_error = lambda *args: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def iter_content_download(session, url, filename):
+    """原来各前端使用的下载方式"""
+    response = session.get(url, stream=True, headers={'Range': 'bytes=0-'})
+    with open(filename, 'wb') as f:
+        for data in response.iter_content(1024 * 1024):
+            if data:
+                f.write(data)
+
+
+def run_threads(jobs, func):
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(func, range(jobs)))
+
+
+def measure(name, jobs, size, func):
+    peak = {'threads': threading.active_count()}
+    stop = threading.Event()
+
+    def sample():
+        while not stop.is_set():
+            peak['threads'] = max(peak['threads'], threading.active_count())
+            stop.wait(0.05)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    func()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    stop.set()
+    sampler.join()
+    total_mb = jobs * size / 1024 / 1024
+    print(f"{name:<14}{wall:>9.2f}s{total_mb / wall:>11.1f}MB/s{cpu:>9.2f}s{peak['threads']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=50, help='同时下载的流数量')
+    parser.add_argument('--size-mb', type=float, default=4, help='每个流的大小(MB)')
+    parser.add_argument('--connections', type=int, default=4, help='每个流的连接数')
+    parser.add_argument('--rate', type=int, default=0, help='每个连接的限速(KB/s)，0表示不限速')
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    server, base = start_server(size, args.rate * 1024)
+    workdir = tempfile.mkdtemp(prefix='bilidown-bench-')
+    path = lambda mode, i: os.path.join(workdir, f'{mode}-{i}.m4s')
+
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=args.jobs * args.connections))
+    engine = AsyncDownloadEngine(connections=args.connections)
+    engine.start()
+
+    print(f"{args.jobs} 个流 × {args.size_mb}MB，每流 {args.connections} 连接，"
+          f"单连接限速 {args.rate or '无'} KB/s")
+    print(f"{'方式':<12}{'耗时':>10}{'吞吐量':>11}{'CPU':>10}{'峰值线程':>7}")
+    try:
+        measure('iter_content', args.jobs, size, lambda: run_threads(
+            args.jobs, lambda i: iter_content_download(session, f'{base}/{i}', path('plain', i))))
+        measure('多线程分段', args.jobs, size, lambda: run_threads(
+            args.jobs, lambda i: SegmentedDownloader(session, {}, args.connections).download(
+                f'{base}/{i}', path('segmented', i))))
+        measure('异步引擎', args.jobs, size, lambda: [
+            future.result() for future in
+            [engine.submit(f'{base}/{i}', path('async', i)) for i in range(args.jobs)]])
+    finally:
+        engine.close()
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""高光分析基准测试：不同条数的弹幕做一次完整的高光分析（分桶、关键词匹配、滑动窗口、选段）的耗时
+
+弹幕随机分布在整个视频上，另在几处加入密集的“高能”时刻，检查能否按得分顺序找回这几处。
+对照组是逐条弹幕用 Python 循环计数、逐秒滑动窗口求和的写法。
+
+    python benchmarks/bench_highlights.py
+    python benchmarks/bench_highlights.py --comments 100000 1000000 --minutes 120
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bilidown.highlights import DEFAULT_KEYWORDS, WINDOW_SECONDS, find_highlights, keyword_mask
+
+WORDS = ['哈哈哈哈', '前方高能', '2333', 'awsl', '这也太好看了吧', '来了来了', '名场面', 'up主辛苦了',
+         '第一次看到这个视频的时候还是高中', 'Amazing!', '泪目', '？？？', '打卡', '好听']
+
+
+def make_timeline(count, minutes, bursts, seed=1):
+    """count 条弹幕，其中约三分之一集中在 bursts 处（秒），越靠前的越密集"""
+    rng = random.Random(seed)
+    duration = minutes * 60
+    times = []
+    texts = []
+    for _ in range(count):
+        if bursts and rng.random() < 0.35:
+            # 越靠前的爆发点分到的弹幕越多
+            index = min(int(rng.expovariate(1.0)), len(bursts) - 1)
+            times.append(min(duration - 0.01, max(0.0, rng.gauss(bursts[index], 6))))
+            texts.append(rng.choice(WORDS[:4]))
+        else:
+            times.append(rng.uniform(0, duration))
+            texts.append(rng.choice(WORDS))
+    return np.asarray(times), texts, duration
+
+
+def legacy_peaks(times, texts, duration, keywords, window=WINDOW_SECONDS):
+    """对照组：逐条计数和匹配关键词，逐秒求窗口和，返回得分最高的秒"""
+    seconds = int(duration) + 1
+    counts = [0.0] * seconds
+    for t, text in zip(times, texts):
+        weight = 3.0 if any(k in text.lower() for k in keywords) else 1.0
+        counts[min(int(t), seconds - 1)] += weight
+    scores = []
+    for i in range(seconds):
+        lo = max(0, i - window // 2)
+        scores.append(sum(counts[lo:lo + window]))
+    return max(range(seconds), key=scores.__getitem__)
+
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None or elapsed < best else best
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, nargs='+', default=[10000, 100000, 500000], help='弹幕条数')
+    parser.add_argument('--minutes', type=int, default=120, help='视频时长（分钟）')
+    parser.add_argument('--repeat', type=int, default=3, help='每项运行次数，取最快一次')
+    parser.add_argument('--legacy', action='store_true', help='同时运行逐条循环的对照组（较慢）')
+    args = parser.parse_args()
+
+    duration = args.minutes * 60
+    bursts = [duration * f for f in (0.15, 0.55, 0.8)]
+    print(f"{'条数':>8}{'关键词ms':>10}{'总耗时ms':>10}{'无关键词ms':>11}{'对照组ms':>10}  找到的高光（按得分）")
+    for count in args.comments:
+        times, texts, duration = make_timeline(count, args.minutes, bursts)
+        match, _ = best_of(lambda: keyword_mask(texts, DEFAULT_KEYWORDS), args.repeat)
+        total, highlights = best_of(lambda: find_highlights(times, texts, duration, count=5), args.repeat)
+        plain, _ = best_of(lambda: find_highlights(times, None, duration, count=5), args.repeat)
+        legacy = ''
+        if args.legacy:
+            elapsed, _ = best_of(lambda: legacy_peaks(times, texts, duration, DEFAULT_KEYWORDS), 1)
+            legacy = f"{elapsed * 1000:.1f}"
+        found = ' '.join(f"{h.start:.0f}-{h.end:.0f}" for h in highlights)
+        print(f"{count:>10}{match * 1000:>12.1f}{total * 1000:>12.1f}{plain * 1000:>13.1f}{legacy:>12}  {found}")
+    print(f"爆发点：{' '.join(f'{b:.0f}' for b in bursts)}")
+
+
+if __name__ == '__main__':
+    main()
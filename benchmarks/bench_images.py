@@ -0,0 +1,110 @@
+"""图片服务基准测试：模拟在上千个封面的网格中快速滚动，测量界面线程每帧的耗时和封面的加载情况
+
+本地 HTTP 服务器提供 B站尺寸（1146x717）的 JPEG 封面，每次请求加固定延迟模拟网络。每帧可见的封面
+请求缩略图，移出视野的请求撤销，停下后等待当前屏的封面加载完。界面线程每帧只提交和撤销请求，
+耗时应远小于一帧（16ms）；快速滚过的封面大多在下载前就被撤销，HTTP 请求数远少于封面数。
+第二遍滚动时已加载过的封面直接读磁盘缓存，只有第一遍被撤销的才会下载。
+
+    python benchmarks/bench_images.py
+    python benchmarks/bench_images.py --items 1000 --visible 40 --latency 0.08
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bilidown.images import ImageService
+
+THUMBNAIL = (192, 120)
+FRAME = 1 / 60
+
+
+def make_cover(seed):
+    image = Image.new('RGB', (1146, 717), ((seed * 37) % 256, (seed * 91) % 256, (seed * 53) % 256))
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=85)
+    return out.getvalue()
+
+
+class CoverServer:
+    def __init__(self, covers, latency):
+        self.requests = 0
+        lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with lock:
+                    server.requests += 1
+                time.sleep(latency)
+                data = covers[int(self.path.rsplit('/', 1)[1].split('.')[0]) % len(covers)]
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+
+def scroll(service, base_url, items, visible, step):
+    """从头滚到尾，返回 (每帧界面耗时列表, 最后一屏加载完的等待时间)"""
+    frame_costs = []
+    shown = set()
+    for top in range(0, items - visible + 1, step):
+        start = time.perf_counter()
+        now = set(range(top, top + visible))
+        for i in shown - now:
+            service.cancel(f'{base_url}/{i}.jpg', THUMBNAIL)
+        futures = [service.thumbnail(f'{base_url}/{i}.jpg', THUMBNAIL) for i in sorted(now)]
+        shown = now
+        frame_costs.append(time.perf_counter() - start)
+        time.sleep(FRAME)
+    start = time.perf_counter()
+    for future in futures:
+        future.result()
+    return frame_costs, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=1000, help='网格中的封面数')
+    parser.add_argument('--visible', type=int, default=40, help='一屏显示的封面数')
+    parser.add_argument('--step', type=int, default=8, help='每帧滚动的封面数')
+    parser.add_argument('--latency', type=float, default=0.05, help='每张图的模拟网络延迟（秒）')
+    parser.add_argument('--workers', type=int, default=4, help='图片服务的线程数')
+    args = parser.parse_args()
+
+    server = CoverServer([make_cover(i) for i in range(16)], args.latency)
+    cache_dir = tempfile.mkdtemp(prefix='bilidown-images-')
+    try:
+        service = ImageService(cache_dir=cache_dir, workers=args.workers)
+        print(f"{'轮次':>6}{'帧数':>6}{'最长帧ms':>10}{'平均帧ms':>10}{'末屏等待ms':>12}{'HTTP请求':>10}{'缓存条目':>10}")
+        for name in ('第一遍', '第二遍'):
+            before = server.requests
+            costs, wait = scroll(service, server.url, args.items, args.visible, args.step)
+            print(f"{name:>6}{len(costs):>8}{max(costs) * 1000:>12.2f}{sum(costs) / len(costs) * 1000:>12.3f}"
+                  f"{wait * 1000:>14.1f}{server.requests - before:>12}{len(service.cache):>12}")
+        service.shutdown(wait=True)
+    finally:
+        server.httpd.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""接收路径基准测试：对比分段下载器的 iter_content 循环和 readinto 复用缓冲区两种写法
+
+本机启动支持Range的HTTP服务，每种写法在单独的子进程中下载同一个流，
+统计子进程的CPU时间（每GB）和峰值内存，不包含服务端的开销。
+
+    python benchmarks/bench_receive_path.py --size-mb 512 --connections 4
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bilidown import segmented
+from bench_download_engines import start_server
+
+MODES = {
+    'iter_content': '每块新建 bytes',
+    'readinto': '复用缓冲区',
+}
+
+
+def peak_rss():
+    """进程的峰值内存（字节）
+
+    Linux 上 fork 出的子进程 ru_maxrss 会沿用父进程的数值，因此优先读取 /proc 中的 VmHWM。
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss 在 Linux 上单位为KB，macOS 上为字节
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def run_worker(mode, url, filename, connections):
+    """在子进程中执行一次下载，输出耗时、CPU时间和峰值内存"""
+    if mode == 'iter_content':
+        segmented.raw_reader = lambda response: None  # 强制走 iter_content 分支
+    session = requests.Session()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    segmented.SegmentedDownloader(session, {}, connections).download(url, filename)
+    result = {
+        'wall': time.perf_counter() - wall_start,
+        'cpu': time.process_time() - cpu_start,
+        'rss': peak_rss(),
+    }
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=512, help='流的大小(MB)')
+    parser.add_argument('--connections', type=int, default=4, help='连接数')
+    parser.add_argument('--repeat', type=int, default=3, help='每种写法重复次数，取CPU时间最少的一次')
+    parser.add_argument('--worker', nargs=3, metavar=('MODE', 'URL', 'FILE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(*args.worker, args.connections)
+        return
+
+    size = int(args.size_mb * 1024 * 1024)
+    server, base = start_server(size, 0)
+    workdir = tempfile.mkdtemp(prefix='bilidown-bench-')
+    gigabytes = size / 1024 ** 3
+    print(f"{args.size_mb}MB，{args.connections} 连接，每种写法 {args.repeat} 次")
+    print(f"{'写法':<16}{'耗时':>8}{'CPU/GB':>10}{'峰值内存':>10}")
+    try:
+        for mode, label in MODES.items():
+            results = []
+            for attempt in range(args.repeat):
+                filename = os.path.join(workdir, f'{mode}-{attempt}.m4s')
+                output = subprocess.run(
+                    [sys.executable, __file__, '--connections', str(args.connections),
+                     '--worker', mode, f'{base}/stream', filename],
+                    check=True, capture_output=True, text=True).stdout
+                results.append(json.loads(output.strip().splitlines()[-1]))
+                os.remove(filename)
+            best = min(results, key=lambda r: r['cpu'])
+            print(f"{label:<14}{best['wall']:>9.2f}s{best['cpu'] / gigabytes:>9.2f}s"
+                  f"{best['rss'] / 1024 / 1024:>9.1f}MB")
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
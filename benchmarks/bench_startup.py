@@ -0,0 +1,181 @@
+"""冷启动基准测试：测量各入口的导入耗时，以及图形界面从进程启动到窗口第一次绘制的时间
+
+每次测量都启动一个新的 Python 进程，结果取多次运行的中位数：
+  导入      进程启动到入口模块导入完成（含解释器自身启动）
+  构造      创建主窗口对象（Qt 为 QApplication + BilibiliDownloaderGUI，Tk 为 BilibiliDownloaderGUI）
+  首次绘制  进程启动到主窗口收到第一个 Paint / Expose 事件
+同时用 -X importtime 列出导入最慢的几个顶层模块，便于找出拖慢启动的依赖。
+子进程在临时目录中运行，不会读到已保存的Cookie；加 --with-cookies 时写入一份假的Cookie，
+用来确认登录状态检查不会阻塞窗口显示。
+
+Qt 在没有显示器时使用 offscreen 平台；Tk 需要可用的显示器，未安装 PyQt6 或没有显示器时跳过对应项。
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 10 --with-cookies
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 名称 -> (模块名, 所在目录)
+ENTRY_POINTS = {
+    'qt': ('bilibili_downloader_qt', ROOT),
+    'tk': ('bilibili_downloader_gui', ROOT),
+    'cli': ('bilibili_downloader', os.path.join(ROOT, 'src')),
+}
+
+PRELUDE = """
+import os, sys, time, json
+T0 = float(os.environ['BENCH_T0'])
+sys.path[:0] = [{path!r}, {root!r}]
+def since():
+    return (time.time() - T0) * 1000
+result = {{}}
+import {module} as entry
+result['import'] = since()
+"""
+
+QT_PAINT = """
+from PyQt6.QtCore import QObject, QEvent, QTimer
+from PyQt6.QtWidgets import QApplication
+
+class FirstPaint(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and 'paint' not in result:
+            result['paint'] = since()
+            QTimer.singleShot(0, app.quit)
+        return False
+
+app = QApplication(sys.argv)
+start = since()
+window = entry.BilibiliDownloaderGUI()
+result['construct'] = since() - start
+watcher = FirstPaint()
+window.installEventFilter(watcher)
+window.show()
+QTimer.singleShot(10000, app.quit)
+app.exec()
+print(json.dumps(result))
+"""
+
+TK_PAINT = """
+start = since()
+gui = entry.BilibiliDownloaderGUI()
+result['construct'] = since() - start
+
+def on_expose(event):
+    if 'paint' not in result:
+        result['paint'] = since()
+        gui.window.after(0, gui.window.destroy)
+
+gui.window.bind('<Expose>', on_expose, add='+')
+gui.window.after(10000, gui.window.destroy)
+gui.window.mainloop()
+print(json.dumps(result))
+"""
+
+IMPORT_ONLY = """
+print(json.dumps(result))
+"""
+
+
+def available(name):
+    """返回 (是否可测, 跳过原因)"""
+    if name == 'qt':
+        try:
+            import PyQt6  # noqa: F401
+        except ImportError:
+            return False, "未安装 PyQt6"
+    if name == 'tk':
+        try:
+            import tkinter
+            tkinter.Tk().destroy()
+        except Exception as e:
+            return False, f"Tk 无法创建窗口：{e}"
+    return True, None
+
+
+def run_once(name, paint, workdir, importtime=False):
+    module, path = ENTRY_POINTS[name]
+    body = IMPORT_ONLY
+    if paint:
+        body = QT_PAINT if name == 'qt' else TK_PAINT
+    code = PRELUDE.format(path=path, root=ROOT, module=module) + body
+    env = dict(os.environ)
+    if name == 'qt' and not env.get('DISPLAY') and not env.get('WAYLAND_DISPLAY') and sys.platform.startswith('linux'):
+        env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    env['BENCH_T0'] = repr(time.time())
+    proc = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, timeout=60)
+    if proc.returncode != 0:
+        raise Exception(f"{name} 启动失败：{proc.stderr.strip().splitlines()[-1:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+def slowest_imports(stderr, count):
+    """解析 -X importtime 的输出，返回入口直接导入的模块中累计耗时最长的几个 [(毫秒, 模块名)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # 每深一层多缩进两格，入口模块本身缩进一格，它直接导入的模块缩进三格
+        if len(name) - len(name.lstrip(' ')) == 3:
+            rows.append((int(cumulative) / 1000, name.strip()))
+    rows.sort(reverse=True)
+    return rows[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='每项运行次数，取中位数')
+    parser.add_argument('--top', type=int, default=8, help='列出导入最慢的模块数')
+    parser.add_argument('--with-cookies', action='store_true', help='在工作目录写入假的Cookie文件')
+    parser.add_argument('entries', nargs='*', metavar='entry', help=f"要测量的入口：{'/'.join(ENTRY_POINTS)}，默认全部")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.entries if name not in ENTRY_POINTS]
+    if unknown:
+        parser.error(f"未知的入口：{', '.join(unknown)}")
+
+    workdir = tempfile.mkdtemp(prefix='bilidown-startup-')
+    if args.with_cookies:
+        with open(os.path.join(workdir, 'bilibili_cookies.json'), 'w') as f:
+            json.dump({'SESSDATA': 'bench', 'bili_jct': 'bench'}, f)
+    try:
+        for name in args.entries or list(ENTRY_POINTS):
+            ok, reason = available(name)
+            if not ok:
+                print(f"[{name}] 跳过：{reason}")
+                continue
+            paint = name != 'cli'
+            samples = {}
+            try:
+                for _ in range(args.repeat):
+                    result, _ = run_once(name, paint, workdir)
+                    for key, value in result.items():
+                        samples.setdefault(key, []).append(value)
+                _, stderr = run_once(name, False, workdir, importtime=True)
+            except Exception as e:
+                print(f"[{name}] {e}")
+                continue
+            summary = "，".join(f"{label} {statistics.median(samples[key]):.0f}ms"
+                               for key, label in (('import', '导入'), ('construct', '构造'), ('paint', '首次绘制'))
+                               if key in samples)
+            print(f"[{name}] {summary}（{args.repeat} 次中位数）")
+            for ms, module in slowest_imports(stderr, args.top):
+                print(f"    {ms:8.1f}ms  {module}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
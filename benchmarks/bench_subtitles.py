@@ -0,0 +1,76 @@
+"""字幕转换基准测试：不同条数的字幕分别转换为 SRT、WebVTT、ASS 的耗时
+
+对照组是原先 Qt 前端逐条用 += 拼接字符串的写法。耗时与条数成正比时，每条的平均耗时（微秒/条）
+不随条数增加而变大。
+
+    python benchmarks/bench_subtitles.py
+    python benchmarks/bench_subtitles.py --cues 1000 10000 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bilidown.subtitles import FORMATS, convert_subtitle
+
+
+def make_subtitle(count):
+    """生成 count 条字幕，模拟讲座字幕：每条约1.5秒，文本二三十个字，偶尔有两行"""
+    body = []
+    for i in range(count):
+        content = f"第{i}句，这是一段用来测试字幕转换速度的讲座内容"
+        if i % 7 == 0:
+            content += "\n下一行：<公式> & {变量}"
+        body.append({'from': i * 1.5, 'to': i * 1.5 + 1.2, 'location': 2, 'content': content})
+    return {'body': body}
+
+
+def legacy_srt(subtitle_data):
+    """原先的写法：逐段拼接字符串"""
+    srt_content = ""
+    index = 1
+    for item in subtitle_data['body']:
+        content = item.get('content', '').strip()
+        if not content:
+            continue
+        parts = []
+        for seconds in (float(item.get('from', 0)), float(item.get('to', 0))):
+            hours = int(seconds / 3600)
+            minutes = int((seconds % 3600) / 60)
+            seconds = seconds % 60
+            milliseconds = int((seconds - int(seconds)) * 1000)
+            parts.append(f"{hours:02d}:{minutes:02d}:{int(seconds):02d},{milliseconds:03d}")
+        srt_content += f"{index}\n{parts[0]} --> {parts[1]}\n{content}\n\n"
+        index += 1
+    return srt_content
+
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cues', type=int, nargs='+', default=[1000, 10000, 50000], help='字幕条数')
+    parser.add_argument('--repeat', type=int, default=3, help='每项运行次数，取最快一次')
+    args = parser.parse_args()
+
+    print(f"{'条数':>8}{'格式':>10}{'耗时ms':>10}{'微秒/条':>10}")
+    for count in args.cues:
+        data = make_subtitle(count)
+        cases = [('旧SRT', lambda: legacy_srt(data))]
+        cases += [(FORMATS[fmt], lambda fmt=fmt: convert_subtitle(data, fmt)) for fmt in FORMATS]
+        for name, func in cases:
+            elapsed = best_of(func, args.repeat)
+            print(f"{count:>10}{name:>10}{elapsed * 1000:>12.1f}{elapsed / count * 1e6:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
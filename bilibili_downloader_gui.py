@@ -2,13 +2,22 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import requests
 import json
-import qrcode
 import time
-from PIL import Image, ImageTk
 import os
 import threading
+import base64
 from io import BytesIO
 import re
+from bilidown.api_cache import install_api_cache
+from bilidown.rate_limit import install_rate_limiter
+from bilidown.transport import create_session, public_session
+from bilidown.playurl_cache import get_playurl_cache, playurl_key
+from bilidown.stream_policy import StreamPolicy, select_streams
+from bilidown.racing import RACING_MODES, THIRD_PARTY_APIS, get_racer
+from bilidown.telemetry import TelemetryHub, format_eta
+from bilidown.danmaku import download_danmaku
+from bilidown.images import get_image_service
+from bilidown.subtitles import FORMATS as SUBTITLE_FORMATS, download_subtitles, list_subtitles
 
 class BilibiliDownloaderGUI:
     def __init__(self):
@@ -16,33 +25,71 @@ class BilibiliDownloaderGUI:
         self.window.title("B站视频下载器")
         self.window.geometry("800x600")
         
-        self.session = requests.Session()
+        self.session = create_session()
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         self.session.headers.update(self.headers)
+        # 视频信息、播放器信息和登录状态接口走缓存，重复查询不再请求网络
+        install_api_cache(self.session)
+        # 所有接口请求共用令牌桶限速，触发412风控时自动降速
+        install_rate_limiter(self.session)
         self.is_logged_in = False
         self.cancel_login = False
         
         self.cookies_file = 'bilibili_cookies.json'
-        self.load_cookies()
+        has_cookies = self.load_cookies()
         
         self.setup_gui()
+        
+        # 登录状态等主循环开始、窗口显示之后再在后台确认
+        if has_cookies:
+            self.login_status.config(text="正在检查登录状态...")
+            self.window.after(0, self.refresh_user_info)
 
     def load_cookies(self):
+        """只读取本地保存的Cookie，是否仍然有效由 refresh_user_info 在后台确认"""
         try:
             if os.path.exists(self.cookies_file):
                 with open(self.cookies_file, 'r') as f:
                     cookies = json.load(f)
                     self.session.cookies.update(cookies)
-                    response = self.session.get('https://api.bilibili.com/x/web-interface/nav')
-                    if response.json().get('data', {}).get('isLogin', False):
-                        self.is_logged_in = True
-                        return True
+                    return True
         except Exception:
             pass
         return False
 
+    def refresh_user_info(self):
+        """在后台线程请求登录状态和头像，结果交回Tk主循环"""
+        def worker():
+            try:
+                nav_data = self.session.get('https://api.bilibili.com/x/web-interface/nav', timeout=10).json()
+            except Exception:
+                nav_data = {}
+            if not nav_data.get('data', {}).get('isLogin', False):
+                self.window.after(0, self.on_login_expired)
+                return
+            face = b''
+            face_url = nav_data['data'].get('face', '')
+            if face_url:
+                # 在图片服务的工作线程中缩放成 PNG 并缓存，界面线程不需要 PIL
+                try:
+                    face = get_image_service().thumbnail(face_url, (40, 40)).result()
+                except Exception:
+                    pass
+            self.window.after(0, self.on_user_info_ready, nav_data, face)
+        
+        threading.Thread(target=worker, daemon=True).start()
+
+    def on_user_info_ready(self, nav_data, face):
+        self.is_logged_in = True
+        self.login_button.config(text="退出登录")
+        self.update_user_info(nav_data, face)
+
+    def on_login_expired(self):
+        if not self.is_logged_in:
+            self.login_status.config(text="未登录")
+
     def save_cookies(self):  # 添加这个方法
         """保存当前cookies到文件"""
         try:
@@ -99,11 +146,16 @@ class BilibiliDownloaderGUI:
         self.audio_var = tk.BooleanVar(value=True)
         self.subtitle_var = tk.BooleanVar(value=False)
         self.cover_var = tk.BooleanVar(value=False)
+        self.danmaku_var = tk.BooleanVar(value=False)
         
         ttk.Checkbutton(options_frame, text="视频", variable=self.video_var).pack(side="left", padx=10)
         ttk.Checkbutton(options_frame, text="音频", variable=self.audio_var).pack(side="left", padx=10)
-        ttk.Checkbutton(options_frame, text="字幕", variable=self.subtitle_var).pack(side="left", padx=10)
+        ttk.Checkbutton(options_frame, text="字幕", variable=self.subtitle_var).pack(side="left", padx=(10, 0))
+        self.subtitle_format_var = tk.StringVar(value=SUBTITLE_FORMATS['srt'])
+        ttk.Combobox(options_frame, textvariable=self.subtitle_format_var, values=list(SUBTITLE_FORMATS.values()),
+                     width=7, state="readonly").pack(side="left", padx=(2, 10))
         ttk.Checkbutton(options_frame, text="封面", variable=self.cover_var).pack(side="left", padx=10)
+        ttk.Checkbutton(options_frame, text="弹幕", variable=self.danmaku_var).pack(side="left", padx=10)
 
         # 分P选择
         self.page_frame = ttk.Frame(self.download_frame)
@@ -145,7 +197,7 @@ class BilibiliDownloaderGUI:
         self.api_var = tk.StringVar(value="官方")
         self.api_combo = ttk.Combobox(self.api_frame, 
                                     textvariable=self.api_var,
-                                    values=["官方", "解析接口1", "RapidAPI", "BiliAPI"],
+                                    values=["官方", "解析接口1", "RapidAPI", "BiliAPI"] + list(RACING_MODES),
                                     state="readonly",
                                     width=20)
         self.api_combo.pack(side="left")
@@ -181,8 +233,9 @@ class BilibiliDownloaderGUI:
             self.login_button.config(text="退出登录")
 
     def set_default_avatar(self):
-        default_avatar = Image.new('RGB', (40, 40), color='#f0f0f0')
-        photo = ImageTk.PhotoImage(default_avatar)
+        # 纯色占位图用 Tk 自带的 PhotoImage 画，启动时不需要导入 PIL
+        photo = tk.PhotoImage(width=40, height=40)
+        photo.put('#f0f0f0', to=(0, 0, 40, 40))
         self.avatar_label.configure(image=photo)
         self.avatar_label.image = photo
 
@@ -198,19 +251,16 @@ class BilibiliDownloaderGUI:
         else:
             messagebox.showwarning("提示", "下载文件夹不存在！")
 
-    def update_user_info(self, nav_data):
+    def update_user_info(self, nav_data, face=b''):
         try:
             uname = nav_data['data'].get('uname', '')
             level = nav_data['data'].get('level_info', {}).get('current_level', 0)
             self.login_status.config(text=f"昵称：{uname}")
             self.user_level.config(text=f"等级：LV{level}")
             
-            face_url = nav_data['data'].get('face', '')
-            if face_url:
-                response = requests.get(face_url)
-                avatar_image = Image.open(BytesIO(response.content))
-                avatar_image = avatar_image.resize((40, 40))
-                photo = ImageTk.PhotoImage(avatar_image)
+            # 头像由 refresh_user_info 在后台缩放成 PNG，Tk 可以直接显示
+            if face:
+                photo = tk.PhotoImage(data=base64.b64encode(face))
                 self.avatar_label.configure(image=photo)
                 self.avatar_label.image = photo
         except Exception as e:
@@ -258,6 +308,10 @@ class BilibiliDownloaderGUI:
 
     def login_process(self):
         try:
+            # qrcode 和 PIL 只在登录时才导入，不拖慢程序启动
+            import qrcode
+            from PIL import Image, ImageTk
+            
             # 使用新的二维码生成接口
             qr_url = "https://passport.bilibili.com/x/passport-login/web/qrcode/generate"
             response = self.session.get(qr_url)
@@ -327,7 +381,8 @@ class BilibiliDownloaderGUI:
                 if data['data']['code'] == 0:  # 登录成功
                     self.save_cookies()
                     self.is_logged_in = True
-                    self.update_user_info()
+                    self.login_button.config(text="退出登录", state="normal")
+                    self.refresh_user_info()
                     qr_window.destroy()
                     messagebox.showinfo("提示", "登录成功！")
                     return
@@ -393,25 +448,41 @@ class BilibiliDownloaderGUI:
                 cover_url = video_info.get('pic', '')
                 if cover_url:
                     cover_path = os.path.join(download_path, f"{base_name}.jpg")
-                    self.download_file(cover_url, cover_path)
+                    try:
+                        get_image_service().save(cover_url, cover_path)
+                    except Exception as e:
+                        print(f"下载封面失败：{str(e)}")
             
             if self.subtitle_var.get():
                 self.update_status("下载字幕...")
-                subtitle_url = f"https://api.bilibili.com/x/player/v2?cid={cid}&bvid={bvid}"
-                subtitle_response = self.session.get(subtitle_url)
-                subtitle_data = subtitle_response.json()
-                subtitles = subtitle_data.get('data', {}).get('subtitle', {}).get('subtitles', [])
-                for sub in subtitles:
-                    sub_url = "https:" + sub.get('subtitle_url', '')
-                    if sub_url:
-                        sub_path = os.path.join(download_path, f"{base_name}_{sub['lan']}.srt")
-                        self.download_file(sub_url, sub_path)
+                # 所有语言（含AI字幕）并发下载，转换为所选格式
+                fmt = next(key for key, name in SUBTITLE_FORMATS.items() if name == self.subtitle_format_var.get())
+                try:
+                    tracks = list_subtitles(self.session, bvid, cid)
+                    results = download_subtitles(self.session, tracks, os.path.join(download_path, base_name), fmt,
+                                                 should_cancel=lambda: not self.downloading)
+                    failed = [f"{lan}：{error}" for lan, path, error in results if not path]
+                    if failed:
+                        print(f"部分字幕下载失败：{'；'.join(failed)}")
+                except Exception as e:
+                    print(f"下载字幕失败：{str(e)}")
+            
+            if self.danmaku_var.get():
+                self.update_status("下载弹幕...")
+                try:
+                    danmaku_path = os.path.join(download_path, f"{base_name}.danmaku.ass")
+                    download_danmaku(self.session, cid, current_page.get('duration', 0), danmaku_path,
+                                     title=video_info.get('title', ''), should_cancel=lambda: not self.downloading)
+                except Exception as e:
+                    print(str(e))
             
             quality = int(self.quality_var.get().split()[0])
             self.update_status("获取下载地址...")
             download_info = self.get_download_url(bvid, cid, quality)
             
             if 'dash' in download_info:
+                # 按所选画质挑选流，同画质下优先兼容性最好的AVC编码
+                video_stream, audio_stream = select_streams(download_info['dash'], StreamPolicy(max_quality=quality))
                 if self.video_var.get() or self.audio_var.get():
                     video_path = os.path.join(download_path, f"{base_name}.mp4")
                     
@@ -420,10 +491,10 @@ class BilibiliDownloaderGUI:
                         temp_audio = video_path + '.audio.m4a'
                         
                         self.update_status("下载视频流...")
-                        self.download_video(download_info['dash']['video'][0]['baseUrl'], temp_video)
+                        self.download_video(video_stream['baseUrl'], temp_video)
                         
                         self.update_status("下载音频流...")
-                        self.download_video(download_info['dash']['audio'][0]['baseUrl'], temp_audio)
+                        self.download_video(audio_stream['baseUrl'], temp_audio)
                         
                         self.update_status("合并音视频...")
                         self.merge_video_audio(temp_video, temp_audio, video_path)
@@ -432,11 +503,15 @@ class BilibiliDownloaderGUI:
                         os.remove(temp_audio)
                     elif self.video_var.get():
                         self.update_status("下载视频流...")
-                        self.download_video(download_info['dash']['video'][0]['baseUrl'], video_path)
+                        self.download_video(video_stream['baseUrl'], video_path)
                     elif self.audio_var.get():
                         audio_path = os.path.join(download_path, f"{base_name}.m4a")
                         self.update_status("下载音频流...")
-                        self.download_video(download_info['dash']['audio'][0]['baseUrl'], audio_path)
+                        self.download_video(audio_stream['baseUrl'], audio_path)
+            elif download_info.get('durl') and self.video_var.get():
+                # 第三方接口返回音视频合在一起的单个文件
+                self.update_status("下载视频...")
+                self.download_video(download_info['durl'][0]['url'], os.path.join(download_path, f"{base_name}.mp4"))
             
             self.update_status("下载完成！")
             messagebox.showinfo("提示", "下载完成！")
@@ -448,10 +523,18 @@ class BilibiliDownloaderGUI:
 
     def get_download_url(self, bvid, cid, quality):
         api_type = self.api_var.get()
+        if api_type in RACING_MODES:
+            # 同时向多个接口请求，先返回的有效结果（或画质最高的结果）胜出
+            sources = {'官方': lambda: self._get_official_download_url(bvid, cid, quality)}
+            for name in THIRD_PARTY_APIS:
+                sources[name] = lambda name=name: self._get_third_party_download_url(bvid, name)
+            name, info = get_racer().resolve(sources, RACING_MODES[api_type])
+            self.update_status(f"已通过「{name}」获取下载地址")
+            return info
         if api_type == "官方":
             return self._get_official_download_url(bvid, cid, quality)
         else:
-            return self._get_third_party_download_url(bvid)
+            return self._get_third_party_download_url(bvid, api_type)
 
     def _get_official_download_url(self, bvid, cid, quality):
         url = f"https://api.bilibili.com/x/player/playurl"
@@ -475,14 +558,18 @@ class BilibiliDownloaderGUI:
             'Accept-Language': 'zh-CN,zh;q=0.9',
             'Range': 'bytes=0-'
         }
-        response = self.session.get(url, params=params, headers=headers)
-        data = response.json()
-        if data.get('code') != 0:
-            raise Exception(f"获取下载地址失败：{data.get('message', '未知错误')}")
-        return data['data']
+        
+        def request_playurl():
+            response = self.session.get(url, params=params, headers=headers)
+            data = response.json()
+            if data.get('code') != 0:
+                raise Exception(f"获取下载地址失败：{data.get('message', '未知错误')}")
+            return data['data']
+        
+        key = playurl_key(self.session, bvid, cid, quality, params['fnval'])
+        return get_playurl_cache().get_or_fetch(key, request_playurl)
 
-    def _get_third_party_download_url(self, bvid):
-        api_type = self.api_var.get()
+    def _get_third_party_download_url(self, bvid, api_type):
         quality = int(self.quality_var.get().split()[0])
         
         try:
@@ -503,11 +590,11 @@ class BilibiliDownloaderGUI:
             }
             
             if api_type == "解析接口1":
-                response = requests.get(api_url, headers=headers, verify=True)
+                response = public_session().get(api_url, headers=headers, verify=True)
                 data = response.json()
                 video_url = data.get('url', '')
             elif api_type in ["RapidAPI", "BiliAPI"]:
-                response = requests.get(api_url, headers=headers, verify=True)
+                response = public_session().get(api_url, headers=headers, verify=True)
                 data = response.json()
                 video_url = data.get('data', {}).get('playurl', '')
             
@@ -523,81 +610,53 @@ class BilibiliDownloaderGUI:
             raise Exception(f"第三方接口解析失败：{str(e)}")
 
     def download_video(self, url, filename):
-        headers = {
-            'Referer': 'https://www.bilibili.com',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Range': 'bytes=0-'
-        }
-        
-        response = self.session.get(url, stream=True, headers=headers)
-        total_size = int(response.headers.get('content-length', 0))
-        block_size = 1024 * 1024  # 1MB块大小
-        
-        self.progress['maximum'] = total_size
+        self.progress['maximum'] = 0
+        self.progress['value'] = 0
         self.downloading = True
         self.download_start_time = time.time()
-        downloaded_size = 0
-        last_update_time = time.time()
-        last_downloaded_size = 0
+        # 下载回调只更新计数，由 TelemetryHub 按固定频率把快照交给Tk主循环
+        telemetry = TelemetryHub()
+        telemetry.subscribe(lambda snapshot: self.window.after(0, self.show_download_progress, snapshot))
+        telemetry.start()
+        
+        def on_progress(downloaded_size, total_size):
+            telemetry.update(filename, filename, downloaded_size, total_size)
+        
+        from bilidown.async_engine import get_engine
         
         try:
-            with open(filename, 'wb') as f:
-                for data in response.iter_content(block_size):
-                    if not self.downloading:  # 检查是否取消下载
-                        raise Exception("下载已取消")
-                    
-                    while self.paused:  # 暂停下载
-                        time.sleep(0.1)
-                        if not self.downloading:  # 在暂停时检查是否取消
-                            raise Exception("下载已取消")
-                    
-                    if data:  # 确保数据不为空
-                        downloaded_size += len(data)
-                        f.write(data)
-                        self.progress['value'] = downloaded_size
-                        
-                        # 计算下载速度
-                        current_time = time.time()
-                        if current_time - last_update_time >= 1.0:  # 每秒更新一次速度
-                            speed = (downloaded_size - last_downloaded_size) / (current_time - last_update_time)
-                            speed_text = f"{speed/1024/1024:.2f} MB/s"
-                            progress_text = f"{downloaded_size/1024/1024:.1f}MB / {total_size/1024/1024:.1f}MB"
-                            self.speed_label.config(text=f"下载速度：{speed_text}")
-                            self.status_label.config(text=f"下载进度：{progress_text}")
-                            
-                            last_update_time = current_time
-                            last_downloaded_size = downloaded_size
-                        
-                        self.window.update()
+            completed = get_engine().download(
+                url, filename,
+                progress_callback=on_progress,
+                should_cancel=lambda: not self.downloading,
+                should_pause=lambda: self.paused
+            )
+            if not completed:
+                raise Exception("下载已取消")
         except Exception as e:
             if str(e) != "下载已取消":
                 raise e
         finally:
+            telemetry.stop()
             self.downloading = False
             self.paused = False
             self.download_button.config(state="normal")
             self.pause_button.config(state="disabled")
             self.cancel_button.config(state="disabled")
 
-    def download_file(self, url, filename):
-        try:
-            response = requests.get(url)
-            with open(filename, 'wb') as f:
-                f.write(response.content)
-        except Exception as e:
-            print(f"下载文件失败：{str(e)}")
+    def show_download_progress(self, snapshot):
+        self.progress['maximum'] = snapshot.total
+        self.progress['value'] = snapshot.downloaded
+        speed_text = f"{snapshot.speed/1024/1024:.2f} MB/s"
+        progress_text = f"{snapshot.downloaded/1024/1024:.1f}MB / {snapshot.total/1024/1024:.1f}MB"
+        self.speed_label.config(text=f"下载速度：{speed_text}  剩余时间：{format_eta(snapshot.eta)}")
+        self.status_label.config(text=f"下载进度：{progress_text}")
 
     def merge_video_audio(self, video_file, audio_file, output_file):
+        from bilidown.mp4_remux import merge_streams
+        
         try:
-            import subprocess
-            command = [
-                'ffmpeg',
-                '-i', video_file,
-                '-i', audio_file,
-                '-c', 'copy',
-                output_file
-            ]
-            subprocess.run(command, check=True)
+            merge_streams(video_file, audio_file, output_file)
         except Exception as e:
             raise Exception(f"合并音视频失败：{str(e)}")
 
@@ -5,17 +5,43 @@ import json
 import time
 import threading
 import requests
-import qrcode
 from io import BytesIO
-from PIL import Image
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                            QLabel, QPushButton, QLineEdit, QComboBox, QCheckBox, 
                            QProgressBar, QFileDialog, QFrame, QMessageBox, QTabWidget, QDialog,
-                           QMenuBar, QMenu)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QSize, QUrl, QEventLoop
+                           QMenuBar, QMenu, QListWidget, QListWidgetItem, QInputDialog)
+from PyQt6.QtCore import (Qt, QThread, QTimer, pyqtSignal, QSize, QUrl, QEventLoop, QObject, QRunnable,
+                          QThreadPool)
 from PyQt6.QtGui import QPixmap, QIcon, QDesktopServices, QColor, QPalette
+from bilidown.segmented import SegmentedDownloader, DEFAULT_CONNECTIONS
+from bilidown.task_graph import TaskGraph
+from bilidown.job_queue import JobQueue, DEFAULT_CONCURRENCY
+from bilidown.transport import create_session, mount_pool, public_session
+from bilidown.api_cache import install_api_cache
+from bilidown.rate_limit import install_rate_limiter
+from bilidown.playurl_cache import get_playurl_cache, playurl_key
+from bilidown.mirrors import stream_urls, select_mirrors
+from bilidown.ffmpeg_mux import StreamingMuxer
+from bilidown.stream_policy import StreamPolicy, CODEC_CHOICES, describe_stream
+from bilidown.racing import RACING_MODES, THIRD_PARTY_APIS, get_racer
+from bilidown.telemetry import TelemetryHub, format_eta
+from bilidown.bandwidth import Schedule, get_shaper, parse_rate
+from bilidown.danmaku import download_danmaku
+from bilidown.images import get_image_service
+from bilidown.watchdog import StallWatchdog
+from bilidown.subtitles import FORMATS as SUBTITLE_FORMATS, download_subtitles, list_subtitles
 # 当前版本号
 CURRENT_VERSION = '1.0.0'
+# 请求视频流时使用的请求头
+STREAM_HEADERS = {
+    'Referer': 'https://www.bilibili.com',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+}
+AVATAR_SIZE = (40, 40)
+BVID_PATTERN = re.compile(r'BV[0-9A-Za-z]{10}')
+NAV_URL = 'https://api.bilibili.com/x/web-interface/nav'
+# 高光片段数的选项，0 表示下载完整视频
+HIGHLIGHT_CHOICES = (0, 3, 5, 10)
 
 class VersionChecker(QThread):
     version_available = pyqtSignal(str, str)  # 参数：新版本号，下载链接
@@ -32,7 +58,7 @@ class VersionChecker(QThread):
     def run(self):
         try:
             # 获取GitHub最新release信息
-            response = requests.get(self.github_api_url, headers=self.headers, timeout=10)
+            response = public_session().get(self.github_api_url, headers=self.headers, timeout=10)
             if response.status_code == 403:
                 self.check_error.emit('检查更新失败：GitHub API访问受限，请稍后再试')
                 return
@@ -119,6 +145,9 @@ class LoginThread(QThread):
     
     def run(self):
         try:
+            # qrcode 依赖 PIL，只在登录时才导入，不拖慢程序启动
+            import qrcode
+            
             # 获取二维码
             qr_url = "https://passport.bilibili.com/x/passport-login/web/qrcode/generate"
             response = self.session.get(qr_url)
@@ -190,27 +219,135 @@ class LoginThread(QThread):
         except Exception as e:
             self.login_failed.emit(f"登录过程出错：{str(e)}")
 
+def fetch_user_info(session, nav_data=None):
+    """确认登录状态并取得缩小后的头像，返回 (nav 数据, 头像PNG)；未登录时返回 None"""
+    try:
+        if nav_data is None:
+            nav_data = session.get(NAV_URL, timeout=10).json()
+        if not nav_data.get('data', {}).get('isLogin', False):
+            return None
+    except Exception:
+        return None
+    face = b''
+    face_url = nav_data['data'].get('face', '')
+    if face_url:
+        # 图片服务在工作线程中缩放并缓存到磁盘，下次启动直接读缓存
+        try:
+            face = get_image_service().thumbnail(face_url, AVATAR_SIZE).result()
+        except Exception:
+            pass
+    return nav_data, face
+
+class _RequestTask(QRunnable):
+    def __init__(self, executor, channel, serial, func):
+        super().__init__()
+        self.executor = executor
+        self.channel = channel
+        self.serial = serial
+        self.func = func
+    
+    def run(self):
+        # 排队期间已被同一通道的新请求取代，不再执行
+        if not self.executor.is_current(self.channel, self.serial):
+            return
+        try:
+            result = self.func()
+        except Exception as e:
+            self.executor.request_failed.emit(self.channel, self.serial, str(e))
+        else:
+            self.executor.request_finished.emit(self.channel, self.serial, result)
+
+class RequestExecutor(QObject):
+    """在线程池中执行会阻塞的网络请求，结果经信号回到界面线程再调用回调
+    
+    每个请求属于一个通道（如 'video_info'），同一通道的新请求取代旧请求：还在排队的旧请求不再执行，
+    已经在执行的旧请求的结果被丢弃，界面不会被过时的结果覆盖。
+    """
+    request_finished = pyqtSignal(str, int, object)  # 通道，序号，结果
+    request_failed = pyqtSignal(str, int, str)  # 通道，序号，错误信息
+    
+    def __init__(self, parent=None, max_threads=4):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self._serial = 0
+        self._current = {}  # 通道 -> 最新请求的序号
+        self._callbacks = {}  # 通道 -> (序号, 成功回调, 失败回调)
+        self.request_finished.connect(self._on_finished)
+        self.request_failed.connect(self._on_failed)
+    
+    def submit(self, channel, func, on_result, on_error=None):
+        """在后台执行 func()，完成后在界面线程调用 on_result(结果) 或 on_error(错误信息)"""
+        self._serial += 1
+        self._current[channel] = self._serial
+        self._callbacks[channel] = (self._serial, on_result, on_error)
+        self.pool.start(_RequestTask(self, channel, self._serial, func))
+        return self._serial
+    
+    def cancel(self, channel):
+        """撤销通道中的请求，结果到达时直接丢弃"""
+        self._current.pop(channel, None)
+        self._callbacks.pop(channel, None)
+    
+    def is_current(self, channel, serial):
+        return self._current.get(channel) == serial
+    
+    def _take(self, channel, serial):
+        callbacks = self._callbacks.get(channel)
+        if callbacks is None or callbacks[0] != serial:
+            return None
+        del self._callbacks[channel]
+        self._current.pop(channel, None)
+        return callbacks
+    
+    def _on_finished(self, channel, serial, result):
+        callbacks = self._take(channel, serial)
+        if callbacks is not None:
+            callbacks[1](result)
+    
+    def _on_failed(self, channel, serial, error):
+        callbacks = self._take(channel, serial)
+        if callbacks is not None and callbacks[2] is not None:
+            callbacks[2](error)
+
 class DownloadThread(QThread):
-    progress_update = pyqtSignal(int, int)
-    speed_update = pyqtSignal(float)
+    telemetry_update = pyqtSignal(object)  # TelemetrySnapshot，按固定频率推送
     status_update = pyqtSignal(str)
     download_complete = pyqtSignal()
     download_error = pyqtSignal(str)
     
-    def __init__(self, session, bvid, cid, quality, download_path, options, api_type):
+    def __init__(self, session, bvid, cid, quality, download_path, options, api_type,
+                 telemetry=None, job_key=None):
         super().__init__()
         self.session = session
         self.bvid = bvid
         self.cid = cid
         self.quality = quality
         self.download_path = download_path
-        self.options = options  # 字典，包含video, audio, subtitle, cover
+        self.options = options  # 字典，包含video, audio, subtitle, cover, danmaku, highlights
         self.api_type = api_type
         self.downloading = False
         self.paused = False
         self.cancel = False
+        # 批量下载时由外部传入共用的 TelemetryHub，单独下载时自己创建；取消时界面线程可以直接停止它
+        self.own_telemetry = telemetry is None
+        if self.own_telemetry:
+            telemetry = TelemetryHub()
+            telemetry.subscribe(self.telemetry_update.emit)
+        self.telemetry = telemetry
+        self.job_key = cid if job_key is None else job_key
+        self.playurl_key = None
+        self.graph = None
+        # 按编码、码率和音质偏好从 DASH 的所有流中挑选
+        self.stream_policy = StreamPolicy.from_options(options, quality)
     
     def run(self):
+        if self.own_telemetry and not self.cancel:
+            self.telemetry.start()
+        self.telemetry.register(self.job_key)
+        # 本任务的所有流共用一个带宽份额，多开连接不会多占总限速
+        self.bandwidth = get_shaper().job(self.job_key)
+        state = 'failed'
         try:
             self.downloading = True
             self.status_update.emit("获取视频信息...")
@@ -234,68 +371,285 @@ class DownloadThread(QThread):
             # 创建下载目录
             os.makedirs(self.download_path, exist_ok=True)
             
-            # 下载封面
-            if self.options.get('cover', False):
-                self.status_update.emit("下载封面...")
-                cover_url = video_info.get('pic', '')
-                if cover_url:
-                    cover_path = os.path.join(self.download_path, f"{base_name}.jpg")
-                    self.download_file(cover_url, cover_path)
-            
-            # 字幕下载功能待开发
-            if self.options.get('subtitle', False):
-                self.status_update.emit("字幕下载功能待开发")
-            
-            # 获取下载地址
-            self.status_update.emit("获取下载地址...")
-            download_info = self.get_download_url()
-            
-            # 下载视频和音频
-            if 'dash' in download_info:
-                if self.options.get('video', False) or self.options.get('audio', False):
-                    video_path = os.path.join(self.download_path, f"{base_name}.mp4")
-                    
-                    if self.options.get('video', False) and self.options.get('audio', False):
-                        temp_video = video_path + '.video.mp4'
-                        temp_audio = video_path + '.audio.m4a'
-                        
-                        self.status_update.emit("下载视频流...")
-                        self.download_stream(download_info['dash']['video'][0]['baseUrl'], temp_video)
-                        
-                        if self.cancel:
-                            return
-                        
-                        self.status_update.emit("下载音频流...")
-                        self.download_stream(download_info['dash']['audio'][0]['baseUrl'], temp_audio)
-                        
-                        if self.cancel:
-                            return
-                        
-                        self.status_update.emit("合并音视频...")
-                        self.merge_video_audio(temp_video, temp_audio, video_path)
-                        
-                        # 删除临时文件
-                        try:
-                            os.remove(temp_video)
-                            os.remove(temp_audio)
-                        except:
-                            pass
-                    elif self.options.get('video', False):
-                        self.status_update.emit("下载视频流...")
-                        self.download_stream(download_info['dash']['video'][0]['baseUrl'], video_path)
-                    elif self.options.get('audio', False):
-                        audio_path = os.path.join(self.download_path, f"{base_name}.m4a")
-                        self.status_update.emit("下载音频流...")
-                        self.download_stream(download_info['dash']['audio'][0]['baseUrl'], audio_path)
+            # 各步骤组成依赖图：封面、字幕、视频流和音频流同时下载，两路流都完成后再合并
+            self.graph = self.build_task_graph(video_info, base_name)
+            self.graph.run(should_cancel=lambda: self.cancel)
+            state = 'cancelled' if self.cancel else 'done'
             
             if not self.cancel:
                 self.status_update.emit("下载完成！")
                 self.download_complete.emit()
             
         except Exception as e:
+            # 缓存的地址可能已经失效（如 CDN 返回403），重试时重新获取
+            if self.playurl_key is not None:
+                get_playurl_cache().invalidate(self.playurl_key)
             self.download_error.emit(f"下载失败：{str(e)}")
         finally:
             self.downloading = False
+            self.bandwidth.release()
+            self.telemetry.finish(self.job_key, state)
+            if self.own_telemetry:
+                self.telemetry.stop()
+    
+    def should_cancel(self):
+        """用户取消了下载，或同一任务的另一个步骤已经出错（如音频流失败时不再继续下载视频流）"""
+        return self.cancel or (self.graph is not None and self.graph.failed)
+    
+    def build_task_graph(self, video_info, base_name):
+        graph = TaskGraph(max_workers=4)
+        video_path = os.path.join(self.download_path, f"{base_name}.mp4")
+        want_video = self.options.get('video', False)
+        want_audio = self.options.get('audio', False)
+        
+        # 下载封面
+        if self.options.get('cover', False):
+            cover_url = video_info.get('pic', '')
+            if cover_url:
+                cover_path = os.path.join(self.download_path, f"{base_name}.jpg")
+                graph.add('cover', lambda: self.download_cover(cover_url, cover_path))
+        
+        # 所选语言的字幕（含AI字幕）并发下载，按设置的格式保存
+        if self.options.get('subtitle', False):
+            subtitle_base = os.path.join(self.download_path, base_name)
+            graph.add('subtitle', lambda: self.download_subtitles(subtitle_base))
+        
+        # 弹幕排版后保存为 ASS，播放器可以和字幕一样加载
+        if self.options.get('danmaku', False):
+            danmaku_path = os.path.join(self.download_path, f"{base_name}.danmaku.ass")
+            graph.add('danmaku', lambda: self.download_danmaku(video_info, danmaku_path))
+        
+        if not (want_video or want_audio):
+            return graph
+        
+        graph.add('playurl', self.fetch_download_url)
+        
+        # 只下载弹幕最密集的几段：分析弹幕和获取地址同时进行，再按 sidx 索引只下载这几段的分片
+        if self.options.get('highlights'):
+            graph.add('highlights', lambda: self.find_highlights(video_info))
+            graph.add('clips', lambda info, highlights: self.download_highlights(info, highlights, base_name),
+                      deps=['playurl', 'highlights'])
+            return graph
+        
+        if (want_video and want_audio and self.options.get('stream_mux') and StreamingMuxer.supported()
+                and self.options.get('merge_mode') != 'native'):
+            # 边下边合并：两路流直接写入 ffmpeg 的命名管道，不落临时文件
+            graph.add('muxer', lambda info: self.start_muxer(info, video_path), deps=['playurl'])
+            graph.add('video', lambda info, muxer: self.feed_muxer(info, muxer, 'video') if 'dash' in info
+                      else self.download_durl(info, video_path), deps=['playurl', 'muxer'])
+            graph.add('audio', lambda info, muxer: self.feed_muxer(info, muxer, 'audio'), deps=['playurl', 'muxer'])
+            graph.add('merge', lambda muxer, video, audio: self.finish_muxer(muxer, video and audio),
+                      deps=['muxer', 'video', 'audio'])
+        elif want_video and want_audio:
+            temp_video = video_path + '.video.mp4'
+            temp_audio = video_path + '.audio.m4a'
+            # 第三方接口只返回音视频合在一起的单个文件，直接下载到目标位置，不再合并
+            graph.add('video', lambda info: self.download_dash_track(info, 'video', temp_video) if 'dash' in info
+                      else self.download_durl(info, video_path), deps=['playurl'])
+            graph.add('audio', lambda info: self.download_dash_track(info, 'audio', temp_audio), deps=['playurl'])
+            graph.add('merge', lambda video, audio: self.merge_tracks(video, audio, video_path),
+                      deps=['video', 'audio'])
+        elif want_video:
+            graph.add('video', lambda info: self.download_dash_track(info, 'video', video_path) if 'dash' in info
+                      else self.download_durl(info, video_path), deps=['playurl'])
+        else:
+            audio_path = os.path.join(self.download_path, f"{base_name}.m4a")
+            graph.add('audio', lambda info: self.download_dash_track(info, 'audio', audio_path), deps=['playurl'])
+        return graph
+    
+    def download_subtitles(self, base_path):
+        """下载 options['selected_subtitles'] 中的字幕，没有指定时（如批量下载）下载全部语言"""
+        fmt = self.options.get('subtitle_format', 'srt')
+        try:
+            tracks = list_subtitles(self.session, self.bvid, self.cid)
+        except Exception as e:
+            # 字幕失败不影响视频下载
+            self.status_update.emit(str(e))
+            return []
+        if not tracks:
+            self.status_update.emit("该视频没有字幕")
+            return []
+        self.status_update.emit(f"下载字幕（{SUBTITLE_FORMATS[fmt]}）...")
+        results = download_subtitles(self.session, tracks, base_path, fmt,
+                                     languages=self.options.get('selected_subtitles'),
+                                     should_cancel=self.should_cancel)
+        saved = [lan for lan, path, _ in results if path]
+        failed = [f"{lan}：{error}" for lan, path, error in results if not path]
+        if failed:
+            self.status_update.emit(f"部分字幕下载失败：{'；'.join(failed)}")
+        if saved:
+            self.status_update.emit(f"已保存 {len(saved)} 个字幕：{'、'.join(saved)}")
+        return results
+    
+    def download_cover(self, url, path):
+        """封面经图片服务下载：边下边写，已缓存（如刚显示过）时不再下载"""
+        self.status_update.emit("下载封面...")
+        try:
+            get_image_service().save(url, path)
+        except Exception as e:
+            raise Exception(f"下载封面失败：{str(e)}")
+    
+    def page_duration(self, video_info):
+        """当前分P的时长（秒），取自视频信息中的分P列表"""
+        page = next((p for p in video_info.get('pages', []) if p['cid'] == self.cid), {})
+        return page.get('duration') or video_info.get('duration', 0)
+    
+    def download_danmaku(self, video_info, path):
+        self.status_update.emit("下载弹幕...")
+        try:
+            result = download_danmaku(self.session, self.cid, self.page_duration(video_info), path,
+                                      title=video_info.get('title', ''),
+                                      should_cancel=self.should_cancel)
+        except Exception as e:
+            # 弹幕失败不影响视频下载
+            self.status_update.emit(str(e))
+            return None
+        if result is not None:
+            written, dropped = result
+            self.status_update.emit(f"弹幕已保存：{written} 条" + (f"（屏幕放不下，省略 {dropped} 条）" if dropped else ""))
+        return result
+    
+    def find_highlights(self, video_info):
+        """按弹幕密度找出 options['highlights'] 段高光"""
+        from bilidown.highlights import danmaku_timeline, find_highlights, format_clock  # 用到时才导入 NumPy
+        
+        duration = self.page_duration(video_info)
+        self.status_update.emit("分析弹幕，查找高光片段...")
+        times, texts = danmaku_timeline(self.session, self.cid, duration, should_cancel=self.should_cancel)
+        if self.should_cancel():
+            return []
+        highlights = find_highlights(times, texts, duration, count=self.options['highlights'])
+        if not highlights:
+            raise Exception("弹幕太少，找不到高光片段")
+        self.status_update.emit(f"找到 {len(highlights)} 段高光：" +
+                                "、".join(f"{format_clock(h.start)}-{format_clock(h.end)}" for h in highlights))
+        return highlights
+    
+    def download_highlights(self, download_info, highlights, base_name):
+        """逐段下载高光片段，按得分排序编号，返回保存的路径"""
+        from bilidown.clips import download_clip
+        from bilidown.highlights import format_clock
+        
+        if 'dash' not in download_info:
+            raise Exception("该下载地址不是DASH流，无法只下载片段，请换用官方接口")
+        video, audio = self.stream_policy.select(download_info['dash'])
+        if not self.options.get('video', False):
+            video = None
+        if not self.options.get('audio', False):
+            audio = None
+        if video is None and audio is None:
+            raise Exception("没有可下载的流")
+        ext = '.mp4' if video is not None else '.m4a'
+        paths = []
+        for index, highlight in enumerate(highlights, 1):
+            if self.should_cancel():
+                break
+            path = os.path.join(self.download_path,
+                                f"{base_name}_高光{index}_{format_clock(highlight.start).replace(':', '-')}{ext}")
+            self.status_update.emit(f"下载高光片段 {index}/{len(highlights)}"
+                                    f"（{format_clock(highlight.start)}-{format_clock(highlight.end)}）...")
+            result = download_clip(
+                self.session, video, audio, highlight.start, highlight.end, path, STREAM_HEADERS,
+                merge_mode=self.options.get('merge_mode', 'auto'),
+                should_cancel=self.should_cancel,
+                progress_callback=lambda kind, downloaded, total: self.telemetry.update(self.job_key, kind,
+                                                                                         downloaded, total),
+                throttle=self.bandwidth
+            )
+            if result is not None:
+                paths.append(path)
+        return paths
+    
+    def fetch_download_url(self):
+        self.status_update.emit("获取下载地址...")
+        return self.get_download_url()
+    
+    def download_dash_track(self, download_info, kind, filename):
+        """下载DASH中的一路流，返回保存路径；没有DASH信息时返回None"""
+        if 'dash' not in download_info:
+            return None
+        stream = self.choose_stream(download_info, kind)
+        # 流身份写进续传清单，画质或编码变了就不会误用旧的 .part 文件
+        identity = {
+            'bvid': self.bvid,
+            'cid': self.cid,
+            'track': kind,
+            'quality': stream.get('id'),
+            'codec': stream.get('codecs', '')
+        }
+        label = "视频流" if kind == 'video' else "音频流"
+        self.status_update.emit(f"下载{label}（{describe_stream(stream)}）...")
+        self.download_stream(stream_urls(stream), filename, identity)
+        return None if self.should_cancel() else filename
+    
+    def choose_stream(self, download_info, kind):
+        video, audio = self.stream_policy.select(download_info['dash'])
+        stream = video if kind == 'video' else audio
+        if stream is None:
+            raise Exception("没有可下载的视频流" if kind == 'video' else "没有可下载的音频流")
+        return stream
+    
+    def download_durl(self, download_info, filename):
+        """下载单文件地址（第三方接口的结果），返回保存路径"""
+        if not download_info.get('durl'):
+            return None
+        identity = {
+            'bvid': self.bvid,
+            'cid': self.cid,
+            'track': 'durl',
+            'quality': download_info.get('quality')
+        }
+        self.status_update.emit("下载视频...")
+        self.download_stream(stream_urls(download_info['durl'][0]), filename, identity)
+        return None if self.should_cancel() else filename
+    
+    def start_muxer(self, download_info, video_path):
+        if 'dash' not in download_info:
+            return None
+        muxer = StreamingMuxer(video_path, connections=self.options.get('connections', DEFAULT_CONNECTIONS))
+        return muxer.start()
+    
+    def feed_muxer(self, download_info, muxer, kind):
+        if muxer is None:
+            return False
+        urls = stream_urls(self.choose_stream(download_info, kind))
+        spread = 1
+        if len(urls) > 1 and self.options.get('mirror_select', True):
+            urls, spread = select_mirrors(self.session, urls, STREAM_HEADERS)
+        self.status_update.emit("下载并合并音视频...")
+        return muxer.feed(
+            kind, urls, self.session, STREAM_HEADERS,
+            progress_callback=lambda downloaded, total: self.telemetry.update(self.job_key, kind, downloaded, total),
+            should_cancel=self.should_cancel,
+            should_pause=lambda: self.paused,
+            spread=spread,
+            throttle=self.bandwidth
+        )
+    
+    def finish_muxer(self, muxer, completed):
+        if muxer is None:
+            return
+        if not completed or self.should_cancel():
+            muxer.abort()
+            return
+        try:
+            muxer.finish()
+        except Exception as e:
+            raise Exception(f"合并音视频失败：{str(e)}")
+    
+    def merge_tracks(self, temp_video, temp_audio, video_path):
+        if not temp_video or not temp_audio or self.should_cancel():
+            return
+        
+        self.status_update.emit("合并音视频...")
+        self.merge_video_audio(temp_video, temp_audio, video_path)
+        
+        # 删除临时文件
+        try:
+            os.remove(temp_video)
+            os.remove(temp_audio)
+        except:
+            pass
     
     def get_video_info(self):
         url = f"https://api.bilibili.com/x/web-interface/view"
@@ -307,305 +661,302 @@ class DownloadThread(QThread):
         return data['data']
     
     def get_download_url(self):
+        if self.api_type in RACING_MODES:
+            # 同时向多个接口请求，先返回的有效结果（或画质最高的结果）胜出
+            sources = {'官方': self.get_official_url}
+            for api_type in THIRD_PARTY_APIS:
+                sources[api_type] = lambda api_type=api_type: self.get_third_party_url(api_type)
+            name, info = get_racer().resolve(sources, RACING_MODES[self.api_type])
+            self.status_update.emit(f"已通过「{name}」获取下载地址")
+            return info
         if self.api_type == "官方":
-            url = f"https://api.bilibili.com/x/player/playurl"
-            params = {
-                'bvid': self.bvid,
-                'cid': self.cid,
-                'qn': self.quality,
-                'fnval': 4048,  # 增加fnval值以支持更多格式
-                'fnver': 0,
-                'fourk': 1,
-                'platform': 'pc',
-                'high_quality': 1,
-                'otype': 'json',
-                'dolby': 1,  # 支持杜比视界
-                'hdr': 1,     # 支持HDR
-                '8k': 1       # 支持8K
-            }
-            headers = {
-                'Referer': f'https://www.bilibili.com/video/{self.bvid}',
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Origin': 'https://www.bilibili.com',
-                'Accept': '*/*',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Accept-Language': 'zh-CN,zh;q=0.9',
-                'Range': 'bytes=0-'
-            }
-            response = self.session.get(url, params=params, headers=headers)
-            data = response.json()
-            if data.get('code') != 0:
-                raise Exception(f"获取下载地址失败：{data.get('message', '未知错误')}")
-            return data['data']
-        else:
-            # 第三方接口实现
-            api_type = self.api_type
-            
-            try:
-                if api_type == "解析接口1":
-                    api_url = f"https://api.injahow.cn/bparse/?bv={self.bvid}&p=1&format=mp4&quality={self.quality}"
-                elif api_type == "RapidAPI":
-                    api_url = f"https://bilibili-video-api.p.rapidapi.com/video/{self.bvid}"
-                    headers = {
-                        'X-RapidAPI-Key': '在此填入你的RapidAPI密钥',
-                        'X-RapidAPI-Host': 'bilibili-video-api.p.rapidapi.com'
-                    }
-                elif api_type == "BiliAPI":
-                    api_url = f"https://bili-api.vercel.app/video/{self.bvid}"
-                
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Referer': f'https://www.bilibili.com/video/{self.bvid}'
-                }
-                
-                if api_type == "解析接口1":
-                    response = requests.get(api_url, headers=headers, verify=True)
-                    data = response.json()
-                    video_url = data.get('url', '')
-                elif api_type in ["RapidAPI", "BiliAPI"]:
-                    response = requests.get(api_url, headers=headers, verify=True)
-                    data = response.json()
-                    video_url = data.get('data', {}).get('playurl', '')
-                
-                if not video_url:
-                    raise Exception("无法获取视频地址")
-                
-                return {
-                    'durl': [{
-                        'url': video_url
-                    }]
-                }
-            except Exception as e:
-                raise Exception(f"第三方接口解析失败：{str(e)}")
+            return self.get_official_url()
+        return self.get_third_party_url(self.api_type)
     
-    def download_stream(self, url, filename):
+    def get_official_url(self):
+        url = f"https://api.bilibili.com/x/player/playurl"
+        params = {
+            'bvid': self.bvid,
+            'cid': self.cid,
+            'qn': self.quality,
+            'fnval': 4048,  # 增加fnval值以支持更多格式
+            'fnver': 0,
+            'fourk': 1,
+            'platform': 'pc',
+            'high_quality': 1,
+            'otype': 'json',
+            'dolby': 1,  # 支持杜比视界
+            'hdr': 1,     # 支持HDR
+            '8k': 1       # 支持8K
+        }
         headers = {
-            'Referer': 'https://www.bilibili.com',
+            'Referer': f'https://www.bilibili.com/video/{self.bvid}',
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Origin': 'https://www.bilibili.com',
+            'Accept': '*/*',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Accept-Language': 'zh-CN,zh;q=0.9',
             'Range': 'bytes=0-'
         }
         
-        response = self.session.get(url, stream=True, headers=headers)
-        total_size = int(response.headers.get('content-length', 0))
-        block_size = 1024 * 1024  # 1MB块大小
-        
-        # 立即发送总大小信息，确保UI显示总文件大小
-        self.progress_update.emit(0, total_size)
-        # 确保目录存在
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-        
-        downloaded_size = 0
-        last_update_time = time.time()
-        last_downloaded_size = 0
+        def request_playurl():
+            response = self.session.get(url, params=params, headers=headers)
+            data = response.json()
+            if data.get('code') != 0:
+                raise Exception(f"获取下载地址失败：{data.get('message', '未知错误')}")
+            return data['data']
         
-        try:
-            with open(filename, 'wb') as f:
-                for data in response.iter_content(block_size):
-                    if self.cancel:  # 检查是否取消下载
-                        return
-                    
-                    while self.paused:  # 暂停下载
-                        time.sleep(0.1)
-                        if self.cancel:  # 在暂停时检查是否取消
-                            return
-                    
-                    if data:  # 确保数据不为空
-                        downloaded_size += len(data)
-                        f.write(data)
-                        
-                        # 更新进度
-                        self.progress_update.emit(downloaded_size, total_size)
-                        
-                        # 计算下载速度
-                        current_time = time.time()
-                        if current_time - last_update_time >= 1.0:  # 每秒更新一次速度
-                            speed = (downloaded_size - last_downloaded_size) / (current_time - last_update_time)
-                            self.speed_update.emit(speed)
-                            
-                            last_update_time = current_time
-                            last_downloaded_size = downloaded_size
-        except Exception as e:
-            if not self.cancel:
-                raise e
+        # 流地址在 deadline 之前一直有效，重试和重新排队的任务直接复用
+        self.playurl_key = playurl_key(self.session, self.bvid, self.cid, self.quality, params['fnval'])
+        return get_playurl_cache().get_or_fetch(self.playurl_key, request_playurl)
     
-    def download_file(self, url, filename):
+    def get_third_party_url(self, api_type):
         try:
-            # 详细记录下载信息
-            self.status_update.emit(f"正在下载: {url}")
-            self.status_update.emit(f"保存到: {filename}")
-            
-            # 确保下载路径存在
-            try:
-                dir_path = os.path.dirname(filename)
-                self.status_update.emit(f"创建目录: {dir_path}")
-                os.makedirs(dir_path, exist_ok=True)
-                
-                # 验证目录是否成功创建
-                if not os.path.exists(dir_path):
-                    raise Exception(f"无法创建目录: {dir_path}")
-            except Exception as e:
-                self.status_update.emit(f"创建目录失败: {str(e)}")
-                raise Exception(f"创建保存目录失败: {str(e)}")
+            if api_type == "解析接口1":
+                api_url = f"https://api.injahow.cn/bparse/?bv={self.bvid}&p=1&format=mp4&quality={self.quality}"
+            elif api_type == "RapidAPI":
+                api_url = f"https://bilibili-video-api.p.rapidapi.com/video/{self.bvid}"
+                headers = {
+                    'X-RapidAPI-Key': '在此填入你的RapidAPI密钥',
+                    'X-RapidAPI-Host': 'bilibili-video-api.p.rapidapi.com'
+                }
+            elif api_type == "BiliAPI":
+                api_url = f"https://bili-api.vercel.app/video/{self.bvid}"
             
-            # 下载文件
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Referer': 'https://www.bilibili.com'
+                'Referer': f'https://www.bilibili.com/video/{self.bvid}'
             }
-            response = requests.get(url, headers=headers)
-            if response.status_code != 200:
-                raise Exception(f"下载失败，状态码：{response.status_code}")
-                
-            # 检查内容是否为JSON格式（针对字幕）
-            if url.endswith('.json') or 'subtitle_url' in url:
-                try:
-                    # 尝试解析JSON
-                    subtitle_data = response.json()
-                    self.status_update.emit(f"字幕数据解析成功，开始转换格式...")
-                    
-                    # 转换为SRT格式
-                    srt_content = self.convert_subtitle_to_srt(subtitle_data)
-                    
-                    # 使用utf-8编码保存字幕文件
-                    try:
-                        with open(filename, 'w', encoding='utf-8') as f:
-                            f.write(srt_content)
-                        
-                        # 验证文件是否成功保存
-                        if os.path.exists(filename):
-                            self.status_update.emit(f"字幕已成功保存到: {filename}")
-                        else:
-                            raise Exception(f"文件写入后未找到: {filename}")
-                        return
-                    except Exception as e:
-                        self.status_update.emit(f"字幕文件写入失败: {str(e)}")
-                        raise Exception(f"字幕文件写入失败: {str(e)}")
-                except json.JSONDecodeError as e:
-                    self.status_update.emit(f"字幕JSON解析失败：{str(e)}，原始内容：{response.text[:200]}")
-                    raise Exception(f"字幕JSON解析失败：{str(e)}")
-                except Exception as e:
-                    self.status_update.emit(f"字幕处理失败：{str(e)}")
-                    raise Exception(f"字幕处理失败：{str(e)}")
             
-            # 保存普通文件
-            try:
-                with open(filename, 'wb') as f:
-                    f.write(response.content)
-                
-                # 验证文件是否成功保存
-                if os.path.exists(filename):
-                    self.status_update.emit(f"文件已成功保存到: {filename}")
-                else:
-                    raise Exception(f"文件写入后未找到: {filename}")
-            except Exception as e:
-                self.status_update.emit(f"文件写入失败: {str(e)}")
-                raise Exception(f"文件写入失败: {str(e)}")
-        except Exception as e:
-            self.status_update.emit(f"下载文件失败: {str(e)}")
-            raise Exception(f"下载文件失败: {str(e)}")
-    
-    def convert_subtitle_to_srt(self, subtitle_data):
-        """将B站字幕JSON转换为SRT格式"""
-        try:
-            srt_content = ""
-            index = 1
+            if api_type == "解析接口1":
+                response = public_session().get(api_url, headers=headers, verify=True)
+                data = response.json()
+                video_url = data.get('url', '')
+            elif api_type in ["RapidAPI", "BiliAPI"]:
+                response = public_session().get(api_url, headers=headers, verify=True)
+                data = response.json()
+                video_url = data.get('data', {}).get('playurl', '')
             
-            # 检查字幕数据格式
-            if isinstance(subtitle_data, dict):
-                if 'body' in subtitle_data:
-                    subtitles = subtitle_data['body']
-                elif 'data' in subtitle_data and isinstance(subtitle_data['data'], dict):
-                    subtitles = subtitle_data['data'].get('body', [])
-                else:
-                    self.status_update.emit(f"字幕数据结构：{json.dumps(subtitle_data, ensure_ascii=False)[:200]}")
-                    raise Exception("无法识别的字幕数据格式")
-            elif isinstance(subtitle_data, list):
-                subtitles = subtitle_data
-            else:
-                self.status_update.emit(f"未知的字幕数据类型：{type(subtitle_data)}")
-                raise Exception("未知的字幕格式")
+            if not video_url:
+                raise Exception("无法获取视频地址")
             
-            if not subtitles:
-                raise Exception("字幕内容为空")
-                
-            for item in subtitles:
-                if not isinstance(item, dict):
-                    self.status_update.emit(f"无效的字幕条目：{item}")
-                    continue
-                    
-                try:
-                    start_time = float(item.get('from', 0))
-                    end_time = float(item.get('to', 0))
-                    content = item.get('content', '').strip()
-                    
-                    if not content:
-                        continue
-                    
-                    # 转换时间格式 (秒 -> HH:MM:SS,mmm)
-                    start_formatted = self.format_time(start_time)
-                    end_formatted = self.format_time(end_time)
-                    
-                    # 添加SRT条目
-                    srt_content += f"{index}\n{start_formatted} --> {end_formatted}\n{content}\n\n"
-                    index += 1
-                except Exception as e:
-                    self.status_update.emit(f"处理字幕条目时出错：{str(e)}，条目内容：{item}")
-                    continue
-            
-            if not srt_content:
-                raise Exception("转换后的字幕内容为空")
-                
-            return srt_content
+            return {
+                'durl': [{
+                    'url': video_url
+                }]
+            }
         except Exception as e:
-            raise Exception(f"字幕转换失败：{str(e)}")
+            raise Exception(f"第三方接口解析失败：{str(e)}")
     
-    def format_time(self, seconds):
-        """将秒转换为SRT时间格式 HH:MM:SS,mmm"""
-        hours = int(seconds / 3600)
-        minutes = int((seconds % 3600) / 60)
-        seconds = seconds % 60
-        milliseconds = int((seconds - int(seconds)) * 1000)
+    def download_stream(self, url, filename, identity=None):
+        headers = STREAM_HEADERS
+        connections = self.options.get('connections', DEFAULT_CONNECTIONS)
+        
+        # url 可以是主地址加备用地址的列表，先测速挑出最快的节点
+        spread = 1
+        if not isinstance(url, str) and len(url) > 1 and self.options.get('mirror_select', True):
+            url, spread = select_mirrors(self.session, url, headers)
         
-        return f"{hours:02d}:{minutes:02d}:{int(seconds):02d},{milliseconds:03d}"
+        def on_progress(downloaded_size, total_size):
+            # 只更新计数，界面由 TelemetryHub 按固定频率刷新
+            self.telemetry.update(self.job_key, filename, downloaded_size, total_size)
+        
+        try:
+            if self.options.get('engine') == '异步':
+                from bilidown.async_engine import get_engine
+                
+                # 异步引擎在共享的事件循环里传输，这里只等待结果
+                get_engine().download(
+                    url, filename,
+                    progress_callback=on_progress,
+                    should_cancel=self.should_cancel,
+                    should_pause=lambda: self.paused,
+                    identity=identity,
+                    connections=connections,
+                    spread=spread,
+                    throttle=self.bandwidth
+                )
+            else:
+                downloader = SegmentedDownloader(self.session, headers, connections, throttle=self.bandwidth)
+                downloader.download(
+                    url, filename,
+                    progress_callback=on_progress,
+                    should_cancel=self.should_cancel,
+                    should_pause=lambda: self.paused,
+                    identity=identity,
+                    spread=spread
+                )
+        except Exception as e:
+            if not self.should_cancel():
+                raise e
     
     def merge_video_audio(self, video_file, audio_file, output_file):
+        from bilidown.mp4_remux import merge_streams
+        
         try:
-            import subprocess
-            import os
-            import sys
-            
-            # 获取程序运行目录
-            if getattr(sys, 'frozen', False):
-                # 如果是打包后的exe，使用实际的程序运行目录
-                base_path = os.path.dirname(sys.executable)
-            else:
-                # 如果是开发环境
-                base_path = os.path.dirname(os.path.abspath(__file__))
-            
-            # 在程序目录中查找ffmpeg.exe
-            ffmpeg_path = os.path.join(base_path, 'ffmpeg.exe')
-            if not os.path.exists(ffmpeg_path):
-                # 如果在程序目录没找到，尝试在临时目录查找（用于处理某些打包情况）
-                if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
-                    temp_path = os.path.join(sys._MEIPASS, 'ffmpeg.exe')
-                    if os.path.exists(temp_path):
-                        ffmpeg_path = temp_path
-                    else:
-                        raise Exception("找不到ffmpeg.exe，请确保程序目录中包含ffmpeg.exe文件")
-                else:
-                    raise Exception("找不到ffmpeg.exe，请确保程序目录中包含ffmpeg.exe文件")
-            
-            command = [
-                ffmpeg_path,
-                '-i', video_file,
-                '-i', audio_file,
-                '-c', 'copy',
-                output_file
-            ]
-            subprocess.run(command, check=True)
+            merge_streams(video_file, audio_file, output_file, self.options.get('merge_mode', 'auto'))
         except Exception as e:
             raise Exception(f"合并音视频失败：{str(e)}")
 
+class BatchDownloadThread(QThread):
+    """批量下载多个分P：每个分P是一个下载任务，由有并发上限的队列执行"""
+    telemetry_update = pyqtSignal(object)
+    status_update = pyqtSignal(str)
+    download_complete = pyqtSignal()
+    download_error = pyqtSignal(str)
+    
+    def __init__(self, session, jobs, quality, download_path, options, api_type, concurrency, total=None):
+        super().__init__()
+        self.session = session
+        self.jobs = jobs  # [(bvid, cid, 名称)]，也可以是 VideoIndex.jobs() 这样的生成器，此时需给出 total
+        self.total = len(jobs) if total is None else total
+        self.quality = quality
+        self.download_path = download_path
+        self.options = options
+        self.api_type = api_type
+        self.concurrency = concurrency
+        self.lock = threading.Lock()
+        self.active_threads = []
+        # 所有分P共用一个进度汇总，合并后按固定频率推送给界面
+        self.telemetry = TelemetryHub()
+        self.telemetry.subscribe(self.telemetry_update.emit)
+        self._paused = False
+        self._cancel = False
+    
+    @property
+    def paused(self):
+        return self._paused
+    
+    @paused.setter
+    def paused(self, value):
+        # 暂停和取消需要同步给正在运行的每个分P任务
+        with self.lock:
+            self._paused = value
+            for thread in self.active_threads:
+                thread.paused = value
+    
+    @property
+    def cancel(self):
+        return self._cancel
+    
+    @cancel.setter
+    def cancel(self, value):
+        with self.lock:
+            self._cancel = value
+            for thread in self.active_threads:
+                thread.cancel = value
+        if value and hasattr(self, 'queue'):
+            self.queue.cancel_pending()
+    
+    def run(self):
+        # 所有任务共用一个会话，连接池要能容纳全部并发连接
+        connections = self.options.get('connections', DEFAULT_CONNECTIONS)
+        mount_pool(self.session, self.concurrency * (connections + 2))
+        
+        self.queue = JobQueue(self.concurrency)
+        total = self.total
+        failures = []
+        jobs = iter(self.jobs)
+        exhausted = False
+        self.telemetry.start()
+        
+        last_report = 0
+        while True:
+            if not exhausted:
+                exhausted = self.feed(jobs, failures)
+            stats = self.queue.stats()
+            finished = stats['done'] + stats['failed'] + stats['cancelled']
+            if time.time() - last_report >= 1.0 or (exhausted and finished == stats['total']):
+                self.status_update.emit(
+                    f"批量下载：已完成 {stats['done']}/{total}，进行中 {stats['running']}，失败 {stats['failed']}")
+                last_report = time.time()
+            if exhausted and finished == stats['total']:
+                break
+            time.sleep(0.2)
+        self.queue.shutdown()
+        self.telemetry.stop()
+        
+        if self.cancel:
+            self.status_update.emit("下载已取消")
+        elif failures:
+            self.download_error.emit(f"{len(failures)} 个分P下载失败：\n" + "\n".join(failures[:10]))
+        else:
+            self.status_update.emit(f"批量下载完成，共 {total} 个分P")
+            self.download_complete.emit()
+    
+    def feed(self, jobs, failures):
+        """逐步提交任务，队列中等待的任务保持在并发数的两倍；任务提交完或已取消时返回 True
+        
+        整个收藏夹或UP主空间可能有上万个分P，不一次性为全部任务创建 Future。
+        """
+        pending = self.queue.stats()['pending']
+        while pending < self.concurrency * 2:
+            if self.cancel:
+                return True
+            job = next(jobs, None)
+            if job is None:
+                return True
+            bvid, cid, name = job
+            self.queue.submit((bvid, cid), self.run_job, bvid, cid, name, failures)
+            pending += 1
+        return self.cancel
+    
+    def run_job(self, bvid, cid, name, failures):
+        if self.cancel:
+            return False
+        thread = DownloadThread(self.session, bvid, cid, self.quality,
+                                self.download_path, self.options, self.api_type,
+                                telemetry=self.telemetry, job_key=(bvid, cid))
+        self.telemetry.register((bvid, cid), name)
+        result = {'error': None}
+        
+        def on_error(message):
+            result['error'] = message
+        
+        # 在当前工作线程里直接执行 DownloadThread.run，信号直接回调不经过事件循环
+        thread.download_error.connect(on_error, Qt.ConnectionType.DirectConnection)
+        
+        with self.lock:
+            thread.paused = self._paused
+            thread.cancel = self._cancel
+            self.active_threads.append(thread)
+        try:
+            thread.run()
+        finally:
+            with self.lock:
+                self.active_threads.remove(thread)
+            # 结束的任务并入合计，快照里只保留正在下载的任务
+            self.telemetry.retire((bvid, cid))
+        
+        if result['error']:
+            failures.append(f"{name}：{result['error']}")
+            return False
+        return not thread.cancel
+
+class ResolveThread(QThread):
+    """在后台解析UP主空间、收藏夹或稍后再看列表"""
+    status_update = pyqtSignal(str)
+    resolve_complete = pyqtSignal(object)  # VideoIndex
+    resolve_error = pyqtSignal(str)
+    
+    def __init__(self, session, source):
+        super().__init__()
+        self.session = session
+        self.source = source
+        self.cancel = False
+    
+    def run(self):
+        from bilidown.bulk_resolver import BulkResolver
+        
+        try:
+            resolver = BulkResolver(self.session, progress_callback=self.status_update.emit,
+                                    should_cancel=lambda: self.cancel)
+            index = resolver.resolve(self.source)
+            if not self.cancel:
+                self.resolve_complete.emit(index)
+        except Exception as e:
+            self.resolve_error.emit(str(e))
+
 class SubtitleSelectDialog(QDialog):
     def __init__(self, subtitles, parent=None):
         super().__init__(parent)
@@ -701,6 +1052,80 @@ class SubtitleSelectDialog(QDialog):
         self.selected_subtitles = []
         super().reject()
 
+class PageSelectDialog(QDialog):
+    def __init__(self, pages, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("选择要下载的分P")
+        self.resize(500, 500)
+        self.setMinimumSize(400, 300)
+        
+        self.selected_pages = []
+        self.pages = pages
+        
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(20, 20, 20, 20)
+        layout.setSpacing(15)
+        
+        # 添加标题
+        title_label = QLabel(f"请选择要下载的分P（共 {len(pages)} 个）")
+        title_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        title_label.setStyleSheet("font-size: 18px; font-weight: bold; margin-bottom: 10px;")
+        layout.addWidget(title_label)
+        
+        # 添加全选/取消全选按钮
+        select_layout = QHBoxLayout()
+        self.select_all_btn = QPushButton("全选")
+        self.select_all_btn.clicked.connect(self.select_all)
+        self.deselect_all_btn = QPushButton("取消全选")
+        self.deselect_all_btn.clicked.connect(self.deselect_all)
+        select_layout.addWidget(self.select_all_btn)
+        select_layout.addWidget(self.deselect_all_btn)
+        select_layout.addStretch()
+        layout.addLayout(select_layout)
+        
+        # 分P可能有上百个，用列表控件代替逐个复选框
+        self.page_list = QListWidget()
+        for p in pages:
+            item = QListWidgetItem(f"{p['page']}. {p['part']}")
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(Qt.CheckState.Checked)  # 默认全选
+            self.page_list.addItem(item)
+        layout.addWidget(self.page_list)
+        
+        # 添加按钮
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.clicked.connect(self.reject)
+        
+        self.confirm_btn = QPushButton("确定")
+        self.confirm_btn.setObjectName("accentButton")
+        self.confirm_btn.clicked.connect(self.accept)
+        
+        button_layout.addWidget(self.cancel_btn)
+        button_layout.addWidget(self.confirm_btn)
+        layout.addLayout(button_layout)
+    
+    def select_all(self):
+        for i in range(self.page_list.count()):
+            self.page_list.item(i).setCheckState(Qt.CheckState.Checked)
+    
+    def deselect_all(self):
+        for i in range(self.page_list.count()):
+            self.page_list.item(i).setCheckState(Qt.CheckState.Unchecked)
+    
+    def accept(self):
+        self.selected_pages = [
+            self.pages[i] for i in range(self.page_list.count())
+            if self.page_list.item(i).checkState() == Qt.CheckState.Checked
+        ]
+        super().accept()
+    
+    def reject(self):
+        self.selected_pages = []
+        super().reject()
+
 class QRCodeDialog(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent, Qt.WindowType.Window)
@@ -818,15 +1243,29 @@ class BilibiliDownloaderGUI(QMainWindow):
         super().__init__()
         
         # 初始化会话
-        self.session = requests.Session()
+        self.session = create_session()
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         self.session.headers.update(self.headers)
+        # 视频信息、播放器信息和登录状态接口走缓存，重复查询不再请求网络
+        install_api_cache(self.session)
+        # 所有接口请求共用令牌桶限速，触发412风控时自动降速
+        install_rate_limiter(self.session)
         self.is_logged_in = False
         
         self.cookies_file = 'bilibili_cookies.json'
-        self.load_cookies()
+        has_cookies = self.load_cookies()
+        # 界面线程不做网络请求：视频信息、字幕列表、登录状态和头像都交给线程池，结果经信号送回
+        self.requests = RequestExecutor(self)
+        self.requested_bvid = None
+        # 界面线程卡顿超过50ms时输出卡顿时长和当时的调用栈
+        self.watchdog = StallWatchdog()
+        self.watchdog_timer = QTimer(self)
+        self.watchdog_timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.watchdog_timer.timeout.connect(self.watchdog.beat)
+        self.watchdog.start()
+        self.watchdog_timer.start(int(self.watchdog.interval * 1000))
         
         # 初始化UI
         self.setWindowTitle("BiliDown-GUI v1.1.5-beta")
@@ -840,22 +1279,40 @@ class BilibiliDownloaderGUI(QMainWindow):
         self.version_checker = VersionChecker()
         self.version_checker.version_available.connect(self.on_update_available)
         self.version_checker.check_error.connect(self.on_update_check_error)
+        
+        # 登录状态等事件循环开始、窗口显示之后再在后台确认
+        if has_cookies:
+            self.login_status_label.setText("正在检查登录状态...")
+            QTimer.singleShot(0, self.refresh_user_info)
     
     def load_cookies(self):
+        """只读取本地保存的Cookie，是否仍然有效由 refresh_user_info 在后台确认"""
         try:
             if os.path.exists(self.cookies_file):
                 with open(self.cookies_file, 'r') as f:
                     cookies = json.load(f)
                     self.session.cookies.update(cookies)
-                    response = self.session.get('https://api.bilibili.com/x/web-interface/nav')
-                    if response.json().get('data', {}).get('isLogin', False):
-                        self.is_logged_in = True
-                        self.nav_data = response.json()
-                        return True
+                    return True
         except Exception:
             pass
         return False
     
+    def refresh_user_info(self, nav_data=None):
+        self.requests.submit('user_info', lambda: fetch_user_info(self.session, nav_data), self.on_user_info_ready)
+    
+    def on_user_info_ready(self, result):
+        if result is None:
+            self.on_login_expired()
+            return
+        nav_data, face = result
+        self.is_logged_in = True
+        self.nav_data = nav_data
+        self.update_user_info(nav_data, face)
+    
+    def on_login_expired(self):
+        if not self.is_logged_in:
+            self.login_status_label.setText("未登录")
+    
     def save_cookies(self):
         try:
             cookies = requests.utils.dict_from_cookiejar(self.session.cookies)
@@ -925,6 +1382,13 @@ class BilibiliDownloaderGUI(QMainWindow):
         self.page_combo = QComboBox()
         self.page_combo.setMinimumWidth(400)
         page_layout.addWidget(self.page_combo)
+        self.batch_button = QPushButton("批量下载分P")
+        self.batch_button.clicked.connect(self.start_batch_download)
+        page_layout.addWidget(self.batch_button)
+        self.resolve_button = QPushButton("批量解析列表")
+        self.resolve_button.setToolTip("下载UP主全部投稿、整个收藏夹或稍后再看列表")
+        self.resolve_button.clicked.connect(self.start_resolve)
+        page_layout.addWidget(self.resolve_button)
         video_card.layout.addLayout(page_layout)
         
         main_layout.addWidget(video_card)
@@ -953,13 +1417,23 @@ class BilibiliDownloaderGUI(QMainWindow):
         self.video_check.setChecked(True)
         self.audio_check = QCheckBox("音频")
         self.audio_check.setChecked(True)
-        self.subtitle_check = QCheckBox("字幕(待开发)")
-        self.subtitle_check.setEnabled(False)
+        self.subtitle_check = QCheckBox("字幕")
+        self.subtitle_format_combo = QComboBox()
+        for fmt, name in SUBTITLE_FORMATS.items():
+            self.subtitle_format_combo.addItem(name, fmt)
         self.cover_check = QCheckBox("封面")
+        self.danmaku_check = QCheckBox("弹幕")
+        self.highlights_combo = QComboBox()
+        self.highlights_combo.setToolTip("按弹幕密度和关键词找出最热闹的几段，只下载这几段")
+        for count in HIGHLIGHT_CHOICES:
+            self.highlights_combo.addItem(f"高光 {count} 段" if count else "完整视频", count)
         options_layout.addWidget(self.video_check)
         options_layout.addWidget(self.audio_check)
         options_layout.addWidget(self.subtitle_check)
+        options_layout.addWidget(self.subtitle_format_combo)
         options_layout.addWidget(self.cover_check)
+        options_layout.addWidget(self.danmaku_check)
+        options_layout.addWidget(self.highlights_combo)
         options_layout.addStretch()
         settings_card.layout.addLayout(options_layout)
         
@@ -982,6 +1456,23 @@ class BilibiliDownloaderGUI(QMainWindow):
         ])
         self.quality_combo.setCurrentIndex(6)  # 默认1080P
         quality_layout.addWidget(self.quality_combo)
+        
+        # 流选择策略：同画质下 HEVC/AV1 体积更小，码率上限用于节省流量
+        quality_layout.addWidget(QLabel("编码："))
+        self.codec_combo = QComboBox()
+        for text, codec in CODEC_CHOICES.items():
+            self.codec_combo.addItem(text, codec)
+        quality_layout.addWidget(self.codec_combo)
+        quality_layout.addWidget(QLabel("码率上限："))
+        self.bandwidth_combo = QComboBox()
+        self.bandwidth_combo.addItem("不限", None)
+        for mbps in (2, 4, 8, 16):
+            self.bandwidth_combo.addItem(f"{mbps} Mbps", mbps * 1000 * 1000)
+        quality_layout.addWidget(self.bandwidth_combo)
+        self.smallest_check = QCheckBox("同画质取最小体积")
+        quality_layout.addWidget(self.smallest_check)
+        self.hires_audio_check = QCheckBox("无损/杜比音频优先")
+        quality_layout.addWidget(self.hires_audio_check)
         quality_layout.addStretch()
         settings_card.layout.addLayout(quality_layout)
         
@@ -989,11 +1480,64 @@ class BilibiliDownloaderGUI(QMainWindow):
         api_layout = QHBoxLayout()
         api_layout.addWidget(QLabel("接口选择："))
         self.api_combo = QComboBox()
-        self.api_combo.addItems(["官方", "解析接口1", "RapidAPI", "BiliAPI"])
+        self.api_combo.addItems(["官方", "解析接口1", "RapidAPI", "BiliAPI"] + list(RACING_MODES))
         api_layout.addWidget(self.api_combo)
+        
+        # 每个流的并发连接数
+        api_layout.addWidget(QLabel("连接数："))
+        self.connections_combo = QComboBox()
+        self.connections_combo.addItems(["1", "2", "4", "8", "16"])
+        self.connections_combo.setCurrentText(str(DEFAULT_CONNECTIONS))
+        api_layout.addWidget(self.connections_combo)
+        
+        # 批量下载时同时进行的分P数
+        api_layout.addWidget(QLabel("同时下载："))
+        self.concurrency_combo = QComboBox()
+        self.concurrency_combo.addItems(["1", "2", "3", "4", "6", "8"])
+        self.concurrency_combo.setCurrentText(str(DEFAULT_CONCURRENCY))
+        api_layout.addWidget(self.concurrency_combo)
+        
+        # 下载引擎：多线程分段下载或共享事件循环的异步下载
+        api_layout.addWidget(QLabel("下载引擎："))
+        self.engine_combo = QComboBox()
+        self.engine_combo.addItems(["多线程", "异步"])
+        api_layout.addWidget(self.engine_combo)
+        
+        # 测速选择CDN节点，节点出错时自动切换到备用地址
+        self.mirror_check = QCheckBox("自动选择CDN节点")
+        self.mirror_check.setChecked(True)
+        api_layout.addWidget(self.mirror_check)
+        
+        # 边下载边合并，省去临时文件的写入和读取（需要支持命名管道的系统）
+        self.stream_mux_check = QCheckBox("边下边合并")
+        self.stream_mux_check.setEnabled(StreamingMuxer.supported())
+        api_layout.addWidget(self.stream_mux_check)
+        
+        # 合并方式：内置合并不需要ffmpeg，不支持的文件自动改用ffmpeg
+        api_layout.addWidget(QLabel("合并方式："))
+        self.merge_mode_combo = QComboBox()
+        self.merge_mode_combo.addItem("自动", 'auto')
+        self.merge_mode_combo.addItem("内置", 'native')
+        self.merge_mode_combo.addItem("ffmpeg", 'ffmpeg')
+        api_layout.addWidget(self.merge_mode_combo)
         api_layout.addStretch()
         settings_card.layout.addLayout(api_layout)
         
+        # 总限速：所有同时进行的下载共用，各任务平分；可以按时段设置不同的限速，修改后立即生效
+        limit_layout = QHBoxLayout()
+        limit_layout.addWidget(QLabel("总限速："))
+        self.rate_limit_combo = QComboBox()
+        for text in ("不限", "512K", "1M", "2M", "5M", "10M", "20M"):
+            self.rate_limit_combo.addItem(text if text == "不限" else f"{text}B/s", parse_rate(text))
+        self.rate_limit_combo.currentIndexChanged.connect(self.apply_rate_limit)
+        limit_layout.addWidget(self.rate_limit_combo)
+        limit_layout.addWidget(QLabel("限速时段："))
+        self.rate_schedule_entry = QLineEdit()
+        self.rate_schedule_entry.setPlaceholderText("如 09:00-18:00=2M, 18:00-23:00=8M，其余时间按总限速")
+        self.rate_schedule_entry.editingFinished.connect(self.apply_rate_limit)
+        limit_layout.addWidget(self.rate_schedule_entry)
+        settings_card.layout.addLayout(limit_layout)
+        
         main_layout.addWidget(settings_card)
         
         # 下载控制卡片
@@ -1039,14 +1583,13 @@ class BilibiliDownloaderGUI(QMainWindow):
         
         # 初始化下载线程
         self.download_thread = None
+        self.cancelled_threads = []  # 已取消、还在退出中的下载线程，退出前保持引用
+        self.resolving = False  # 批量解析列表进行中
+        self.video_pages = []
         self.login_thread = None
         self.downloading = False
         self.paused = False
         
-        # 更新用户信息
-        if self.is_logged_in:
-            self.update_user_info(self.nav_data)
-        
     def create_menu(self):
         menubar = self.menuBar()
         help_menu = menubar.addMenu('帮助')
@@ -1166,7 +1709,7 @@ class BilibiliDownloaderGUI(QMainWindow):
         pixmap.fill(QColor('#f0f0f0'))
         self.avatar_label.setPixmap(pixmap)
     
-    def update_user_info(self, nav_data):
+    def update_user_info(self, nav_data, face=b''):
         try:
             uname = nav_data['data'].get('uname', '')
             level = nav_data['data'].get('level_info', {}).get('current_level', 0)
@@ -1174,47 +1717,51 @@ class BilibiliDownloaderGUI(QMainWindow):
             self.user_level_label.setText(f"等级：LV{level}")
             self.login_button.setText("退出登录")
             
-            face_url = nav_data['data'].get('face', '')
-            if face_url:
-                response = requests.get(face_url)
-                avatar_image = Image.open(BytesIO(response.content))
-                avatar_image = avatar_image.resize((40, 40))
-                
-                # 转换为QPixmap
-                bio = BytesIO()
-                avatar_image.save(bio, format='PNG')
-                pixmap = QPixmap()
-                pixmap.loadFromData(bio.getvalue())
-                self.avatar_label.setPixmap(pixmap)
+            # 头像由 fetch_user_info 在线程池中经图片服务缩成小图，这里只解码一张很小的 PNG
+            pixmap = QPixmap()
+            if face and pixmap.loadFromData(face):
+                self.avatar_label.setPixmap(pixmap.scaled(
+                    40, 40, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
         except Exception as e:
             print(f"更新用户信息失败：{str(e)}")
     
     def on_url_change(self):
         text = self.bv_entry.text().strip()
-        if 'bilibili.com' in text:
-            bv_match = re.search(r'BV\w+', text)
-            if bv_match:
-                bv_number = bv_match.group()
-                self.bv_entry.setText(bv_number)
-                self.update_page_list(bv_number)
+        bv_match = BVID_PATTERN.search(text)
+        if not bv_match:
+            return
+        bv_number = bv_match.group()
+        if bv_number != text:
+            self.bv_entry.setText(bv_number)  # 会再次触发本方法
+            return
+        if bv_number != self.requested_bvid:
+            self.update_page_list(bv_number)
     
     def update_page_list(self, bvid):
-        try:
-            self.status_label.setText("获取视频信息...")
-            video_info = self.get_video_info(bvid)
-            if 'pages' in video_info:
-                pages = video_info['pages']
-                self.page_combo.clear()
-                for p in pages:
-                    self.page_combo.addItem(f"{p['page']}. {p['part']}", p['cid'])
-                self.status_label.setText("")
-        except Exception as e:
-            self.status_label.setText(f"获取分P信息失败：{str(e)}")
+        """在后台获取分P列表；输入新的BV号时，上一个还没返回的请求被取代"""
+        self.requested_bvid = bvid
+        self.status_label.setText("获取视频信息...")
+        self.requests.submit('video_info', lambda: self.get_video_info(bvid),
+                             self.on_video_info, self.on_video_info_error)
+    
+    def on_video_info(self, video_info):
+        if 'pages' in video_info:
+            pages = video_info['pages']
+            self.video_pages = pages
+            self.page_combo.clear()
+            for p in pages:
+                self.page_combo.addItem(f"{p['page']}. {p['part']}", p['cid'])
+            self.status_label.setText("")
+    
+    def on_video_info_error(self, error):
+        self.requested_bvid = None  # 允许重新输入同一个BV号重试
+        self.status_label.setText(f"获取分P信息失败：{error}")
     
     def get_video_info(self, bvid):
+        """在 RequestExecutor 的线程池中调用"""
         url = f"https://api.bilibili.com/x/web-interface/view"
         params = {'bvid': bvid}
-        response = self.session.get(url, params=params)
+        response = self.session.get(url, params=params, timeout=15)
         data = response.json()
         if data.get('code') != 0:
             raise Exception(f"获取视频信息失败：{data.get('message', '未知错误')}")
@@ -1249,6 +1796,7 @@ class BilibiliDownloaderGUI(QMainWindow):
         self.is_logged_in = True
         self.save_cookies()
         self.update_user_info(nav_data)
+        self.refresh_user_info(nav_data)  # 后台下载头像
         self.login_button.setEnabled(True)
         self.status_label.setText("登录成功！")
         if hasattr(self, 'qr_dialog') and self.qr_dialog:
@@ -1268,6 +1816,17 @@ class BilibiliDownloaderGUI(QMainWindow):
         self.qr_dialog.qr_label.setPixmap(qr_pixmap)
         self.qr_dialog.show()
     
+    def apply_rate_limit(self):
+        schedule = None
+        text = self.rate_schedule_entry.text().strip()
+        if text:
+            try:
+                schedule = Schedule.parse(text)
+            except ValueError as e:
+                self.status_label.setText(f"限速时段格式错误：{str(e)}")
+                return
+        get_shaper().configure(self.rate_limit_combo.currentData(), schedule)
+    
     def choose_download_path(self):
         path = QFileDialog.getExistingDirectory(self, "选择下载目录", self.path_entry.text())
         if path:
@@ -1280,6 +1839,27 @@ class BilibiliDownloaderGUI(QMainWindow):
         else:
             QMessageBox.warning(self, "提示", "下载文件夹不存在！")
     
+    def collect_options(self):
+        """界面上的下载选项，单个下载和批量下载共用"""
+        return {
+            'video': self.video_check.isChecked(),
+            'audio': self.audio_check.isChecked(),
+            'subtitle': self.subtitle_check.isChecked(),
+            'subtitle_format': self.subtitle_format_combo.currentData(),
+            'cover': self.cover_check.isChecked(),
+            'danmaku': self.danmaku_check.isChecked(),
+            'highlights': self.highlights_combo.currentData(),
+            'connections': int(self.connections_combo.currentText()),
+            'engine': self.engine_combo.currentText(),
+            'mirror_select': self.mirror_check.isChecked(),
+            'stream_mux': self.stream_mux_check.isChecked(),
+            'merge_mode': self.merge_mode_combo.currentData(),
+            'codec': self.codec_combo.currentData(),
+            'max_bandwidth': self.bandwidth_combo.currentData(),
+            'smallest': self.smallest_check.isChecked(),
+            'hires_audio': self.hires_audio_check.isChecked()
+        }
+    
     def start_download(self):
         bvid = self.bv_entry.text().strip()
         if not bvid:
@@ -1299,44 +1879,60 @@ class BilibiliDownloaderGUI(QMainWindow):
         quality = int(quality_text.split()[0])
         
         # 获取下载选项
-        options = {
-            'video': self.video_check.isChecked(),
-            'audio': self.audio_check.isChecked(),
-            'subtitle': self.subtitle_check.isChecked(),
-            'cover': self.cover_check.isChecked()
-        }
+        options = self.collect_options()
         
-        # 如果选择了下载字幕，先获取字幕列表并让用户选择
+        # 如果选择了下载字幕，先在后台获取字幕列表，返回后再让用户选择
         if options['subtitle']:
-            try:
-                self.status_label.setText("获取字幕信息...")
-                subtitle_url = f"https://api.bilibili.com/x/player/v2?cid={cid}&bvid={bvid}"
-                subtitle_response = self.session.get(subtitle_url)
-                subtitle_data = subtitle_response.json()
-                
-                # 检查是否有字幕
-                subtitles = subtitle_data.get('data', {}).get('subtitle', {}).get('subtitles', [])
-                
-                if not subtitles:
-                    self.status_label.setText("该视频没有字幕")
+            self.status_label.setText("获取字幕信息...")
+            # 等待字幕列表期间不能开始其他下载，否则回调会覆盖正在进行的任务
+            self.set_download_enabled(False)
+            # 字幕列表包含AI生成的字幕（语言代码以 ai- 开头）
+            self.requests.submit('subtitles', lambda: list_subtitles(self.session, bvid, cid),
+                                 lambda subtitles: self.on_subtitles_listed(bvid, cid, quality, options, subtitles),
+                                 lambda error: self.on_subtitles_error(bvid, cid, quality, options, error))
+            return
+        self.launch_download(bvid, cid, quality, options)
+    
+    def set_download_enabled(self, enabled):
+        """开始下载的几个入口同时启用或禁用，下载进行中不能再开始另一个下载"""
+        self.download_button.setEnabled(enabled)
+        self.batch_button.setEnabled(enabled)
+        self.resolve_button.setEnabled(enabled and not self.resolving)
+    
+    def download_active(self):
+        return self.download_thread is not None and self.download_thread.isRunning()
+    
+    def on_subtitles_listed(self, bvid, cid, quality, options, subtitles):
+        if self.download_active():
+            return  # 期间已经开始了其他下载，放弃这次单独下载
+        if not subtitles:
+            self.status_label.setText("该视频没有字幕")
+            options['subtitle'] = False
+        else:
+            # 显示字幕选择对话框
+            subtitle_dialog = SubtitleSelectDialog(subtitles, self)
+            if subtitle_dialog.exec() == QDialog.DialogCode.Accepted:
+                selected_subtitles = subtitle_dialog.selected_subtitles
+                # 如果用户没有选择任何字幕，则不下载字幕
+                if not selected_subtitles:
                     options['subtitle'] = False
                 else:
-                    # 显示字幕选择对话框
-                    subtitle_dialog = SubtitleSelectDialog(subtitles, self)
-                    if subtitle_dialog.exec() == QDialog.DialogCode.Accepted:
-                        selected_subtitles = subtitle_dialog.selected_subtitles
-                        # 如果用户没有选择任何字幕，则不下载字幕
-                        if not selected_subtitles:
-                            options['subtitle'] = False
-                        else:
-                            options['selected_subtitles'] = selected_subtitles
-                    else:
-                        # 用户取消了选择，不下载字幕
-                        options['subtitle'] = False
-            except Exception as e:
-                self.status_label.setText(f"获取字幕信息失败: {str(e)}")
+                    options['selected_subtitles'] = selected_subtitles
+            else:
+                # 用户取消了选择，不下载字幕
                 options['subtitle'] = False
-        
+            if self.download_active():
+                return
+        self.launch_download(bvid, cid, quality, options)
+    
+    def on_subtitles_error(self, bvid, cid, quality, options, error):
+        if self.download_active():
+            return
+        self.status_label.setText(f"获取字幕信息失败: {error}")
+        options['subtitle'] = False
+        self.launch_download(bvid, cid, quality, options)
+    
+    def launch_download(self, bvid, cid, quality, options):
         # 获取下载路径
         download_path = self.path_entry.text()
         
@@ -1344,7 +1940,7 @@ class BilibiliDownloaderGUI(QMainWindow):
         api_type = self.api_combo.currentText()
         
         # 禁用下载按钮，启用暂停和取消按钮
-        self.download_button.setEnabled(False)
+        self.set_download_enabled(False)
         self.pause_button.setEnabled(True)
         self.cancel_button.setEnabled(True)
         
@@ -1354,8 +1950,7 @@ class BilibiliDownloaderGUI(QMainWindow):
         )
         
         # 连接信号
-        self.download_thread.progress_update.connect(self.update_progress)
-        self.download_thread.speed_update.connect(self.update_speed)
+        self.download_thread.telemetry_update.connect(self.update_telemetry)
         self.download_thread.status_update.connect(self.status_label.setText)
         self.download_thread.download_complete.connect(self.on_download_complete)
         self.download_thread.download_error.connect(self.on_download_error)
@@ -1366,6 +1961,93 @@ class BilibiliDownloaderGUI(QMainWindow):
         # 开始下载
         self.download_thread.start()
     
+    def start_batch_download(self):
+        bvid = self.bv_entry.text().strip()
+        if not bvid or not self.video_pages:
+            QMessageBox.warning(self, "提示", "请先输入BV号并获取分P列表！")
+            return
+        
+        page_dialog = PageSelectDialog(self.video_pages, self)
+        if page_dialog.exec() != QDialog.DialogCode.Accepted or not page_dialog.selected_pages:
+            return
+        jobs = [(bvid, p['cid'], f"P{p['page']} {p['part']}") for p in page_dialog.selected_pages]
+        self.start_jobs_download(jobs)
+    
+    def start_resolve(self):
+        source, ok = QInputDialog.getText(self, "批量解析列表",
+                                          "输入UP主空间、收藏夹或稍后再看链接：")
+        if not ok or not source.strip():
+            return
+        self.resolving = True
+        self.resolve_button.setEnabled(False)
+        self.status_label.setText("正在解析列表...")
+        self.resolve_thread = ResolveThread(self.session, source.strip())
+        self.resolve_thread.status_update.connect(self.status_label.setText)
+        self.resolve_thread.resolve_complete.connect(self.on_resolve_complete)
+        self.resolve_thread.resolve_error.connect(self.on_resolve_error)
+        self.resolve_thread.start()
+    
+    def download_busy(self):
+        """正在下载，或正在获取字幕列表准备下载（此时开始下载的按钮已禁用）"""
+        return self.download_active() or not self.download_button.isEnabled()
+    
+    def on_resolve_complete(self, index):
+        self.resolving = False
+        self.resolve_button.setEnabled(self.download_button.isEnabled())
+        message = f"解析到 {index.videos} 个视频，共 {len(index)} 个分P"
+        if index.failed:
+            message += f"，{len(index.failed)} 个视频获取失败"
+        self.status_label.setText(message)
+        if not len(index):
+            QMessageBox.warning(self, "提示", "列表中没有可下载的视频！")
+            return
+        # 解析期间开始了其他下载时不能再开始批量下载，否则会替换掉正在进行的下载线程，暂停和取消都无法再作用于它
+        busy_message = message + "。\n当前有下载正在进行，请完成或取消后再重新解析。"
+        if self.download_busy():
+            QMessageBox.information(self, "批量解析列表", busy_message)
+            return
+        answer = QMessageBox.question(self, "批量解析列表", message + "。\n是否开始下载？")
+        if answer == QMessageBox.StandardButton.Yes:
+            # 对话框打开期间可能已经开始了其他下载（如字幕列表返回后）
+            if self.download_busy():
+                QMessageBox.information(self, "批量解析列表", busy_message)
+                return
+            self.start_jobs_download(index.jobs(), len(index))
+    
+    def on_resolve_error(self, error_msg):
+        self.resolving = False
+        self.resolve_button.setEnabled(self.download_button.isEnabled())
+        self.status_label.setText(f"解析列表失败：{error_msg}")
+        QMessageBox.critical(self, "错误", f"解析列表失败：{error_msg}")
+    
+    def start_jobs_download(self, jobs, total=None):
+        """按当前设置批量下载 (bvid, cid, 名称) 任务"""
+        quality = int(self.quality_combo.currentText().split()[0])
+        # 批量下载不逐个弹出字幕选择，勾选字幕时下载每个分P的全部语言
+        options = self.collect_options()
+        concurrency = int(self.concurrency_combo.currentText())
+        
+        self.set_download_enabled(False)
+        self.pause_button.setEnabled(True)
+        self.cancel_button.setEnabled(True)
+        
+        self.download_thread = BatchDownloadThread(
+            self.session, jobs, quality, self.path_entry.text(), options,
+            self.api_combo.currentText(), concurrency, total
+        )
+        self.download_thread.telemetry_update.connect(self.update_telemetry)
+        self.download_thread.status_update.connect(self.status_label.setText)
+        self.download_thread.download_complete.connect(self.on_download_complete)
+        self.download_thread.download_error.connect(self.on_download_error)
+        
+        self.progress_bar.setTextVisible(True)
+        self.download_thread.start()
+    
+    def update_telemetry(self, snapshot):
+        self.update_progress(snapshot.downloaded, snapshot.total)
+        speed_mb = snapshot.speed / 1024 / 1024
+        self.speed_label.setText(f"下载速度: {speed_mb:.2f} MB/s  剩余时间: {format_eta(snapshot.eta)}")
+    
     def update_progress(self, current, total):
         if total > 0:
             percentage = int(current * 100 / total)
@@ -1377,12 +2059,8 @@ class BilibiliDownloaderGUI(QMainWindow):
             self.progress_bar.setTextVisible(True)  # 确保文本可见
             self.progress_bar.setAlignment(Qt.AlignmentFlag.AlignCenter)
     
-    def update_speed(self, speed_bytes):
-        speed_mb = speed_bytes / 1024 / 1024
-        self.speed_label.setText(f"下载速度: {speed_mb:.2f} MB/s")
-    
     def on_download_complete(self):
-        self.download_button.setEnabled(True)
+        self.set_download_enabled(True)
         self.pause_button.setEnabled(False)
         self.cancel_button.setEnabled(False)
         self.progress_bar.setValue(100)
@@ -1390,7 +2068,7 @@ class BilibiliDownloaderGUI(QMainWindow):
         QMessageBox.information(self, "提示", "下载完成！")
     
     def on_download_error(self, error_msg):
-        self.download_button.setEnabled(True)
+        self.set_download_enabled(True)
         self.pause_button.setEnabled(False)
         self.cancel_button.setEnabled(False)
         self.progress_bar.setValue(0)
@@ -1405,19 +2083,22 @@ class BilibiliDownloaderGUI(QMainWindow):
     
     def cancel_download(self):
         if hasattr(self, 'download_thread') and self.download_thread:
-            self.download_thread.cancel = True
-            self.status_label.setText("正在取消下载...")
-            self.download_button.setEnabled(True)
+            thread = self.download_thread
+            thread.cancel = True
+            self.set_download_enabled(True)
             self.pause_button.setEnabled(False)
             self.cancel_button.setEnabled(False)
             
-            # 确保下载线程正确终止
-            self.download_thread.quit()
-            self.download_thread.wait(1000)  # 等待最多1秒
+            # 断开与界面的连接并停止进度推送，被取消的任务不会再覆盖界面，也不会干扰下一次下载
+            for signal in (thread.telemetry_update, thread.status_update,
+                           thread.download_complete, thread.download_error):
+                signal.disconnect()
+            thread.telemetry.stop()
             
-            # 如果线程仍在运行，强制终止
-            if self.download_thread.isRunning():
-                self.download_thread.terminate()
+            # 不强行终止线程：各步骤检查到取消标志后自行退出，finally 中停止推送、归还带宽份额
+            if thread.isRunning():
+                self.cancelled_threads.append(thread)
+                thread.finished.connect(lambda: self.cancelled_threads.remove(thread))
                 
             # 重置UI状态
             self.progress_bar.setValue(0)
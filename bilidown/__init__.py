@@ -0,0 +1 @@
+"""BiliDown 下载核心：各前端（Qt、Tk、命令行）共用的下载组件"""
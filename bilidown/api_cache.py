@@ -0,0 +1,251 @@
+"""接口元数据缓存：视频信息、播放器信息和登录状态接口的响应保存在内存和磁盘中，过期后按 ETag 重新验证
+
+以传输适配器的形式挂在共用会话上，调用方照常 session.get，不需要改动：
+    install_api_cache(session)
+命中且未过期时不发请求；过期后带 If-None-Match / If-Modified-Since 重新验证，304 时沿用缓存；
+网络暂时不通时返回已过期的缓存，保证排队大批任务或短暂断网时仍能取到元数据。
+缓存键包含 Cookie 的摘要，登录前后、不同账号的响应互不混用。
+"""
+import base64
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# 各接口的缓存时间（秒）
+CACHE_RULES = {
+    'https://api.bilibili.com/x/web-interface/view': 600,
+    'https://api.bilibili.com/x/player/v2': 300,
+    'https://api.bilibili.com/x/web-interface/nav': 60,
+}
+MEMORY_ENTRIES = 256
+DISK_ENTRIES = 2000
+MAX_STALE = 7 * 24 * 3600  # 断网时最多使用一周前的缓存
+CACHE_HEADER = 'X-BiliDown-Cache'  # 标记响应来源：hit/revalidated/stale
+STORED_HEADERS = ('content-type', 'etag', 'last-modified', 'date')
+
+
+def default_cache_dir():
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+        return os.path.join(base, 'BiliDown', 'cache', 'api')
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'bilidown', 'api')
+
+
+def _is_cacheable(response):
+    """只缓存成功的响应：HTTP 200 且B站接口返回 code 为0"""
+    if response.status_code != 200:
+        return False
+    try:
+        return response.json().get('code') == 0
+    except ValueError:
+        return False
+
+
+class _Entry:
+    def __init__(self, status, headers, body, stored_at, expires_at):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires_at
+
+    def validators(self):
+        headers = {}
+        if self.headers.get('etag'):
+            headers['If-None-Match'] = self.headers['etag']
+        if self.headers.get('last-modified'):
+            headers['If-Modified-Since'] = self.headers['last-modified']
+        return headers
+
+    def to_json(self):
+        return {
+            'status': self.status,
+            'headers': self.headers,
+            'body': base64.b64encode(self.body).decode('ascii'),
+            'stored_at': self.stored_at,
+            'expires_at': self.expires_at,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['status'], data['headers'], base64.b64decode(data['body']),
+                   data['stored_at'], data['expires_at'])
+
+
+class ResponseCache:
+    """内存 LRU 加磁盘两级缓存，键为请求的摘要；磁盘上每个条目一个JSON文件"""
+
+    def __init__(self, cache_dir=None, memory_entries=MEMORY_ENTRIES, disk_entries=DISK_ENTRIES):
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = _Entry.from_json(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        self._remember(key, entry)
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(entry.to_json(), f)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            return  # 磁盘缓存只是优化，写不进去不影响请求
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % 100 == 0
+        if prune:
+            self.prune()
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def prune(self):
+        """磁盘条目超过上限时删掉最久未更新的"""
+        try:
+            paths = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                     if name.endswith('.json')]
+            if len(paths) <= self.disk_entries:
+                return
+            paths.sort(key=os.path.getmtime)
+            for path in paths[:len(paths) - self.disk_entries]:
+                os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.cache_dir:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.json'):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, name))
+                    except OSError:
+                        pass
+
+
+class CachingAdapter(BaseAdapter):
+    """带缓存的传输适配器，实际请求交给 delegate（通常是会话原有的连接池适配器）"""
+
+    def __init__(self, delegate, cache, ttl):
+        super().__init__()
+        self.delegate = delegate
+        self.cache = cache
+        self.ttl = ttl
+
+    @staticmethod
+    def cache_key(request):
+        cookie = request.headers.get('Cookie', '')
+        digest = hashlib.sha1()
+        digest.update(request.url.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(hashlib.sha1(cookie.encode('utf-8')).digest())
+        return digest.hexdigest()
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            return self.delegate.send(request, **kwargs)
+
+        key = self.cache_key(request)
+        entry = self.cache.get(key)
+        if entry is not None and entry.fresh:
+            return self._build_response(request, entry, 'hit')
+
+        conditional = request
+        if entry is not None and entry.validators():
+            conditional = request.copy()
+            conditional.headers.update(entry.validators())
+        try:
+            response = self.delegate.send(conditional, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if entry is not None and time.time() - entry.stored_at < MAX_STALE:
+                return self._build_response(request, entry, 'stale')
+            raise
+
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            entry.expires_at = time.time() + self.ttl
+            self.cache.put(key, entry)
+            return self._build_response(request, entry, 'revalidated')
+
+        if kwargs.get('stream'):
+            return response  # 流式读取的响应不缓存
+        if _is_cacheable(response):
+            headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+            now = time.time()
+            self.cache.put(key, _Entry(response.status_code, headers, response.content, now, now + self.ttl))
+        return response
+
+    def _build_response(self, request, entry, source):
+        response = requests.Response()
+        response.status_code = entry.status
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response.headers[CACHE_HEADER] = source
+        response._content = entry.body
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        self.delegate.close()
+
+
+def install_api_cache(session, cache_dir=None, rules=None):
+    """在会话上为各接口前缀挂载缓存适配器；cache_dir 为 False 时只用内存缓存，返回 ResponseCache"""
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    try:
+        cache = ResponseCache(cache_dir or None)
+    except OSError:
+        cache = ResponseCache(None)  # 缓存目录不可写时只用内存
+    for prefix, ttl in (rules or CACHE_RULES).items():
+        adapter = session.get_adapter(prefix)
+        if isinstance(adapter, CachingAdapter):
+            adapter = adapter.delegate
+        session.mount(prefix, CachingAdapter(adapter, cache, ttl))
+    return cache
@@ -0,0 +1,294 @@
+"""异步下载引擎：一个 asyncio 事件循环配合 httpx 同时处理所有流，不再为每个传输占用一个线程
+
+Qt、Tk 和命令行前端都通过 get_engine() 取得同一个引擎：
+    engine = get_engine()
+    engine.download(url, filename, progress_callback=..., should_cancel=..., should_pause=...)
+download() 会阻塞调用线程直到完成；submit() 返回 concurrent.futures.Future，适合一次提交多个流。
+"""
+import asyncio
+import os
+import threading
+
+import httpx
+
+from bilidown.resume import PartManifest, part_path
+from bilidown.segmented import DEFAULT_CONNECTIONS, MAX_RETRIES, STALL_TIMEOUT, preallocate, split_ranges, write_all
+
+READ_SIZE = 256 * 1024  # 每次从连接读取的字节数
+MAX_CONNECTIONS = 256  # 整个引擎的连接上限
+DEFAULT_HEADERS = {
+    'Referer': 'https://www.bilibili.com',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+}
+
+
+class AsyncDownloadEngine:
+    """在后台线程运行事件循环的下载引擎，可以在同一个循环里并发上百个流"""
+
+    def __init__(self, connections=DEFAULT_CONNECTIONS, max_connections=MAX_CONNECTIONS,
+                 headers=None, timeout=STALL_TIMEOUT):
+        self.connections = max(1, int(connections))
+        self.max_connections = max_connections
+        self.headers = dict(DEFAULT_HEADERS if headers is None else headers)
+        self.timeout = timeout
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,),
+                                            name='bilidown-async-engine', daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def _run_loop(self, ready):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._client = httpx.AsyncClient(
+            headers=self.headers,
+            timeout=httpx.Timeout(self.timeout, connect=10),
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_connections),
+            follow_redirects=True,
+        )
+        ready.set()
+        self._loop.run_forever()
+
+    def close(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+        asyncio.run_coroutine_threadsafe(self._loop.shutdown_asyncgens(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def submit(self, url, filename, progress_callback=None, should_cancel=None, should_pause=None,
+               identity=None, connections=None, spread=1, throttle=None):
+        """提交一个流，返回 concurrent.futures.Future，结果为是否完整下载"""
+        self.start()
+        coroutine = self.fetch(url, filename, progress_callback, should_cancel, should_pause,
+                               identity, connections, spread, throttle)
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def download(self, url, filename, progress_callback=None, should_cancel=None, should_pause=None,
+                 identity=None, connections=None, spread=1, throttle=None):
+        """阻塞下载一个流，完成返回 True，被取消返回 False"""
+        return self.submit(url, filename, progress_callback, should_cancel, should_pause,
+                           identity, connections, spread, throttle).result()
+
+    async def fetch(self, url, filename, progress_callback=None, should_cancel=None, should_pause=None,
+                    identity=None, connections=None, spread=1, throttle=None):
+        """在引擎的事件循环中下载一个流，进度回调在事件循环线程中串行调用
+
+        url 可以是地址列表，含义与 SegmentedDownloader.download 相同；throttle 为 bandwidth.JobShare。
+        """
+        return await _StreamFetch(self, url, filename, progress_callback, should_cancel,
+                                  should_pause, identity, connections or self.connections, spread,
+                                  throttle).run()
+
+
+class _StreamFetch:
+    """单个流的一次下载过程"""
+
+    def __init__(self, engine, url, filename, progress_callback, should_cancel, should_pause,
+                 identity, connections, spread, throttle=None):
+        self.client = engine._client
+        self.urls = [url] if isinstance(url, str) else list(url)
+        self.spread = max(1, min(spread, len(self.urls)))
+        self.throttle = throttle
+        self.filename = filename
+        self.progress_callback = progress_callback
+        self.should_cancel = should_cancel or (lambda: False)
+        self.should_pause = should_pause or (lambda: False)
+        self.identity = identity
+        self.connections = connections
+        self.downloaded = 0
+        self.total = 0
+        self.manifest = None
+
+    def report(self, size, start=None):
+        self.downloaded += size
+        if self.manifest is not None and start is not None:
+            self.manifest.add_range(start, start + size)
+            self.manifest.save_if_due()
+        if self.progress_callback:
+            self.progress_callback(self.downloaded, self.total)
+
+    async def wait_if_paused(self):
+        """暂停时让出事件循环，返回是否应当停止"""
+        while self.should_pause():
+            if self.should_cancel():
+                return True
+            await asyncio.sleep(0.1)
+        return self.should_cancel()
+
+    async def wait_for_bandwidth(self, size):
+        """按带宽份额等待，返回是否应当停止"""
+        if self.throttle is not None:
+            await self.throttle.consume_async(size, self.should_cancel)
+        return self.should_cancel()
+
+    async def probe(self):
+        error = None
+        for url in self.urls:
+            try:
+                async with self.client.stream('GET', url, headers={'Range': 'bytes=0-0'}) as response:
+                    if response.status_code == 206:
+                        total = response.headers.get('content-range', '').rsplit('/', 1)[-1]
+                        if total.isdigit():
+                            return int(total), True
+                        return 0, False
+                    if response.status_code == 200:
+                        return int(response.headers.get('content-length', 0)), False
+                    raise Exception(f"探测下载地址失败，状态码：{response.status_code}")
+            except Exception as e:
+                error = e
+        raise error
+
+    async def run(self):
+        self.total, accept_ranges = await self.probe()
+        dir_path = os.path.dirname(self.filename)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+
+        if not accept_ranges or self.total <= 0:
+            self.report(0)
+            return await self.run_single()
+
+        temp_path = part_path(self.filename)
+        manifest = PartManifest.load(self.filename, self.identity, self.total)
+        if manifest is None:
+            manifest = PartManifest(self.filename, self.identity, self.total)
+            with open(temp_path, 'wb') as f:
+                preallocate(f, self.total)
+            manifest.save()
+        self.manifest = manifest
+        self.downloaded = manifest.completed_size
+        self.report(0)
+
+        segments = split_ranges(manifest.missing_ranges(), self.connections)
+        segments.reverse()  # 从列表尾部取段，保持从前往后下载
+        workers = [asyncio.ensure_future(self.worker(index % self.spread, temp_path, segments))
+                   for index in range(min(self.connections, len(segments)))]
+        errors = []
+        try:
+            if workers:
+                done, _ = await asyncio.wait(workers, return_when=asyncio.FIRST_EXCEPTION)
+                errors = [task.exception() for task in done if not task.cancelled() and task.exception()]
+        finally:
+            # 任一连接失败就停下其他连接，不再继续拉取剩余的段；等它们退出后再保存进度
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            manifest.save()
+
+        if errors:
+            raise errors[0]
+        if self.should_cancel():
+            return False
+        if manifest.missing_ranges():
+            raise Exception(f"下载不完整：{manifest.completed_size}/{self.total} 字节")
+        os.replace(temp_path, self.filename)
+        manifest.remove()
+        return True
+
+    async def worker(self, host, temp_path, segments):
+        with open(temp_path, 'r+b', buffering=0) as f:
+            while segments and not self.should_cancel():
+                start, end = segments.pop()
+                host = await self.fetch_segment(host, f, start, end)
+
+    async def fetch_segment(self, host, f, start, end):
+        """拉取闭区间 [start, end]，出错或停滞时换到下一个节点继续，返回最后使用的节点序号"""
+        position = start
+        attempts = 0
+        max_attempts = MAX_RETRIES + len(self.urls) - 1
+        while position <= end:
+            if await self.wait_if_paused():
+                return host
+            attempt_start = position
+            try:
+                headers = {'Range': f'bytes={position}-{end}'}
+                async with self.client.stream('GET', self.urls[host], headers=headers) as response:
+                    if response.status_code != 206:
+                        raise Exception(f"分段请求失败，状态码：{response.status_code}")
+                    async for data in response.aiter_raw(READ_SIZE):
+                        if await self.wait_if_paused():
+                            return host
+                        data = memoryview(data)[:end + 1 - position]
+                        # 写入页缓存很快，直接在事件循环里写，避免额外的线程切换
+                        f.seek(position)
+                        write_all(f, data)
+                        self.report(len(data), position)
+                        position += len(data)
+                        if await self.wait_for_bandwidth(len(data)):
+                            return host
+                        if position > end:
+                            break
+                if position <= end:
+                    raise Exception(f"分段提前结束：{position}/{end + 1}")
+            except Exception:
+                attempts = 0 if position > attempt_start else attempts + 1
+                if attempts > max_attempts or self.should_cancel():
+                    raise
+                host = (host + 1) % len(self.urls)
+        return host
+
+    async def run_single(self):
+        """单连接从头顺序下载，出错时换下一个节点重新下载；全部失败时不生成目标文件"""
+        temp_path = part_path(self.filename)
+        error = None
+        for url in self.urls:
+            downloaded = self.downloaded
+            try:
+                async with self.client.stream('GET', url, headers={'Range': 'bytes=0-'}) as response:
+                    # 地址过期或被拒绝时服务器返回的是错误页，不能当作视频写入
+                    if response.status_code not in (200, 206):
+                        raise Exception(f"下载请求失败，状态码：{response.status_code}")
+                    expected = int(response.headers.get('content-length', 0))
+                    if expected:
+                        self.total = expected
+                    size = 0
+                    with open(temp_path, 'wb') as f:
+                        async for data in response.aiter_raw(READ_SIZE):
+                            if await self.wait_if_paused():
+                                return False
+                            f.write(data)
+                            size += len(data)
+                            self.report(len(data))
+                            if await self.wait_for_bandwidth(len(data)):
+                                return False
+                    if expected and size < expected:
+                        raise Exception(f"下载不完整：{size}/{expected} 字节")
+            except Exception as e:
+                if self.should_cancel():
+                    raise
+                error = e
+                # 换节点后从头下载，撤回这次计入的进度
+                self.report(downloaded - self.downloaded)
+                continue
+            os.replace(temp_path, self.filename)
+            return True
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise error
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """各前端共用的引擎实例"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncDownloadEngine()
+        return _engine
@@ -0,0 +1,333 @@
+"""带宽整形：所有并发下载共用一个总限速，各任务按权重公平分配，可以按一天中的时段设置不同的限速
+
+层级为 全局 -> 任务 -> 连接：同一任务的多个连接共用该任务的份额，开更多连接不会多占带宽，
+大任务也不会挤占小任务。每个连接收到一块数据后调用 consume()，超出份额时在条件变量上阻塞等待，
+不轮询：
+    share = get_shaper().job(job_key, weight=1)
+    share.consume(received)
+    share.release()  # 任务结束时
+调度采用按权重的起始时间公平排队（SFQ）：每块数据按所属任务的虚拟时间排队，虚拟时间最小的先放行，
+放行速度由全局令牌桶控制。未设置限速时 consume() 直接返回，不加锁。
+异步引擎用不阻塞的 reserve() 在同一个队列中排队，按返回的等待时间 asyncio.sleep，不占用线程。
+"""
+import datetime
+import heapq
+import itertools
+import re
+import threading
+import time
+
+MIN_CHUNK = 16 * 1024
+GRANULARITY = 0.05  # 限速时每次读取约为总速率0.05秒的数据量，避免一次读太多造成突发
+BURST_TIME = 0.2  # 令牌桶最多积攒0.2秒的流量
+MAX_WAIT = 0.5  # 阻塞等待时最多隔这么久检查一次取消
+MIN_DELAY = 0.005  # 异步等待时两次检查的最短间隔
+SCHEDULE_CHECK_INTERVAL = 1.0
+UNITS = {'': 1, 'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_rate(text):
+    """解析速率文本，如 "500K"、"2M"、"2MB/s"，返回每秒字节数；空、0、"不限" 返回None"""
+    text = str(text).strip().upper().replace(' ', '')
+    if text in ('', '0', '不限', 'NONE', 'UNLIMITED'):
+        return None
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([KMG]?)(?:I?B)?(?:/S)?', text)
+    if not match:
+        raise ValueError(f"无法识别的速率：{text}")
+    rate = float(match.group(1)) * UNITS[match.group(2)]
+    return int(rate) if rate > 0 else None
+
+
+def format_rate(rate):
+    if rate is None:
+        return "不限"
+    if rate >= 1024 ** 2:
+        return f"{rate / 1024 ** 2:.1f}MB/s"
+    return f"{rate / 1024:.0f}KB/s"
+
+
+def _minutes(text):
+    hours, minutes = text.split(':')
+    value = int(hours) * 60 + int(minutes)
+    if not 0 <= value <= 24 * 60:
+        raise ValueError(f"时间格式错误：{text}")
+    return value
+
+
+class Schedule:
+    """按时段设置限速：[('09:00', '18:00', 2 * 1024 ** 2), ('23:00', '07:00', None)]
+
+    结束时间早于开始时间的时段跨过零点；时段重叠时先列出的优先，不在任何时段内时使用限速器的基础速率。
+    """
+
+    def __init__(self, rules):
+        self.rules = [(_minutes(start), _minutes(end), rate) for start, end, rate in rules]
+
+    @classmethod
+    def parse(cls, text):
+        """解析 "09:00-18:00=2M, 23:00-07:00=不限" 这样的文本"""
+        rules = []
+        for item in re.split(r'[,，;；]', text):
+            item = item.strip()
+            if not item:
+                continue
+            match = re.fullmatch(r'(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})\s*=\s*(.+)', item)
+            if not match:
+                raise ValueError(f"无法识别的限速时段：{item}")
+            rules.append((match.group(1), match.group(2), parse_rate(match.group(3))))
+        return cls(rules)
+
+    def lookup(self, moment=None):
+        """返回 (是否落在某个时段内, 该时段的速率)"""
+        moment = moment or datetime.datetime.now()
+        minute = moment.hour * 60 + moment.minute
+        for start, end, rate in self.rules:
+            if start <= end:
+                if start <= minute < end:
+                    return True, rate
+            elif minute >= start or minute < end:
+                return True, rate
+        return False, None
+
+
+class JobShare:
+    """一个任务在限速器中的份额，任务的所有连接共用"""
+
+    def __init__(self, shaper, key, weight):
+        self.shaper = shaper
+        self.key = key
+        self.weight = weight
+        self.finish = 0.0  # 该任务最后一块数据的虚拟结束时间
+        self.granted = 0
+        self.refs = 1
+
+    def consume(self, nbytes, should_stop=None):
+        """登记收到的 nbytes 字节，超出份额时阻塞；should_stop() 为真时提前返回 False"""
+        return self.shaper.consume(self, nbytes, should_stop)
+
+    async def consume_async(self, nbytes, should_stop=None):
+        """异步引擎使用：与 consume() 在同一个公平队列中排队，等待时 asyncio.sleep，不占用线程"""
+        ticket, delay = self.shaper.reserve(self, nbytes)
+        if ticket is None:
+            return True
+        import asyncio  # 只有限速的异步下载会走到这里，线程下载不必导入
+
+        try:
+            while True:
+                if should_stop is not None and should_stop():
+                    return False
+                await asyncio.sleep(delay)
+                ticket, delay = self.shaper.reserve(self, nbytes, ticket)
+                if ticket is None:
+                    return True
+        finally:
+            # 取消（包括协程被 cancel）时让出队列中的位置
+            if ticket is not None:
+                self.shaper.withdraw(ticket)
+
+    def chunk_size(self, default):
+        return self.shaper.chunk_size(default)
+
+    def release(self):
+        self.shaper.release(self)
+
+
+class BandwidthShaper:
+    """全局限速器；rate 为每秒字节数，None 表示不限速"""
+
+    def __init__(self, rate=None, schedule=None):
+        self._cond = threading.Condition()
+        self.base_rate = rate
+        self.schedule = schedule
+        self._rate = rate
+        self._checked = 0.0
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self._vtime = 0.0
+        self._queue = []  # 等待放行的 (虚拟起始时间, 序号, 字节数)
+        self._seq = itertools.count()
+        self._jobs = {}
+        self.granted = 0
+        self.waited = 0.0  # 所有连接累计的等待时间（秒）
+
+    @property
+    def unlimited(self):
+        return self._rate is None and self.schedule is None
+
+    @property
+    def rate(self):
+        with self._cond:
+            self._refresh(time.monotonic())
+            return self._rate
+
+    def configure(self, rate=None, schedule=None):
+        """修改基础速率和时段设置，对正在进行的下载立即生效"""
+        with self._cond:
+            self.base_rate = rate
+            self.schedule = schedule
+            self._checked = 0.0
+            self._refresh(time.monotonic())
+            self._cond.notify_all()
+
+    def _refresh(self, now):
+        """按时段更新当前速率，每秒最多检查一次"""
+        if self.schedule is None:
+            rate = self.base_rate
+        elif now - self._checked >= SCHEDULE_CHECK_INTERVAL:
+            self._checked = now
+            matched, rate = self.schedule.lookup()
+            if not matched:
+                rate = self.base_rate
+        else:
+            return
+        if rate != self._rate:
+            # 速率变化时重新开始积攒令牌，不把旧速率下欠的账带过来
+            self._rate = rate
+            self._tokens = 0.0
+            self._updated = now
+
+    def _refill(self, now):
+        self._tokens = min(self._rate * BURST_TIME, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def chunk_size(self, default):
+        """限速时每次读取的字节数上限"""
+        rate = self._rate
+        if rate is None:
+            return default
+        return max(MIN_CHUNK, min(default, int(rate * GRANULARITY)))
+
+    def job(self, key, weight=1.0):
+        """取得任务的份额；同一任务多次调用返回同一个份额，需对应调用同样次数的 release()"""
+        with self._cond:
+            share = self._jobs.get(key)
+            if share is None:
+                share = self._jobs[key] = JobShare(self, key, max(float(weight), 1e-3))
+            else:
+                share.refs += 1
+            return share
+
+    def release(self, share):
+        with self._cond:
+            share.refs -= 1
+            if share.refs <= 0 and self._jobs.get(share.key) is share:
+                del self._jobs[share.key]
+
+    def consume(self, share, nbytes, should_stop=None):
+        if self.unlimited:
+            share.granted += nbytes
+            return True
+        with self._cond:
+            now = time.monotonic()
+            self._refresh(now)
+            if self._rate is None:
+                self._grant(share, nbytes)
+                return True
+            entry = self._enqueue(share, nbytes)
+            granted = False
+            try:
+                while True:
+                    if should_stop is not None and should_stop():
+                        break
+                    now = time.monotonic()
+                    wait = self._poll(entry, now)
+                    if wait == 0:
+                        granted = True
+                        break
+                    self._cond.wait(MAX_WAIT if wait is None else min(MAX_WAIT, wait))
+                    self.waited += time.monotonic() - now
+            finally:
+                self._dequeue(entry)
+            if granted:
+                self._grant(share, nbytes)
+            return granted
+
+    def reserve(self, share, nbytes, ticket=None):
+        """不阻塞的 consume()：返回 (ticket, 等待秒数)
+
+        ticket 为 None 表示已放行；否则等待返回的秒数后带着 ticket 再次调用，保持在队列中的位置，
+        放弃时调用 withdraw(ticket)。
+        """
+        if self.unlimited:
+            share.granted += nbytes
+            return None, 0.0
+        with self._cond:
+            now = time.monotonic()
+            if ticket is None:
+                self._refresh(now)
+                if self._rate is None:
+                    self._grant(share, nbytes)
+                    return None, 0.0
+                ticket = self._enqueue(share, nbytes)
+            elif ticket not in self._queue:
+                raise ValueError("ticket 已被放行或撤销")
+            wait = self._poll(ticket, now)
+            if wait == 0:
+                self._dequeue(ticket)
+                self._grant(share, nbytes)
+                return None, 0.0
+            if wait is None:
+                # 不在队首时按排在前面的字节数估计，轮到时最多晚 MIN_DELAY 左右
+                ahead = sum(entry[2] for entry in self._queue if entry < ticket)
+                wait = (ahead - self._tokens) / self._rate
+            return ticket, min(MAX_WAIT, max(MIN_DELAY, wait))
+
+    def withdraw(self, ticket):
+        """撤销 reserve() 中还未放行的排队"""
+        with self._cond:
+            if ticket in self._queue:
+                self._dequeue(ticket)
+
+    def _enqueue(self, share, nbytes):
+        # 同一任务的各块依次排在该任务上一块之后，空闲后重新出现的任务不能补回之前没用的份额
+        start = max(self._vtime, share.finish)
+        share.finish = start + nbytes / share.weight
+        entry = (start, next(self._seq), nbytes)
+        heapq.heappush(self._queue, entry)
+        return entry
+
+    def _dequeue(self, entry):
+        if self._queue[0] == entry:
+            heapq.heappop(self._queue)
+        else:
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+        # 唤醒下一个排在队首的连接
+        self._cond.notify_all()
+
+    def _poll(self, entry, now):
+        """轮到 entry 且令牌足够时扣除令牌并返回0；在队首时返回还需等待的秒数，不在队首时返回None"""
+        self._refresh(now)
+        if self._rate is None:
+            return 0
+        if self._queue[0] != entry:
+            return None
+        self._refill(now)
+        # 令牌不为负就放行，本块的字节数记为欠账，下一块等欠账还清
+        if self._tokens >= 0:
+            self._tokens -= entry[2]
+            self._vtime = entry[0]
+            return 0
+        return -self._tokens / self._rate
+
+    def _grant(self, share, nbytes):
+        share.granted += nbytes
+        self.granted += nbytes
+
+    def stats(self):
+        with self._cond:
+            return {'rate': self._rate, 'jobs': len(self._jobs), 'waiting': len(self._queue),
+                    'granted': self.granted, 'waited': round(self.waited, 3)}
+
+
+_shaper = None
+_shaper_lock = threading.Lock()
+
+
+def get_shaper():
+    """进程内共用的限速器，所有前端和下载引擎的流共享同一个总速率"""
+    global _shaper
+    with _shaper_lock:
+        if _shaper is None:
+            _shaper = BandwidthShaper()
+        return _shaper
@@ -0,0 +1,244 @@
+"""批量解析：把UP主投稿、收藏夹、稍后再看等列表展开成 (bvid, cid, 名称) 下载任务
+
+列表接口先取第一页得到总数，其余页并发获取；缺少 cid 的条目再分批并发请求 view 接口展开分P。
+结果保存在 VideoIndex 中，按列存放在 array/bytearray 里，十万个分P也只占几十MB，
+可以直接把 index.jobs() 交给批量下载队列。
+"""
+import collections
+import re
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from bilidown.wbi import WbiSigner
+
+SPACE_URL = 'https://api.bilibili.com/x/space/wbi/arc/search'
+FAVORITE_URL = 'https://api.bilibili.com/x/v3/fav/resource/list'
+WATCHLATER_URL = 'https://api.bilibili.com/x/v2/history/toview'
+VIEW_URL = 'https://api.bilibili.com/x/web-interface/view'
+
+SPACE_PAGE_SIZE = 50
+FAVORITE_PAGE_SIZE = 20
+DEFAULT_WORKERS = 4  # 并发过高容易触发412风控
+VIEW_BATCH = 200  # 每批展开的视频数，批与批之间检查取消并汇报进度
+BVID_LENGTH = 12
+
+IndexEntry = collections.namedtuple('IndexEntry', 'bvid cid page title part duration')
+
+
+def parse_source(text):
+    """识别列表链接，返回 (类型, 标识)：('space', mid)、('favorite', media_id)、('watchlater', None)"""
+    text = text.strip()
+    if not text:
+        raise ValueError("请输入列表链接")
+    if 'watchlater' in text or 'toview' in text or text == '稍后再看':
+        return 'watchlater', None
+    match = re.search(r'[?&]fid=(\d+)', text) or re.search(r'\bml(\d+)', text)
+    if match:
+        return 'favorite', match.group(1)
+    match = re.search(r'space\.bilibili\.com/(\d+)', text) or re.fullmatch(r'(?:uid:?)?(\d+)', text, re.I)
+    if match:
+        return 'space', match.group(1)
+    raise ValueError(f"无法识别的列表链接：{text}")
+
+
+class VideoIndex:
+    """按列存放的分P列表
+
+    每个分P占 bvid 12字节、cid 8字节、分P序号2字节、时长4字节、标题编号4字节以及分P名的UTF-8编码，
+    不为每条记录创建对象；取出时才组装成 IndexEntry。同一视频的多个分P共用一份标题。
+    """
+
+    def __init__(self):
+        self._bvids = bytearray()
+        self._cids = array('q')
+        self._pages = array('H')
+        self._durations = array('I')
+        self._title_ids = array('I')
+        self._part_ends = array('Q')
+        self._parts = bytearray()
+        self._title_ends = array('Q')
+        self._titles = bytearray()
+        self._last_title = None
+        self._seen = set()  # 已收录的 cid，同一分P出现在多个列表里只保留一次
+        self.videos = 0
+        self.failed = []  # [(bvid, 原因)]
+
+    def __len__(self):
+        return len(self._cids)
+
+    @staticmethod
+    def _slice(blob, ends, i):
+        start = ends[i - 1] if i else 0
+        return blob[start:ends[i]].decode('utf-8')
+
+    def _title_id(self, title):
+        if title != self._last_title:
+            self._titles += title.encode('utf-8')
+            self._title_ends.append(len(self._titles))
+            self._last_title = title
+        return len(self._title_ends) - 1
+
+    def add(self, bvid, cid, page, title, part, duration=0):
+        """添加一个分P，已存在时返回 False"""
+        cid = int(cid)
+        if cid in self._seen:
+            return False
+        encoded = bvid.encode('ascii')
+        if len(encoded) != BVID_LENGTH:
+            raise ValueError(f"BV号格式错误：{bvid}")
+        self._seen.add(cid)
+        self._bvids += encoded
+        self._cids.append(cid)
+        self._pages.append(min(int(page), 0xFFFF))
+        self._durations.append(max(0, int(duration or 0)))
+        self._title_ids.append(self._title_id(title))
+        self._parts += part.encode('utf-8')
+        self._part_ends.append(len(self._parts))
+        return True
+
+    def add_view(self, view):
+        """按 view 接口返回的 data 添加该视频的所有分P"""
+        added = 0
+        for p in view.get('pages') or []:
+            added += self.add(view['bvid'], p['cid'], p['page'], view.get('title', ''),
+                              p.get('part', ''), p.get('duration', 0))
+        if added:
+            self.videos += 1
+        return added
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        offset = i * BVID_LENGTH
+        return IndexEntry(self._bvids[offset:offset + BVID_LENGTH].decode('ascii'), self._cids[i],
+                          self._pages[i], self._slice(self._titles, self._title_ends, self._title_ids[i]),
+                          self._slice(self._parts, self._part_ends, i), self._durations[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def jobs(self):
+        """逐个生成批量下载任务 (bvid, cid, 名称)"""
+        for entry in self:
+            if entry.page <= 1 and entry.part in ('', entry.title):
+                name = entry.title
+            else:
+                name = f"{entry.title} P{entry.page} {entry.part}"
+            yield entry.bvid, entry.cid, name
+
+    def total_duration(self):
+        return sum(self._durations)
+
+
+class BulkResolver:
+    """并发解析列表
+
+    用法：
+        index = BulkResolver(session).resolve('https://space.bilibili.com/123')
+        for bvid, cid, name in index.jobs(): ...
+    progress_callback(消息) 在工作线程中调用；should_cancel() 返回真时尽快停止并返回已解析的部分。
+    """
+
+    def __init__(self, session, workers=DEFAULT_WORKERS, progress_callback=None, should_cancel=None):
+        self.session = session
+        self.workers = max(1, int(workers))
+        self.progress_callback = progress_callback
+        self.should_cancel = should_cancel or (lambda: False)
+        self.signer = WbiSigner(session)
+
+    def _report(self, message):
+        if self.progress_callback:
+            self.progress_callback(message)
+
+    def _get_json(self, url, params, action):
+        try:
+            response = self.session.get(url, params=params, timeout=15)
+            data = response.json()
+        except Exception as e:
+            raise Exception(f"{action}失败：{str(e)}")
+        if data.get('code') != 0:
+            raise Exception(f"{action}失败：{data.get('message', '未知错误')}")
+        return data.get('data') or {}
+
+    def resolve(self, source, index=None):
+        kind, ident = parse_source(source) if isinstance(source, str) else source
+        index = VideoIndex() if index is None else index
+        if kind == 'space':
+            items = self._list_pages(self._space_page, ident)
+        elif kind == 'favorite':
+            items = self._list_pages(self._favorite_page, ident)
+        elif kind == 'watchlater':
+            items = self._watchlater()
+        else:
+            raise ValueError(f"不支持的列表类型：{kind}")
+        self._expand(items, index)
+        return index
+
+    def _list_pages(self, fetch_page, ident):
+        """取第一页得到总数后，并发获取剩余各页，按原顺序拼接"""
+        items, total, page_size = fetch_page(ident, 1)
+        pages = -(-total // page_size) if page_size else 1
+        self._report(f"列表共 {total} 个视频，{pages} 页")
+        if pages > 1 and not self.should_cancel():
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for page_items, _, _ in executor.map(lambda pn: fetch_page(ident, pn), range(2, pages + 1)):
+                    items.extend(page_items)
+        return items
+
+    def _space_page(self, mid, pn):
+        params = self.signer.sign({'mid': mid, 'pn': pn, 'ps': SPACE_PAGE_SIZE, 'order': 'pubdate'})
+        data = self._get_json(SPACE_URL, params, "获取投稿列表")
+        vlist = ((data.get('list') or {}).get('vlist')) or []
+        items = [(v['bvid'], v.get('title', ''), None) for v in vlist]
+        return items, (data.get('page') or {}).get('count', len(items)), SPACE_PAGE_SIZE
+
+    def _favorite_page(self, media_id, pn):
+        params = {'media_id': media_id, 'pn': pn, 'ps': FAVORITE_PAGE_SIZE, 'platform': 'web'}
+        data = self._get_json(FAVORITE_URL, params, "获取收藏夹")
+        items = []
+        for media in data.get('medias') or []:
+            # type 2 为视频，音频、合集等其他类型以及已失效的视频跳过
+            if media.get('type') != 2 or media.get('title') == '已失效视频':
+                continue
+            first_cid = (media.get('ugc') or {}).get('first_cid')
+            # 单P视频列表里已有 cid，不必再请求 view
+            pages = None
+            if media.get('page') == 1 and first_cid:
+                pages = [{'cid': first_cid, 'page': 1, 'part': media.get('title', ''),
+                          'duration': media.get('duration', 0)}]
+            items.append((media['bvid'], media.get('title', ''), pages))
+        return items, (data.get('info') or {}).get('media_count', len(items)), FAVORITE_PAGE_SIZE
+
+    def _watchlater(self):
+        data = self._get_json(WATCHLATER_URL, {}, "获取稍后再看")
+        items = [(v['bvid'], v.get('title', ''), v.get('pages')) for v in data.get('list') or []]
+        self._report(f"稍后再看共 {len(items)} 个视频")
+        return items
+
+    def _view(self, bvid):
+        try:
+            return self._get_json(VIEW_URL, {'bvid': bvid}, "获取视频信息"), None
+        except Exception as e:
+            return None, str(e)
+
+    def _expand(self, items, index):
+        """按列表顺序收录：已有分P信息的直接收录，其余每批并发请求 view 接口"""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for start in range(0, len(items), VIEW_BATCH):
+                if self.should_cancel():
+                    return
+                batch = items[start:start + VIEW_BATCH]
+                views = executor.map(self._view, [bvid for bvid, _, pages in batch if not pages])
+                for bvid, title, pages in batch:
+                    if pages:
+                        index.add_view({'bvid': bvid, 'title': title, 'pages': pages})
+                        continue
+                    view, error = next(views)
+                    if view is None:
+                        index.failed.append((bvid, error))
+                    else:
+                        index.add_view(view)
+                self._report(f"已解析 {min(start + VIEW_BATCH, len(items))}/{len(items)} 个视频，共 {len(index)} 个分P")
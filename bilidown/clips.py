@@ -0,0 +1,184 @@
+"""片段下载：只下载一段时间范围内的 DASH 分片，不下载整个视频
+
+    video, audio = policy.select(download_info['dash'])
+    download_clip(session, video, audio, 1200, 1260, 'clip.mp4', STREAM_HEADERS)
+B站的 DASH 流开头是初始化段（ftyp、moov）和 sidx 索引，segment_base 给出它们的字节范围。sidx 列出每个分片
+（几秒长，从关键帧开始）的位置和时长，按时间范围选出连续的分片后用 Range 请求只下载这几段，
+改写时间戳使片段从0开始，再交给 mp4_remux 合并音视频。片段的起止对齐到分片边界，会比请求的范围略长。
+"""
+import collections
+import os
+import re
+import struct
+
+from bilidown.mirrors import stream_urls
+from bilidown.mp4_remux import merge_streams, parse_sidx, rebase_clip
+
+HEADER_PROBE = 64 * 1024  # 没有 segment_base 时读取文件开头的这么多字节来查找 sidx
+CHUNK_SIZE = 256 * 1024
+TIMEOUT = 30
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/')
+
+# 下载好的一路片段：文件路径，起始时间和时长（秒），分片相对源文件移动的字节数
+ClipTrack = collections.namedtuple('ClipTrack', 'path start duration moved_by')
+
+
+def index_end(stream):
+    """segment_base 中 sidx 结束的字节位置（含），没有时返回 None"""
+    base = stream.get('segment_base') or stream.get('SegmentBase') or {}
+    value = base.get('index_range') or base.get('indexRange') or ''
+    try:
+        return int(value.split('-')[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def fetch_range(session, urls, headers, start, end, out=None, should_cancel=None, progress_callback=None,
+                throttle=None):
+    """用 Range 请求下载 [start, end] 字节，依次尝试各个地址
+
+    out 为 None 时返回下载的字节；否则写入 out，返回 True，取消时返回 False。某个地址中途失败时
+    out 回到开始的位置，由下一个地址重新下载。end 超过文件末尾时只下载到文件末尾。
+    """
+    should_cancel = should_cancel or (lambda: False)
+    request_headers = dict(headers, Range=f'bytes={start}-{end}')
+    origin = out.tell() if out is not None else 0
+    last_error = None
+    for url in urls:
+        chunks = []
+        received = 0
+        total = end - start + 1
+        try:
+            with session.get(url, headers=request_headers, stream=True, timeout=TIMEOUT) as response:
+                # 服务器忽略 Range 返回整个文件时不能用
+                if response.status_code != 206:
+                    raise Exception(f"状态码：{response.status_code}")
+                match = CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+                if match and int(match.group(1)) == start:
+                    total = min(total, int(match.group(2)) - start + 1)
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    if should_cancel():
+                        return False
+                    chunk = chunk[:total - received]
+                    if out is None:
+                        chunks.append(chunk)
+                    else:
+                        out.write(chunk)
+                    received += len(chunk)
+                    if throttle is not None and not throttle.consume(len(chunk), should_cancel):
+                        return False
+                    if progress_callback:
+                        progress_callback(received, total)
+                    if received >= total:
+                        break
+            if received < total:
+                raise Exception(f"数据不完整：{received}/{total}")
+            return b''.join(chunks) if out is None else True
+        except Exception as e:
+            last_error = e
+            if out is not None:
+                out.seek(origin)
+                out.truncate()
+    raise Exception(f"下载片段失败：{str(last_error)}")
+
+
+def load_index(session, urls, headers, stream):
+    """下载初始化段和 sidx，返回 (初始化段字节, 时间刻度, [SidxReference])"""
+    end = index_end(stream)
+    data = fetch_range(session, urls, headers, 0, end if end is not None else HEADER_PROBE - 1)
+    init_end = None
+    offset = 0
+    while offset + 8 <= len(data):
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header_size = 8
+        if size == 1 and offset + 16 <= len(data):
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header_size = 16
+        if size < header_size:
+            break
+        if box_type == b'sidx':
+            if init_end is None:
+                raise Exception("sidx 之前没有 moov")
+            if offset + size > len(data):
+                raise Exception("sidx 不完整")
+            timescale, references = parse_sidx(data[offset + header_size:offset + size], offset + size)
+            return data[:init_end], timescale, references
+        if box_type == b'moov':
+            init_end = offset + size
+        elif box_type == b'moof':
+            break
+        offset += size
+    raise Exception("流中没有 sidx 索引，无法只下载片段")
+
+
+def select_references(references, timescale, start, end):
+    """与 [start, end) 秒有重叠的连续分片"""
+    return [r for r in references if r.start / timescale < end and (r.start + r.duration) / timescale > start]
+
+
+def download_track(session, stream, headers, start, end, path, should_cancel=None, progress_callback=None,
+                   throttle=None):
+    """下载一路流在 [start, end) 秒内的分片，写成初始化段后接分片的文件，返回 ClipTrack，取消时返回 None"""
+    urls = stream_urls(stream)
+    init, timescale, references = load_index(session, urls, headers, stream)
+    chosen = select_references(references, timescale, start, end)
+    if not chosen:
+        raise Exception("片段超出了视频时长")
+    first, last = chosen[0], chosen[-1]
+    with open(path, 'wb') as f:
+        f.write(init)
+        moved_by = f.tell() - first.offset
+        if not fetch_range(session, urls, headers, first.offset, last.offset + last.size - 1, f,
+                           should_cancel, progress_callback, throttle):
+            return None
+    return ClipTrack(path, first.start / timescale, (last.start + last.duration - first.start) / timescale, moved_by)
+
+
+def download_clip(session, video, audio, start, end, output, headers, merge_mode='auto', should_cancel=None,
+                  progress_callback=None, throttle=None):
+    """下载 [start, end) 秒的片段保存为 output，video 或 audio 为 None 时只下载另一路
+
+    返回片段实际的 (起点, 终点) 秒，取消时返回 None。progress_callback(kind, downloaded, total)。
+    """
+    def on_progress(kind):
+        if progress_callback is None:
+            return None
+        return lambda downloaded, total: progress_callback(kind, downloaded, total)
+
+    temp_video = output + '.video.mp4'
+    temp_audio = output + '.audio.m4a'
+    tracks = []
+    try:
+        if video is not None:
+            track = download_track(session, video, headers, start, end, temp_video, should_cancel,
+                                   on_progress('video'), throttle)
+            if track is None:
+                return None
+            tracks.append(track)
+            # 视频从关键帧开始，音频按视频实际的范围取，保证整段都有声音
+            start, end = track.start, track.start + track.duration
+        if audio is not None:
+            track = download_track(session, audio, headers, start, end, temp_audio, should_cancel,
+                                   on_progress('audio'), throttle)
+            if track is None:
+                return None
+            tracks.append(track)
+        if not tracks:
+            raise Exception("没有可下载的流")
+
+        # 以第一路（有视频时为视频）的范围为准，另一路用编辑列表跳过多出的开头、截掉多出的结尾
+        start, end = tracks[0].start, tracks[0].start + tracks[0].duration
+        for track in tracks:
+            rebase_clip(track.path, max(0.0, start - track.start), end - start, track.moved_by)
+        if len(tracks) == 2:
+            try:
+                merge_streams(temp_video, temp_audio, output, merge_mode)
+            except Exception as e:
+                raise Exception(f"合并音视频失败：{str(e)}")
+        else:
+            os.replace(tracks[0].path, output)
+        return start, end
+    finally:
+        for path in (temp_video, temp_audio):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,323 @@
+"""弹幕：并发获取分段的 protobuf 弹幕，按时间顺序排成滚动、顶部、底部三类轨道，输出 ASS 字幕
+
+    written, dropped = download_danmaku(session, cid, duration, 'video.danmaku.ass')
+弹幕接口按每6分钟一段返回 protobuf，这里手写了只取所需字段的解码，不依赖 protobuf 库。
+各段并发下载，但按段的先后顺序交给排版，同时在途的段数有上限，几万条弹幕也不会一次全部留在内存里。
+排版时弹幕按时间顺序到达，画面按行划分，三类弹幕共用同一份占用记录，每行只需记住最后占用它的弹幕：
+滚动弹幕记 尾部进入屏幕 和 离开屏幕 两个时刻，顶部、底部弹幕记消失时刻，每条弹幕检查一遍各行即可，
+耗时与弹幕数成正比。放不下的弹幕丢弃。
+"""
+import collections
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+SEG_URL = 'https://api.bilibili.com/x/v2/dm/web/seg.so'
+SEGMENT_SECONDS = 360
+DEFAULT_WORKERS = 4
+
+# 弹幕模式：1-3 滚动，4 底部，5 顶部，6 逆向滚动；7 高级、8 代码、9 BAS 弹幕无法用普通字幕表示，跳过
+SCROLL_MODES = (1, 2, 3, 6)
+BOTTOM_MODE = 4
+TOP_MODE = 5
+
+STAGE_WIDTH = 1920
+STAGE_HEIGHT = 1080
+FONT_SCALE = 1.6  # B站的字号以播放器默认尺寸为准，放大到1080P
+DEFAULT_FONT_SIZE = 25
+SCROLL_TIME = 8.0
+FIXED_TIME = 4.0
+LINE_SPACING = 1.15
+SCROLL_GAP = 20  # 同一轨道前后两条滚动弹幕之间至少留出的像素
+SCROLL_AREA = 1.0  # 滚动弹幕可使用的屏幕高度比例
+ALPHA = 0x33  # 弹幕不透明度 80%
+WHITE = 0xFFFFFF
+DARK_LUMA = 0x33  # 亮度低于此值的颜色算深色
+
+Comment = collections.namedtuple('Comment', 'time mode size color text')
+
+
+def _varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _skip(data, pos, wire_type):
+    if wire_type == 0:
+        return _varint(data, pos)[1]
+    if wire_type == 1:
+        return pos + 8
+    if wire_type == 2:
+        length, pos = _varint(data, pos)
+        return pos + length
+    if wire_type == 5:
+        return pos + 4
+    raise ValueError(f"不支持的 protobuf 字段类型：{wire_type}")
+
+
+def _parse_elem(data, pos, end):
+    """解析一条 DanmakuElem，只取 progress(2)、mode(3)、fontsize(4)、color(5)、content(7)"""
+    progress = 0
+    mode = 1
+    size = DEFAULT_FONT_SIZE
+    color = WHITE
+    text = ''
+    while pos < end:
+        key, pos = _varint(data, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0 and 2 <= field <= 5:
+            value, pos = _varint(data, pos)
+            if field == 2:
+                progress = value
+            elif field == 3:
+                mode = value
+            elif field == 4:
+                size = value
+            else:
+                color = value
+        elif field == 7 and wire_type == 2:
+            length, pos = _varint(data, pos)
+            text = data[pos:pos + length].decode('utf-8', 'replace')
+            pos += length
+        else:
+            pos = _skip(data, pos, wire_type)
+    if pos > end:
+        raise IndexError("字段超出弹幕条目的长度")
+    return Comment(progress / 1000, mode, size, color & WHITE, text)
+
+
+def parse_segment(data):
+    """解析一段 DmSegMobileReply，返回按时间排序的弹幕列表"""
+    comments = []
+    pos = 0
+    end = len(data)
+    try:
+        while pos < end:
+            key, pos = _varint(data, pos)
+            if key == (1 << 3) | 2:  # repeated DanmakuElem elems = 1
+                length, pos = _varint(data, pos)
+                if pos + length > end:
+                    raise IndexError("弹幕条目超出数据长度")
+                comments.append(_parse_elem(data, pos, pos + length))
+                pos += length
+            else:
+                pos = _skip(data, pos, key & 7)
+        if pos > end:
+            raise IndexError("字段超出数据长度")
+    except IndexError:
+        raise ValueError("弹幕数据不完整")
+    comments.sort(key=lambda c: c.time)
+    return comments
+
+
+def segment_count(duration):
+    return max(1, -(-int(duration or 0) // SEGMENT_SECONDS))
+
+
+def iter_danmaku(session, cid, duration, workers=DEFAULT_WORKERS, should_cancel=None):
+    """按时间顺序逐条生成弹幕；各段并发下载，最多同时有 workers * 2 段在途或等待排版"""
+    should_cancel = should_cancel or (lambda: False)
+
+    def fetch(index):
+        try:
+            response = session.get(SEG_URL, params={'type': 1, 'oid': cid, 'segment_index': index}, timeout=15)
+            if response.status_code != 200:
+                raise Exception(f"状态码：{response.status_code}")
+            return parse_segment(response.content)
+        except Exception as e:
+            raise Exception(f"获取第{index}段弹幕失败：{str(e)}")
+
+    total = segment_count(duration)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = collections.deque()
+        next_index = 1
+        while pending or next_index <= total:
+            while next_index <= total and len(pending) < workers * 2:
+                pending.append(executor.submit(fetch, next_index))
+                next_index += 1
+            comments = pending.popleft().result()
+            if should_cancel():
+                for future in pending:
+                    future.cancel()
+                return
+            yield from comments
+
+
+def text_width(text, size):
+    """估算文本宽度：中日韩等全角字符按一个字号宽，其他按半个"""
+    wide = sum(1 for c in text if c >= 'ᄀ')
+    return size * (wide + (len(text) - wide) * 0.5)
+
+
+def _ass_clock(seconds):
+    cs = int(seconds * 100 + 0.5)
+    seconds, cs = divmod(cs, 100)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%d:%02d:%02d.%02d" % (hours, minutes, seconds, cs)
+
+
+def _escape(text):
+    # 花括号是 ASS 的样式标签，反斜杠会组成 \N \h 等转义，都换成全角
+    return (text.replace('\\', '＼').replace('{', '｛').replace('}', '｝')
+            .replace('\r', '').replace('\n', ' '))
+
+
+class DanmakuLayout:
+    """把按时间顺序到达的弹幕分配到轨道上，返回 ASS 事件行，放不下时返回 None
+
+    滚动弹幕从右向左匀速移动，全程 scroll_time 秒，越长的弹幕速度越快。同一行上新弹幕不与前一条重叠需要：
+    前一条的尾部已经进入屏幕，并且新弹幕追上前一条之前前一条已离开屏幕（新弹幕头部到达左边缘不早于前一条离开）。
+    顶部弹幕从上往下、底部弹幕从下往上找行，与滚动弹幕共用各行的占用记录：有滚动弹幕还在屏幕上的行
+    不放固定弹幕，固定弹幕消失前该行也不放滚动弹幕。
+    """
+
+    def __init__(self, width=STAGE_WIDTH, height=STAGE_HEIGHT, font_scale=FONT_SCALE, scroll_time=SCROLL_TIME,
+                 fixed_time=FIXED_TIME, scroll_area=SCROLL_AREA):
+        self.width = width
+        self.height = height
+        self.font_scale = font_scale
+        self.scroll_time = scroll_time
+        self.fixed_time = fixed_time
+        self.line_height = DEFAULT_FONT_SIZE * font_scale * LINE_SPACING
+        self.lanes = max(1, int(height / self.line_height))
+        self.scroll_lanes = max(1, int(self.lanes * scroll_area))  # 滚动弹幕只使用最上面的这些行
+        self.scroll_enter = [0.0] * self.lanes  # 前一条滚动弹幕尾部进入屏幕的时刻
+        self.scroll_exit = [0.0] * self.lanes  # 前一条滚动弹幕离开屏幕的时刻
+        self.fixed_end = [0.0] * self.lanes  # 顶部或底部弹幕消失的时刻
+        self.dropped = 0
+
+    def _span(self, size):
+        """字号较大的弹幕占用连续的多条轨道"""
+        return max(1, int(-(-size // self.line_height)))
+
+    def _scroll_lane(self, start, width, span):
+        duration = self.scroll_time
+        # 新弹幕头部从右边缘到左边缘所需的时间
+        reach_left = duration * self.width / (self.width + width)
+        enter, exit_, fixed = self.scroll_enter, self.scroll_exit, self.fixed_end
+        for lane in range(self.scroll_lanes - span + 1):
+            for i in range(lane, lane + span):
+                if enter[i] > start or exit_[i] > start + reach_left or fixed[i] > start:
+                    break
+            else:
+                tail_in = start + duration * (width + SCROLL_GAP) / (self.width + width)
+                for i in range(lane, lane + span):
+                    enter[i] = tail_in
+                    exit_[i] = start + duration
+                return lane
+        return None
+
+    def _fixed_lane(self, start, span, from_bottom):
+        """返回占用的最上面一行"""
+        fixed, exit_ = self.fixed_end, self.scroll_exit
+        lanes = range(self.lanes - span + 1)
+        for lane in (reversed(lanes) if from_bottom else lanes):
+            for i in range(lane, lane + span):
+                if fixed[i] > start or exit_[i] > start:
+                    break
+            else:
+                for i in range(lane, lane + span):
+                    fixed[i] = start + self.fixed_time
+                return lane
+        return None
+
+    def place(self, comment):
+        if comment.mode not in SCROLL_MODES and comment.mode not in (TOP_MODE, BOTTOM_MODE):
+            return None
+        text = _escape(comment.text.strip())
+        if not text:
+            return None
+        size = comment.size * self.font_scale
+        width = text_width(text, size)
+        span = self._span(size)
+        start = comment.time
+        style = ''
+        if comment.size != DEFAULT_FONT_SIZE:
+            style += "\\fs%d" % size
+        if comment.color != WHITE:
+            r, g, b = comment.color >> 16, (comment.color >> 8) & 0xFF, comment.color & 0xFF
+            style += "\\c&H%02X%02X%02X&" % (b, g, r)
+            # 按亮度（0.299R + 0.587G + 0.114B）判断深浅，用整数计算避免浮点误差
+            if 299 * r + 587 * g + 114 * b < DARK_LUMA * 1000:
+                style += "\\3c&HFFFFFF&"  # 深色弹幕用白色描边，避免看不清
+        if comment.mode in SCROLL_MODES:
+            lane = self._scroll_lane(start, width, span)
+            if lane is None:
+                self.dropped += 1
+                return None
+            y = lane * self.line_height
+            end = start + self.scroll_time
+            position = "\\an7\\move(%d,%d,%d,%d)" % (self.width, y, -width, y)
+        else:
+            lane = self._fixed_lane(start, span, comment.mode == BOTTOM_MODE)
+            if lane is None:
+                self.dropped += 1
+                return None
+            end = start + self.fixed_time
+            # 底部弹幕也按行的位置定位，与滚动弹幕的行严格对齐
+            position = "\\an8\\pos(%d,%d)" % (self.width // 2, lane * self.line_height)
+        return "Dialogue: 2,%s,%s,Danmaku,,0,0,0,,{%s%s}%s\n" % (
+            _ass_clock(start), _ass_clock(end), position, style, text)
+
+
+def ass_header(width=STAGE_WIDTH, height=STAGE_HEIGHT, font_scale=FONT_SCALE, title=''):
+    font_size = int(DEFAULT_FONT_SIZE * font_scale)
+    return (
+        "[Script Info]\n"
+        f"Title: {title}\n"
+        "ScriptType: v4.00+\n"
+        f"PlayResX: {width}\n"
+        f"PlayResY: {height}\n"
+        "WrapStyle: 2\n"
+        "ScaledBorderAndShadow: yes\n"
+        "\n"
+        "[V4+ Styles]\n"
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, "
+        "Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, "
+        "MarginL, MarginR, MarginV, Encoding\n"
+        f"Style: Danmaku,Microsoft YaHei,{font_size},&H{ALPHA:02X}FFFFFF,&H{ALPHA:02X}FFFFFF,&H{ALPHA:02X}000000,"
+        f"&H{ALPHA:02X}000000,1,0,0,0,100,100,0,0,1,1.5,0,7,0,0,0,1\n"
+        "\n"
+        "[Events]\n"
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+    )
+
+
+def write_danmaku_ass(comments, out, title='', **layout_options):
+    """把按时间排序的弹幕逐条排版写入文本流 out，返回 (写入条数, 丢弃条数)"""
+    layout = DanmakuLayout(**layout_options)
+    out.write(ass_header(layout.width, layout.height, layout.font_scale, title))
+    written = 0
+    for comment in comments:
+        line = layout.place(comment)
+        if line is not None:
+            out.write(line)
+            written += 1
+    return written, layout.dropped
+
+
+def download_danmaku(session, cid, duration, path, title='', workers=DEFAULT_WORKERS, should_cancel=None,
+                     **layout_options):
+    """下载 cid 的全部弹幕并保存为 ASS，返回 (写入条数, 丢弃条数)；取消时返回 None"""
+    should_cancel = should_cancel or (lambda: False)
+    temp_path = path + '.part'
+    try:
+        with open(temp_path, 'w', encoding='utf-8', newline='\n') as f:
+            result = write_danmaku_ass(iter_danmaku(session, cid, duration, workers, should_cancel), f,
+                                       title, **layout_options)
+        if should_cancel():
+            os.remove(temp_path)
+            return None
+        os.replace(temp_path, path)
+        return result
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise Exception(f"下载弹幕失败：{str(e)}")
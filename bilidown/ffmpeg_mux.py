@@ -0,0 +1,279 @@
+"""ffmpeg 合并：查找 ffmpeg，合并已下载的音视频文件，或者边下载边通过命名管道送给 ffmpeg 合并"""
+import collections
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bilidown.segmented import DEFAULT_CONNECTIONS, MAX_RETRIES, STALL_TIMEOUT, probe_stream
+
+STREAM_SEGMENT_SIZE = 4 * 1024 * 1024  # 边下边合并时每段4MB，内存中最多缓存 连接数×4MB
+READ_SIZE = 256 * 1024  # 每次从连接读取的字节数，取消后最多再读这么多
+
+
+def find_ffmpeg():
+    """依次在程序目录、打包临时目录和 PATH 中查找 ffmpeg，找不到返回None"""
+    name = 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg'
+    if getattr(sys, 'frozen', False):
+        # 如果是打包后的exe，使用实际的程序运行目录
+        base_path = os.path.dirname(sys.executable)
+    else:
+        # 如果是开发环境
+        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    candidates = [os.path.join(base_path, name)]
+    # 尝试在临时目录查找（用于处理某些打包情况）
+    if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
+        candidates.append(os.path.join(sys._MEIPASS, name))
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return shutil.which('ffmpeg')
+
+
+def require_ffmpeg():
+    ffmpeg_path = find_ffmpeg()
+    if not ffmpeg_path:
+        raise Exception("找不到ffmpeg，请确保程序目录中包含ffmpeg.exe文件")
+    return ffmpeg_path
+
+
+def merge_files(video_file, audio_file, output_file, ffmpeg_path=None):
+    command = [
+        ffmpeg_path or require_ffmpeg(),
+        '-y',
+        '-i', video_file,
+        '-i', audio_file,
+        '-c', 'copy',
+        output_file
+    ]
+    subprocess.run(command, check=True, stdin=subprocess.DEVNULL)
+
+
+class StreamingMuxer:
+    """边下载边合并：视频流和音频流分别写入两个命名管道，由 ffmpeg 一次性输出最终文件
+
+    用法：
+        muxer = StreamingMuxer(output_file)
+        muxer.start()
+        # 在两个线程中分别调用
+        muxer.feed('video', video_urls, session, headers)
+        muxer.feed('audio', audio_urls, session, headers)
+        muxer.finish()
+
+    数据必须按顺序送入管道，因此每路流用多个连接预取后续分段，再按顺序写出；
+    服务器不支持 Range 时只用一个连接，边读边写入管道，不在内存中缓存整个流。
+    这种方式不经过临时文件，也就不支持断点续传；命名管道只在类Unix系统上可用。
+    """
+
+    def __init__(self, output_file, ffmpeg_path=None, connections=DEFAULT_CONNECTIONS):
+        self.output_file = output_file
+        self.ffmpeg_path = ffmpeg_path
+        self.connections = max(1, int(connections))
+        self.process = None
+        self.temp_dir = None
+        self.pipes = {}
+        self.aborted = False
+
+    @staticmethod
+    def supported():
+        return hasattr(os, 'mkfifo') and find_ffmpeg() is not None
+
+    def start(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='bilidown-mux-')
+        for kind in ('video', 'audio'):
+            path = os.path.join(self.temp_dir, kind)
+            os.mkfifo(path)
+            self.pipes[kind] = path
+        command = [
+            self.ffmpeg_path or require_ffmpeg(),
+            '-y', '-loglevel', 'error',
+            '-i', self.pipes['video'],
+            '-i', self.pipes['audio'],
+            '-map', '0:v', '-map', '1:a',
+            '-c', 'copy',
+            self.output_file
+        ]
+        self.process = subprocess.Popen(command, stdin=subprocess.DEVNULL,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        return self
+
+    def _open_pipe(self, kind, should_cancel):
+        """以非阻塞方式等待 ffmpeg 打开管道的读端，避免 ffmpeg 异常退出时永远卡住"""
+        while True:
+            try:
+                fd = os.open(self.pipes[kind], os.O_WRONLY | os.O_NONBLOCK)
+                os.set_blocking(fd, True)
+                return os.fdopen(fd, 'wb', buffering=0)
+            except OSError:
+                # ENXIO：读端尚未打开
+                if self.aborted or should_cancel() or self.process.poll() is not None:
+                    raise Exception("ffmpeg 未能读取输入")
+                time.sleep(0.05)
+
+    def feed(self, kind, urls, session, headers, progress_callback=None, should_cancel=None, should_pause=None,
+             spread=1, throttle=None):
+        """按顺序下载一路流并写入对应管道，返回是否完整写入
+
+        urls 为主地址加备用地址时，前 spread 个节点轮流承担分段，其余节点只用于出错重试。
+        throttle 为 bandwidth.JobShare 时，各分段边下载边计入该任务的带宽份额。
+        """
+        urls = [urls] if isinstance(urls, str) else list(urls)
+        spread = max(1, min(spread, len(urls)))
+        should_cancel = should_cancel or (lambda: False)
+        should_pause = should_pause or (lambda: False)
+        try:
+            total_size, accept_ranges = probe_stream(session, urls, headers)
+            written = 0
+            if progress_callback:
+                progress_callback(0, total_size)
+            if not accept_ranges or total_size <= 0:
+                with self._open_pipe(kind, should_cancel) as pipe:
+                    return self._pipe_single(pipe, session, urls, headers, total_size, progress_callback,
+                                             should_cancel, should_pause, throttle)
+            segments = [(start, min(start + STREAM_SEGMENT_SIZE, total_size) - 1)
+                        for start in range(0, total_size, STREAM_SEGMENT_SIZE)]
+
+            with self._open_pipe(kind, should_cancel) as pipe:
+                with ThreadPoolExecutor(max_workers=self.connections) as executor:
+                    pending = collections.deque()
+                    remaining = iter(segments)
+                    for index, segment in zip(range(self.connections), remaining):
+                        index %= spread
+                        pending.append(executor.submit(self._fetch, session, urls, index, headers, *segment,
+                                                       throttle=throttle, should_cancel=should_cancel))
+                    while pending:
+                        data = pending.popleft().result()
+                        next_segment = next(remaining, None)
+                        if next_segment is not None:
+                            index = (index + 1) % spread
+                            pending.append(executor.submit(self._fetch, session, urls, index, headers,
+                                                       *next_segment, throttle=throttle, should_cancel=should_cancel))
+                        while should_pause() and not should_cancel():
+                            time.sleep(0.1)
+                        if should_cancel() or data is None:
+                            for future in pending:
+                                future.cancel()
+                            self.abort()
+                            return False
+                        pipe.write(data)
+                        written += len(data)
+                        if progress_callback:
+                            progress_callback(written, total_size)
+            return True
+        except Exception as e:
+            # 一路流失败时结束 ffmpeg，另一路阻塞在管道上的写入也会随之出错退出
+            self.abort()
+            if isinstance(e, BrokenPipeError):
+                raise Exception(f"ffmpeg 提前退出：{self._stderr()}")
+            raise
+
+    def _pipe_single(self, pipe, session, urls, headers, total_size, progress_callback, should_cancel,
+                     should_pause, throttle):
+        """用一个连接从头读取整个流，按块写入管道，返回是否完整写入
+
+        写入管道的数据无法撤回，只有还没写出任何数据时才换节点重试。
+        """
+        request_headers = dict(headers)
+        request_headers['Range'] = 'bytes=0-'
+        written = 0
+        error = None
+        for url in urls:
+            try:
+                for chunk in self._stream(session, url, request_headers, throttle, should_cancel):
+                    while should_pause() and not self._stopped(should_cancel):
+                        time.sleep(0.1)
+                    if self._stopped(should_cancel):
+                        break
+                    pipe.write(chunk)
+                    written += len(chunk)
+                    if progress_callback:
+                        progress_callback(written, total_size)
+            except Exception as e:
+                if written or isinstance(e, BrokenPipeError) or self._stopped(should_cancel):
+                    raise
+                error = e
+                continue
+            if self._stopped(should_cancel):
+                self.abort()
+                return False
+            if total_size and written < total_size:
+                raise Exception(f"下载不完整：{written}/{total_size} 字节")
+            return True
+        raise error
+
+    def _fetch(self, session, urls, host, headers, start, end, throttle=None, should_cancel=None):
+        """下载闭区间 [start, end] 的分段到内存，出错或停滞时切换节点重试；取消时返回None"""
+        attempts = 0
+        while True:
+            request_headers = dict(headers)
+            request_headers['Range'] = f'bytes={start}-{end}'
+            try:
+                data = bytearray()
+                for chunk in self._stream(session, urls[host % len(urls)], request_headers, throttle, should_cancel):
+                    data += chunk
+                if self._stopped(should_cancel):
+                    return None
+                if len(data) != end - start + 1:
+                    raise Exception(f"分段长度不正确：{len(data)}/{end - start + 1}")
+                return data
+            except Exception:
+                attempts += 1
+                if attempts > MAX_RETRIES + len(urls) - 1 or self.aborted:
+                    raise
+                host += 1
+
+    def _stopped(self, should_cancel):
+        return self.aborted or (should_cancel is not None and should_cancel())
+
+    def _stream(self, session, url, headers, throttle, should_cancel):
+        """按块读取一个请求的响应，限速时每块计入带宽份额；中止或取消时提前结束"""
+        size = READ_SIZE if throttle is None else throttle.chunk_size(READ_SIZE)
+        stop = lambda: self._stopped(should_cancel)
+        with session.get(url, headers=headers, stream=True, timeout=STALL_TIMEOUT) as response:
+            if response.status_code not in (200, 206):
+                raise Exception(f"分段请求失败，状态码：{response.status_code}")
+            for chunk in response.iter_content(size):
+                if stop():
+                    return
+                yield chunk
+                if throttle is not None:
+                    throttle.consume(len(chunk), stop)
+
+    def _stderr(self):
+        try:
+            return self.process.stderr.read().decode('utf-8', 'replace').strip()[-500:]
+        except Exception:
+            return ''
+
+    def abort(self):
+        """结束 ffmpeg 并删除不完整的输出文件"""
+        self.aborted = True
+        if self.process and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+            try:
+                os.remove(self.output_file)
+            except OSError:
+                pass
+        if self.temp_dir:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.temp_dir = None
+
+    def finish(self):
+        """等待 ffmpeg 写完输出文件并清理管道"""
+        try:
+            if self.aborted:
+                raise Exception("合并已中止")
+            returncode = self.process.wait()
+            if returncode != 0:
+                raise Exception(f"ffmpeg 返回错误 {returncode}：{self._stderr()}")
+        finally:
+            if self.process.stderr:
+                self.process.stderr.close()
+            if self.temp_dir:
+                shutil.rmtree(self.temp_dir, ignore_errors=True)
+                self.temp_dir = None
@@ -0,0 +1,303 @@
+"""图片服务：头像、封面在后台线程下载和缩放，按URL缓存在磁盘上
+
+    images = get_image_service()
+    images.thumbnail(url, (40, 40), callback=lambda png, error: ...)
+    images.save(url, 'cover.jpg')
+同一张图同时只下载一次，其余请求等它下载完共用结果；磁盘缓存超过容量上限时删除最久未用的文件。
+缩略图在线程池中用 Pillow 生成后同样缓存为 PNG，界面线程只需把数据交给 QPixmap 或 PhotoImage。
+回调在工作线程中执行，Qt 前端应通过信号转回界面线程。列表滚动时可用 cancel 撤销已移出视野、
+还在排队的请求。
+"""
+import collections
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from bilidown.transport import public_session
+
+DEFAULT_WORKERS = 4
+MAX_CACHE_BYTES = 200 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+TIMEOUT = 15
+IMAGE_HEADERS = {
+    'Referer': 'https://www.bilibili.com',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+}
+
+
+def default_cache_dir():
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+        return os.path.join(base, 'BiliDown', 'cache', 'images')
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'bilidown', 'images')
+
+
+class DiskLRU:
+    """按总字节数限制大小的磁盘 LRU，每个条目一个文件
+
+    使用顺序保存在内存中，启动时按文件的访问/修改时间恢复；命中时更新文件时间，重启后顺序不变。
+    """
+
+    def __init__(self, directory, max_bytes=MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()  # 文件名 -> 大小，最近使用的在末尾
+        self._size = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                if name.endswith('.part'):
+                    os.remove(path)  # 上次退出时没写完的临时文件
+                    continue
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((max(stat.st_atime, stat.st_mtime), name, stat.st_size))
+        with self._lock:
+            for _, name, size in sorted(files):
+                self._entries[name] = size
+                self._size += size
+            self._evict()
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def temp_path(self, name):
+        """写入条目用的临时文件，各线程互不冲突"""
+        return self.path(f"{name}.{threading.get_ident()}.part")
+
+    def get(self, name):
+        """命中时返回文件路径并标记为最近使用，否则返回None"""
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._forget(name)  # 文件被外部删除
+            return None
+        return path
+
+    def put_file(self, name, temp_path):
+        """把写好的临时文件移入缓存，返回缓存中的路径"""
+        size = os.path.getsize(temp_path)
+        path = self.path(name)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._forget(name)
+            self._entries[name] = size
+            self._size += size
+            self._evict()
+        return path
+
+    def put(self, name, data):
+        temp_path = self.temp_path(name)
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        return self.put_file(name, temp_path)
+
+    def _forget(self, name):
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._size -= size
+
+    def _evict(self):
+        # 最近放入的条目即使单独超过上限也保留，调用方马上就要用
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            name = next(iter(self._entries))
+            self._forget(name)
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+
+
+def _deliver(future, callback):
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        callback(None, error)
+    else:
+        callback(future.result(), None)
+
+
+class ImageService:
+    """后台下载和缩放图片的线程池，原图和缩略图都存在 DiskLRU 中"""
+
+    def __init__(self, session=None, cache_dir=None, max_bytes=MAX_CACHE_BYTES, workers=DEFAULT_WORKERS):
+        self.session = session
+        try:
+            self.cache = DiskLRU(cache_dir or default_cache_dir(), max_bytes)
+        except OSError:
+            # 缓存目录不可写时改用临时目录，只在本次运行中有效
+            self.cache = DiskLRU(tempfile.mkdtemp(prefix='bilidown-images-'), max_bytes)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='images')
+        self._lock = threading.RLock()
+        self._requests = {}  # (url, 尺寸) -> 排队或进行中的 Future
+        self._downloads = {}  # 缓存文件名 -> 正在下载的原图，供其他线程等待
+
+    @staticmethod
+    def cache_name(url, size=None):
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return digest if size is None else f"{digest}_{size[0]}x{size[1]}.png"
+
+    def fetch(self, url, callback=None):
+        """在后台下载原图，返回 Future，结果为缓存中的文件路径；callback(路径, 错误) 在工作线程中调用"""
+        return self._submit((url, None), lambda: self._load(url), callback)
+
+    def thumbnail(self, url, size, callback=None):
+        """在后台生成不超过 size（宽, 高）、保持比例的缩略图，返回 Future，结果为PNG数据"""
+        size = (int(size[0]), int(size[1]))
+        return self._submit((url, size), lambda: self._thumbnail(url, size), callback)
+
+    def cancel(self, url, size=None):
+        """撤销还在排队的请求，已开始的不受影响；同一图片的其他请求者也会收到取消"""
+        with self._lock:
+            future = self._requests.get((url, None if size is None else (int(size[0]), int(size[1]))))
+        return future.cancel() if future is not None else False
+
+    def save(self, url, path):
+        """把原图保存到 path（在调用线程中执行），缓存命中时不再下载"""
+        temp_path = path + '.part'
+        for attempt in range(2):
+            source = self._load(url)
+            try:
+                with open(source, 'rb') as src, open(temp_path, 'wb') as dst:
+                    while True:
+                        chunk = src.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                break
+            except FileNotFoundError:
+                if attempt:
+                    raise
+                # 原图刚好被淘汰，重新下载一次
+        os.replace(temp_path, path)
+        return path
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _submit(self, key, func, callback):
+        with self._lock:
+            future = self._requests.get(key)
+            if future is None:
+                future = self._executor.submit(func)
+                self._requests[key] = future
+                future.add_done_callback(lambda done: self._finished(key, done))
+        if callback is not None:
+            future.add_done_callback(lambda done: _deliver(done, callback))
+        return future
+
+    def _finished(self, key, future):
+        with self._lock:
+            if self._requests.get(key) is future:
+                del self._requests[key]
+
+    def _load(self, url):
+        """返回原图在缓存中的路径；同一张图同时只有一个线程在下载，其余线程等它的结果"""
+        name = self.cache_name(url)
+        path = self.cache.get(name)
+        if path is not None:
+            return path
+        with self._lock:
+            download = self._downloads.get(name)
+            owner = download is None
+            if owner:
+                path = self.cache.get(name)  # 可能刚被其他线程下载完
+                if path is not None:
+                    return path
+                download = Future()
+                self._downloads[name] = download
+        if not owner:
+            return download.result()
+        try:
+            path = self._download(url, name)
+        except Exception as e:
+            download.set_exception(e)
+            raise
+        else:
+            download.set_result(path)
+            return path
+        finally:
+            with self._lock:
+                self._downloads.pop(name, None)
+
+    def _download(self, url, name):
+        """边下载边写入临时文件，完成后移入缓存，不把整张图读进内存"""
+        session = self.session or public_session()
+        temp_path = self.cache.temp_path(name)
+        try:
+            with session.get(url, headers=IMAGE_HEADERS, stream=True, timeout=TIMEOUT) as response:
+                if response.status_code != 200:
+                    raise Exception(f"状态码：{response.status_code}")
+                with open(temp_path, 'wb') as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+            return self.cache.put_file(name, temp_path)
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise Exception(f"下载图片失败：{str(e)}")
+
+    def _thumbnail(self, url, size):
+        name = self.cache_name(url, size)
+        path = self.cache.get(name)
+        if path is not None:
+            try:
+                with open(path, 'rb') as f:
+                    return f.read()
+            except OSError:
+                pass
+        from PIL import Image  # 第一次生成缩略图时才导入
+
+        for attempt in range(2):
+            source = self._load(url)
+            try:
+                with Image.open(source) as image:
+                    image.draft('RGB', size)  # JPEG 直接按接近目标的尺寸解码，大封面也很快
+                    if image.mode not in ('RGB', 'RGBA'):
+                        image = image.convert('RGBA')
+                    image.thumbnail(size, Image.Resampling.LANCZOS)
+                    out = io.BytesIO()
+                    image.save(out, 'PNG')
+                break
+            except FileNotFoundError:
+                if attempt:
+                    raise
+                # 原图刚好被淘汰，重新下载一次
+        data = out.getvalue()
+        self.cache.put(name, data)
+        return data
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_image_service():
+    """各前端共用的图片服务，第一次调用时创建"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ImageService()
+        return _service
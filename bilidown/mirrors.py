@@ -0,0 +1,98 @@
+"""CDN节点选择：探测主地址和备用地址的首字节延迟与吞吐量，挑出最快的节点"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+SAMPLE_SIZE = 256 * 1024  # 每个节点试读256KB估算吞吐量
+PROBE_TIMEOUT = 5
+MAX_SPREAD = 3  # 同一个流最多同时使用的节点数
+
+
+def stream_urls(stream):
+    """取出DASH流（或 durl 中的一项）的主地址和全部备用地址，去重并保持原有顺序"""
+    urls = [stream.get('baseUrl') or stream.get('base_url') or stream.get('url')]
+    urls += stream.get('backupUrl') or stream.get('backup_url') or []
+    result = []
+    for url in urls:
+        if url and url not in result:
+            result.append(url)
+    return result
+
+
+def host_of(url):
+    return urlsplit(url).hostname or ''
+
+
+class MirrorStats:
+    def __init__(self, url, ttfb=None, throughput=0.0, error=None):
+        self.url = url
+        self.ttfb = ttfb  # 首字节延迟（秒）
+        self.throughput = throughput  # 试读阶段的速度（字节/秒）
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def score(self):
+        """估算下载一个分段所需时间，越小越好"""
+        if not self.ok or self.throughput <= 0:
+            return float('inf')
+        return self.ttfb + SAMPLE_SIZE * 16 / self.throughput
+
+    def __repr__(self):
+        if not self.ok:
+            return f"<MirrorStats {host_of(self.url)} 失败：{self.error}>"
+        return f"<MirrorStats {host_of(self.url)} 首字节{self.ttfb * 1000:.0f}ms {self.throughput / 1024 / 1024:.2f}MB/s>"
+
+
+def probe_mirror(session, url, headers, sample_size=SAMPLE_SIZE, timeout=PROBE_TIMEOUT):
+    """请求开头的 sample_size 字节，测量首字节延迟和吞吐量"""
+    probe_headers = dict(headers)
+    probe_headers['Range'] = f'bytes=0-{sample_size - 1}'
+    started = time.perf_counter()
+    try:
+        response = session.get(url, headers=probe_headers, stream=True, timeout=timeout)
+        try:
+            if response.status_code not in (200, 206):
+                return MirrorStats(url, error=f"状态码 {response.status_code}")
+            received = 0
+            first_byte = None
+            for data in response.iter_content(64 * 1024):
+                if first_byte is None:
+                    first_byte = time.perf_counter()
+                received += len(data)
+                if received >= sample_size or time.perf_counter() - started > timeout:
+                    break
+        finally:
+            response.close()
+        if first_byte is None:
+            return MirrorStats(url, error="没有返回数据")
+        elapsed = max(time.perf_counter() - first_byte, 1e-3)
+        return MirrorStats(url, ttfb=first_byte - started, throughput=received / elapsed)
+    except Exception as e:
+        return MirrorStats(url, error=str(e))
+
+
+def rank_mirrors(session, urls, headers, sample_size=SAMPLE_SIZE, timeout=PROBE_TIMEOUT):
+    """并发探测所有节点，返回按速度排序的 MirrorStats 列表，失败的节点排在最后"""
+    if len(urls) <= 1:
+        return [MirrorStats(url) for url in urls]
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        stats = list(executor.map(lambda url: probe_mirror(session, url, headers, sample_size, timeout), urls))
+    return sorted(stats, key=lambda s: s.score())
+
+
+def select_mirrors(session, urls, headers, spread=MAX_SPREAD):
+    """返回 (按速度排序的地址列表, 用于分担分段的节点数)
+
+    明显慢于最快节点的地址不参与分段，只在其他节点出错时作为后备。
+    """
+    stats = rank_mirrors(session, urls, headers)
+    usable = [s for s in stats if s.ok]
+    if not usable:
+        return list(urls), 1
+    best = usable[0].score()
+    # 速度在最快节点一半以内的节点一起分担分段
+    preferred = [s.url for s in usable[:spread] if s.score() <= best * 2]
+    return preferred + [s.url for s in stats if s.url not in preferred], len(preferred)
@@ -0,0 +1,525 @@
+"""内置 MP4 合并：在盒子（box）层面把 DASH 视频轨和音频轨合成一个 MP4，不重新编码，也不需要 ffmpeg
+
+B站的 DASH 流是分片 MP4（ftyp、moov、sidx，后接若干 moof+mdat）。合并时只需要：
+把两个 moov 里的 trak 放进同一个 moov，音频轨改用新的轨道号；再按解码时间交错写出两路的 moof+mdat，
+改写其中的轨道号和分片序号。mdat 按块从源文件直接复制到输出文件，不会整个读入内存。
+只下载了部分分片的片段文件（见 clips）先用 rebase_clip 把时间轴平移到从0开始并加上编辑列表，再照常合并。
+"""
+import collections
+import heapq
+import io
+import os
+import struct
+
+from bilidown.ffmpeg_mux import find_ffmpeg, merge_files
+
+COPY_CHUNK = 1024 * 1024  # 不支持 copy_file_range 时每次复制1MB
+VIDEO_TRACK_ID = 1
+AUDIO_TRACK_ID = 2
+FRAGMENT_END_BOXES = (b'moof', b'sidx', b'styp', b'mfra')  # 遇到这些盒子说明当前分片结束
+TFHD_BASE_DATA_OFFSET = 0x000001
+TFHD_SAMPLE_DESCRIPTION_INDEX = 0x000002
+TFHD_DEFAULT_SAMPLE_DURATION = 0x000008
+TRUN_OPTIONAL_FIELDS = ((0x000001, 4), (0x000004, 4))  # data_offset、first_sample_flags
+TRUN_SAMPLE_FIELDS = (0x000100, 0x000200, 0x000400, 0x000800)  # 时长、大小、标志、显示时间偏移
+TRUN_SAMPLE_DURATION = 0x000100
+TRUN_COMPOSITION_OFFSET = 0x000800
+
+# sidx 中的一条引用：分片在文件中的偏移和大小，起始时间和时长（sidx 的时间刻度）
+SidxReference = collections.namedtuple('SidxReference', 'offset size start duration')
+
+
+class RemuxError(Exception):
+    """输入不是可以直接合并的分片 MP4，调用方可以改用 ffmpeg"""
+
+
+def read_boxes(f, start, end):
+    """列出 [start, end) 范围内的盒子，返回 (类型, 偏移, 大小, 头部长度) 列表"""
+    boxes = []
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(16)
+        size, box_type = struct.unpack('>I4s', header[:8])
+        header_size = 8
+        if size == 1:
+            if len(header) < 16:
+                raise RemuxError(f"盒子 {box_type!r} 头部不完整")
+            size = struct.unpack('>Q', header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset  # 大小为0表示一直到文件末尾
+        if size < header_size or offset + size > end:
+            raise RemuxError(f"盒子 {box_type!r} 大小不正确")
+        boxes.append((box_type, offset, size, header_size))
+        offset += size
+    return boxes
+
+
+def find_box(data, path, start=0, end=None):
+    """在内存数据中按路径（如 [b'mdia', b'mdhd']）查找盒子，返回 (负载起点, 盒子终点)，找不到返回None"""
+    end = len(data) if end is None else end
+    for box_type, offset, size, header_size in read_boxes(io.BytesIO(data), start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return offset + header_size, offset + size
+            return find_box(data, path[1:], offset + header_size, offset + size)
+    return None
+
+
+def make_box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def _read_uint(data, offset, version):
+    """读取 version 决定宽度的字段：version 0 为32位，version 1 为64位"""
+    if version == 1:
+        return struct.unpack_from('>Q', data, offset)[0]
+    return struct.unpack_from('>I', data, offset)[0]
+
+
+def _write_uint(data, offset, version, value):
+    if version == 1:
+        struct.pack_into('>Q', data, offset, value)
+    else:
+        struct.pack_into('>I', data, offset, min(value, 0xFFFFFFFF))
+
+
+def parse_sidx(sidx, anchor):
+    """解析 sidx 的负载，返回 (时间刻度, [SidxReference])；anchor 为 sidx 盒子结束处在文件中的偏移"""
+    if len(sidx) < 12:
+        raise RemuxError("sidx 不完整")
+    version = sidx[0]
+    timescale = struct.unpack_from('>I', sidx, 8)[0]
+    if not timescale:
+        raise RemuxError("时间刻度为0")
+    width = 8 if version == 1 else 4
+    start = _read_uint(sidx, 12, version)
+    offset = anchor + _read_uint(sidx, 12 + width, version)
+    position = 12 + 2 * width + 2
+    if len(sidx) < position + 2:
+        raise RemuxError("sidx 不完整")
+    count = struct.unpack_from('>H', sidx, position)[0]
+    position += 2
+    if len(sidx) < position + 12 * count:
+        raise RemuxError("sidx 不完整")
+    references = []
+    for _ in range(count):
+        reference, duration = struct.unpack_from('>II', sidx, position)
+        if reference & 0x80000000:
+            raise RemuxError("不支持多级 sidx")
+        size = reference & 0x7FFFFFFF
+        references.append(SidxReference(offset, size, start, duration))
+        offset += size
+        start += duration
+        position += 12
+    return timescale, references
+
+
+class _Fragment:
+    def __init__(self, decode_time, moof_offset, moof_size, data_end):
+        self.decode_time = decode_time
+        self.moof_offset = moof_offset
+        self.moof_size = moof_size
+        self.data_end = data_end  # moof 之后的 mdat 等盒子一直到这里
+
+
+class _Track:
+    """解析一个单轨分片 MP4：记下 ftyp、moov 的各部分以及每个分片的位置，不读取媒体数据"""
+
+    def __init__(self, f):
+        self.f = f
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        top = read_boxes(f, 0, file_size)
+
+        self.ftyp = None
+        sidx = None
+        moov = None
+        self.fragments = []
+        index = 0
+        while index < len(top):
+            box_type, offset, size, header_size = top[index]
+            if box_type == b'ftyp' and self.ftyp is None:
+                self.ftyp = self._read(offset, size)
+            elif box_type == b'moov':
+                moov = bytearray(self._read(offset, size))
+            elif box_type == b'sidx' and sidx is None:
+                sidx = self._read(offset, size)[header_size:]
+            elif box_type == b'moof':
+                data_end = offset + size
+                while index + 1 < len(top) and top[index + 1][0] not in FRAGMENT_END_BOXES:
+                    index += 1
+                    data_end = top[index][1] + top[index][2]
+                moof = self._read(offset, size)
+                if not self.fragments:
+                    first_moof = moof
+                self.fragments.append(_Fragment(self._decode_time(moof), offset, size, data_end))
+            index += 1
+
+        if moov is None or not self.fragments:
+            raise RemuxError("不是分片MP4（缺少 moov 或 moof）")
+        self._parse_moov(moov)
+
+        # sidx 声明的起始时间与首帧实际显示时间不一致时（如B帧带来的延迟），合并后用编辑列表保持原来的时间轴，
+        # 否则音视频会错开
+        self.media_offset = 0
+        if sidx is not None:
+            declared = self._sidx_time(sidx)
+            if declared is not None:
+                first_time = self._first_presentation_time(first_moof, self.fragments[0].decode_time)
+                self.media_offset = max(0, first_time - declared)
+
+    def _read(self, offset, size):
+        self.f.seek(offset)
+        return self.f.read(size)
+
+    def _parse_moov(self, moov):
+        self.mvhd = None
+        self.mehd = None
+        self.trak = None
+        self.trex = None
+        self.extra = []  # udta、meta 等原样保留的盒子
+        traks = 0
+        for box_type, offset, size, header_size in read_boxes(io.BytesIO(moov), 8, len(moov)):
+            box = bytearray(moov[offset:offset + size])
+            if box_type == b'mvhd':
+                self.mvhd = box
+            elif box_type == b'trak':
+                self.trak = box
+                traks += 1
+            elif box_type == b'mvex':
+                for child_type, child_offset, child_size, _ in read_boxes(io.BytesIO(box), header_size, size):
+                    child = bytearray(box[child_offset:child_offset + child_size])
+                    if child_type == b'mehd':
+                        self.mehd = child
+                    elif child_type == b'trex':
+                        self.trex = child
+            else:
+                self.extra.append(bytes(box))
+        if self.mvhd is None or traks != 1 or self.trex is None:
+            raise RemuxError("moov 中应当只有一个轨道且带有 trex")
+
+        mdhd = find_box(self.trak, [b'trak', b'mdia', b'mdhd'])
+        if mdhd is None:
+            raise RemuxError("找不到 mdhd")
+        version = self.trak[mdhd[0]]
+        self.timescale = struct.unpack_from('>I', self.trak, mdhd[0] + (20 if version == 1 else 12))[0]
+        version = self.mvhd[8]
+        self.movie_timescale = struct.unpack_from('>I', self.mvhd, 8 + (20 if version == 1 else 12))[0]
+        if not self.timescale or not self.movie_timescale:
+            raise RemuxError("时间刻度为0")
+
+    @staticmethod
+    def _decode_time(moof):
+        trafs = [box for box in read_boxes(io.BytesIO(moof), 8, len(moof)) if box[0] == b'traf']
+        if len(trafs) != 1:
+            raise RemuxError("每个 moof 应当只有一个 traf")
+        _, offset, size, header_size = trafs[0]
+        tfdt = find_box(moof, [b'tfdt'], offset + header_size, offset + size)
+        if tfdt is None:
+            raise RemuxError("分片缺少 tfdt，无法确定时间")
+        return _read_uint(moof, tfdt[0] + 4, moof[tfdt[0]])
+
+    def _sidx_time(self, sidx):
+        """sidx 中声明的最早显示时间，换算到轨道的时间刻度"""
+        timescale = struct.unpack_from('>I', sidx, 8)[0]
+        if not timescale:
+            return None
+        return _read_uint(sidx, 12, sidx[0]) * self.timescale // timescale
+
+    @staticmethod
+    def _first_presentation_time(moof, decode_time):
+        """分片首帧（关键帧）的显示时间：解码时间加上它的显示时间偏移"""
+        trun = find_box(moof, [b'traf', b'trun'], 8)
+        if trun is None:
+            return decode_time
+        version = moof[trun[0]]
+        flags = struct.unpack_from('>I', moof, trun[0])[0] & 0xFFFFFF
+        count = struct.unpack_from('>I', moof, trun[0] + 4)[0]
+        if not count or not flags & TRUN_COMPOSITION_OFFSET:
+            return decode_time
+        position = trun[0] + 8 + sum(width for flag, width in TRUN_OPTIONAL_FIELDS if flags & flag)
+        # 显示时间偏移是每个样本记录中的最后一个字段
+        position += 4 * sum(1 for flag in TRUN_SAMPLE_FIELDS if flags & flag) - 4
+        return decode_time + struct.unpack_from('>i' if version == 1 else '>I', moof, position)[0]
+
+    def fragment_duration(self, fragment):
+        """分片中所有样本时长之和（轨道时间刻度）；trun 没有逐个样本的时长时取 tfhd 或 trex 中的默认值"""
+        moof = self._read(fragment.moof_offset, fragment.moof_size)
+        traf = find_box(moof, [b'traf'], 8)
+        if traf is None:
+            raise RemuxError("分片缺少 traf")
+        default = struct.unpack_from('>I', self.trex, 20)[0]
+        total = 0
+        for box_type, offset, size, header_size in read_boxes(io.BytesIO(moof), traf[0], traf[1]):
+            position = offset + header_size
+            flags = struct.unpack_from('>I', moof, position)[0] & 0xFFFFFF
+            if box_type == b'tfhd' and flags & TFHD_DEFAULT_SAMPLE_DURATION:
+                position += 8 + (8 if flags & TFHD_BASE_DATA_OFFSET else 0)
+                position += 4 if flags & TFHD_SAMPLE_DESCRIPTION_INDEX else 0
+                default = struct.unpack_from('>I', moof, position)[0]
+            elif box_type == b'trun':
+                count = struct.unpack_from('>I', moof, position + 4)[0]
+                if not flags & TRUN_SAMPLE_DURATION:
+                    total += count * default
+                    continue
+                # 样本时长是每个样本记录中的第一个字段
+                position += 8 + sum(width for flag, width in TRUN_OPTIONAL_FIELDS if flags & flag)
+                record = 4 * sum(1 for flag in TRUN_SAMPLE_FIELDS if flags & flag)
+                total += sum(struct.unpack_from('>I', moof, position + i * record)[0] for i in range(count))
+        return total
+
+    def presentation_duration(self, movie_timescale):
+        """轨道的显示时长，换算到 movie 时间刻度
+
+        已有编辑列表（如 rebase_clip 截取的片段）时取各段时长之和；否则按分片中的样本时长计算，分片 MP4
+        的 mvhd、tkhd 中的时长常常为0，不能作为依据。编辑列表跳过 media_offset 只是平移显示时间，
+        显示的长度仍是全部样本时长之和。
+        """
+        elst = find_box(self.trak, [b'trak', b'edts', b'elst'])
+        if elst is not None:
+            version = self.trak[elst[0]]
+            count = struct.unpack_from('>I', self.trak, elst[0] + 4)[0]
+            entry_size = 20 if version == 1 else 12
+            edited = sum(_read_uint(self.trak, elst[0] + 8 + entry * entry_size, version) for entry in range(count))
+            if edited:
+                return edited * movie_timescale // self.movie_timescale
+        first, last = self.fragments[0], self.fragments[-1]
+        media = last.decode_time + self.fragment_duration(last) - first.decode_time
+        return media * movie_timescale // self.timescale
+
+    def renumbered_trak(self, track_id, movie_timescale, duration):
+        """复制 trak，改写轨道号，tkhd 时长改为 duration（movie 时间刻度）；movie 时间刻度不同时换算 elst 中的时长"""
+        trak = bytearray(self.trak)
+        tkhd = find_box(trak, [b'trak', b'tkhd'])
+        if tkhd is None:
+            raise RemuxError("找不到 tkhd")
+        tkhd_version = trak[tkhd[0]]
+        id_offset = tkhd[0] + (20 if tkhd_version == 1 else 12)
+        duration_offset = id_offset + 8
+        struct.pack_into('>I', trak, id_offset, track_id)
+        _write_uint(trak, duration_offset, tkhd_version, duration)
+        if movie_timescale != self.movie_timescale:
+            elst = find_box(trak, [b'trak', b'edts', b'elst'])
+            if elst is not None:
+                version = trak[elst[0]]
+                count = struct.unpack_from('>I', trak, elst[0] + 4)[0]
+                entry_size = 20 if version == 1 else 12
+                for entry in range(count):
+                    entry_offset = elst[0] + 8 + entry * entry_size
+                    duration = _read_uint(trak, entry_offset, version)
+                    _write_uint(trak, entry_offset, version, duration * movie_timescale // self.movie_timescale)
+        if self.media_offset and find_box(trak, [b'trak', b'edts']) is None:
+            # 编辑列表：从 media_offset 处开始显示，与源文件 sidx 声明的时间轴一致
+            elst = struct.pack('>IIQqhh', 0x01000000, 1, duration, self.media_offset, 1, 0)
+            trak[tkhd[1]:tkhd[1]] = make_box(b'edts', make_box(b'elst', elst))
+            struct.pack_into('>I', trak, 0, len(trak))
+        return bytes(trak)
+
+    def renumbered_trex(self, track_id):
+        trex = bytearray(self.trex)
+        struct.pack_into('>I', trex, 12, track_id)
+        return bytes(trex)
+
+    def patched_moof(self, fragment, track_id, sequence, new_offset):
+        """读取一个 moof 并改写分片序号、轨道号；带绝对数据偏移的按新位置平移"""
+        moof = bytearray(self._read(fragment.moof_offset, fragment.moof_size))
+        mfhd = find_box(moof, [b'mfhd'], 8)
+        if mfhd is not None:
+            struct.pack_into('>I', moof, mfhd[0] + 4, sequence)
+        tfhd = find_box(moof, [b'traf', b'tfhd'], 8)
+        if tfhd is None:
+            raise RemuxError("分片缺少 tfhd")
+        flags = struct.unpack_from('>I', moof, tfhd[0])[0] & 0xFFFFFF
+        struct.pack_into('>I', moof, tfhd[0] + 4, track_id)
+        if flags & TFHD_BASE_DATA_OFFSET:
+            base_offset = struct.unpack_from('>Q', moof, tfhd[0] + 8)[0]
+            struct.pack_into('>Q', moof, tfhd[0] + 8, base_offset - fragment.moof_offset + new_offset)
+        return moof
+
+
+def _set_duration(data, box, offset_v0, offset_v1, value, keep_zero=False):
+    """改写 mvhd、tkhd、mdhd 等盒子中按版本决定宽度的时长字段；keep_zero 时原来为0的不改"""
+    if box is None:
+        return
+    version = data[box[0]]
+    offset = box[0] + (offset_v1 if version == 1 else offset_v0)
+    if not keep_zero or _read_uint(data, offset, version):
+        _write_uint(data, offset, version, value)
+
+
+def rebase_clip(path, skip_seconds, duration_seconds, moved_by=0):
+    """改写只含部分分片的片段文件（初始化段后直接接分片），使其可以单独播放或合并
+
+    分片的解码时间平移到从0开始，用编辑列表跳过开头 skip_seconds 秒、只显示 duration_seconds 秒，
+    这样音频分片的边界与视频关键帧不一致时，两路仍从同一时刻开始。moved_by 是分片在片段文件中的位置
+    相对源文件的偏移量，用于平移 tfhd 中的绝对数据偏移。
+    """
+    temp_path = path + '.rebase'
+    with open(path, 'rb') as f:
+        track = _Track(f)
+        first = track.fragments[0]
+        base = first.decode_time
+        composition = track._first_presentation_time(track._read(first.moof_offset, first.moof_size), base) - base
+        media_time = round(skip_seconds * track.timescale) + composition
+        movie_duration = round(duration_seconds * track.movie_timescale)
+
+        mvhd = bytearray(track.mvhd)
+        _set_duration(mvhd, (8, len(mvhd)), 16, 24, movie_duration)
+        trak = bytearray(track.trak)
+        edts = find_box(trak, [b'trak', b'edts'])
+        if edts is not None:
+            del trak[edts[0] - 8:edts[1]]
+        tkhd = find_box(trak, [b'trak', b'tkhd'])
+        if tkhd is None:
+            raise RemuxError("找不到 tkhd")
+        _set_duration(trak, tkhd, 20, 28, movie_duration)
+        _set_duration(trak, find_box(trak, [b'trak', b'mdia', b'mdhd']), 16, 24,
+                      round(duration_seconds * track.timescale), keep_zero=True)
+        elst = struct.pack('>IIQqhh', 0x01000000, 1, movie_duration, media_time, 1, 0)
+        trak[tkhd[1]:tkhd[1]] = make_box(b'edts', make_box(b'elst', elst))
+        struct.pack_into('>I', trak, 0, len(trak))
+        mvex = bytes(track.trex)
+        if track.mehd is not None:
+            mehd = bytearray(track.mehd)
+            _set_duration(mehd, (8, len(mehd)), 4, 4, movie_duration)
+            mvex = bytes(mehd) + mvex
+        moov = make_box(b'moov', bytes(mvhd) + bytes(trak) + make_box(b'mvex', mvex) + b''.join(track.extra))
+
+        try:
+            with open(temp_path, 'wb', buffering=0) as out:
+                out.write(track.ftyp or make_box(b'ftyp', b'isom\x00\x00\x02\x00isomiso6mp41'))
+                out.write(moov)
+                position = out.tell()
+                for fragment in track.fragments:
+                    moof = bytearray(track._read(fragment.moof_offset, fragment.moof_size))
+                    tfdt = find_box(moof, [b'traf', b'tfdt'], 8)
+                    version = moof[tfdt[0]]
+                    _write_uint(moof, tfdt[0] + 4, version, _read_uint(moof, tfdt[0] + 4, version) - base)
+                    tfhd = find_box(moof, [b'traf', b'tfhd'], 8)
+                    if tfhd is not None and struct.unpack_from('>I', moof, tfhd[0])[0] & TFHD_BASE_DATA_OFFSET:
+                        # 绝对偏移是相对源文件的：先换算成相对 moof 的位置，再加上新位置
+                        base_offset = struct.unpack_from('>Q', moof, tfhd[0] + 8)[0]
+                        source_offset = fragment.moof_offset - moved_by
+                        struct.pack_into('>Q', moof, tfhd[0] + 8, base_offset - source_offset + position)
+                    out.write(moof)
+                    data_size = fragment.data_end - fragment.moof_offset - fragment.moof_size
+                    copy_range(f, out, fragment.moof_offset + fragment.moof_size, data_size)
+                    position += len(moof) + data_size
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+    os.replace(temp_path, path)
+
+
+def copy_range(src, dst, offset, size):
+    """把 src 中 [offset, offset+size) 复制到 dst 当前位置；dst 须为无缓冲文件
+
+    支持的系统上用 copy_file_range 在内核中复制，数据不经过用户空间。
+    """
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while size > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), size, offset)
+                if copied == 0:
+                    raise RemuxError("源文件提前结束")
+                offset += copied
+                size -= copied
+            return
+        except OSError:
+            pass  # 跨文件系统或内核不支持时退回普通复制
+    buffer = bytearray(min(COPY_CHUNK, max(size, 1)))
+    view = memoryview(buffer)
+    src.seek(offset)
+    while size > 0:
+        read = src.readinto(view[:min(size, len(buffer))])
+        if not read:
+            raise RemuxError("源文件提前结束")
+        dst.write(view[:read])
+        size -= read
+
+
+def _tfra(track_id, entries):
+    """随机访问表：每个分片首帧的显示时间和 moof 位置，便于播放器跳转"""
+    payload = struct.pack('>I', 0x01000000) + struct.pack('>III', track_id, 0, len(entries))
+    payload += b''.join(struct.pack('>QQBBB', time, offset, 1, 1, 1) for time, offset in entries)
+    return make_box(b'tfra', payload)
+
+
+def remux(video_file, audio_file, output_file):
+    """把 DASH 视频轨和音频轨合并为一个分片 MP4，输入不受支持时抛出 RemuxError"""
+    with open(video_file, 'rb') as vf, open(audio_file, 'rb') as af:
+        video = _Track(vf)
+        audio = _Track(af)
+
+        movie_timescale = video.movie_timescale
+        mvhd = bytearray(video.mvhd)
+        version = mvhd[8]
+        # 各轨道的时长按分片中的样本时长计算，影片时长和 mehd 取两者中较长的
+        video_duration = video.presentation_duration(movie_timescale)
+        audio_duration = audio.presentation_duration(movie_timescale)
+        duration = max(video_duration, audio_duration)
+        _write_uint(mvhd, 8 + (24 if version == 1 else 16), version, duration)
+        struct.pack_into('>I', mvhd, len(mvhd) - 4, AUDIO_TRACK_ID + 1)  # next_track_ID
+
+        mvex = video.renumbered_trex(VIDEO_TRACK_ID) + audio.renumbered_trex(AUDIO_TRACK_ID)
+        mvex = make_box(b'mehd', struct.pack('>IQ', 0x01000000, duration)) + mvex
+        moov = make_box(b'moov', bytes(mvhd)
+                        + video.renumbered_trak(VIDEO_TRACK_ID, movie_timescale, video_duration)
+                        + audio.renumbered_trak(AUDIO_TRACK_ID, movie_timescale, audio_duration)
+                        + make_box(b'mvex', mvex)
+                        + b''.join(video.extra))
+
+        # 按解码时间（换算成秒）交错两路分片，时间相同时视频在前
+        streams = [
+            ((fragment.decode_time / video.timescale, 0, index), video, fragment, VIDEO_TRACK_ID)
+            for index, fragment in enumerate(video.fragments)
+        ], [
+            ((fragment.decode_time / audio.timescale, 1, index), audio, fragment, AUDIO_TRACK_ID)
+            for index, fragment in enumerate(audio.fragments)
+        ]
+
+        random_access = {VIDEO_TRACK_ID: [], AUDIO_TRACK_ID: []}
+        try:
+            with open(output_file, 'wb', buffering=0) as out:
+                out.write(video.ftyp or make_box(b'ftyp', b'isom\x00\x00\x02\x00isomiso6mp41'))
+                out.write(moov)
+                position = out.tell()
+                for sequence, (_, track, fragment, track_id) in enumerate(heapq.merge(*streams), 1):
+                    moof = track.patched_moof(fragment, track_id, sequence, position)
+                    out.write(moof)
+                    data_size = fragment.data_end - fragment.moof_offset - fragment.moof_size
+                    copy_range(track.f, out, fragment.moof_offset + fragment.moof_size, data_size)
+                    random_access[track_id].append((track._first_presentation_time(moof, fragment.decode_time), position))
+                    position += len(moof) + data_size
+
+                mfra = b''.join(_tfra(track_id, entries) for track_id, entries in random_access.items())
+                mfro_size = 8 + 4 + 4
+                out.write(make_box(b'mfra', mfra + make_box(b'mfro', struct.pack('>II', 0, 8 + len(mfra) + mfro_size))))
+        except BaseException:
+            try:
+                os.remove(output_file)
+            except OSError:
+                pass
+            raise
+
+
+def merge_streams(video_file, audio_file, output_file, mode='auto'):
+    """按 mode 合并音视频：
+
+    auto   优先用内置合并，输入不受支持时改用 ffmpeg（找不到 ffmpeg 时报错）
+    native 只用内置合并
+    ffmpeg 只用 ffmpeg
+    """
+    if mode == 'ffmpeg':
+        return merge_files(video_file, audio_file, output_file)
+    try:
+        return remux(video_file, audio_file, output_file)
+    except RemuxError as e:
+        if mode == 'native' or find_ffmpeg() is None:
+            raise Exception(f"内置合并不支持该文件：{str(e)}")
+        return merge_files(video_file, audio_file, output_file)
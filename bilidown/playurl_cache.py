@@ -0,0 +1,138 @@
+"""playurl 结果缓存：流地址带有签名和 deadline 参数，在到期前可以反复使用，不必每次都请求接口
+
+按 (账号, bvid, cid, qn, fnval) 缓存 x/player/playurl 的 data，过期时间取所有流地址中最早的 deadline，
+再提前 DEADLINE_MARGIN 秒刷新，保证交出去的地址还能用足够长的时间。重新排队、重试和切换回同一画质的任务直接使用缓存，也能少触发 412 限流。
+"""
+import collections
+import copy
+import hashlib
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+# 到期前1小时就重新获取：分段重试、续传和切换镜像会在整个下载过程中用同一份地址再次发起请求，
+# 长时间的下载途中地址不能过期（B站地址的有效期通常为2小时）
+DEADLINE_MARGIN = 3600
+DEFAULT_TTL = 600  # 地址中没有 deadline 时缓存10分钟
+MAX_ENTRIES = 512
+
+
+def account_of(session):
+    """区分账号的摘要：未登录和不同账号拿到的画质不同，不能共用缓存"""
+    sessdata = next((cookie.value for cookie in session.cookies if cookie.name == 'SESSDATA'), '')
+    return hashlib.sha1(sessdata.encode('utf-8')).hexdigest()[:16]
+
+
+def playurl_key(session, bvid, cid, qn, fnval):
+    return (account_of(session), bvid, str(cid), str(qn), str(fnval))
+
+
+def _stream_urls(data):
+    """playurl 返回中的所有流地址（DASH 的主/备用地址以及 durl）"""
+    dash = data.get('dash') or {}
+    for stream in (dash.get('video') or []) + (dash.get('audio') or []):
+        yield stream.get('baseUrl') or stream.get('base_url')
+        yield from stream.get('backupUrl') or stream.get('backup_url') or []
+    for item in data.get('durl') or []:
+        yield item.get('url')
+        yield from item.get('backup_url') or []
+
+
+def expires_at(data, now=None, margin=DEADLINE_MARGIN, default_ttl=DEFAULT_TTL):
+    """根据地址里最早的 deadline 计算缓存到期时间"""
+    now = time.time() if now is None else now
+    deadlines = []
+    for url in _stream_urls(data):
+        if not url:
+            continue
+        value = parse_qs(urlsplit(url).query).get('deadline', [''])[0]
+        if value.isdigit():
+            deadlines.append(int(value))
+    if not deadlines:
+        return now + default_ttl
+    return min(deadlines) - margin
+
+
+class PlayurlCache:
+    """线程安全的 playurl 缓存；同一个键同时只有一个线程请求接口，其他线程等待结果"""
+
+    def __init__(self, margin=DEADLINE_MARGIN, default_ttl=DEFAULT_TTL, max_entries=MAX_ENTRIES):
+        self.margin = margin
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()  # 键 -> (到期时间, data)
+        self._lock = threading.Lock()
+        self._fetch_locks = {}  # 键 -> [锁, 使用中的线程数]，没有线程使用时删除
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() >= entry[0]:
+                return None
+            self._entries.move_to_end(key)
+            # 返回副本，调用方修改结果不会影响缓存
+            return copy.deepcopy(entry[1])
+
+    def put(self, key, data):
+        deadline = expires_at(data, margin=self.margin, default_ttl=self.default_ttl)
+        if deadline <= time.time():
+            return  # 地址已经快过期，缓存没有意义
+        with self._lock:
+            self._entries[key] = (deadline, copy.deepcopy(data))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """地址失效（如 CDN 返回403）时删除缓存，下次重新获取"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_or_fetch(self, key, fetch):
+        data = self.get(key)
+        if data is not None:
+            self._record(True)
+            return data
+        with self._lock:
+            fetch_lock = self._fetch_locks.get(key)
+            if fetch_lock is None:
+                fetch_lock = self._fetch_locks[key] = [threading.Lock(), 0]
+            fetch_lock[1] += 1
+        try:
+            with fetch_lock[0]:
+                # 等锁期间其他线程可能已经取到
+                data = self.get(key)
+                if data is not None:
+                    self._record(True)
+                    return data
+                self._record(False)
+                data = fetch()
+                self.put(key, data)
+                return data
+        finally:
+            with self._lock:
+                fetch_lock[1] -= 1
+                if fetch_lock[1] == 0:
+                    del self._fetch_locks[key]
+
+    def _record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_playurl_cache():
+    """各前端共用的缓存实例"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PlayurlCache()
+        return _cache
@@ -0,0 +1,202 @@
+"""竞速解析：同时向官方接口和第三方解析接口请求下载地址，取最先返回的有效结果或画质最好的结果
+
+每个接口的成功率和延迟按指数加权滚动统计，健康度高、延迟低的接口先发出请求，其余接口间隔
+hedge_delay 秒依次补发；某个接口失败时立即补发下一个，用户只会在全部接口都失败时看到错误。
+    name, info = get_racer().resolve({'官方': fetch_official, '解析接口1': fetch_parse1})
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+THIRD_PARTY_APIS = ('解析接口1', 'RapidAPI', 'BiliAPI')
+RACING_MODES = {
+    '自动(竞速)': 'first',
+    '自动(最高画质)': 'best',
+}
+HEDGE_DELAY = 0.3  # 前一个接口这么久还没结果就补发下一个
+GRACE_PERIOD = 0.5  # 竞速模式拿到第一个结果后再等一会儿，看有没有画质更好的
+RESOLVE_TIMEOUT = 15
+SMOOTHING = 0.3  # 滚动统计中新样本的权重
+PRIOR_LATENCY = 1.0  # 没有记录的接口按1秒延迟估计
+COOLDOWN = 60  # 连续失败后的冷却时间（秒），每多失败一次翻倍
+MAX_COOLDOWN = 600
+FAILURES_BEFORE_COOLDOWN = 3
+
+
+def is_valid(info):
+    """结果中至少要有一路可下载的地址"""
+    if not isinstance(info, dict):
+        return False
+    dash = info.get('dash') or {}
+    for stream in (dash.get('video') or []) + (dash.get('audio') or []):
+        if stream.get('baseUrl') or stream.get('base_url'):
+            return True
+    return any(item.get('url') for item in info.get('durl') or [])
+
+
+def result_quality(info):
+    """结果的画质编号：DASH 取最高的视频流，单文件结果取 quality 字段，没有时为0"""
+    videos = (info.get('dash') or {}).get('video') or []
+    if videos:
+        return max(v.get('id') or 0 for v in videos)
+    return info.get('quality') or 0
+
+
+class SourceHealth:
+    """单个接口的滚动统计"""
+
+    def __init__(self, name):
+        self.name = name
+        self.latency = None  # 成功请求的平均耗时（秒）
+        self.success_rate = 1.0
+        self.failures = 0  # 连续失败次数
+        self.last_failure = 0.0
+        self.requests = 0
+
+    def record(self, ok, elapsed):
+        self.requests += 1
+        self.success_rate += SMOOTHING * ((1.0 if ok else 0.0) - self.success_rate)
+        if ok:
+            self.latency = elapsed if self.latency is None else self.latency + SMOOTHING * (elapsed - self.latency)
+            self.failures = 0
+        else:
+            self.failures += 1
+            self.last_failure = time.monotonic()
+
+    def cooling_down(self, now=None):
+        if self.failures < FAILURES_BEFORE_COOLDOWN:
+            return False
+        cooldown = min(MAX_COOLDOWN, COOLDOWN * 2 ** (self.failures - FAILURES_BEFORE_COOLDOWN))
+        return (time.monotonic() if now is None else now) - self.last_failure < cooldown
+
+    def expected_time(self):
+        """拿到一次有效结果的预期耗时，越小越好"""
+        latency = PRIOR_LATENCY if self.latency is None else self.latency
+        return latency / max(self.success_rate, 0.05)
+
+
+class HealthBoard:
+    """所有接口的健康度，线程安全"""
+
+    def __init__(self):
+        self._sources = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name):
+        source = self._sources.get(name)
+        if source is None:
+            source = self._sources[name] = SourceHealth(name)
+        return source
+
+    def record(self, name, ok, elapsed):
+        with self._lock:
+            self._get(name).record(ok, elapsed)
+
+    def ranked(self, names):
+        """按预期耗时排序，冷却中的接口排在最后；分数相同时保持传入顺序"""
+        now = time.monotonic()
+        with self._lock:
+            sources = [self._get(name) for name in names]
+            return [s.name for s in sorted(sources, key=lambda s: (s.cooling_down(now), s.expected_time()))]
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {'latency': s.latency, 'success_rate': round(s.success_rate, 3),
+                           'failures': s.failures, 'requests': s.requests}
+                    for name, s in self._sources.items()}
+
+
+class RacingResolver:
+    """按健康度依次（交错）发出请求
+
+    mode 为 'first' 时返回最先到达的有效结果（再等 grace 秒看有没有画质更高的）；
+    为 'best' 时同时请求全部接口，在超时前等所有结果，返回画质最高的。
+    """
+
+    def __init__(self, board=None, hedge_delay=HEDGE_DELAY, grace=GRACE_PERIOD, timeout=RESOLVE_TIMEOUT):
+        self.board = board or HealthBoard()
+        self.hedge_delay = hedge_delay
+        self.grace = grace
+        self.timeout = timeout
+
+    def _call(self, name, fetch):
+        started = time.monotonic()
+        try:
+            info = fetch()
+            if not is_valid(info):
+                raise Exception("没有返回可用的地址")
+        except Exception:
+            self.board.record(name, False, time.monotonic() - started)
+            raise
+        self.board.record(name, True, time.monotonic() - started)
+        return info
+
+    def resolve(self, sources, mode='first'):
+        """sources 为 {接口名: 无参函数}，返回 (接口名, 下载信息)"""
+        if not sources:
+            raise Exception("没有可用的解析接口")
+        waiting = self.board.ranked(list(sources))
+        # 不用 with：返回时不等待仍在进行的慢请求，它们结束后照常计入健康度
+        executor = ThreadPoolExecutor(max_workers=len(waiting), thread_name_prefix='bilidown-resolve')
+        running = {}
+        errors = {}
+        best = None
+        now = time.monotonic()
+        deadline = now + self.timeout
+        settle_at = None  # 拿到第一个结果后最多等到这个时刻
+
+        def launch():
+            name = waiting.pop(0)
+            running[executor.submit(self._call, name, sources[name])] = name
+
+        try:
+            launch()
+            if mode == 'best':
+                while waiting:
+                    launch()
+            next_launch = now + self.hedge_delay
+            while running or waiting:
+                now = time.monotonic()
+                limit = settle_at or deadline
+                if now >= limit:
+                    break
+                wake = min(limit, next_launch) if waiting else limit
+                done, _ = wait(list(running), timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        info = future.result()
+                    except Exception as e:
+                        errors[name] = str(e)
+                        if waiting:
+                            launch()  # 失败的接口由下一个顶上
+                        continue
+                    if best is None or result_quality(info) > result_quality(best[1]):
+                        best = (name, info)
+                    if mode == 'first' and settle_at is None:
+                        settle_at = time.monotonic() + self.grace
+                        waiting.clear()  # 已有结果，不再补发
+                if waiting and time.monotonic() >= next_launch:
+                    launch()
+                    next_launch = time.monotonic() + self.hedge_delay
+        finally:
+            executor.shutdown(wait=False)
+
+        if best is not None:
+            return best
+        if not errors:
+            raise Exception("解析超时")
+        raise Exception("所有解析接口都失败：" + "；".join(f"{name}：{error}" for name, error in errors.items()))
+
+
+_racer = None
+_racer_lock = threading.Lock()
+
+
+def get_racer():
+    """各前端共用的解析器，健康度统计在整个进程内累积"""
+    global _racer
+    with _racer_lock:
+        if _racer is None:
+            _racer = RacingResolver()
+        return _racer
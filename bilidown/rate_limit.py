@@ -0,0 +1,203 @@
+"""接口限速：所有B站接口请求共用的令牌桶，遇到 412 / -352 风控时自动降速并逐步恢复
+
+以传输适配器的形式挂在会话上，位于缓存适配器之下，命中缓存的请求不占用令牌：
+    install_api_cache(session)
+    install_rate_limiter(session)
+每个接口有自己的速率和突发上限，同时受全局令牌桶约束。收到风控响应时所有速率减半、暂停一段时间后重试，
+之后每隔 RECOVERY_INTERVAL 秒没有再触发风控就把速率回升一档（乘性减、加性增）。
+"""
+import threading
+import time
+
+from requests.adapters import BaseAdapter
+
+from bilidown.api_cache import CachingAdapter
+
+# 各接口的 (每秒请求数, 突发上限)，按前缀匹配
+RATE_RULES = {
+    'https://api.bilibili.com/x/web-interface/view': (5, 10),
+    'https://api.bilibili.com/x/player/playurl': (3, 6),
+    'https://api.bilibili.com/x/player/v2': (3, 6),
+    'https://api.bilibili.com/x/web-interface/nav': (1, 3),
+    'https://api.bilibili.com/x/space/wbi/arc/search': (1, 2),
+    'https://api.bilibili.com/': (6, 12),
+}
+GLOBAL_RATE = (10, 20)
+MIN_FACTOR = 0.05
+RECOVERY_STEP = 0.1
+RECOVERY_INTERVAL = 5.0
+BASE_PAUSE = 2.0  # 第一次触发风控后暂停的秒数，连续触发时翻倍
+MAX_PAUSE = 60.0
+MAX_RETRIES = 3
+RISK_CODES = (b'"code":-352', b'"code":-412')
+
+
+def is_throttled(response, stream=False):
+    """HTTP 412 或接口返回 -352/-412 都是风控"""
+    if response.status_code == 412:
+        return True
+    if stream or response.status_code != 200:
+        return False
+    head = response.content[:64].replace(b' ', b'')
+    return any(code in head for code in RISK_CODES)
+
+
+class TokenBucket:
+    """令牌桶；reserve() 可以预支令牌，返回需要等待的秒数，多个线程排队时不用反复轮询"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, factor=1.0):
+        with self._lock:
+            now = time.monotonic()
+            rate = self.rate * factor
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / rate
+
+    def drain(self):
+        """清空积攒的令牌，降速后不再允许突发"""
+        with self._lock:
+            self.tokens = min(self.tokens, 0)
+
+
+class AdaptiveRateLimiter:
+    """按接口划分的令牌桶加一个全局令牌桶，速率整体乘以 factor"""
+
+    def __init__(self, rules=None, global_rate=GLOBAL_RATE):
+        self.rules = dict(RATE_RULES if rules is None else rules)
+        self.buckets = {prefix: TokenBucket(*budget) for prefix, budget in self.rules.items()}
+        self.global_bucket = TokenBucket(*global_rate)
+        self.factor = 1.0
+        self.strikes = 0  # 连续触发风控的次数
+        self.pause_until = 0.0
+        self.last_change = time.monotonic()
+        self.last_penalty = 0.0
+        self.throttled = 0  # 累计收到的风控响应数
+        self._lock = threading.Lock()
+
+    def bucket_for(self, url):
+        # 规则按前缀长度从长到短匹配
+        for prefix in sorted(self.buckets, key=len, reverse=True):
+            if url.startswith(prefix):
+                return self.buckets[prefix]
+        return None
+
+    def acquire(self, url):
+        """等到允许发送为止，返回发送时刻，收到风控时交给 penalize"""
+        with self._lock:
+            factor = self.factor
+            pause = self.pause_until - time.monotonic()
+        wait = max(0.0, pause)
+        wait = max(wait, self.global_bucket.reserve(factor))
+        bucket = self.bucket_for(url)
+        if bucket is not None:
+            wait = max(wait, bucket.reserve(factor))
+        if wait > 0:
+            time.sleep(wait)
+        # 等待期间其他请求可能触发了风控，暂停结束前不发送
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                pause = self.pause_until - now
+            if pause <= 0:
+                return now
+            time.sleep(pause)
+
+    def penalize(self, sent_at=None):
+        """收到风控响应：速率减半，暂停一段时间
+
+        上次降速之前就已发出的请求同属一轮风控，只计数不再降速，避免并发请求同时被拒时速率被连续减半。
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.throttled += 1
+            if sent_at is not None and sent_at < self.last_penalty:
+                return
+            self.last_penalty = now
+            self.strikes += 1
+            self.factor = max(MIN_FACTOR, self.factor / 2)
+            self.pause_until = max(self.pause_until, now + min(MAX_PAUSE, BASE_PAUSE * 2 ** (self.strikes - 1)))
+            self.last_change = now
+        self.global_bucket.drain()
+        for bucket in self.buckets.values():
+            bucket.drain()
+
+    def reward(self):
+        """请求成功：距离上次调整足够久就回升一档"""
+        with self._lock:
+            self.strikes = 0
+            now = time.monotonic()
+            if self.factor < 1.0 and now - self.last_change >= RECOVERY_INTERVAL:
+                self.factor = min(1.0, self.factor + RECOVERY_STEP)
+                self.last_change = now
+
+    def stats(self):
+        with self._lock:
+            return {'factor': round(self.factor, 3), 'throttled': self.throttled,
+                    'paused': max(0.0, self.pause_until - time.monotonic())}
+
+
+class RateLimitedAdapter(BaseAdapter):
+    """发请求前先取令牌，收到风控响应时降速并重试，实际请求交给 delegate"""
+
+    def __init__(self, delegate, limiter, max_retries=MAX_RETRIES):
+        super().__init__()
+        self.delegate = delegate
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            sent_at = self.limiter.acquire(request.url)
+            response = self.delegate.send(request, **kwargs)
+            if not is_throttled(response, kwargs.get('stream')):
+                self.limiter.reward()
+                return response
+            self.limiter.penalize(sent_at)
+            attempt += 1
+            if attempt > self.max_retries:
+                return response  # 多次重试仍被风控，交给调用方按接口错误处理
+            response.close()
+
+    def close(self):
+        self.delegate.close()
+
+
+def install_rate_limiter(session, limiter=None):
+    """在会话上为各接口前缀挂载限速适配器，返回 AdaptiveRateLimiter
+
+    已挂载缓存适配器的前缀把限速放在缓存之后，缓存命中不消耗令牌。应在 install_api_cache 之后调用。
+    """
+    limiter = limiter or get_rate_limiter()
+    for prefix in limiter.rules:
+        adapter = session.get_adapter(prefix)
+        if isinstance(adapter, RateLimitedAdapter):
+            continue
+        if isinstance(adapter, CachingAdapter):
+            # 缓存适配器：把限速插到它和实际传输之间
+            if not isinstance(adapter.delegate, RateLimitedAdapter):
+                adapter.delegate = RateLimitedAdapter(adapter.delegate, limiter)
+        else:
+            session.mount(prefix, RateLimitedAdapter(adapter, limiter))
+    return limiter
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """进程内共用的限速器，风控是按IP和账号计算的，所有会话应共享同一份额度"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveRateLimiter()
+        return _limiter
@@ -0,0 +1,111 @@
+"""断点续传：下载中的数据写入 .part 文件，旁边的清单记录已完成的字节区间"""
+import bisect
+import json
+import os
+import time
+
+PART_SUFFIX = '.part'
+MANIFEST_SUFFIX = '.part.json'
+MANIFEST_VERSION = 1
+SAVE_INTERVAL = 1.0  # 清单最多每秒落盘一次
+SAVE_BYTES = 8 * 1024 * 1024  # 或者每新完成8MB落盘一次
+
+
+def part_path(filename):
+    return filename + PART_SUFFIX
+
+
+def manifest_path(filename):
+    return filename + MANIFEST_SUFFIX
+
+
+class PartManifest:
+    """记录一个 .part 文件的流身份、总大小和已完成区间
+
+    completed 中的区间为左闭右开 [start, end)，始终保持有序且互不重叠。
+    """
+
+    def __init__(self, filename, identity, total_size, completed=None):
+        self.filename = filename
+        self.identity = dict(identity or {})
+        self.total_size = total_size
+        self.completed = []
+        self._dirty_bytes = 0
+        for start, end in completed or []:
+            self.add_range(start, end)
+        self._dirty_bytes = 0
+        self._last_save = time.time()
+
+    @classmethod
+    def load(cls, filename, identity, total_size):
+        """读取已有清单，流身份、大小与 .part 文件都吻合时才返回，否则返回None"""
+        try:
+            with open(manifest_path(filename), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != MANIFEST_VERSION:
+                return None
+            if data.get('identity') != dict(identity or {}) or data.get('total_size') != total_size:
+                return None
+            if os.path.getsize(part_path(filename)) != total_size:
+                return None
+            return cls(filename, identity, total_size, data.get('completed', []))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    @property
+    def completed_size(self):
+        return sum(end - start for start, end in self.completed)
+
+    def add_range(self, start, end):
+        """标记 [start, end) 已写入，与相邻区间合并"""
+        if end <= start:
+            return
+        self._dirty_bytes += end - start
+        index = bisect.bisect_left(self.completed, [start, start])
+        # 向前合并可能覆盖到 start 的区间
+        if index > 0 and self.completed[index - 1][1] >= start:
+            index -= 1
+            start = self.completed[index][0]
+        last = index
+        while last < len(self.completed) and self.completed[last][0] <= end:
+            end = max(end, self.completed[last][1])
+            last += 1
+        self.completed[index:last] = [[start, end]]
+
+    def missing_ranges(self):
+        """返回尚未完成的闭区间列表 [(start, end)]"""
+        missing = []
+        position = 0
+        for start, end in self.completed:
+            if start > position:
+                missing.append((position, start - 1))
+            position = max(position, end)
+        if position < self.total_size:
+            missing.append((position, self.total_size - 1))
+        return missing
+
+    def save_if_due(self):
+        if self._dirty_bytes >= SAVE_BYTES or time.time() - self._last_save >= SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        """原子写入清单，进程崩溃时不会留下半个文件"""
+        data = {
+            'version': MANIFEST_VERSION,
+            'identity': self.identity,
+            'total_size': self.total_size,
+            'completed': self.completed,
+        }
+        path = manifest_path(self.filename)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        self._dirty_bytes = 0
+        self._last_save = time.time()
+
+    def remove(self):
+        try:
+            os.remove(manifest_path(self.filename))
+        except OSError:
+            pass
@@ -0,0 +1,376 @@
+"""分段多连接下载：把一个流按字节范围切成多段，用多个连接并行拉取后写入文件对应位置"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bilidown.resume import PartManifest, part_path
+
+DEFAULT_CONNECTIONS = 4
+MIN_SEGMENT_SIZE = 2 * 1024 * 1024  # 每段最小2MB，太小的段只会增加请求开销
+SEGMENTS_PER_CONNECTION = 4  # 每个连接分到的段数，段多一些可以让快连接多干活
+BLOCK_SIZE = 1024 * 1024  # 1MB块大小
+MIN_CHUNK_SIZE = 64 * 1024  # 自适应读取块的上下限
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+CHUNK_TARGET_TIME = 0.25  # 每次读取大约耗时0.25秒，慢连接用小块保证进度和暂停及时，快连接用大块减少调用次数
+MAX_RETRIES = 3
+STALL_TIMEOUT = 15  # 连接超过15秒没有数据视为停滞
+
+
+def probe_stream(session, url, headers, timeout=15):
+    """探测流的总大小以及服务器是否支持Range请求，返回 (total_size, accept_ranges)"""
+    if not isinstance(url, str):
+        # 多个节点时依次尝试，直到有一个节点正常响应
+        error = None
+        for candidate in url:
+            try:
+                return probe_stream(session, candidate, headers, timeout)
+            except Exception as e:
+                error = e
+        raise error or Exception("没有可用的下载地址")
+    probe_headers = dict(headers)
+    probe_headers['Range'] = 'bytes=0-0'
+    response = session.get(url, headers=probe_headers, stream=True, timeout=timeout)
+    try:
+        if response.status_code == 206:
+            # Content-Range: bytes 0-0/123456
+            total = response.headers.get('content-range', '').rsplit('/', 1)[-1]
+            if total.isdigit():
+                return int(total), True
+            return 0, False
+        if response.status_code == 200:
+            return int(response.headers.get('content-length', 0)), False
+        raise Exception(f"探测下载地址失败，状态码：{response.status_code}")
+    finally:
+        response.close()
+
+
+def preallocate(f, size):
+    """把文件预先分配到 size 字节，避免边下载边扩展造成磁盘碎片；不支持时退回 truncate"""
+    if hasattr(os, 'posix_fallocate') and size > 0:
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+        except OSError:
+            pass  # 部分文件系统（如某些网络存储）不支持预分配
+    f.truncate(size)
+
+
+def raw_reader(response):
+    """取出可以直接 readinto 的底层响应流，数据经过压缩或无法取得时返回None"""
+    if response.headers.get('content-encoding', 'identity').lower() != 'identity':
+        return None
+    reader = getattr(response.raw, '_fp', None)
+    if reader is None or not hasattr(reader, 'readinto'):
+        return None
+    return reader
+
+
+def write_all(f, view):
+    """向无缓冲文件写入全部数据（一次 write 可能只写入一部分）"""
+    while view:
+        written = f.write(view)
+        view = view[written:]
+
+
+class ReceiveBuffer:
+    """每个连接复用的接收缓冲区，块大小根据实际速度在上下限之间按倍数调整"""
+
+    def __init__(self, min_size=MIN_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.size = min_size
+        self._buffer = bytearray(min_size)
+        self._view = memoryview(self._buffer)
+
+    def view(self, limit):
+        """返回长度为 min(当前块大小, limit) 的缓冲区视图，只在块变大时重新分配"""
+        size = min(self.size, limit)
+        if len(self._buffer) < size:
+            self._buffer = bytearray(self.size)
+            self._view = memoryview(self._buffer)
+        return self._view[:size]
+
+    def adapt(self, received, elapsed):
+        if received < self.size:
+            return  # 读到段尾的短块不能反映速度
+        target = received / max(elapsed, 1e-6) * CHUNK_TARGET_TIME
+        if target >= self.size * 2 and self.size < self.max_size:
+            self.size = min(self.size * 2, self.max_size)
+        elif target < self.size / 2 and self.size > self.min_size:
+            self.size = max(self.size // 2, self.min_size)
+
+
+def split_ranges(ranges, connections, min_segment_size=MIN_SEGMENT_SIZE):
+    """把待下载的闭区间列表切成若干段 (start, end)，段数与连接数相匹配"""
+    remaining = sum(end - start + 1 for start, end in ranges)
+    if remaining <= 0:
+        return []
+    wanted = max(1, connections) * SEGMENTS_PER_CONNECTION
+    segment_size = max(min_segment_size, -(-remaining // wanted))
+    segments = []
+    for range_start, range_end in ranges:
+        for start in range(range_start, range_end + 1, segment_size):
+            segments.append((start, min(start + segment_size - 1, range_end)))
+    return segments
+
+
+class SegmentedDownloader:
+    """多连接分段下载器
+
+    progress_callback(downloaded, total) 在内部锁中调用，多个工作线程的回调不会并发执行。
+    should_cancel / should_pause 为无参可调用对象，用于配合前端的暂停和取消。
+    数据先写入 filename.part，并由清单记录已完成区间；传入 identity（bvid/cid/画质/编码等）后，
+    重新开始的任务只会补齐缺失的区间，全部完成后再改名为 filename。
+    url 可以是地址列表（主地址加备用地址），前 spread 个节点分担分段；某个节点出错或停滞时，
+    该连接从已写到的位置切换到下一个节点继续，不必重新下载整个流。
+    throttle 为 bandwidth.JobShare 时，每块数据都计入该任务的带宽份额。
+    """
+
+    def __init__(self, session, headers=None, connections=DEFAULT_CONNECTIONS,
+                 block_size=BLOCK_SIZE, timeout=STALL_TIMEOUT, throttle=None):
+        self.session = session
+        self.throttle = throttle
+        self.headers = dict(headers or {})
+        self.connections = max(1, int(connections))
+        self.block_size = block_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._downloaded = 0
+        self._total = 0
+        self._progress_callback = None
+
+    def download(self, url, filename, progress_callback=None, should_cancel=None, should_pause=None,
+                 identity=None, spread=1):
+        """下载 url 到 filename，完成返回 True，被取消返回 False（已下载的数据保留在 .part 中）"""
+        self.urls = [url] if isinstance(url, str) else list(url)
+        self.spread = max(1, min(spread, len(self.urls)))
+        self._progress_callback = progress_callback
+        self._should_cancel = should_cancel or (lambda: False)
+        self._should_pause = should_pause or (lambda: False)
+        self._stop = threading.Event()
+        self._downloaded = 0
+        self._manifest = None
+
+        total_size, accept_ranges = probe_stream(self.session, self.urls, self.headers, self.timeout)
+        self._total = total_size
+
+        dir_path = os.path.dirname(filename)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+
+        # 服务器不支持Range或大小未知时退回单连接顺序下载，这种情况下无法续传
+        if not accept_ranges or total_size <= 0:
+            self._report(0)
+            return self._download_single(filename)
+
+        temp_path = part_path(filename)
+        manifest = PartManifest.load(filename, identity, total_size)
+        if manifest is None:
+            manifest = PartManifest(filename, identity, total_size)
+            # 先按完整大小预分配文件，各段再写入自己的位置
+            with open(temp_path, 'wb') as f:
+                preallocate(f, total_size)
+            manifest.save()
+        self._manifest = manifest
+        self._downloaded = manifest.completed_size
+        self._report(0)
+
+        segments = queue.Queue()
+        for segment in split_ranges(manifest.missing_ranges(), self.connections):
+            segments.put(segment)
+
+        errors = []
+        workers = min(self.connections, segments.qsize())
+        if workers:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self._worker, index % self.spread, temp_path, segments)
+                           for index in range(workers)]
+                for future in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        errors.append(e)
+
+        # 无论成功与否都把进度落盘，下次可以从这里继续
+        with self._lock:
+            manifest.save()
+
+        if self._cancelled() and not errors:
+            return False
+        if errors:
+            raise errors[0]
+        if manifest.missing_ranges():
+            raise Exception(f"下载不完整：{manifest.completed_size}/{total_size} 字节")
+
+        os.replace(temp_path, filename)
+        manifest.remove()
+        return True
+
+    def _cancelled(self):
+        return self._stop.is_set() or self._should_cancel()
+
+    def _wait_if_paused(self):
+        """暂停时阻塞，返回是否应当停止"""
+        while self._should_pause():
+            if self._cancelled():
+                return True
+            self._stop.wait(0.1)
+        return self._cancelled()
+
+    def _throttle(self, size):
+        """按带宽份额等待，返回是否应当停止"""
+        if self.throttle is not None:
+            self.throttle.consume(size, self._cancelled)
+        return self._cancelled()
+
+    def _report(self, size, start=None):
+        with self._lock:
+            self._downloaded += size
+            if self._manifest is not None and start is not None:
+                self._manifest.add_range(start, start + size)
+                self._manifest.save_if_due()
+            if self._progress_callback:
+                self._progress_callback(self._downloaded, self._total)
+
+    def _worker(self, host, filename, segments):
+        try:
+            # 无缓冲打开：数据从接收缓冲区直接写入，不再经过文件对象的缓冲和 flush
+            with open(filename, 'r+b', buffering=0) as f:
+                buffer = ReceiveBuffer(max_size=max(self.block_size, MIN_CHUNK_SIZE))
+                while not self._cancelled():
+                    try:
+                        start, end = segments.get_nowait()
+                    except queue.Empty:
+                        return
+                    host = self._fetch_segment(host, f, start, end, buffer)
+        except Exception:
+            # 任一段失败就让其他连接尽快停下
+            self._stop.set()
+            raise
+
+    def _fetch_segment(self, host, f, start, end, buffer):
+        """拉取闭区间 [start, end]，返回最后使用的节点序号
+
+        连接出错或停滞（读超时）时换到下一个节点，从已写到的位置继续。
+        """
+        position = start
+        attempts = 0
+        max_attempts = MAX_RETRIES + len(self.urls) - 1
+        while position <= end:
+            if self._wait_if_paused():
+                return host
+            headers = dict(self.headers)
+            headers['Range'] = f'bytes={position}-{end}'
+            attempt_start = position
+            try:
+                response = self.session.get(self.urls[host], headers=headers, stream=True, timeout=self.timeout)
+                try:
+                    if response.status_code != 206:
+                        raise Exception(f"分段请求失败，状态码：{response.status_code}")
+                    f.seek(position)
+                    reader = raw_reader(response)
+                    if reader is not None:
+                        position = self._receive(reader, f, position, end, buffer)
+                        if reader.isclosed():
+                            # 响应体已经读完，连接可以放回连接池复用
+                            response.raw.release_conn()
+                    else:
+                        position = self._receive_chunks(response, f, position, end)
+                finally:
+                    response.close()
+                if self._cancelled():
+                    return host
+                if position <= end:
+                    raise Exception(f"分段提前结束：{position}/{end + 1}")
+            except Exception:
+                # 有进展说明节点本身可用，重新计数
+                attempts = 0 if position > attempt_start else attempts + 1
+                if attempts > max_attempts or self._cancelled():
+                    raise
+                host = (host + 1) % len(self.urls)
+        return host
+
+    def _receive(self, reader, f, position, end, buffer):
+        """把响应体直接读进复用的缓冲区再写入文件，不为每块数据创建新对象，返回写到的位置"""
+        while position <= end:
+            if self._wait_if_paused():
+                break
+            limit = end + 1 - position
+            if self.throttle is not None:
+                limit = min(limit, self.throttle.chunk_size(buffer.size))
+            view = buffer.view(limit)
+            started = time.perf_counter()
+            received = reader.readinto(view)
+            if not received:
+                break
+            buffer.adapt(received, time.perf_counter() - started)
+            write_all(f, view[:received])
+            self._report(received, position)
+            position += received
+            if self._throttle(received):
+                break
+        return position
+
+    def _receive_chunks(self, response, f, position, end):
+        """响应经过压缩等无法直接读取时，退回 iter_content"""
+        for data in response.iter_content(self.block_size):
+            if self._wait_if_paused():
+                break
+            if not data:
+                continue
+            data = data[:end + 1 - position]  # 防止服务器多给数据越界写入
+            write_all(f, memoryview(data))
+            self._report(len(data), position)
+            position += len(data)
+            if position > end or self._throttle(len(data)):
+                break
+        return position
+
+    def _download_single(self, filename):
+        """单连接从头顺序下载，出错时换下一个节点重新下载；全部失败时不生成目标文件"""
+        temp_path = part_path(filename)
+        headers = dict(self.headers)
+        headers['Range'] = 'bytes=0-'
+        error = None
+        for url in self.urls:
+            downloaded = self._downloaded
+            try:
+                response = self.session.get(url, stream=True, headers=headers, timeout=self.timeout)
+                try:
+                    # 地址过期或被拒绝时服务器返回的是错误页，不能当作视频写入
+                    if response.status_code not in (200, 206):
+                        raise Exception(f"下载请求失败，状态码：{response.status_code}")
+                    expected = int(response.headers.get('content-length', 0))
+                    if expected:
+                        self._total = expected
+                    with open(temp_path, 'wb') as f:
+                        if expected:
+                            preallocate(f, expected)
+                        for data in response.iter_content(self.block_size):
+                            if self._wait_if_paused():
+                                return False
+                            if data:
+                                f.write(data)
+                                self._report(len(data))
+                                if self._throttle(len(data)):
+                                    return False
+                        size = f.tell()
+                        f.truncate(size)  # 实际长度与预分配的大小不同时以实际为准
+                    if expected and size < expected:
+                        raise Exception(f"下载不完整：{size}/{expected} 字节")
+                finally:
+                    response.close()
+            except Exception as e:
+                if self._cancelled():
+                    raise
+                error = e
+                # 换节点后从头下载，撤回这次计入的进度
+                self._report(downloaded - self._downloaded)
+                continue
+            os.replace(temp_path, filename)
+            return True
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise error
@@ -0,0 +1,139 @@
+"""DASH 流选择：按用户策略在 playurl 返回的所有视频、音频流中挑选要下载的一路
+
+fnval=4048 时同一清晰度通常有 AVC(7)、HEVC(12)、AV1(13) 三种编码，码率依次降低，
+同画质下 HEVC/AV1 往往能省下三到五成的流量和空间；音频除了普通 AAC 外还可能有杜比全景声和 Hi-Res 无损。
+    video, audio = select_streams(download_info['dash'], StreamPolicy(codec='hevc', max_quality=80))
+"""
+
+CODEC_IDS = {'avc': 7, 'hevc': 12, 'av1': 13}
+CODEC_NAMES = {7: 'AVC', 12: 'HEVC', 13: 'AV1'}
+CODEC_PREFIXES = {'avc1': 7, 'hev1': 12, 'hvc1': 12, 'av01': 13}
+DOLBY_AUDIO_ID = 30250
+HIRES_AUDIO_ID = 30251
+# 界面选项的取值：显示文本 -> codec 参数
+CODEC_CHOICES = {
+    'AVC (兼容性最好)': 'avc',
+    'HEVC (体积更小)': 'hevc',
+    'AV1 (体积最小)': 'av1',
+}
+
+
+def codec_of(stream):
+    """流的编码编号：优先用 codecid，没有时按 codecs 字符串的前缀判断"""
+    if stream.get('codecid') in CODEC_NAMES:
+        return stream['codecid']
+    return CODEC_PREFIXES.get((stream.get('codecs') or '')[:4], 0)
+
+
+def estimated_size(stream, duration):
+    """按平均码率估算流的大小（字节），不知道时长时返回0"""
+    return int((stream.get('bandwidth') or 0) / 8 * (duration or 0))
+
+
+def describe_stream(stream):
+    """用于状态栏的简短描述，如 "1920x1080 HEVC 1.9Mbps"、"Hi-Res无损" """
+    if stream.get('id') == HIRES_AUDIO_ID:
+        return "Hi-Res无损"
+    if stream.get('id') == DOLBY_AUDIO_ID:
+        return "杜比全景声"
+    bandwidth = stream.get('bandwidth') or 0
+    if stream.get('height'):
+        return f"{stream.get('width')}x{stream['height']} {CODEC_NAMES.get(codec_of(stream), '未知编码')} {bandwidth / 1e6:.1f}Mbps"
+    return f"{bandwidth / 1000:.0f}kbps"
+
+
+def audio_streams(dash):
+    """返回 (普通音轨列表, 杜比音轨列表, 无损音轨列表)"""
+    dolby = (dash.get('dolby') or {}).get('audio') or []
+    flac = (dash.get('flac') or {}).get('audio')
+    return list(dash.get('audio') or []), list(dolby), [flac] if flac else []
+
+
+class StreamPolicy:
+    """流选择策略
+
+    codec：首选编码 avc/hevc/av1，没有该编码时按 AVC、HEVC、AV1 的顺序退而求其次
+    max_quality：最高清晰度编号（qn），超过的流不选
+    max_bandwidth：视频码率上限（比特/秒）
+    max_size：音视频合计大小上限（字节），按码率和时长估算
+    smallest：在选定的清晰度下不看编码偏好，直接取码率最低的流
+    hires_audio：有 Hi-Res 无损或杜比全景声时优先选用
+    超出限制的流全部被排除时，退回码率最低的一路，而不是下载失败。
+    """
+
+    def __init__(self, codec='avc', max_quality=None, max_bandwidth=None, max_size=None,
+                 smallest=False, hires_audio=False):
+        if codec not in CODEC_IDS:
+            raise ValueError(f"不支持的编码：{codec}")
+        self.codec = codec
+        self.max_quality = max_quality
+        self.max_bandwidth = max_bandwidth
+        self.max_size = max_size
+        self.smallest = smallest
+        self.hires_audio = hires_audio
+
+    @classmethod
+    def from_options(cls, options, quality=None):
+        """由前端的下载选项构造，未设置的项保持默认"""
+        max_size = options.get('max_size_mb')
+        return cls(codec=options.get('codec') or 'avc',
+                   max_quality=quality,
+                   max_bandwidth=options.get('max_bandwidth'),
+                   max_size=max_size * 1024 * 1024 if max_size else None,
+                   smallest=options.get('smallest', False),
+                   hires_audio=options.get('hires_audio', False))
+
+    def codec_rank(self, stream):
+        order = [CODEC_IDS[self.codec]] + [c for c in (7, 12, 13) if c != CODEC_IDS[self.codec]]
+        codec = codec_of(stream)
+        return order.index(codec) if codec in order else len(order)
+
+    def rank_audio(self, dash):
+        """按偏好排序的音频流，第一个为选中的"""
+        normal, dolby, flac = audio_streams(dash)
+        normal.sort(key=lambda s: s.get('bandwidth') or 0, reverse=True)
+        if self.hires_audio:
+            return flac + dolby + normal
+        return normal + dolby + flac
+
+    def rank_video(self, dash, budget=None):
+        """按偏好排序的视频流，第一个为选中的；budget 为留给视频的字节数"""
+        streams = list(dash.get('video') or [])
+        if not streams:
+            return []
+        duration = dash.get('duration') or 0
+        candidates = streams
+        if self.max_quality:
+            candidates = [s for s in streams if (s.get('id') or 0) <= self.max_quality] or \
+                [min(streams, key=lambda s: s.get('id') or 0)]
+
+        def within_limits(stream):
+            if self.max_bandwidth and (stream.get('bandwidth') or 0) > self.max_bandwidth:
+                return False
+            if budget is not None and duration and estimated_size(stream, duration) > budget:
+                return False
+            return True
+
+        allowed = [s for s in candidates if within_limits(s)]
+        if not allowed:
+            # 没有满足限制的流时选最省流量的一路
+            allowed = [min(candidates, key=lambda s: s.get('bandwidth') or 0)]
+        if self.smallest:
+            key = lambda s: (-(s.get('id') or 0), s.get('bandwidth') or 0)
+        else:
+            key = lambda s: (-(s.get('id') or 0), self.codec_rank(s), -(s.get('bandwidth') or 0))
+        return sorted(allowed, key=key)
+
+    def select(self, dash):
+        """返回 (视频流, 音频流)，缺少某一类时对应位置为 None"""
+        audios = self.rank_audio(dash)
+        audio = audios[0] if audios else None
+        budget = None
+        if self.max_size:
+            budget = self.max_size - (estimated_size(audio, dash.get('duration')) if audio else 0)
+        videos = self.rank_video(dash, budget)
+        return (videos[0] if videos else None), audio
+
+
+def select_streams(dash, policy=None):
+    return (policy or StreamPolicy()).select(dash)
@@ -0,0 +1,207 @@
+"""字幕：取得视频的所有字幕轨（含AI生成字幕），并发下载并转换为 SRT、WebVTT 或 ASS
+
+    tracks = list_subtitles(session, bvid, cid)
+    results = download_subtitles(session, tracks, base_path, 'srt', languages=['zh-CN', 'ai-zh'])
+B站字幕是 {"body": [{"from": 秒, "to": 秒, "content": 文本}, ...]} 格式的JSON。转换时逐条写入文件，
+时间用整数毫秒计算，耗时与条数成正比，几万条的讲座字幕不会越转越慢。
+"""
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+PLAYER_URL = 'https://api.bilibili.com/x/player/v2'
+DEFAULT_WORKERS = 4
+# 格式 -> 显示名称
+FORMATS = {
+    'srt': 'SRT',
+    'vtt': 'WebVTT',
+    'ass': 'ASS',
+}
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: 1920
+PlayResY: 1080
+WrapStyle: 0
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Microsoft YaHei,54,&H00FFFFFF,&H000000FF,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,2,1,2,30,30,40,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+def is_ai_track(track):
+    """AI生成的字幕语言代码以 ai- 开头，type 为1"""
+    return track.get('lan', '').startswith('ai-') or track.get('type') == 1
+
+
+def track_url(track):
+    url = track.get('subtitle_url') or track.get('subtitle_url_v2') or ''
+    if url.startswith('//'):
+        url = 'https:' + url
+    return url
+
+
+def list_subtitles(session, bvid, cid):
+    """返回视频的所有字幕轨 [{'lan', 'lan_doc', 'subtitle_url', ...}]，AI字幕需要登录才有地址"""
+    try:
+        response = session.get(PLAYER_URL, params={'bvid': bvid, 'cid': cid}, timeout=15)
+        data = response.json()
+    except Exception as e:
+        raise Exception(f"获取字幕列表失败：{str(e)}")
+    if data.get('code') != 0:
+        raise Exception(f"获取字幕列表失败：{data.get('message', '未知错误')}")
+    return ((data.get('data') or {}).get('subtitle') or {}).get('subtitles') or []
+
+
+def subtitle_cues(subtitle_data):
+    """从字幕JSON中取出条目列表，兼容 {"body": []}、{"data": {"body": []}} 和直接的列表"""
+    if isinstance(subtitle_data, list):
+        return subtitle_data
+    if isinstance(subtitle_data, dict):
+        if 'body' in subtitle_data:
+            return subtitle_data['body'] or []
+        if isinstance(subtitle_data.get('data'), dict):
+            return subtitle_data['data'].get('body') or []
+    raise ValueError("无法识别的字幕数据格式")
+
+
+def _iter_cues(cues):
+    """逐条生成 (起始毫秒, 结束毫秒, 文本)，跳过无效和空白的条目"""
+    for item in cues:
+        if not isinstance(item, dict):
+            continue
+        content = str(item.get('content') or '').strip()
+        if not content:
+            continue
+        try:
+            start = int(float(item.get('from', 0)) * 1000 + 0.5)
+            end = int(float(item.get('to', 0)) * 1000 + 0.5)
+        except (TypeError, ValueError):
+            continue
+        yield max(0, start), max(start, end), content
+
+
+def _split(ms):
+    """毫秒 -> (时, 分, 秒, 毫秒)"""
+    seconds, ms = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return hours, minutes, seconds, ms
+
+
+# 每条一次 % 格式化，不逐段拼接字符串
+SRT_CUE = "%d\n%02d:%02d:%02d,%03d --> %02d:%02d:%02d,%03d\n%s\n\n"
+VTT_CUE = "%02d:%02d:%02d.%03d --> %02d:%02d:%02d.%03d\n%s\n\n"
+ASS_CUE = "Dialogue: 0,%d:%02d:%02d.%02d,%d:%02d:%02d.%02d,Default,,0,0,0,,%s\n"
+
+
+def _write_srt(cues, out):
+    count = 0
+    for count, (start, end, text) in enumerate(_iter_cues(cues), 1):
+        out.write(SRT_CUE % ((count,) + _split(start) + _split(end) + (text,)))
+    return count
+
+
+def _write_vtt(cues, out):
+    out.write("WEBVTT\n\n")
+    count = 0
+    for count, (start, end, text) in enumerate(_iter_cues(cues), 1):
+        # WebVTT 的文本中 & < > 有特殊含义，连续空行会提前结束当前条目
+        text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        if '\n' in text:
+            text = '\n'.join(line for line in text.split('\n') if line.strip())
+        out.write(VTT_CUE % (_split(start) + _split(end) + (text,)))
+    return count
+
+
+def _write_ass(cues, out):
+    out.write(ASS_HEADER)
+    count = 0
+    for count, (start, end, text) in enumerate(_iter_cues(cues), 1):
+        # 花括号是 ASS 的样式标签，换成全角；换行写成 \N。ASS 的时间精度为百分之一秒
+        text = text.replace('{', '｛').replace('}', '｝').replace('\r', '').replace('\n', '\\N')
+        start = _split((start + 5) // 10 * 10)
+        end = _split((end + 5) // 10 * 10)
+        out.write(ASS_CUE % (start[:3] + (start[3] // 10,) + end[:3] + (end[3] // 10,) + (text,)))
+    return count
+
+
+WRITERS = {
+    'srt': _write_srt,
+    'vtt': _write_vtt,
+    'ass': _write_ass,
+}
+
+
+def write_subtitle(subtitle_data, out, fmt='srt'):
+    """把字幕JSON按 fmt 格式逐条写入文本流 out，返回写入的条数"""
+    if fmt not in WRITERS:
+        raise ValueError(f"不支持的字幕格式：{fmt}")
+    return WRITERS[fmt](subtitle_cues(subtitle_data), out)
+
+
+def convert_subtitle(subtitle_data, fmt='srt'):
+    """把字幕JSON转换为 fmt 格式的文本"""
+    out = io.StringIO()
+    if not write_subtitle(subtitle_data, out, fmt):
+        raise Exception("字幕内容为空")
+    return out.getvalue()
+
+
+def save_subtitle(subtitle_data, path, fmt='srt'):
+    """转换并保存字幕，先写临时文件再改名，失败时不留下半个文件"""
+    temp_path = path + '.part'
+    try:
+        with open(temp_path, 'w', encoding='utf-8', newline='\n') as f:
+            count = write_subtitle(subtitle_data, f, fmt)
+        if not count:
+            raise Exception("字幕内容为空")
+        os.replace(temp_path, path)
+        return count
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def subtitle_path(base_path, lan, fmt):
+    """字幕文件名：视频名.语言.格式，播放器能据此自动加载并识别语言"""
+    return f"{base_path}.{lan}.{fmt}"
+
+
+def download_subtitles(session, tracks, base_path, fmt='srt', languages=None, workers=DEFAULT_WORKERS,
+                       should_cancel=None):
+    """并发下载 languages 中的字幕轨（None 表示全部）并转换保存
+
+    返回 [(语言, 保存路径或None, 错误信息或None)]，顺序与 tracks 一致；单个语言失败不影响其他语言。
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"不支持的字幕格式：{fmt}")
+    should_cancel = should_cancel or (lambda: False)
+    wanted = [t for t in tracks if languages is None or t.get('lan') in languages]
+
+    def fetch(track):
+        lan = track.get('lan', 'unknown')
+        url = track_url(track)
+        if not url:
+            return lan, None, "没有字幕地址（AI字幕需要登录）" if is_ai_track(track) else "没有字幕地址"
+        if should_cancel():
+            return lan, None, "已取消"
+        try:
+            response = session.get(url, timeout=15)
+            if response.status_code != 200:
+                raise Exception(f"状态码：{response.status_code}")
+            path = subtitle_path(base_path, lan, fmt)
+            save_subtitle(response.json(), path, fmt)
+            return lan, path, None
+        except Exception as e:
+            return lan, None, str(e)
+
+    if not wanted:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(wanted)))) as executor:
+        return list(executor.map(fetch, wanted))
@@ -0,0 +1,82 @@
+"""任务依赖图：把一个下载任务拆成若干步骤，没有依赖关系的步骤并行执行"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class TaskGraph:
+    """简单的有向无环任务图
+
+    每个步骤是一个可调用对象，调用时按 deps 的顺序传入所依赖步骤的返回值。
+    任一步骤出错后 failed 变为真，不再启动新的步骤，已提交但还没开始的步骤被撤销；
+    正在运行的步骤应在取消检查中同时检查 failed 尽快退出，全部结束后抛出第一个错误。
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._tasks = {}  # name -> (func, deps)
+        self._order = []
+        self._failed = threading.Event()
+
+    @property
+    def failed(self):
+        """本次 run() 中已有步骤出错"""
+        return self._failed.is_set()
+
+    def add(self, name, func, deps=()):
+        if name in self._tasks:
+            raise Exception(f"任务步骤重复：{name}")
+        for dep in deps:
+            if dep not in self._tasks:
+                raise Exception(f"任务步骤 {name} 依赖的 {dep} 不存在")
+        # 依赖必须先添加，因此图天然无环
+        self._tasks[name] = (func, tuple(deps))
+        self._order.append(name)
+        return name
+
+    def __contains__(self, name):
+        return name in self._tasks
+
+    def run(self, should_cancel=None):
+        """执行全部步骤，返回 {步骤名: 返回值}；被取消时返回已完成步骤的结果"""
+        should_cancel = should_cancel or (lambda: False)
+        results = {}
+        pending = list(self._order)
+        running = {}
+        error = None
+        self._failed.clear()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                if error is None and not should_cancel():
+                    for name in list(pending):
+                        func, deps = self._tasks[name]
+                        if all(dep in results for dep in deps):
+                            pending.remove(name)
+                            args = [results[dep] for dep in deps]
+                            running[executor.submit(func, *args)] = name
+                elif not running:
+                    break
+
+                if not running:
+                    # 剩余步骤的依赖都无法满足，不会出现在只按添加顺序建图的情况下
+                    raise Exception(f"任务步骤无法执行：{', '.join(pending)}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        value = future.result()
+                    except Exception as e:
+                        if error is None:
+                            error = e
+                            self._failed.set()
+                        continue
+                    results[name] = value
+                if error is not None:
+                    # 排队中还没开始的步骤直接撤销，正在运行的步骤通过 failed 得知要退出
+                    for future in [f for f in running if f.cancel()]:
+                        running.pop(future)
+
+        if error is not None:
+            raise error
+        return results
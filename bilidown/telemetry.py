@@ -0,0 +1,232 @@
+"""下载进度汇总：各下载线程只更新计数，由一个发布线程按固定频率推送合并后的快照
+
+下载线程每写一块数据就调用 update()，只在锁内改几个数字；界面、命令行或远程接口通过
+subscribe() 注册回调，每隔 interval 秒收到一份 TelemetrySnapshot，不会因为连接数多而被刷屏。
+速度用指数加权移动平均（EWMA）平滑，剩余时间按平滑后的速度估算。
+"""
+import math
+import threading
+import time
+
+PUBLISH_INTERVAL = 0.25  # 每秒推送4次，足够界面刷新
+SPEED_HALF_LIFE = 2.0  # 速度平滑的半衰期（秒），越大越平稳、反应越慢
+
+
+def format_eta(seconds):
+    """剩余时间格式化为 1:02:03 或 02:03，未知时返回 --:--"""
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def _eta(downloaded, total, speed):
+    if total <= 0 or speed <= 0:
+        return None
+    return max(0, total - downloaded) / speed
+
+
+class JobSnapshot:
+    def __init__(self, key, name, state, downloaded, total, speed):
+        self.key = key
+        self.name = name
+        self.state = state  # running/done/failed/cancelled
+        self.downloaded = downloaded
+        self.total = total
+        self.speed = speed  # 字节/秒
+        self.eta = _eta(downloaded, total, speed) if state == 'running' else None
+
+    def to_dict(self):
+        return {
+            'key': str(self.key),
+            'name': self.name,
+            'state': self.state,
+            'downloaded': self.downloaded,
+            'total': self.total,
+            'speed': round(self.speed, 1),
+            'eta': None if self.eta is None else round(self.eta, 1),
+        }
+
+
+class TelemetrySnapshot:
+    """某一时刻所有任务的进度，以及合计的已下载、总大小、速度和剩余时间"""
+
+    def __init__(self, timestamp, jobs, retired=(0, 0)):
+        self.timestamp = timestamp
+        self.jobs = jobs
+        # retired 为已移出列表的任务的 (已下载, 总大小)
+        self.downloaded = retired[0] + sum(job.downloaded for job in jobs)
+        self.total = retired[1] + sum(job.total for job in jobs)
+        self.speed = sum(job.speed for job in jobs if job.state == 'running')
+        self.eta = _eta(self.downloaded, self.total, self.speed)
+
+    @property
+    def percent(self):
+        return self.downloaded * 100 / self.total if self.total > 0 else 0.0
+
+    def to_dict(self):
+        """转换为可直接 json.dumps 的字典，供命令行和远程接口使用"""
+        return {
+            'timestamp': round(self.timestamp, 3),
+            'downloaded': self.downloaded,
+            'total': self.total,
+            'speed': round(self.speed, 1),
+            'eta': None if self.eta is None else round(self.eta, 1),
+            'jobs': [job.to_dict() for job in self.jobs],
+        }
+
+
+class _Job:
+    def __init__(self, key, name):
+        self.key = key
+        self.name = name
+        self.state = 'running'
+        self.streams = {}  # 流 -> (已下载, 总大小)
+        self.transferred = 0  # 本次实际传输的字节数，不含续传前已有的部分
+        self.sampled = 0  # 上次计算速度时的 transferred
+        self.speed = 0.0
+        self.warmed = False
+
+    def snapshot(self):
+        downloaded = sum(d for d, _ in self.streams.values())
+        total = sum(t for _, t in self.streams.values())
+        return JobSnapshot(self.key, self.name, self.state, downloaded, total, self.speed)
+
+
+class TelemetryHub:
+    """收集所有任务的下载计数，按固定频率向订阅者推送快照
+
+    用法：
+        hub = TelemetryHub()
+        hub.subscribe(lambda snapshot: print(snapshot.to_dict()))
+        hub.start()
+        hub.update(job_key, stream_key, downloaded, total)  # 在任意线程中调用
+        hub.finish(job_key)
+        hub.stop()
+    订阅回调在发布线程中执行，Qt 界面应通过信号转到主线程。
+    """
+
+    def __init__(self, interval=PUBLISH_INTERVAL, half_life=SPEED_HALF_LIFE):
+        self.interval = interval
+        self.half_life = half_life
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._retired = (0, 0)
+        self._subscribers = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_sample = None
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def register(self, job_key, name=''):
+        """登记一个任务；update() 遇到未登记的任务也会自动登记"""
+        with self._lock:
+            job = self._jobs.get(job_key)
+            if job is None:
+                self._jobs[job_key] = _Job(job_key, name)
+            else:
+                job.name = name or job.name
+                job.state = 'running'
+
+    def update(self, job_key, stream_key, downloaded, total):
+        """上报某个流当前的累计下载量，开销很小，可以在每次写入后调用"""
+        with self._lock:
+            job = self._jobs.get(job_key)
+            if job is None:
+                job = self._jobs[job_key] = _Job(job_key, '')
+            previous = job.streams.get(stream_key)
+            # 流第一次上报的是续传前已有的大小，不计入速度
+            if previous is not None:
+                job.transferred += max(0, downloaded - previous[0])
+            job.streams[stream_key] = (downloaded, total)
+
+    def finish(self, job_key, state='done'):
+        with self._lock:
+            job = self._jobs.get(job_key)
+            if job is not None:
+                job.state = state
+                job.speed = 0.0
+
+    def remove(self, job_key):
+        with self._lock:
+            self._jobs.pop(job_key, None)
+
+    def retire(self, job_key):
+        """把已结束的任务并入合计后移出列表；任务数很多的批量下载用它控制每次快照的开销"""
+        with self._lock:
+            job = self._jobs.pop(job_key, None)
+            if job is not None:
+                snapshot = job.snapshot()
+                self._retired = (self._retired[0] + snapshot.downloaded, self._retired[1] + snapshot.total)
+
+    def snapshot(self):
+        """按距上次采样的时间更新各任务的平滑速度，返回当前快照"""
+        now = time.monotonic()
+        with self._lock:
+            if self._last_sample is not None:
+                elapsed = max(now - self._last_sample, 1e-3)
+                # 按实际间隔换算权重，推送间隔不均匀时平滑效果保持一致
+                alpha = 1 - math.exp(-elapsed * math.log(2) / self.half_life)
+                for job in self._jobs.values():
+                    if job.state != 'running':
+                        continue
+                    instant = (job.transferred - job.sampled) / elapsed
+                    if job.warmed:
+                        job.speed += alpha * (instant - job.speed)
+                    elif job.transferred:
+                        # 第一次有数据时直接取瞬时速度，免得从0慢慢爬升
+                        job.speed = instant
+                        job.warmed = True
+                    job.sampled = job.transferred
+            self._last_sample = now
+            jobs = [job.snapshot() for job in self._jobs.values()]
+            retired = self._retired
+        return TelemetrySnapshot(time.time(), jobs, retired)
+
+    def publish(self):
+        snapshot = self.snapshot()
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(snapshot)
+        return snapshot
+
+    def start(self):
+        # 从启动时刻开始计算速度，之前上报的数据不计入
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._last_sample = time.monotonic()
+            for job in self._jobs.values():
+                job.sampled = job.transferred
+            self._thread = threading.Thread(target=self._run, name='bilidown-telemetry', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.publish()
+
+    def stop(self):
+        """停止发布线程，并推送最后一份快照，让订阅者看到最终状态；可以在任意线程中重复调用"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        if thread is not threading.current_thread():
+            thread.join()
+        self.publish()
@@ -0,0 +1,334 @@
+"""HTTP连接管理：所有会话共用一套按主机划分的连接池，接口和图片主机可走 HTTP/2，并缓存DNS解析结果
+
+前端通过 create_session() 创建带登录状态的会话，访问第三方解析接口、GitHub 等不应带上B站Cookie的请求
+使用 public_session()；两者挂载同一个 Transport，连接都能复用：
+    session = create_session()
+    mount_pool(session, 64)  # 批量下载前按并发连接数扩大连接池
+安装了 h2 时，接口、封面、头像和字幕所在的主机通过 httpx 的 HTTP/2 连接发送请求，一批小请求复用同一个连接；
+视频流仍走 HTTP/1.1 多连接，分段下载需要多条连接才能跑满带宽。
+DNS 缓存只作用于 Transport 自己的 HTTP/1.1 连接池新建连接时的解析，不替换 socket.getaddrinfo，
+进程中的其他库不受影响。
+"""
+import http.client
+import importlib.util
+import os
+import socket
+import ssl
+import threading
+import sys
+import time
+import types
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util import connection
+from urllib3.util.ssl_ import is_ipaddress
+from requests.cookies import extract_cookies_to_jar
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers, select_proxy
+
+# httpx 的 HTTP/2 支持依赖 h2；两者导入较慢，这里只检查是否安装，第一次发送 HTTP/2 请求时才导入
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None and importlib.util.find_spec('httpx') is not None
+
+DEFAULT_POOL_SIZE = 16
+POOL_HOSTS = 32  # 缓存连接池的主机数：接口、图片以及多个CDN镜像
+DNS_TTL = 300
+# 按主机单独设置连接池大小，这些主机都是小请求，不需要和视频流一样多的连接
+HOST_POOLS = {
+    'https://api.bilibili.com/': 8,
+    'https://passport.bilibili.com/': 2,
+    'https://i0.hdslb.com/': 4,
+    'https://i1.hdslb.com/': 4,
+    'https://i2.hdslb.com/': 4,
+    'https://aisubtitle.hdslb.com/': 4,
+}
+HTTP2_HOSTS = ('https://api.bilibili.com/', 'https://i0.hdslb.com/', 'https://i1.hdslb.com/',
+               'https://i2.hdslb.com/', 'https://aisubtitle.hdslb.com/')
+
+
+class DnsCache:
+    """按 TTL 缓存 getaddrinfo 的结果，同一主机的连续请求不再重复解析"""
+
+    def __init__(self, ttl=DNS_TTL, resolver=None):
+        self.ttl = ttl
+        self.resolver = resolver or socket.getaddrinfo
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        key = (host, port, family, type, proto, flags)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return list(entry[1])
+        result = self.resolver(host, port, family, type, proto, flags)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, result)
+        return list(result)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _CachedDnsConnection:
+    """新建连接时经 dns_cache 解析主机名，逐个尝试解析出的地址；主机名仍用于 SNI 和证书校验"""
+    dns_cache = None
+
+    def _new_conn(self):
+        host = self._dns_host
+        if self.dns_cache is None or is_ipaddress(host.strip('[]')):
+            return super()._new_conn()
+        try:
+            addresses = self.dns_cache.getaddrinfo(host, self.port, connection.allowed_gai_family(),
+                                                   socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        error = None
+        for _, _, _, _, sockaddr in addresses:
+            try:
+                sock = connection.create_connection((sockaddr[0], self.port), self.timeout,
+                                                    source_address=self.source_address,
+                                                    socket_options=self.socket_options)
+            except socket.timeout as e:
+                error = ConnectTimeoutError(
+                    self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})")
+                error.__cause__ = e
+            except OSError as e:
+                error = NewConnectionError(self, f"Failed to establish a new connection: {e}")
+                error.__cause__ = e
+            else:
+                sys.audit("http.client.connect", self, self.host, self.port)
+                return sock
+        raise error or NewConnectionError(self, "Failed to establish a new connection: 解析结果为空")
+
+
+def _cached_pool_classes(dns_cache):
+    """连接经 dns_cache 解析的 http/https 连接池类，供 PoolManager.pool_classes_by_scheme 使用"""
+    attrs = {'dns_cache': dns_cache}
+    http_connection = type('CachedHTTPConnection', (_CachedDnsConnection, HTTPConnection), attrs)
+    https_connection = type('CachedHTTPSConnection', (_CachedDnsConnection, HTTPSConnection), attrs)
+    return {
+        'http': type('CachedHTTPConnectionPool', (HTTPConnectionPool,), {'ConnectionCls': http_connection}),
+        'https': type('CachedHTTPSConnectionPool', (HTTPSConnectionPool,), {'ConnectionCls': https_connection}),
+    }
+
+
+class CachedDnsAdapter(HTTPAdapter):
+    """新建连接时使用 dns_cache 解析主机名的 HTTPAdapter；dns_cache 为 None 时与 HTTPAdapter 相同"""
+
+    def __init__(self, dns_cache=None, **kwargs):
+        self.dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        if self.dns_cache is not None:
+            self.poolmanager.pool_classes_by_scheme = _cached_pool_classes(self.dns_cache)
+
+    def resize(self, maxsize):
+        """修改之后新建的连接池的大小，并关闭现有的连接池
+
+        适配器和 PoolManager 对象不变，挂载它的会话继续有效；正在传输的连接用完后随旧连接池关闭，
+        之后的请求在新大小的连接池中建立连接。
+        """
+        self._pool_maxsize = maxsize
+        self.poolmanager.connection_pool_kw['maxsize'] = maxsize
+        self.poolmanager.clear()
+
+
+def _httpx_timeout(timeout):
+    import httpx
+    
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+class _Http2Body:
+    """把 httpx 响应包装成 requests 需要的 raw 对象，支持 read() 和提取 Set-Cookie"""
+
+    def __init__(self, response):
+        self._response = response
+        self._chunks = response.iter_bytes()
+        self._buffer = bytearray()  # 原地追加和从头部删除，大块读取不会反复复制已缓存的数据
+        msg = http.client.HTTPMessage()
+        for name, value in response.headers.multi_items():
+            msg[name] = value
+        self._original_response = types.SimpleNamespace(msg=msg)
+
+    def read(self, amt=None, decode_content=True):
+        import httpx
+        
+        try:
+            while amt is None or len(self._buffer) < amt:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._buffer += chunk
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e))
+        if amt is None:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:amt])
+            del self._buffer[:amt]
+        if not data:
+            self.close()
+        return data
+
+    def close(self):
+        self._response.close()
+
+    def release_conn(self):
+        self.close()
+
+
+class Http2Adapter(BaseAdapter):
+    """通过 httpx 发送请求，服务器支持时走 HTTP/2，多个请求共用一个连接
+
+    需要代理、客户端证书或关闭证书校验的请求交给 fallback（普通的 HTTPAdapter）。
+    """
+
+    def __init__(self, fallback, max_connections=DEFAULT_POOL_SIZE):
+        super().__init__()
+        self.fallback = fallback
+        self.max_connections = max_connections
+        self._clients = {}  # verify 参数 -> httpx.Client
+        self._lock = threading.Lock()
+
+    def _client(self, verify):
+        """按证书设置取得客户端；设置了 REQUESTS_CA_BUNDLE 时 verify 为证书路径"""
+        import httpx
+        
+        with self._lock:
+            client = self._clients.get(verify)
+            if client is None:
+                context = True
+                if isinstance(verify, str):
+                    if os.path.isdir(verify):
+                        context = ssl.create_default_context(capath=verify)
+                    else:
+                        context = ssl.create_default_context(cafile=verify)
+                client = self._clients[verify] = httpx.Client(
+                    http2=True, follow_redirects=False, trust_env=False, verify=context,
+                    limits=httpx.Limits(max_connections=self.max_connections,
+                                        max_keepalive_connections=self.max_connections))
+            return client
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if cert or verify is False or select_proxy(request.url, proxies or {}):
+            return self.fallback.send(request, stream=stream, timeout=timeout, verify=verify,
+                                      cert=cert, proxies=proxies)
+        import httpx
+        
+        client = self._client(verify)
+        body = request.body.encode('utf-8') if isinstance(request.body, str) else request.body
+        outgoing = client.build_request(request.method, request.url, headers=dict(request.headers),
+                                        content=body, timeout=_httpx_timeout(timeout))
+        try:
+            response = client.send(outgoing, stream=True)
+        except httpx.ConnectTimeout as e:
+            raise requests.ConnectTimeout(str(e), request=request)
+        except httpx.TimeoutException as e:
+            raise requests.ReadTimeout(str(e), request=request)
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e), request=request)
+        return self.build_response(request, response, stream)
+
+    def build_response(self, request, response, stream):
+        result = requests.Response()
+        result.status_code = response.status_code
+        result.reason = response.reason_phrase
+        result.headers = CaseInsensitiveDict(response.headers)
+        result.encoding = get_encoding_from_headers(result.headers)
+        result.raw = _Http2Body(response)
+        result.url = request.url
+        result.request = request
+        result.connection = self
+        extract_cookies_to_jar(result.cookies, request, result.raw)
+        if not stream:
+            result.content  # 读完响应体，连接立即回到池中
+        return result
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+        self.fallback.close()
+
+
+class Transport:
+    """一组可以挂载到多个会话上的适配器：默认适配器服务视频流和其他主机，HOST_POOLS 中的主机各用一个小连接池"""
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, http2=None, dns_ttl=DNS_TTL):
+        self._lock = threading.Lock()
+        # 只缓存本 Transport 的连接的解析结果；dns_ttl 为 None 时不缓存
+        self.dns_cache = DnsCache(dns_ttl) if dns_ttl else None
+        self.default = CachedDnsAdapter(self.dns_cache, pool_connections=POOL_HOSTS, pool_maxsize=pool_size)
+        self.http2 = HTTP2_AVAILABLE if http2 is None else http2
+        self.hosts = {}
+        for prefix, size in HOST_POOLS.items():
+            adapter = CachedDnsAdapter(self.dns_cache, pool_connections=1, pool_maxsize=size)
+            if self.http2 and prefix in HTTP2_HOSTS:
+                adapter = Http2Adapter(adapter, size)
+            self.hosts[prefix] = adapter
+
+    def mount(self, session):
+        session.mount('https://', self.default)
+        session.mount('http://', self.default)
+        for prefix, adapter in self.hosts.items():
+            session.mount(prefix, adapter)
+        return session
+
+    def resize(self, pool_size):
+        """扩大默认连接池；只增不减。适配器对象不变，旧的连接池被关闭，之后按新大小重新建立连接"""
+        with self._lock:
+            if pool_size > self.default._pool_maxsize:
+                self.default.resize(pool_size)
+
+
+_transport = None
+_public_session = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """进程内共用的 Transport"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = Transport()
+        return _transport
+
+
+def create_session():
+    """创建挂载共用连接池的会话"""
+    return get_transport().mount(requests.Session())
+
+
+def public_session():
+    """不带登录Cookie的共用会话，用于第三方解析接口、检查更新等非B站请求"""
+    global _public_session
+    transport = get_transport()
+    with _transport_lock:
+        if _public_session is None:
+            _public_session = transport.mount(requests.Session())
+        return _public_session
+
+
+def mount_pool(session, pool_size=DEFAULT_POOL_SIZE):
+    """保证会话的连接池能容纳 pool_size 个并发连接，多个线程共用一个会话时不会频繁新建连接"""
+    pool_size = max(DEFAULT_POOL_SIZE, int(pool_size))
+    transport = get_transport()
+    if session.adapters.get('https://') is not transport.default:
+        transport.mount(session)
+    transport.resize(pool_size)
+    return session
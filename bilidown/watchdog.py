@@ -0,0 +1,76 @@
+"""界面卡顿检测：界面线程定时打点，后台线程发现打点停顿超过阈值时抓取界面线程当时的调用栈
+
+    watchdog = StallWatchdog()
+    watchdog.start()          # 在界面线程中调用
+    timer.timeout.connect(watchdog.beat)  # 每 BEAT_INTERVAL 秒打一次点
+卡顿结束、界面线程重新打点时调用 report(卡顿秒数, 调用栈文本)，默认输出到标准错误。调用栈是在卡顿
+进行中抓取的，指向真正阻塞界面线程的代码（如同步的网络请求），而不是卡顿结束后的位置。
+"""
+import sys
+import threading
+import time
+import traceback
+
+STALL_THRESHOLD = 0.05  # 超过50ms算卡顿
+BEAT_INTERVAL = 0.02
+
+
+class StallWatchdog:
+    def __init__(self, threshold=STALL_THRESHOLD, interval=BEAT_INTERVAL, report=None):
+        self.threshold = threshold
+        self.interval = interval
+        self.report = report or self._print
+        self.stalls = 0
+        self.longest = 0.0
+        self._thread_id = None
+        self._last_beat = None
+        self._stack = None  # 本次卡顿中抓到的调用栈
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor = None
+
+    def start(self):
+        """开始监视调用线程（界面线程）"""
+        self._thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._monitor = threading.Thread(target=self._watch, name='stall-watchdog', daemon=True)
+        self._monitor.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def beat(self):
+        """由界面线程的定时器调用；距上次打点超出 interval 的部分就是卡顿时长"""
+        now = time.monotonic()
+        with self._lock:
+            last, self._last_beat = self._last_beat, now
+            stack, self._stack = self._stack, None
+        if last is None:
+            return
+        stalled = now - last - self.interval
+        if stalled > self.threshold:
+            self.stalls += 1
+            self.longest = max(self.longest, stalled)
+            self.report(stalled, stack or '')
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                last = self._last_beat
+                if self._stack is not None or last is None:
+                    continue
+                if time.monotonic() - last - self.interval <= self.threshold:
+                    continue
+            frame = sys._current_frames().get(self._thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+            with self._lock:
+                # 抓取期间界面线程可能已经恢复并打过点，这时的调用栈不属于这次卡顿
+                if self._last_beat == last and self._stack is None:
+                    self._stack = stack
+
+    @staticmethod
+    def _print(stalled, stack):
+        print(f"界面线程卡顿 {stalled * 1000:.0f}ms", file=sys.stderr)
+        if stack:
+            print(stack, file=sys.stderr)
@@ -1,115 +1,586 @@
-import requests
+"""命令行下载器：不依赖 PyQt6 和 Tk，适合在服务器或定时任务中批量下载
+
+    python src/bilibili_downloader.py BV1xx411c7mD https://www.bilibili.com/video/BV1yy411c7mE?p=2
+    python src/bilibili_downloader.py -i list.txt -o ~/Videos -q 80 --codec hevc
+    cat list.txt | python src/bilibili_downloader.py -i - --progress text
+列表文件每行一个BV号、视频链接或UP主空间/收藏夹链接，空行和 # 开头的行忽略。
+登录状态复用图形界面保存的 bilibili_cookies.json，也可以用 --login 在终端扫码登录。
+进度默认以 JSON Lines 输出到标准输出，每行一个事件；退出码见 EXIT_* 常量。
+"""
+import argparse
 import json
-import qrcode
-import time
-from PIL import Image
 import os
-from concurrent.futures import ThreadPoolExecutor
+import re
+import sys
+import threading
+import time
+
+import requests
+
+# 下载核心位于仓库根目录的 bilidown 包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bilidown.api_cache import install_api_cache
+from bilidown.rate_limit import install_rate_limiter
+from bilidown.transport import create_session, mount_pool
+from bilidown.playurl_cache import get_playurl_cache, playurl_key
+from bilidown.async_engine import get_engine
+from bilidown.segmented import SegmentedDownloader, DEFAULT_CONNECTIONS
+from bilidown.mirrors import stream_urls
+from bilidown.mp4_remux import merge_streams
+from bilidown.stream_policy import StreamPolicy, CODEC_IDS
+from bilidown.job_queue import JobQueue, DEFAULT_CONCURRENCY
+from bilidown.bandwidth import Schedule, get_shaper, parse_rate
+from bilidown.bulk_resolver import BulkResolver, parse_source
+from bilidown.telemetry import TelemetryHub, format_eta
+from bilidown.danmaku import download_danmaku
+from bilidown.subtitles import FORMATS as SUBTITLE_FORMATS, download_subtitles, list_subtitles
+
+EXIT_OK = 0
+EXIT_FAILED = 1  # 有任务下载失败
+EXIT_USAGE = 2  # 参数错误或没有可下载的任务（与 argparse 一致）
+EXIT_LOGIN = 3  # 要求登录但未登录，或扫码登录失败
+EXIT_INTERRUPTED = 130
+
+COOKIES_FILE = 'bilibili_cookies.json'
+STREAM_HEADERS = {
+    'Referer': 'https://www.bilibili.com',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+}
+BVID_PATTERN = re.compile(r'BV[0-9A-Za-z]{10}')
+WEIGHT_PATTERN = re.compile(r'\s\*(\d+(?:\.\d+)?)$')
+
+
+def safe_filename(name):
+    """去掉文件名中各系统不允许的字符"""
+    return re.sub(r'[\\/:*?"<>|\r\n\t]', '_', name).strip().rstrip('.') or 'untitled'
+
+
+def parse_pages(spec):
+    """解析分P选择，如 "all"、"1"、"1,3-5"，返回 None（全部）或分P序号集合"""
+    if spec is None or spec.strip().lower() == 'all':
+        return None
+    pages = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        if not start.isdigit() or (end and not end.isdigit()):
+            raise ValueError(f"无法识别的分P选择：{spec}")
+        pages.update(range(int(start), int(end or start) + 1))
+    return pages
+
+
+def read_inputs(args):
+    """合并命令行参数和列表文件中的输入，"-" 表示标准输入"""
+    items = list(args.inputs)
+    for path in args.input_file or []:
+        f = sys.stdin if path == '-' else open(path, encoding='utf-8')
+        try:
+            items.extend(f.read().splitlines())
+        finally:
+            if f is not sys.stdin:
+                f.close()
+    return [item.strip() for item in items if item.strip() and not item.strip().startswith('#')]
+
+
+def split_weight(text):
+    """拆出输入末尾的限速权重，如 "BV1xx411c7mD *2" 返回 ("BV1xx411c7mD", 2.0)，没有时权重为1"""
+    match = WEIGHT_PATTERN.search(text)
+    if match is None:
+        return text, 1.0
+    weight = float(match.group(1))
+    if weight <= 0:
+        raise ValueError(f"权重必须大于0：{text}")
+    return text[:match.start()].strip(), weight
+
+
+class EventWriter:
+    """输出进度事件：json 模式每行一个 JSON 对象，text 模式输出便于阅读的文字"""
+
+    def __init__(self, mode='json', stream=None):
+        self.mode = mode
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        if self.mode == 'none' and event != 'summary':
+            return
+        with self._lock:
+            if self.mode == 'json':
+                fields = dict({'event': event, 'time': round(time.time(), 3)}, **fields)
+                self.stream.write(json.dumps(fields, ensure_ascii=False) + '\n')
+            else:
+                self.stream.write(self._text(event, fields) + '\n')
+            self.stream.flush()
+
+    @staticmethod
+    def _text(event, fields):
+        if event == 'progress':
+            total = fields['total']
+            percent = f"{fields['downloaded'] * 100 / total:5.1f}%" if total else "  ?  "
+            return (f"{percent} {fields['downloaded'] / 1024 / 1024:.1f}MB/{total / 1024 / 1024:.1f}MB "
+                    f"{fields['speed'] / 1024 / 1024:.2f}MB/s 剩余 {format_eta(fields['eta'])}")
+        if event == 'summary':
+            return f"完成 {fields['done']}，跳过 {fields['skipped']}，失败 {fields['failed']}"
+        details = ' '.join(f"{key}={value}" for key, value in fields.items())
+        return f"[{event}] {details}"
+
 
 class BilibiliDownloader:
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, cookies_file=COOKIES_FILE):
+        self.session = create_session()
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         self.session.headers.update(self.headers)
+        # 视频信息、播放器信息和登录状态接口走缓存，重复查询不再请求网络
+        install_api_cache(self.session)
+        # 所有接口请求共用令牌桶限速，触发412风控时自动降速
+        install_rate_limiter(self.session)
+        self.cookies_file = cookies_file
         self.is_logged_in = False
+        self.load_cookies()
+
+    def load_cookies(self):
+        """读取图形界面保存的登录Cookie"""
+        if self.cookies_file and os.path.exists(self.cookies_file):
+            try:
+                with open(self.cookies_file, 'r') as f:
+                    self.session.cookies.update(json.load(f))
+            except Exception as e:
+                raise Exception(f"读取Cookie文件失败：{str(e)}")
+
+    def save_cookies(self):
+        cookies = requests.utils.dict_from_cookiejar(self.session.cookies)
+        with open(self.cookies_file, 'w') as f:
+            json.dump(cookies, f)
+
+    def check_login(self):
+        """用 nav 接口确认Cookie是否有效，返回用户名或None"""
+        try:
+            data = self.session.get('https://api.bilibili.com/x/web-interface/nav', timeout=15).json()
+        except Exception as e:
+            raise Exception(f"检查登录状态失败：{str(e)}")
+        self.is_logged_in = bool(data.get('code') == 0 and data['data'].get('isLogin'))
+        return data['data'].get('uname') if self.is_logged_in else None
+
+    def login(self, timeout=180):
+        """在终端打印二维码扫码登录，成功后保存Cookie"""
+        import qrcode  # 只在扫码登录时需要
+
+        response = self.session.get('https://passport.bilibili.com/x/passport-login/web/qrcode/generate')
+        data = response.json()
+        if data.get('code') != 0:
+            raise Exception(f"获取二维码失败：{data.get('message', '未知错误')}")
+        qr = qrcode.QRCode(border=1)
+        qr.add_data(data['data']['url'])
+        qr.print_ascii(out=sys.stderr, invert=True)
+        print("请使用B站APP扫描二维码登录", file=sys.stderr)
 
-    def login(self):
-        """使用二维码登录B站"""
-        # 获取二维码登录URL
-        qr_url = "https://passport.bilibili.com/qrcode/getLoginUrl"
-        response = self.session.get(qr_url)
-        data = response.json()['data']
-        
-        # 生成二维码
-        qr = qrcode.QRCode()
-        qr.add_data(data['url'])
-        qr.make()
-        img = qr.make_image()
-        img.save('qrcode.png')
-        
-        # 打开二维码图片
-        Image.open('qrcode.png').show()
-        
-        # 检查登录状态
-        while not self.is_logged_in:
-            check_url = f"https://passport.bilibili.com/qrcode/getLoginInfo"
-            response = self.session.post(check_url, data={
-                'oauthKey': data['oauthKey']
-            })
-            
-            if response.json()['status']:
+        qrcode_key = data['data']['qrcode_key']
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            response = self.session.get('https://passport.bilibili.com/x/passport-login/web/qrcode/poll',
+                                        params={'qrcode_key': qrcode_key})
+            result = response.json()
+            if result.get('code') != 0:
+                raise Exception(f"登录失败：{result.get('message', '未知错误')}")
+            code = result['data']['code']
+            if code == 0:
+                self.save_cookies()
                 self.is_logged_in = True
-                print("登录成功！")
-                break
-            
-            time.sleep(2)
-        
-        os.remove('qrcode.png')
+                return
+            if code == 86038:
+                raise Exception("二维码已过期")
+            time.sleep(1)
+        raise Exception("等待扫码超时")
 
     def get_video_info(self, bvid):
         """获取视频信息"""
-        url = f"https://api.bilibili.com/x/web-interface/view?bvid={bvid}"
-        response = self.session.get(url)
-        return response.json()['data']
+        url = "https://api.bilibili.com/x/web-interface/view"
+        try:
+            data = self.session.get(url, params={'bvid': bvid}, timeout=15).json()
+        except Exception as e:
+            raise Exception(f"获取视频信息失败：{str(e)}")
+        if data.get('code') != 0:
+            raise Exception(f"获取视频信息失败：{data.get('message', '未知错误')}")
+        return data['data']
 
     def get_download_url(self, bvid, cid, quality):
-        """获取视频下载地址"""
-        url = f"https://api.bilibili.com/x/player/playurl"
+        """获取DASH下载地址，结果在有效期内缓存"""
+        url = "https://api.bilibili.com/x/player/playurl"
         params = {
             'bvid': bvid,
             'cid': cid,
             'qn': quality,
-            'fnval': 16
+            'fnval': 4048,
+            'fnver': 0,
+            'fourk': 1
         }
-        response = self.session.get(url, params=params)
-        return response.json()['data']
-
-    def download_video(self, url, filename):
-        """下载视频"""
-        response = self.session.get(url, stream=True)
-        total_size = int(response.headers.get('content-length', 0))
-        
-        with open(filename, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-
-    def start_download(self, bvid):
-        """开始下载流程"""
-        if not self.is_logged_in:
-            print("请先登录！")
-            self.login()
-
-        # 获取视频信息
-        video_info = self.get_video_info(bvid)
-        print(f"视频标题：{video_info['title']}")
-
-        # 显示可用画质
-        qualities = {
-            80: '1080P',
-            64: '720P',
-            32: '480P',
-            16: '360P'
-        }
-        print("\n可用画质：")
-        for qn, name in qualities.items():
-            print(f"{qn}: {name}")
-        
-        quality = int(input("请选择画质(输入数字)："))
-
-        # 获取下载地址
-        download_info = self.get_download_url(bvid, video_info['cid'], quality)
-        
-        # 下载视频
-        video_url = download_info['durl'][0]['url']
-        filename = f"{video_info['title']}.mp4"
-        print(f"\n开始下载：{filename}")
-        self.download_video(video_url, filename)
-        print("下载完成！")
+
+        def request_playurl():
+            data = self.session.get(url, params=params, headers={'Referer': f'https://www.bilibili.com/video/{bvid}'},
+                                    timeout=15).json()
+            if data.get('code') != 0:
+                raise Exception(f"获取下载地址失败：{data.get('message', '未知错误')}")
+            return data['data']
+
+        key = playurl_key(self.session, bvid, cid, quality, params['fnval'])
+        return key, get_playurl_cache().get_or_fetch(key, request_playurl)
+
+    def expand_input(self, text, pages=None):
+        """把一条输入展开成 (bvid, cid, 名称) 任务列表"""
+        match = BVID_PATTERN.search(text)
+        if match is None:
+            # 不是视频链接时按UP主空间、收藏夹、稍后再看列表解析
+            index = BulkResolver(self.session).resolve(parse_source(text))
+            return list(index.jobs())
+        bvid = match.group(0)
+        if pages is None:
+            page = re.search(r'[?&]p=(\d+)', text)
+            pages = {int(page.group(1))} if page else None
+        info = self.get_video_info(bvid)
+        jobs = []
+        for p in info['pages']:
+            if pages is not None and p['page'] not in pages:
+                continue
+            name = info['title']
+            if len(info['pages']) > 1:
+                name += f"_P{p['page']}_{p['part']}"
+            jobs.append((bvid, p['cid'], name))
+        return jobs
+
+
+class DownloadJob:
+    """下载一个分P：取地址、按策略选流、下载音视频后合并"""
+
+    def __init__(self, downloader, options, telemetry, events, bvid, cid, name, weight=1.0):
+        self.downloader = downloader
+        self.session = downloader.session
+        self.options = options
+        self.telemetry = telemetry
+        self.events = events
+        self.bvid = bvid
+        self.cid = cid
+        self.name = name
+        self.key = (bvid, cid)
+        self.weight = weight
+        self.cancel = False
+
+    def run(self):
+        output = os.path.join(self.options['output'], safe_filename(self.name) +
+                              ('.m4a' if self.options['audio_only'] else '.mp4'))
+        if os.path.exists(output) and not self.options['overwrite']:
+            self.events.emit('skipped', bvid=self.bvid, cid=self.cid, file=output)
+            return 'skipped'
+        self.events.emit('start', bvid=self.bvid, cid=self.cid, name=self.name)
+        self.telemetry.register(self.key, self.name)
+        # 限速时按输入给出的权重分配带宽，如 "BV... *2" 分到普通任务的两倍
+        self.bandwidth = get_shaper().job(self.key, self.weight)
+        key = None
+        result = {'file': output}
+        try:
+            key, info = self.downloader.get_download_url(self.bvid, self.cid, self.options['quality'])
+            if self.options['highlights']:
+                result = {'files': self.download_highlights(info, output)}
+            else:
+                self.download(info, output)
+            if self.options['subtitles'] is not None:
+                self.fetch_subtitles(os.path.splitext(output)[0])
+            if self.options['danmaku']:
+                self.fetch_danmaku(os.path.splitext(output)[0] + '.danmaku.ass')
+        except Exception as e:
+            if key is not None:
+                get_playurl_cache().invalidate(key)  # 地址可能已失效，下次重新获取
+            self.telemetry.finish(self.key, 'failed')
+            self.events.emit('error', bvid=self.bvid, cid=self.cid, name=self.name, message=str(e))
+            return 'failed'
+        finally:
+            self.bandwidth.release()
+            self.telemetry.retire(self.key)
+        self.events.emit('done', bvid=self.bvid, cid=self.cid, **result)
+        return 'done'
+
+    def download(self, info, output):
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        if 'dash' not in info:
+            if not info.get('durl'):
+                raise Exception("没有可下载的地址")
+            self.fetch(stream_urls(info['durl'][0]), output, 'durl', info.get('quality'))
+            return
+        video, audio = self.options['policy'].select(info['dash'])
+        if audio is None and self.options['audio_only']:
+            raise Exception("没有可下载的音频流")
+        if video is None and not self.options['audio_only']:
+            raise Exception("没有可下载的视频流")
+        if self.options['audio_only']:
+            self.fetch(stream_urls(audio), output, 'audio', audio.get('id'), audio.get('codecs'))
+            return
+        if audio is None:
+            self.fetch(stream_urls(video), output, 'video', video.get('id'), video.get('codecs'))
+            return
+        temp_video = output + '.video.mp4'
+        temp_audio = output + '.audio.m4a'
+        self.fetch(stream_urls(video), temp_video, 'video', video.get('id'), video.get('codecs'))
+        self.fetch(stream_urls(audio), temp_audio, 'audio', audio.get('id'), audio.get('codecs'))
+        try:
+            merge_streams(temp_video, temp_audio, output, self.options['merge_mode'])
+        except Exception as e:
+            raise Exception(f"合并音视频失败：{str(e)}")
+        for path in (temp_video, temp_audio):
+            os.remove(path)
+
+    def download_highlights(self, info, output):
+        """只下载弹幕最密集的几段，每段输出一个 clip 事件，返回保存的路径"""
+        # 用到时才导入 NumPy，不找高光时不拖慢启动
+        from bilidown.clips import download_clip
+        from bilidown.highlights import DEFAULT_KEYWORDS, danmaku_timeline, find_highlights, format_clock
+
+        if 'dash' not in info:
+            raise Exception("该下载地址不是DASH流，无法只下载片段")
+        video, audio = self.options['policy'].select(info['dash'])
+        if self.options['audio_only']:
+            video = None
+        if (audio if self.options['audio_only'] else video) is None:
+            raise Exception("没有可下载的音频流" if self.options['audio_only'] else "没有可下载的视频流")
+        duration = self.page_duration()
+        times, texts = danmaku_timeline(self.session, self.cid, duration, should_cancel=lambda: self.cancel)
+        keywords = self.options['keywords']
+        highlights = find_highlights(times, texts, duration, count=self.options['highlights'],
+                                     keywords=DEFAULT_KEYWORDS if keywords is None else keywords)
+        if not highlights:
+            raise Exception("弹幕太少，找不到高光片段")
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        base, ext = os.path.splitext(output)
+        on_progress = lambda kind, downloaded, total: self.telemetry.update(self.key, kind, downloaded, total)
+        paths = []
+        for index, highlight in enumerate(highlights, 1):
+            path = f"{base}_高光{index}_{format_clock(highlight.start).replace(':', '-')}{ext}"
+            span = download_clip(self.session, video, audio, highlight.start, highlight.end, path, STREAM_HEADERS,
+                                 merge_mode=self.options['merge_mode'], should_cancel=lambda: self.cancel,
+                                 progress_callback=on_progress, throttle=self.bandwidth)
+            if span is None:
+                raise Exception("下载已取消")
+            self.events.emit('clip', bvid=self.bvid, cid=self.cid, file=path, start=round(span[0], 3),
+                             end=round(span[1], 3), score=highlight.score, comments=highlight.comments)
+            paths.append(path)
+        return paths
+
+    def page_duration(self):
+        """当前分P的时长（秒）"""
+        view = self.downloader.get_video_info(self.bvid)
+        page = next((p for p in view.get('pages', []) if p['cid'] == self.cid), {})
+        return page.get('duration') or view.get('duration', 0)
+
+    def fetch_subtitles(self, base_path):
+        """下载字幕，失败只输出 subtitle 事件，不算任务失败"""
+        languages = self.options['subtitles'] or None  # 空列表表示全部语言
+        try:
+            tracks = list_subtitles(self.session, self.bvid, self.cid)
+            results = download_subtitles(self.session, tracks, base_path, self.options['subtitle_format'],
+                                         languages=languages, should_cancel=lambda: self.cancel)
+        except Exception as e:
+            self.events.emit('subtitle', bvid=self.bvid, cid=self.cid, message=str(e))
+            return
+        for lan, path, error in results:
+            if path:
+                self.events.emit('subtitle', bvid=self.bvid, cid=self.cid, lan=lan, file=path)
+            else:
+                self.events.emit('subtitle', bvid=self.bvid, cid=self.cid, lan=lan, message=error)
+
+    def fetch_danmaku(self, path):
+        """下载弹幕并排版为 ASS，失败只输出 danmaku 事件，不算任务失败"""
+        try:
+            result = download_danmaku(self.session, self.cid, self.page_duration(), path,
+                                      title=self.name, should_cancel=lambda: self.cancel)
+        except Exception as e:
+            self.events.emit('danmaku', bvid=self.bvid, cid=self.cid, message=str(e))
+            return
+        if result is not None:
+            self.events.emit('danmaku', bvid=self.bvid, cid=self.cid, file=path, written=result[0], dropped=result[1])
+
+    def fetch(self, urls, filename, track, quality, codec=''):
+        # 流身份写进续传清单，画质或编码变了就不会误用旧的 .part 文件
+        identity = {'bvid': self.bvid, 'cid': self.cid, 'track': track, 'quality': quality, 'codec': codec or ''}
+        on_progress = lambda downloaded, total: self.telemetry.update(self.key, track, downloaded, total)
+        if self.options['engine'] == 'async':
+            completed = get_engine().download(urls, filename, progress_callback=on_progress,
+                                              should_cancel=lambda: self.cancel, identity=identity,
+                                              connections=self.options['connections'], throttle=self.bandwidth)
+        else:
+            downloader = SegmentedDownloader(self.session, STREAM_HEADERS, self.options['connections'],
+                                             throttle=self.bandwidth)
+            completed = downloader.download(urls, filename, progress_callback=on_progress,
+                                            should_cancel=lambda: self.cancel, identity=identity)
+        if not completed:
+            raise Exception("下载已取消")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="B站视频命令行下载器",
+        epilog="退出码：0 全部成功，1 有任务失败，2 参数错误或没有任务，3 需要登录，130 被中断")
+    parser.add_argument('inputs', nargs='*', help='BV号、视频链接、UP主空间或收藏夹链接，末尾加 " *2" 表示限速时分到两倍带宽')
+    parser.add_argument('-i', '--input-file', action='append', metavar='FILE',
+                        help='从文件读取输入，每行一个，"-" 表示标准输入；可重复')
+    parser.add_argument('-o', '--output', default='.', help='保存目录（默认当前目录）')
+    parser.add_argument('-q', '--quality', type=int, default=80, help='最高画质编号 qn，如 120/80/64/32（默认80）')
+    parser.add_argument('--codec', choices=sorted(CODEC_IDS), default='avc', help='首选视频编码（默认avc）')
+    parser.add_argument('--max-bitrate', type=float, metavar='MBPS', help='视频码率上限（Mbps）')
+    parser.add_argument('--max-size', type=float, metavar='MB', help='单个分P的大小上限（按码率估算）')
+    parser.add_argument('--smallest', action='store_true', help='同画质下取体积最小的流')
+    parser.add_argument('--hires-audio', action='store_true', help='优先选用Hi-Res无损或杜比全景声音频')
+    parser.add_argument('--audio-only', action='store_true', help='只下载音频')
+    parser.add_argument('--subtitles', metavar='LANGS', help='同时下载字幕：all 或语言代码列表，如 zh-CN,ai-zh')
+    parser.add_argument('--danmaku', action='store_true', help='同时下载弹幕，排版后保存为 .danmaku.ass')
+    parser.add_argument('--highlights', type=int, default=0, metavar='N',
+                        help='只下载弹幕最密集的 N 段高光片段，每段保存为单独的文件')
+    parser.add_argument('--keywords', metavar='WORDS',
+                        help='高光关键词，逗号分隔；命中的弹幕计分更高，留空字符串表示不按关键词计分')
+    parser.add_argument('--subtitle-format', choices=sorted(SUBTITLE_FORMATS), default='srt',
+                        help='字幕格式（默认srt）')
+    parser.add_argument('-p', '--pages', help='分P选择，如 all、1、1,3-5；默认链接中的 p 参数，否则全部')
+    parser.add_argument('--merge-mode', choices=('auto', 'native', 'ffmpeg'), default='auto', help='音视频合并方式')
+    parser.add_argument('--engine', choices=('async', 'threads'), default='async', help='下载引擎（默认async）')
+    parser.add_argument('-c', '--connections', type=int, default=DEFAULT_CONNECTIONS, help='每个流的连接数')
+    parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_CONCURRENCY, help='同时下载的分P数')
+    parser.add_argument('--limit-rate', metavar='RATE', help='总限速，如 500K、2M')
+    parser.add_argument('--rate-schedule', metavar='RULES', help='按时段限速，如 "09:00-18:00=2M,23:00-07:00=不限"')
+    parser.add_argument('--overwrite', action='store_true', help='覆盖已存在的文件（默认跳过）')
+    parser.add_argument('--cookies', default=COOKIES_FILE, help=f'Cookie文件（默认 {COOKIES_FILE}）')
+    parser.add_argument('--login', action='store_true', help='在终端扫码登录并保存Cookie')
+    parser.add_argument('--require-login', action='store_true', help='未登录时直接退出（退出码3）')
+    parser.add_argument('--progress', choices=('json', 'text', 'none'), default='json', help='进度输出格式（默认json）')
+    parser.add_argument('--progress-interval', type=float, default=1.0, help='进度输出间隔（秒）')
+    return parser
+
+
+def run(args, events):
+    """执行下载，返回退出码"""
+    try:
+        pages = parse_pages(args.pages)
+        rate = parse_rate(args.limit_rate) if args.limit_rate else None
+        schedule = Schedule.parse(args.rate_schedule) if args.rate_schedule else None
+        inputs = [split_weight(item) for item in read_inputs(args)]
+    except (ValueError, OSError) as e:
+        events.emit('error', message=str(e))
+        return EXIT_USAGE
+    if not inputs and not args.login:
+        events.emit('error', message="没有输入，请给出BV号、链接或 -i 列表文件")
+        return EXIT_USAGE
+    get_shaper().configure(rate, schedule)
+
+    downloader = BilibiliDownloader(args.cookies)
+    try:
+        if args.login:
+            downloader.login()
+        user = downloader.check_login()
+    except Exception as e:
+        events.emit('error', message=str(e))
+        return EXIT_LOGIN
+    events.emit('login', logged_in=downloader.is_logged_in, user=user)
+    if args.require_login and not downloader.is_logged_in:
+        return EXIT_LOGIN
+    if not inputs:
+        return EXIT_OK
+
+    options = {
+        'output': os.path.expanduser(args.output),
+        'quality': args.quality,
+        'policy': StreamPolicy.from_options({
+            'codec': args.codec,
+            'max_bandwidth': int(args.max_bitrate * 1000 * 1000) if args.max_bitrate else None,
+            'max_size_mb': args.max_size,
+            'smallest': args.smallest,
+            'hires_audio': args.hires_audio
+        }, args.quality),
+        'audio_only': args.audio_only,
+        'merge_mode': args.merge_mode,
+        'engine': args.engine,
+        'connections': max(1, args.connections),
+        'overwrite': args.overwrite,
+        # None 不下载字幕，空列表下载全部语言
+        'subtitles': None if args.subtitles is None else
+        [lan.strip() for lan in args.subtitles.split(',') if lan.strip() and lan.strip() != 'all'],
+        'subtitle_format': args.subtitle_format,
+        'danmaku': args.danmaku,
+        'highlights': max(0, args.highlights),
+        # None 使用默认关键词
+        'keywords': None if args.keywords is None else
+        [word.strip() for word in args.keywords.split(',') if word.strip()]
+    }
+    results = {'done': 0, 'skipped': 0, 'failed': 0}
+    jobs = []
+    seen = set()
+    for text, weight in inputs:
+        try:
+            expanded = downloader.expand_input(text, pages)
+        except Exception as e:
+            results['failed'] += 1
+            events.emit('error', input=text, message=str(e))
+            continue
+        events.emit('resolved', input=text, jobs=len(expanded))
+        for job in expanded:
+            if job[1] not in seen:
+                seen.add(job[1])
+                jobs.append(job + (weight,))
+    if not jobs and not results['failed']:
+        # 输入都能解析，但分P筛选后或列表中没有任何分P
+        events.emit('error', message="没有可下载的分P")
+        return EXIT_USAGE
+
+    telemetry = TelemetryHub(interval=args.progress_interval)
+    telemetry.subscribe(lambda snapshot: events.emit('progress', **snapshot.to_dict()))
+    concurrency = max(1, args.jobs)
+    mount_pool(downloader.session, concurrency * (options['connections'] + 2))
+    queue = JobQueue(concurrency)
+    running = []
+    lock = threading.Lock()
+
+    def run_job(job):
+        with lock:
+            running.append(job)
+        try:
+            outcome = job.run()
+        finally:
+            with lock:
+                running.remove(job)
+        with lock:
+            results[outcome] += 1
+        return True
+
+    telemetry.start()
+    try:
+        futures = [queue.submit(job.key, run_job, job) for job in
+                   (DownloadJob(downloader, options, telemetry, events, *item) for item in jobs)]
+        for future in futures:
+            # 带超时等待，主线程才能及时响应 Ctrl+C
+            while not future.done():
+                time.sleep(0.2)
+    except KeyboardInterrupt:
+        queue.cancel_pending()
+        with lock:
+            for job in running:
+                job.cancel = True
+        queue.shutdown()
+        telemetry.stop()
+        events.emit('summary', interrupted=True, **results)
+        return EXIT_INTERRUPTED
+    queue.shutdown()
+    telemetry.stop()
+    events.emit('summary', **results)
+    return EXIT_FAILED if results['failed'] else EXIT_OK
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    events = EventWriter(args.progress)
+    try:
+        return run(args, events)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+
 
 if __name__ == "__main__":
-    downloader = BilibiliDownloader()
-    bvid = input("请输入BV号：")
-    downloader.start_download(bvid)
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""测试用的本地 HTTP 服务器：按路径提供内存中的数据，支持 Range 请求，可以模拟中途断开"""
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RangeServer:
+    """files 为 {路径: 字节}；accept_ranges 为 False 时忽略 Range，总是返回整个文件"""
+
+    def __init__(self, files, accept_ranges=True):
+        self.files = dict(files)
+        self.accept_ranges = accept_ranges
+        self.requests = []  # 每个请求的 (路径, Range 头)
+        self.fail_after = None  # 设置后，每个响应只发送这么多字节就断开连接
+        # 路径或 (路径, Range 头) -> [状态码或None]，匹配的请求依次返回这些状态码和一段错误页，None 为正常响应
+        self.errors = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                header = self.headers.get('Range')
+                server.requests.append((path, header))
+                data = server.files.get(path)
+                queued = server.errors.get((path, header)) or server.errors.get(path)
+                status = queued.pop(0) if queued else None
+                if status is not None:
+                    body = b'<html>error</html>'
+                    self.send_response(status)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                if data is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                match = re.match(r'bytes=(\d+)-(\d*)', header or '')
+                if match and server.accept_ranges:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+                    body = data[start:end + 1]
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+                else:
+                    body = data
+                    self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if server.fail_after is not None:
+                    body = body[:server.fail_after]
+                    self.close_connection = True
+                try:
+                    self.wfile.write(body)
+                except OSError:
+                    pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.handle_error = lambda *args: None
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
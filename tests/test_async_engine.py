@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from bilidown.async_engine import AsyncDownloadEngine
+from bilidown.bandwidth import BandwidthShaper
+from bilidown.segmented import MAX_RETRIES, split_ranges
+from tests.rangeserver import RangeServer
+
+
+class AsyncDownloadEngineTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = AsyncDownloadEngine(connections=4)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.close()
+
+    def setUp(self):
+        self.data = os.urandom(5 * 1024 * 1024 + 321)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def serve(self, accept_ranges=True, **files):
+        server = RangeServer({'/' + name: data for name, data in files.items()} or {'/v': self.data},
+                             accept_ranges=accept_ranges)
+        self.addCleanup(server.close)
+        return server
+
+    def download(self, urls, **kwargs):
+        filename = os.path.join(self.directory, 'video.m4s')
+        progress = []
+        result = self.engine.download(urls, filename, progress_callback=lambda done, total: progress.append((done, total)),
+                                      **kwargs)
+        return result, filename, progress
+
+    def assertDownloaded(self, filename):
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(filename)])
+
+    def test_parallel_download_matches_source(self):
+        server = self.serve()
+        result, filename, progress = self.download(server.url + '/v')
+        self.assertTrue(result)
+        self.assertDownloaded(filename)
+        self.assertEqual(progress[-1], (len(self.data), len(self.data)))
+        self.assertGreater(len([h for _, h in server.requests if h not in ('bytes=0-0', None)]), 1)
+
+    def test_single_connection_without_ranges(self):
+        server = self.serve(accept_ranges=False)
+        result, filename, _ = self.download(server.url + '/v')
+        self.assertTrue(result)
+        self.assertDownloaded(filename)
+
+    def test_single_connection_fails_over_on_error_status(self):
+        server = self.serve(accept_ranges=False, v=self.data, backup=self.data)
+        server.errors['/v'] = [None, 403]  # 探测正常，下载时地址已过期
+        result, filename, progress = self.download([server.url + '/v', server.url + '/backup'])
+        self.assertTrue(result)
+        self.assertDownloaded(filename)
+        self.assertEqual(progress[-1], (len(self.data), len(self.data)))
+
+    def test_single_connection_error_leaves_no_file(self):
+        server = self.serve(accept_ranges=False)
+        server.errors['/v'] = [None, 404]
+        with self.assertRaises(Exception):
+            self.download(server.url + '/v')
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_failed_segment_stops_other_connections(self):
+        self.data = os.urandom(16 * 1024 * 1024)
+        server = self.serve()
+        start, end = split_ranges([(0, len(self.data) - 1)], 2)[0]
+        server.errors[('/v', f'bytes={start}-{end}')] = [500] * (MAX_RETRIES + 1)
+        # 限速让其他连接慢下来：不停下的话要约4秒才能下载完其余的段
+        share = BandwidthShaper(rate=4 * 1024 * 1024).job('test')
+        began = time.monotonic()
+        with self.assertRaises(Exception):
+            self.download(server.url + '/v', connections=2, throttle=share)
+        self.assertLess(time.monotonic() - began, 2)
+        segments = {h for _, h in server.requests if h not in ('bytes=0-0', None)}
+        self.assertLess(len(segments), len(split_ranges([(0, len(self.data) - 1)], 2)))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'video.m4s.part')))
+
+    def test_cancel_keeps_part_file(self):
+        server = self.serve()
+        result, filename, _ = self.download(server.url + '/v', should_cancel=lambda: True)
+        self.assertFalse(result)
+        self.assertFalse(os.path.exists(filename))
+        self.assertTrue(os.path.exists(filename + '.part'))
+
+
+if __name__ == '__main__':
+    unittest.main()
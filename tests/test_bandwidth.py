@@ -0,0 +1,99 @@
+import asyncio
+import datetime
+import threading
+import time
+import unittest
+
+from bilidown.bandwidth import BandwidthShaper, Schedule, parse_rate
+
+CHUNK = 32 * 1024
+
+
+class RateTest(unittest.TestCase):
+    def test_parse_rate(self):
+        self.assertEqual([parse_rate(t) for t in ('500K', '2M', '2MB/s', '1.5 MiB/s', '不限', '0')],
+                         [500 * 1024, 2 * 1024 ** 2, 2 * 1024 ** 2, int(1.5 * 1024 ** 2), None, None])
+        with self.assertRaises(ValueError):
+            parse_rate('fast')
+
+    def test_schedule_wraps_midnight(self):
+        schedule = Schedule.parse('09:00-18:00=2M，23:00-07:00=不限')
+        at = lambda hour: schedule.lookup(datetime.datetime(2024, 1, 1, hour, 30))
+        self.assertEqual([at(10), at(23), at(3), at(20)],
+                         [(True, 2 * 1024 ** 2), (True, None), (True, None), (False, None)])
+
+
+class ShaperTest(unittest.TestCase):
+    def test_reserve_queues_and_withdraw_leaves_queue(self):
+        shaper = BandwidthShaper(rate=1024 ** 2)
+        share = shaper.job('a')
+        self.assertEqual(shaper.reserve(share, CHUNK), (None, 0.0))
+        ticket, delay = shaper.reserve(share, CHUNK)
+        self.assertIsNotNone(ticket)
+        self.assertGreater(delay, 0)
+        self.assertEqual(shaper.stats()['waiting'], 1)
+        shaper.withdraw(ticket)
+        self.assertEqual(shaper.stats()['waiting'], 0)
+        with self.assertRaises(ValueError):
+            shaper.reserve(share, CHUNK, ticket)
+
+    def test_unlimited_grants_immediately(self):
+        shaper = BandwidthShaper()
+        share = shaper.job('a')
+        self.assertTrue(share.consume(10 ** 9))
+        self.assertEqual(shaper.reserve(share, 10 ** 9), (None, 0.0))
+        self.assertEqual(share.granted, 2 * 10 ** 9)
+
+    def test_weighted_share_across_sync_and_async(self):
+        """同一总速率下，线程和协程的连接按任务权重分配，与各任务开的连接数无关"""
+        shaper = BandwidthShaper(rate=4 * 1024 ** 2)
+        light = shaper.job('light', weight=1)
+        heavy = shaper.job('heavy', weight=2)
+        coroutine = shaper.job('async', weight=1)
+        stop = threading.Event()
+
+        def pump(share):
+            while share.consume(CHUNK, stop.is_set):
+                pass
+
+        async def pump_async(connections):
+            async def one():
+                while await coroutine.consume_async(CHUNK, stop.is_set):
+                    pass
+            await asyncio.gather(*(one() for _ in range(connections)))
+
+        threads = [threading.Thread(target=pump, args=(light,)) for _ in range(3)]
+        threads += [threading.Thread(target=pump, args=(heavy,))]
+        threads += [threading.Thread(target=asyncio.run, args=(pump_async(10),))]
+        for thread in threads:
+            thread.start()
+        time.sleep(1.5)
+        stop.set()
+        for thread in threads:
+            thread.join(5)
+
+        total = light.granted + heavy.granted + coroutine.granted
+        self.assertAlmostEqual(light.granted / total, 0.25, delta=0.06)
+        self.assertAlmostEqual(heavy.granted / total, 0.5, delta=0.06)
+        self.assertAlmostEqual(coroutine.granted / total, 0.25, delta=0.06)
+        self.assertEqual(shaper.stats()['waiting'], 0)
+
+    def test_cancelled_coroutine_withdraws(self):
+        shaper = BandwidthShaper(rate=64 * 1024)
+        share = shaper.job('a')
+
+        async def main():
+            share.shaper.reserve(share, CHUNK)  # 用掉令牌，之后的请求都要排队
+            task = asyncio.ensure_future(share.consume_async(CHUNK))
+            await asyncio.sleep(0.05)
+            self.assertEqual(shaper.stats()['waiting'], 1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(main())
+        self.assertEqual(shaper.stats()['waiting'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
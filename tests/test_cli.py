@@ -0,0 +1,151 @@
+import importlib.util
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+
+from tests.rangeserver import RangeServer
+
+_spec = importlib.util.spec_from_file_location(
+    'bilibili_downloader', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src', 'bilibili_downloader.py'))
+cli = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(cli)
+
+
+class _FakeApi(BaseAdapter):
+    """按路径返回预先设定的B站接口 JSON"""
+
+    def __init__(self, routes):
+        super().__init__()
+        self.routes = routes
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = 'application/json'
+        response._content = json.dumps(self.routes[url.path](query)).encode('utf-8')
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class CliTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        # 接口缓存写到临时目录，不读写用户的缓存
+        environ = mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.directory, 'LOCALAPPDATA': self.directory})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        self.audio = os.urandom(300 * 1024)
+        self.server = RangeServer({'/a.m4s': self.audio})
+        self.addCleanup(self.server.close)
+        self.playurl_code = 0
+        routes = {
+            '/x/web-interface/nav': lambda q: {'code': -101, 'data': {'isLogin': False}},
+            '/x/web-interface/view': lambda q: {'code': 0, 'data': {
+                'bvid': q['bvid'], 'title': '测试视频', 'duration': 10,
+                'pages': [{'page': 1, 'cid': int(q['bvid'][-4:]), 'part': 'P1', 'duration': 10}]}},
+            '/x/player/playurl': lambda q: {'code': self.playurl_code, 'message': '啥都木有', 'data': {'dash': {
+                'duration': 10, 'video': [],
+                'audio': [{'id': 30280, 'bandwidth': 192000, 'baseUrl': self.server.url + '/a.m4s?deadline=9999999999'}]}}},
+        }
+
+        def create_session():
+            session = requests.Session()
+            session.mount('https://api.bilibili.com/', _FakeApi(routes))
+            return session
+
+        patch = mock.patch.object(cli, 'create_session', create_session)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def run_cli(self, *argv):
+        stream = io.StringIO()
+        args = cli.build_parser().parse_args(list(argv) + ['--cookies', os.path.join(self.directory, 'cookies.json'),
+                                                           '-o', os.path.join(self.directory, 'out')])
+        code = cli.run(args, cli.EventWriter('json', stream))
+        events = [json.loads(line) for line in stream.getvalue().splitlines()]
+        return code, events
+
+    def names(self, events):
+        return [event['event'] for event in events]
+
+    def test_usage_errors(self):
+        code, events = self.run_cli()
+        self.assertEqual(code, cli.EXIT_USAGE)
+        self.assertEqual(self.names(events), ['error'])
+        code, events = self.run_cli('BV1cli000001', '--pages', '2-x')
+        self.assertEqual(code, cli.EXIT_USAGE)
+
+    def test_require_login(self):
+        code, events = self.run_cli('BV1cli000002', '--require-login')
+        self.assertEqual(code, cli.EXIT_LOGIN)
+        self.assertEqual(events[-1], dict(events[-1], event='login', logged_in=False))
+
+    def test_no_pages_after_filter_is_usage_error(self):
+        code, events = self.run_cli('BV1cli000003', '--pages', '5')
+        self.assertEqual(code, cli.EXIT_USAGE)
+        self.assertEqual(self.names(events), ['login', 'resolved', 'error'])
+        self.assertEqual(events[1]['jobs'], 0)
+
+    def test_download_then_skip_existing(self):
+        code, events = self.run_cli('BV1cli000004', '--audio-only')
+        self.assertEqual(code, cli.EXIT_OK)
+        done = next(event for event in events if event['event'] == 'done')
+        with open(done['file'], 'rb') as f:
+            self.assertEqual(f.read(), self.audio)
+        self.assertEqual(events[-1]['event'], 'summary')
+        self.assertEqual((events[-1]['done'], events[-1]['failed']), (1, 0))
+
+        code, events = self.run_cli('BV1cli000004', '--audio-only')
+        self.assertEqual(code, cli.EXIT_OK)
+        self.assertIn('skipped', self.names(events))
+        self.assertEqual(events[-1]['skipped'], 1)
+
+    def test_failed_job_exit_code(self):
+        self.playurl_code = -404
+        code, events = self.run_cli('BV1cli000005', '--audio-only')
+        self.assertEqual(code, cli.EXIT_FAILED)
+        error = next(event for event in events if event['event'] == 'error')
+        self.assertIn('啥都木有', error['message'])
+        self.assertEqual(events[-1]['failed'], 1)
+
+    def test_error_status_from_cdn_fails_job_without_output(self):
+        self.server.errors['/a.m4s'] = [403] * 20
+        for engine in ('async', 'threads'):
+            code, events = self.run_cli('BV1cli000006', '--audio-only', '--engine', engine)
+            self.assertEqual(code, cli.EXIT_FAILED)
+            self.assertFalse(os.path.exists(os.path.join(self.directory, 'out', '测试视频.m4a')))
+
+    def test_input_weight_reaches_shaper(self):
+        self.assertEqual(cli.split_weight('BV1xx411c7mD'), ('BV1xx411c7mD', 1.0))
+        self.assertEqual(cli.split_weight('https://b23.tv/BV1xx411c7mD *2.5'), ('https://b23.tv/BV1xx411c7mD', 2.5))
+        with self.assertRaises(ValueError):
+            cli.split_weight('BV1xx411c7mD *0')
+
+        shaper = cli.get_shaper()
+        with mock.patch.object(shaper, 'job', wraps=shaper.job) as job:
+            code, events = self.run_cli('BV1cli000007 *3', '--audio-only')
+        self.assertEqual(code, cli.EXIT_OK)
+        self.assertEqual(events[1]['input'], 'BV1cli000007')
+        job.assert_called_once_with(('BV1cli000007', 7), 3.0)
+        code, events = self.run_cli('BV1cli000008 *0')
+        self.assertEqual(code, cli.EXIT_USAGE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import io
+import random
+import re
+import unittest
+
+from bilidown.danmaku import (BOTTOM_MODE, DEFAULT_FONT_SIZE, TOP_MODE, Comment, DanmakuLayout, parse_segment,
+                              segment_count, write_danmaku_ass)
+
+
+def varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def field(number, wire_type, payload):
+    key = varint(number << 3 | wire_type)
+    if wire_type == 0:
+        return key + varint(payload)
+    if wire_type == 2:
+        return key + varint(len(payload)) + payload
+    return key + payload
+
+
+def elem(progress, text, mode=1, size=25, color=0xFFFFFF):
+    return field(1, 2, b''.join([
+        field(1, 1, (123456789).to_bytes(8, 'little')),  # id
+        field(2, 0, progress),
+        field(3, 0, mode),
+        field(4, 0, size),
+        field(5, 0, color),
+        field(6, 2, b'a1b2c3d4'),  # midHash
+        field(7, 2, text.encode('utf-8')),
+        field(8, 0, 1700000000),  # ctime
+        field(9, 5, b'\x00\x00\x00\x00'),
+    ]))
+
+
+class ParseSegmentTest(unittest.TestCase):
+    def test_reads_needed_fields_sorted_by_time(self):
+        data = elem(65000, '后发', mode=TOP_MODE, size=18, color=0xFF0000) + field(2, 0, 7) + elem(1500, '先发')
+        self.assertEqual(parse_segment(data), [
+            Comment(1.5, 1, 25, 0xFFFFFF, '先发'),
+            Comment(65.0, TOP_MODE, 18, 0xFF0000, '后发'),
+        ])
+
+    def test_missing_fields_use_defaults(self):
+        data = field(1, 2, field(7, 2, '只有文字'.encode('utf-8')))
+        self.assertEqual(parse_segment(data), [Comment(0.0, 1, DEFAULT_FONT_SIZE, 0xFFFFFF, '只有文字')])
+
+    def test_truncated_data_raises(self):
+        data = elem(1000, '被截断的弹幕')
+        with self.assertRaises(ValueError):
+            parse_segment(data[:-3])
+
+    def test_segment_count(self):
+        self.assertEqual([segment_count(d) for d in (0, 360, 361, 3600)], [1, 1, 2, 10])
+
+
+DIALOGUE = re.compile(r'Dialogue: 2,(\S+?),(\S+?),Danmaku,,0,0,0,,\{(.*?)\}')
+MOVE = re.compile(r'\\move\((-?\d+),(-?\d+),(-?\d+),(-?\d+)\)')
+POS = re.compile(r'\\pos\((\d+),(\d+)\)')
+FONT_SIZE = re.compile(r'\\fs(\d+)')
+
+
+def seconds(clock):
+    h, m, s = clock.split(':')
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def events(text, layout):
+    """从输出中还原每条弹幕的 (类型, 开始, 结束, 占用的行, 宽度)"""
+    result = []
+    for start, end, tags in DIALOGUE.findall(text):
+        size = FONT_SIZE.search(tags)
+        size = int(size.group(1)) if size else DEFAULT_FONT_SIZE * layout.font_scale
+        span = layout._span(size)
+        move = MOVE.search(tags)
+        if move:
+            y, width, kind = int(move.group(2)), -int(move.group(3)), 'scroll'
+        else:
+            y, width, kind = int(POS.search(tags).group(2)), 0, 'fixed'
+        row = round(y / layout.line_height)
+        result.append((kind, seconds(start), seconds(end), set(range(row, row + span)), width))
+    return result
+
+
+class LayoutTest(unittest.TestCase):
+    def test_no_overlap_in_busy_stream(self):
+        rng = random.Random(7)
+        comments = []
+        for i in range(3000):
+            mode = rng.choice((1, 1, 1, 1, TOP_MODE, BOTTOM_MODE))
+            size = rng.choice((25, 25, 25, 36))
+            comments.append(Comment(i * 0.05, mode, size, 0xFFFFFF, '弹' * rng.randint(1, 20)))
+        layout = DanmakuLayout()
+        out = io.StringIO()
+        written, dropped = write_danmaku_ass(comments, out)
+        self.assertEqual(written + dropped, len(comments))
+        self.assertGreater(dropped, 0)
+
+        placed = events(out.getvalue(), DanmakuLayout())
+        self.assertEqual(len(placed), written)
+        width = layout.width
+        duration = layout.scroll_time
+        for i, a in enumerate(placed):
+            for b in placed[i + 1:]:
+                if b[1] >= a[2] - 0.01:
+                    break  # 按开始时间排列，之后的都不会与 a 同时出现
+                if not a[3] & b[3]:
+                    continue
+                self.assertFalse(a[0] == 'fixed' or b[0] == 'fixed', (a, b))
+                # 两条滚动弹幕：b 出现时 a 的尾部已进入屏幕，a 离开前 b 的头部没有追上
+                tail = width - (width + a[4]) * (b[1] - a[1]) / duration + a[4]
+                self.assertLessEqual(tail, width + 1, (a, b))
+                head = width - (width + b[4]) * (a[2] - b[1]) / duration
+                self.assertGreaterEqual(head, -1, (a, b))
+
+    def test_fixed_comments_fill_from_edges_and_drop_when_full(self):
+        # 高度只够两行
+        layout = DanmakuLayout(height=100)
+        self.assertEqual(layout.lanes, 2)
+        top = layout.place(Comment(0, TOP_MODE, 25, 0xFFFFFF, '顶'))
+        bottom = layout.place(Comment(0, BOTTOM_MODE, 25, 0xFFFFFF, '底'))
+        self.assertIn('\\pos(960,0)', top)
+        self.assertIn('\\pos(960,46)', bottom)
+        self.assertIsNone(layout.place(Comment(1, TOP_MODE, 25, 0xFFFFFF, '满')))
+        self.assertIsNone(layout.place(Comment(1, 1, 25, 0xFFFFFF, '滚动也放不下')))
+        self.assertEqual(layout.dropped, 2)
+        # 固定弹幕消失后行可以再用
+        self.assertIsNotNone(layout.place(Comment(4, 1, 25, 0xFFFFFF, '滚动')))
+
+    def test_fixed_comment_avoids_row_with_scrolling_comment(self):
+        layout = DanmakuLayout()
+        layout.place(Comment(0, 1, 25, 0xFFFFFF, '滚动'))
+        self.assertIn('\\pos(960,46)', layout.place(Comment(1, TOP_MODE, 25, 0xFFFFFF, '顶')))
+
+    def test_styles_and_skipped_modes(self):
+        layout = DanmakuLayout()
+        line = layout.place(Comment(61.5, 1, 36, 0x102030, '{\\b1}'))
+        self.assertTrue(line.startswith('Dialogue: 2,0:01:01.50,0:01:09.50,'))
+        self.assertIn('\\fs57\\c&H302010&\\3c&HFFFFFF&}｛＼b1｝', line)
+        self.assertIsNone(layout.place(Comment(0, 7, 25, 0xFFFFFF, '高级弹幕')))
+        self.assertIsNone(layout.place(Comment(0, 1, 25, 0xFFFFFF, '   ')))
+        self.assertEqual(layout.dropped, 0)
+
+    def test_outline_only_for_dark_colors(self):
+        layout = DanmakuLayout()
+        # 按亮度判断：纯蓝和暗红是深色，青色数值小但很亮
+        for index, (color, dark) in enumerate(((0x0000FF, True), (0x400000, True),
+                                               (0x00FFFF, False), (0x333333, False))):
+            line = layout.place(Comment(index * 10, TOP_MODE, 25, color, '色'))
+            self.assertEqual('\\3c&HFFFFFF&' in line, dark, hex(color))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bilidown.ffmpeg_mux import READ_SIZE, StreamingMuxer, find_ffmpeg
+from tests.rangeserver import RangeServer
+
+
+class _Pipe:
+    """记录每次写入的大小"""
+
+    def __init__(self):
+        self.writes = []
+        self.data = bytearray()
+
+    def write(self, data):
+        self.writes.append(len(data))
+        self.data += data
+
+
+class FetchTest(unittest.TestCase):
+    def setUp(self):
+        self.data = os.urandom(3 * 1024 * 1024 + 5)
+        self.session = requests.Session()
+        self.addCleanup(self.session.close)
+        self.muxer = StreamingMuxer(os.path.join(tempfile.gettempdir(), 'unused.mp4'))
+
+    def serve(self, accept_ranges=True):
+        server = RangeServer({'/v': self.data, '/backup': self.data}, accept_ranges=accept_ranges)
+        self.addCleanup(server.close)
+        return server
+
+    def test_segment_fails_over_on_error_status(self):
+        server = self.serve()
+        server.errors['/v'] = [403]
+        urls = [server.url + '/v', server.url + '/backup']
+        self.assertEqual(self.muxer._fetch(self.session, urls, 0, {}, 100, 200), self.data[100:201])
+        self.assertEqual([path for path, _ in server.requests], ['/v', '/backup'])
+
+    def test_cancel_stops_segment_mid_transfer(self):
+        server = self.serve()
+        chunks = []
+        result = self.muxer._fetch(self.session, [server.url + '/v'], 0, {}, 0, len(self.data) - 1,
+                                   should_cancel=lambda: chunks.append(1) or len(chunks) > 2)
+        self.assertIsNone(result)
+
+    def test_without_ranges_streams_into_pipe(self):
+        server = self.serve(accept_ranges=False)
+        server.errors['/v'] = [404]
+        pipe = _Pipe()
+        progress = []
+        result = self.muxer._pipe_single(pipe, self.session, [server.url + '/v', server.url + '/backup'], {},
+                                         len(self.data), lambda done, total: progress.append(done),
+                                         None, lambda: False, None)
+        self.assertTrue(result)
+        self.assertEqual(bytes(pipe.data), self.data)
+        # 按块写入，不会先把整个流读进内存
+        self.assertGreater(len(pipe.writes), 1)
+        self.assertLessEqual(max(pipe.writes), READ_SIZE)
+        self.assertEqual(progress[-1], len(self.data))
+
+    def test_without_ranges_does_not_retry_after_writing(self):
+        server = self.serve(accept_ranges=False)
+        server.fail_after = 1024 * 1024
+        pipe = _Pipe()
+        with self.assertRaises(Exception):
+            self.muxer._pipe_single(pipe, self.session, [server.url + '/v', server.url + '/backup'], {},
+                                    len(self.data), None, None, lambda: False, None)
+        self.assertEqual([path for path, _ in server.requests], ['/v'])
+
+
+@unittest.skipUnless(hasattr(os, 'mkfifo') and find_ffmpeg(), "需要 ffmpeg 和命名管道")
+class StreamingMuxerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        sources = {'video': ['-f', 'lavfi', '-i', 'testsrc=size=160x90:rate=25', '-c:v', 'mpeg4'],
+                   'audio': ['-f', 'lavfi', '-i', 'sine=frequency=440', '-c:a', 'aac']}
+        cls.files = {}
+        for kind, args in sources.items():
+            path = os.path.join(cls.directory, kind + '.m4s')
+            subprocess.run([find_ffmpeg(), '-y', '-loglevel', 'error'] + args + [
+                '-t', '2', '-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof', path], check=True)
+            with open(path, 'rb') as f:
+                cls.files['/' + kind] = f.read()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def mux(self, accept_ranges):
+        server = RangeServer(self.files, accept_ranges=accept_ranges)
+        self.addCleanup(server.close)
+        output = os.path.join(self.directory, f'out-{accept_ranges}.mp4')
+        muxer = StreamingMuxer(output, connections=2).start()
+        session = requests.Session()
+        self.addCleanup(session.close)
+        with ThreadPoolExecutor(2) as executor:
+            results = [executor.submit(muxer.feed, kind, server.url + '/' + kind, session, {})
+                       for kind in ('video', 'audio')]
+            results = [r.result() for r in results]
+        muxer.finish()
+        return results, output
+
+    def test_ranged_and_unranged_streams(self):
+        for accept_ranges in (True, False):
+            results, output = self.mux(accept_ranges)
+            self.assertEqual(results, [True, True])
+            probe = subprocess.run([find_ffmpeg(), '-v', 'error', '-i', output, '-f', 'null', '-'],
+                                   capture_output=True)
+            self.assertEqual(probe.returncode, 0, probe.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+
+import numpy as np
+
+from bilidown.clips import select_references
+from bilidown.highlights import find_highlights, format_clock, keyword_mask, local_peaks, sliding_sum
+from bilidown.mp4_remux import SidxReference
+
+DURATION = 1200
+
+
+def timeline(bursts, seed=1):
+    """全片均匀的稀疏弹幕，加上若干 (开始秒, 结束秒, 条数, 文本) 的密集段"""
+    rng = np.random.default_rng(seed)
+    times = [rng.uniform(0, DURATION, 240)]
+    texts = ['普通弹幕'] * 240
+    for start, end, count, text in bursts:
+        times.append(rng.uniform(start, end, count))
+        texts += [text] * count
+    return np.concatenate(times), texts
+
+
+class FindHighlightsTest(unittest.TestCase):
+    def test_bursts_in_score_order_without_overlap(self):
+        times, texts = timeline([(300, 320, 300, '普通'), (800, 810, 150, '普通'), (1000, 1010, 80, '普通')])
+        highlights = find_highlights(times, texts, DURATION, count=5)
+        self.assertEqual(len(highlights), 3)
+        for highlight, (start, end) in zip(highlights, [(300, 320), (800, 810), (1000, 1010)]):
+            self.assertLessEqual(highlight.start, start)
+            self.assertGreaterEqual(highlight.end, end)
+            self.assertLessEqual(highlight.end - highlight.start, 180)
+        scores = [h.score for h in highlights]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        ranges = sorted((h.start, h.end) for h in highlights)
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertLessEqual(end, start)
+
+    def test_keywords_outweigh_plain_density(self):
+        times, texts = timeline([(300, 310, 120, '普通'), (800, 810, 90, '前方高能')])
+        first = find_highlights(times, texts, DURATION, count=1)[0]
+        self.assertLessEqual(first.start, 800)
+        self.assertGreaterEqual(first.end, 810)
+        self.assertEqual(first.keywords, 90)
+        plain = find_highlights(times, texts, DURATION, count=1, keywords=())[0]
+        self.assertLessEqual(plain.start, 300)
+        self.assertGreaterEqual(plain.end, 310)
+
+    def test_flat_timeline_has_no_highlights(self):
+        times = np.arange(0, DURATION, 2.0)
+        self.assertEqual(find_highlights(times, None, DURATION), [])
+        self.assertEqual(find_highlights([], [], DURATION), [])
+
+    def test_clamped_to_duration(self):
+        times, texts = timeline([(1190, 1199, 200, '普通')])
+        highlight = find_highlights(times, texts, DURATION, count=1)[0]
+        self.assertEqual(highlight.end, DURATION)
+
+
+class HelperTest(unittest.TestCase):
+    def test_keyword_mask(self):
+        texts = ['哈', '哈', 'AWSL好可爱', '前方高能预警', '', '无关']
+        self.assertEqual(keyword_mask(texts, ('哈哈', 'awsl', '高能')).tolist(),
+                         [False, False, True, True, False, False])
+        self.assertEqual(keyword_mask(texts, ()).tolist(), [False] * 6)
+
+    def test_sliding_sum_is_centered(self):
+        self.assertEqual(sliding_sum(np.array([0, 0, 0, 3, 0, 0, 0], dtype=float), 3).tolist(),
+                         [0, 0, 3, 3, 3, 0, 0])
+
+    def test_local_peaks_take_left_end_of_plateau(self):
+        self.assertEqual(local_peaks(np.array([1, 3, 3, 2, 5, 4], dtype=float)).tolist(), [1, 4])
+
+    def test_format_clock(self):
+        self.assertEqual([format_clock(s) for s in (0, 61.9, 3600, 3725)], ['00:00', '01:01', '1:00:00', '1:02:05'])
+
+    def test_select_references_overlapping_range(self):
+        references = [SidxReference(i * 100, 100, i * 5000, 5000) for i in range(6)]
+        selected = select_references(references, 1000, 7, 16)
+        self.assertEqual([r.start for r in selected], [5000, 10000, 15000])
+
+
+if __name__ == '__main__':
+    unittest.main()
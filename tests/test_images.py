@@ -0,0 +1,145 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import requests
+
+from bilidown.images import DiskLRU, ImageService
+from tests.rangeserver import RangeServer
+
+
+class DiskLRUTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def names(self, cache):
+        return list(cache._entries)
+
+    def test_evicts_least_recently_used(self):
+        cache = DiskLRU(self.directory, max_bytes=100)
+        cache.put('a', b'a' * 40)
+        cache.put('b', b'b' * 40)
+        self.assertIsNotNone(cache.get('a'))
+        cache.put('c', b'c' * 40)
+        # a 刚被读过，淘汰的是 b
+        self.assertEqual(self.names(cache), ['a', 'c'])
+        self.assertEqual(cache.size, 80)
+        self.assertIsNone(cache.get('b'))
+        self.assertFalse(os.path.exists(cache.path('b')))
+        # 覆盖同名条目只按新大小计算
+        cache.put('a', b'a' * 10)
+        self.assertEqual((self.names(cache), cache.size), (['c', 'a'], 50))
+        # 单个超过上限的条目保留，其余全部淘汰
+        cache.put('big', b'x' * 150)
+        self.assertEqual((self.names(cache), cache.size), (['big'], 150))
+        self.assertEqual(sorted(os.listdir(self.directory)), ['big'])
+
+    def test_restores_order_from_file_times_on_restart(self):
+        for name, moment in (('old', 1000), ('new', 1020), ('middle', 1010)):
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(b'x' * 40)
+            os.utime(os.path.join(self.directory, name), (moment, moment))
+        with open(os.path.join(self.directory, 'half.123.part'), 'wb') as f:
+            f.write(b'x')
+        cache = DiskLRU(self.directory, max_bytes=100)
+        # 超过上限时按文件时间淘汰最旧的，未写完的临时文件被删除
+        self.assertEqual(self.names(cache), ['middle', 'new'])
+        self.assertEqual(sorted(os.listdir(self.directory)), ['middle', 'new'])
+        # 命中会更新文件时间，重启后仍是最近使用
+        cache.get('middle')
+        self.assertEqual(self.names(DiskLRU(self.directory, max_bytes=100)), ['new', 'middle'])
+
+    def test_forgets_files_deleted_outside(self):
+        cache = DiskLRU(self.directory, max_bytes=100)
+        cache.put('a', b'a' * 40)
+        os.remove(cache.path('a'))
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+
+class _GatedSession(requests.Session):
+    """放行前阻塞所有请求，用来让请求在线程池中排队"""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+
+    def get(self, url, **kwargs):
+        self.gate.wait(5)
+        return super().get(url, **kwargs)
+
+
+class ImageServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.image = os.urandom(100 * 1024)
+        self.server = RangeServer({'/a.jpg': self.image, '/b.jpg': b'b' * 10})
+        self.addCleanup(self.server.close)
+        self.session = _GatedSession()
+        self.service = ImageService(self.session, self.directory, workers=1)
+        self.addCleanup(self.service.shutdown)
+
+    def test_fetch_downloads_once_and_caches(self):
+        url = self.server.url + '/a.jpg'
+        first = self.service.fetch(url)
+        results = []
+        second = self.service.fetch(url, callback=lambda path, error: results.append((path, error)))
+        self.assertIs(first, second)
+        self.session.gate.set()
+        with open(first.result(5), 'rb') as f:
+            self.assertEqual(f.read(), self.image)
+        self.assertEqual(self.service.fetch(url).result(5), first.result())
+        target = os.path.join(self.directory, 'cover.jpg')
+        self.service.save(url, target)
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), self.image)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(results, [(first.result(), None)])
+
+    def test_error_status_is_not_cached(self):
+        url = self.server.url + '/a.jpg'
+        self.server.errors['/a.jpg'] = [404]
+        self.session.gate.set()
+        errors = []
+        future = self.service.fetch(url, callback=lambda path, error: errors.append(error))
+        with self.assertRaises(Exception) as context:
+            future.result(5)
+        self.assertIn('404', str(context.exception))
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(len(self.service.cache), 0)
+        # 出错后再次请求会重新下载
+        with open(self.service.fetch(url).result(5), 'rb') as f:
+            self.assertEqual(f.read(), self.image)
+
+    def test_cancel_queued_request(self):
+        running = self.service.fetch(self.server.url + '/a.jpg')
+        queued = self.service.fetch(self.server.url + '/b.jpg', callback=lambda path, error: self.fail('不应回调'))
+        self.assertTrue(self.service.cancel(self.server.url + '/b.jpg'))
+        self.session.gate.set()
+        running.result(5)
+        self.assertTrue(queued.cancelled())
+        self.assertEqual([path for path, _ in self.server.requests], ['/a.jpg'])
+
+    @unittest.skipUnless(importlib.util.find_spec('PIL'), '需要 Pillow')
+    def test_thumbnail_is_cached(self):
+        import io
+        from PIL import Image
+
+        out = io.BytesIO()
+        Image.new('RGB', (320, 200), 'red').save(out, 'JPEG')
+        self.server.files['/c.jpg'] = out.getvalue()
+        self.session.gate.set()
+        data = self.service.thumbnail(self.server.url + '/c.jpg', (40, 40)).result(5)
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertEqual(image.size, (40, 25))
+        self.assertEqual(self.service.thumbnail(self.server.url + '/c.jpg', (40, 40)).result(5), data)
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import threading
+import unittest
+
+from bilidown.job_queue import JobQueue
+
+
+class JobQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.queue = JobQueue(2)
+        self.addCleanup(self.queue.shutdown)
+
+    def test_counts_outcomes_and_drops_finished_jobs(self):
+        def job(result):
+            if result is None:
+                raise RuntimeError('失败')
+            return result
+
+        futures = [self.queue.submit(i, job, result) for i, result in enumerate([True, False, None, 1])]
+        for future in futures:
+            future.exception()
+        self.assertEqual(self.queue.stats(), {'pending': 0, 'running': 0, 'done': 2, 'failed': 2,
+                                              'cancelled': 0, 'total': 4})
+        self.assertEqual(self.queue._states, {})
+        self.assertEqual(self.queue._futures, {})
+        # 结束后同一个 key 可以再次提交
+        self.assertTrue(self.queue.submit(0, job, True).result())
+
+    def test_limits_concurrency_and_cancels_pending(self):
+        release = threading.Event()
+        started = threading.Semaphore(0)
+
+        def job():
+            started.release()
+            release.wait(5)
+            return True
+
+        futures = [self.queue.submit(i, job) for i in range(5)]
+        started.acquire(timeout=5)
+        started.acquire(timeout=5)
+        stats = self.queue.stats()
+        self.assertEqual((stats['running'], stats['pending']), (2, 3))
+        with self.assertRaises(ValueError):
+            self.queue.submit(0, job)
+
+        self.queue.cancel_pending()
+        release.set()
+        self.assertEqual([f.result() for f in futures[:2]], [True, True])
+        self.assertTrue(all(f.cancelled() for f in futures[2:]))
+        self.assertEqual(self.queue.stats(), {'pending': 0, 'running': 0, 'done': 2, 'failed': 0,
+                                              'cancelled': 3, 'total': 5})
+        self.assertEqual(self.queue._states, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,268 @@
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from bilidown.mp4_remux import RemuxError, find_box, make_box, parse_sidx, read_boxes, rebase_clip, remux
+
+MOVIE_TIMESCALE = 1000
+
+
+def full_box(box_type, version, flags, payload):
+    return make_box(box_type, struct.pack('>I', (version << 24) | flags) + payload)
+
+
+def init_segment(timescale, default_duration=0):
+    """单轨的 ftyp + moov，mvhd、tkhd、mdhd 中的时长都为0（分片 MP4 的常见写法）"""
+    ftyp = make_box(b'ftyp', b'iso6\x00\x00\x02\x00iso6mp41')
+    mvhd = full_box(b'mvhd', 0, 0, struct.pack('>IIII', 0, 0, MOVIE_TIMESCALE, 0) + b'\x00' * 76 + struct.pack('>I', 2))
+    tkhd = full_box(b'tkhd', 0, 3, struct.pack('>IIIII', 0, 0, 1, 0, 0) + b'\x00' * 60)
+    mdhd = full_box(b'mdhd', 0, 0, struct.pack('>IIIIHH', 0, 0, timescale, 0, 0x55C4, 0))
+    trak = make_box(b'trak', tkhd + make_box(b'mdia', mdhd))
+    trex = full_box(b'trex', 0, 0, struct.pack('>IIIII', 1, 1, default_duration, 0, 0))
+    return ftyp + make_box(b'moov', mvhd + trak + make_box(b'mvex', trex))
+
+
+def fragment(sequence, decode_time, durations, payload, composition=None, tfhd_default=None):
+    """一个 moof + mdat；durations 为 None 时 trun 不带逐样本时长，用 tfhd 或 trex 的默认值"""
+    count = len(payload)
+    tfhd_flags = 0x020000 | (0x000008 if tfhd_default is not None else 0)
+    tfhd = full_box(b'tfhd', 0, tfhd_flags, struct.pack('>I', 1)
+                    + (struct.pack('>I', tfhd_default) if tfhd_default is not None else b''))
+    tfdt = full_box(b'tfdt', 1, 0, struct.pack('>Q', decode_time))
+    trun_flags = 0x000001 | 0x000200 | (0x000100 if durations is not None else 0)
+    trun_flags |= 0x000800 if composition is not None else 0
+    samples = b''
+    for i, sample in enumerate(payload):
+        if durations is not None:
+            samples += struct.pack('>I', durations[i])
+        samples += struct.pack('>I', len(sample))
+        if composition is not None:
+            samples += struct.pack('>I', composition[i])
+
+    def build(data_offset):
+        trun = full_box(b'trun', 0, trun_flags, struct.pack('>Ii', count, data_offset) + samples)
+        traf = make_box(b'traf', tfhd + tfdt + trun)
+        return make_box(b'moof', full_box(b'mfhd', 0, 0, struct.pack('>I', sequence)) + traf)
+
+    moof = build(0)
+    moof = build(len(moof) + 8)  # 数据紧跟在 mdat 头部之后
+    return moof + make_box(b'mdat', b''.join(payload))
+
+
+def sidx_box(timescale, earliest, references):
+    """references 为 [(大小, 时长)]"""
+    payload = struct.pack('>IIII', 1, timescale, earliest, 0) + struct.pack('>HH', 0, len(references))
+    payload += b''.join(struct.pack('>III', size, duration, 0x90000000) for size, duration in references)
+    return full_box(b'sidx', 0, 0, payload)
+
+
+def samples(prefix, count):
+    return [f'{prefix}{i:04d}'.encode() * 3 for i in range(count)]
+
+
+def top_boxes(data):
+    return read_boxes(io.BytesIO(data), 0, len(data))
+
+
+def box_payload(data, offset, size, header_size):
+    return data[offset + header_size:offset + size]
+
+
+def duration_field(box, v0_offset, v1_offset):
+    """box 为不含头部的负载"""
+    version = box[0]
+    return struct.unpack_from('>Q' if version == 1 else '>I', box, v1_offset if version == 1 else v0_offset)[0]
+
+
+class MoovView:
+    def __init__(self, data):
+        moov = next(box for box in top_boxes(data) if box[0] == b'moov')
+        self.data = data[moov[1]:moov[1] + moov[2]]
+        mvhd = find_box(self.data, [b'moov', b'mvhd'])
+        self.mvhd = self.data[mvhd[0]:mvhd[1]]
+        mehd = find_box(self.data, [b'moov', b'mvex', b'mehd'])
+        self.mehd = self.data[mehd[0]:mehd[1]] if mehd else None
+        self.traks = []
+        for box_type, offset, size, header_size in read_boxes(io.BytesIO(self.data), 8, len(self.data)):
+            if box_type == b'trak':
+                self.traks.append(self.data[offset:offset + size])
+
+    def movie_duration(self):
+        return duration_field(self.mvhd, 16, 24)
+
+    def fragment_duration(self):
+        return duration_field(self.mehd, 4, 4)
+
+    @staticmethod
+    def track(trak):
+        """(轨道号, tkhd 时长, [(elst 时长, media_time)])"""
+        tkhd = find_box(trak, [b'trak', b'tkhd'])
+        body = trak[tkhd[0]:tkhd[1]]
+        track_id = struct.unpack_from('>I', body, 20 if body[0] == 1 else 12)[0]
+        duration = duration_field(body, 20, 28)
+        edits = []
+        elst = find_box(trak, [b'trak', b'edts', b'elst'])
+        if elst is not None:
+            body = trak[elst[0]:elst[1]]
+            count = struct.unpack_from('>I', body, 4)[0]
+            for i in range(count):
+                if body[0] == 1:
+                    edits.append(struct.unpack_from('>Qq', body, 8 + i * 20))
+                else:
+                    edits.append(struct.unpack_from('>Ii', body, 8 + i * 12))
+        return track_id, duration, edits
+
+
+def fragments_of(data):
+    """输出文件中每个分片的 (序号, 轨道号, 解码时间, mdat 内容)"""
+    result = []
+    boxes = top_boxes(data)
+    for index, (box_type, offset, size, header_size) in enumerate(boxes):
+        if box_type != b'moof':
+            continue
+        moof = data[offset:offset + size]
+        mfhd = find_box(moof, [b'mfhd'], 8)
+        tfhd = find_box(moof, [b'traf', b'tfhd'], 8)
+        tfdt = find_box(moof, [b'traf', b'tfdt'], 8)
+        version = moof[tfdt[0]]
+        decode_time = struct.unpack_from('>Q' if version == 1 else '>I', moof, tfdt[0] + 4)[0]
+        mdat = boxes[index + 1]
+        result.append((struct.unpack_from('>I', moof, mfhd[0] + 4)[0], struct.unpack_from('>I', moof, tfhd[0] + 4)[0],
+                       decode_time, box_payload(data, *mdat[1:])))
+    return result
+
+
+class RemuxTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def video_file(self, composition=None, sidx=False):
+        # 12800 的时间刻度，每帧512（25fps），两个分片各1秒
+        frames = [samples('v0-', 25), samples('v1-', 25)]
+        moofs = [fragment(1, 0, [512] * 25, frames[0], composition),
+                 fragment(2, 12800, [512] * 25, frames[1], composition)]
+        index = sidx_box(12800, 0, [(len(m), 12800) for m in moofs]) if sidx else b''
+        return self.write('video.m4s', init_segment(12800) + index + b''.join(moofs)), frames
+
+    def audio_file(self):
+        # 44100 的时间刻度，样本时长分别来自 trun、tfhd 和 trex 的默认值，共 3 * 40 * 1024 个刻度
+        frames = [samples('a0-', 40), samples('a1-', 40), samples('a2-', 40)]
+        data = init_segment(44100, default_duration=1024)
+        data += fragment(1, 0, [1024] * 40, frames[0])
+        data += fragment(2, 40960, None, frames[1], tfhd_default=1024)
+        data += fragment(3, 81920, None, frames[2])
+        return self.write('audio.m4s', data), frames
+
+    def test_merges_tracks_with_renumbered_ids_and_sequences(self):
+        video, video_frames = self.video_file()
+        audio, audio_frames = self.audio_file()
+        output = os.path.join(self.directory, 'out.mp4')
+        remux(video, audio, output)
+        with open(output, 'rb') as f:
+            data = f.read()
+
+        moov = MoovView(data)
+        self.assertEqual([MoovView.track(trak)[0] for trak in moov.traks], [1, 2])
+        self.assertEqual(struct.unpack_from('>I', moov.mvhd, len(moov.mvhd) - 4)[0], 3)  # next_track_ID
+
+        fragments = fragments_of(data)
+        self.assertEqual([f[0] for f in fragments], list(range(1, 6)))
+        # 按解码时间（秒）交错：视频 0s、1s，音频 0s、0.93s、1.86s
+        order = [(track, time) for _, track, time, _ in fragments]
+        self.assertEqual(order, [(1, 0), (2, 0), (2, 40960), (1, 12800), (2, 81920)])
+        payloads = {1: [f[3] for f in fragments if f[1] == 1], 2: [f[3] for f in fragments if f[1] == 2]}
+        self.assertEqual(payloads[1], [b''.join(frames) for frames in video_frames])
+        self.assertEqual(payloads[2], [b''.join(frames) for frames in audio_frames])
+        self.assertEqual(top_boxes(data)[-1][0], b'mfra')
+
+    def test_durations_come_from_samples(self):
+        video, _ = self.video_file()
+        audio, _ = self.audio_file()
+        output = os.path.join(self.directory, 'out.mp4')
+        remux(video, audio, output)
+        with open(output, 'rb') as f:
+            moov = MoovView(f.read())
+
+        video_duration = 2000  # 50帧 * 512 / 12800 秒
+        audio_duration = 3 * 40 * 1024 * MOVIE_TIMESCALE // 44100
+        durations = {track_id: duration for track_id, duration, _ in map(MoovView.track, moov.traks)}
+        self.assertEqual(durations, {1: video_duration, 2: audio_duration})
+        self.assertEqual(moov.movie_duration(), max(video_duration, audio_duration))
+        self.assertEqual(moov.fragment_duration(), max(video_duration, audio_duration))
+
+    def test_composition_offset_gets_non_empty_edit(self):
+        # B帧使首帧的显示时间比 sidx 声明的晚两帧，合并后用编辑列表跳过这段
+        video, _ = self.video_file(composition=[1024] * 25, sidx=True)
+        audio, _ = self.audio_file()
+        output = os.path.join(self.directory, 'out.mp4')
+        remux(video, audio, output)
+        with open(output, 'rb') as f:
+            moov = MoovView(f.read())
+        track_id, duration, edits = MoovView.track(moov.traks[0])
+        self.assertEqual(track_id, 1)
+        self.assertEqual(edits, [(2000, 1024)])
+        self.assertEqual(duration, 2000)
+
+    def test_rejects_non_fragmented_input(self):
+        plain = self.write('plain.mp4', init_segment(12800) + make_box(b'mdat', b'data'))
+        audio, _ = self.audio_file()
+        output = os.path.join(self.directory, 'out.mp4')
+        with self.assertRaises(RemuxError):
+            remux(plain, audio, output)
+        self.assertFalse(os.path.exists(output))
+
+
+class RebaseClipTest(unittest.TestCase):
+    def test_shifts_decode_time_and_adds_edit(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = os.path.join(directory, 'clip.mp4')
+        # 源文件中第20秒开始的两个分片
+        frames = [samples('c0-', 25), samples('c1-', 25)]
+        with open(path, 'wb') as f:
+            f.write(init_segment(12800))
+            f.write(fragment(41, 256000, [512] * 25, frames[0], composition=[1024] * 25))
+            f.write(fragment(42, 268800, [512] * 25, frames[1], composition=[1024] * 25))
+
+        rebase_clip(path, 0.5, 1.2)
+        with open(path, 'rb') as f:
+            data = f.read()
+        fragments = fragments_of(data)
+        self.assertEqual([f[2] for f in fragments], [0, 12800])
+        self.assertEqual([f[3] for f in fragments], [b''.join(frames[0]), b''.join(frames[1])])
+        moov = MoovView(data)
+        self.assertEqual(moov.movie_duration(), 1200)
+        _, duration, edits = MoovView.track(moov.traks[0])
+        self.assertEqual(duration, 1200)
+        # 跳过0.5秒，再加上首帧的显示时间偏移
+        self.assertEqual(edits, [(1200, 6400 + 1024)])
+
+
+class ParseSidxTest(unittest.TestCase):
+    def test_references_are_contiguous(self):
+        box = sidx_box(1000, 500, [(100, 2000), (150, 2000), (80, 1500)])
+        timescale, references = parse_sidx(box[8:], anchor=1000)
+        self.assertEqual(timescale, 1000)
+        self.assertEqual([(r.offset, r.size, r.start, r.duration) for r in references],
+                         [(1000, 100, 500, 2000), (1100, 150, 2500, 2000), (1250, 80, 4500, 1500)])
+
+    def test_rejects_truncated_sidx(self):
+        box = sidx_box(1000, 0, [(100, 2000), (150, 2000)])
+        with self.assertRaises(RemuxError):
+            parse_sidx(box[8:-4], anchor=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import threading
+import time
+import unittest
+
+from bilidown.playurl_cache import PlayurlCache, expires_at
+
+
+def url(deadline=None):
+    query = f'?deadline={deadline}&upsig=x' if deadline is not None else '?upsig=x'
+    return 'https://upos-sz-mirror.bilivideo.com/v.m4s' + query
+
+
+def dash(video, audio=(), backup=()):
+    return {'dash': {'video': [{'baseUrl': u, 'backupUrl': list(backup)} for u in video],
+                     'audio': [{'base_url': u} for u in audio]}}
+
+
+class ExpiresAtTest(unittest.TestCase):
+    def test_earliest_deadline_minus_margin(self):
+        data = dash([url(5000), url(9000)], audio=[url(7000)])
+        self.assertEqual(expires_at(data, now=0, margin=100), 4900)
+
+    def test_backup_and_durl_addresses_count(self):
+        self.assertEqual(expires_at(dash([url(9000)], backup=[url(3000)]), now=0, margin=0), 3000)
+        data = {'durl': [{'url': url(9000), 'backup_url': [url(2000)]}]}
+        self.assertEqual(expires_at(data, now=0, margin=0), 2000)
+
+    def test_default_ttl_without_deadline(self):
+        self.assertEqual(expires_at(dash([url()]), now=100, default_ttl=60), 160)
+        self.assertEqual(expires_at({}, now=100, default_ttl=60), 160)
+
+
+class PlayurlCacheTest(unittest.TestCase):
+    def fresh(self):
+        return dash([url(int(time.time()) + 7200)])
+
+    def test_hit_returns_copy(self):
+        cache = PlayurlCache(margin=60)
+        data = self.fresh()
+        cache.put('k', data)
+        cached = cache.get('k')
+        self.assertEqual(cached, data)
+        cached['dash']['video'].clear()
+        self.assertEqual(cache.get('k'), data)
+
+    def test_skips_nearly_expired_data(self):
+        cache = PlayurlCache(margin=3600)
+        cache.put('k', dash([url(int(time.time()) + 1800)]))
+        self.assertIsNone(cache.get('k'))
+
+    def test_invalidate(self):
+        cache = PlayurlCache(margin=60)
+        cache.put('k', self.fresh())
+        cache.invalidate('k')
+        self.assertIsNone(cache.get('k'))
+
+    def test_evicts_least_recently_used(self):
+        cache = PlayurlCache(margin=60, max_entries=2)
+        for key in 'abc':
+            cache.put(key, self.fresh())
+            if key == 'b':
+                cache.get('a')
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_concurrent_requests_fetch_once(self):
+        cache = PlayurlCache(margin=60)
+        calls = []
+        release = threading.Event()
+        data = self.fresh()
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return data
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_fetch('k', fetch))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        # 等所有线程都在排队后再放行
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            with cache._lock:
+                entry = cache._fetch_locks.get('k')
+                if entry is not None and entry[1] == 8:
+                    break
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [data] * 8)
+        self.assertEqual((cache.hits, cache.misses), (7, 1))
+        self.assertEqual(cache._fetch_locks, {})
+
+    def test_failed_fetch_releases_lock(self):
+        cache = PlayurlCache(margin=60)
+
+        def fail():
+            raise RuntimeError('412')
+
+        with self.assertRaises(RuntimeError):
+            cache.get_or_fetch('k', fail)
+        self.assertEqual(cache._fetch_locks, {})
+        self.assertEqual(cache.get_or_fetch('k', self.fresh), cache.get('k'))
+        self.assertEqual(cache.misses, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
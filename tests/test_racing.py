@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+
+from bilidown.racing import HealthBoard, RacingResolver
+
+
+def info(quality):
+    return {'dash': {'video': [{'id': quality, 'baseUrl': f'https://cdn/{quality}.m4s'}], 'audio': []}}
+
+
+def source(result, delay=0.0, calls=None):
+    """延迟 delay 秒后返回 result，result 为异常时抛出"""
+    def fetch():
+        if calls is not None:
+            calls.append(time.monotonic())
+        time.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return fetch
+
+
+class RacingResolverTest(unittest.TestCase):
+    def resolver(self, **kwargs):
+        options = {'hedge_delay': 0.05, 'grace': 0.0, 'timeout': 5}
+        options.update(kwargs)
+        return RacingResolver(HealthBoard(), **options)
+
+    def test_hedges_slow_source(self):
+        started = time.monotonic()
+        name, result = self.resolver().resolve({'慢': source(info(80), 1.0), '快': source(info(64))})
+        self.assertEqual(name, '快')
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_failure_launches_next_without_waiting(self):
+        calls = []
+        resolver = self.resolver(hedge_delay=5)
+        started = time.monotonic()
+        name, _ = resolver.resolve({'坏': source(Exception('接口错误'), calls=calls), '好': source(info(64), calls=calls)})
+        self.assertEqual(name, '好')
+        self.assertLess(time.monotonic() - started, 1)
+        # 没有地址的结果也算失败
+        name, _ = resolver.resolve({'空': source({'durl': []}), '新': source(info(32))})
+        self.assertEqual(name, '新')
+        self.assertEqual(resolver.board.snapshot()['空']['failures'], 1)
+
+    def test_grace_period_and_best_mode_prefer_quality(self):
+        # 低画质的接口先返回时，宽限期内已发出的请求还可以胜出
+        sources = {'低': source(info(32), 0.05), '高': source(info(116), 0.1)}
+        self.assertEqual(self.resolver(hedge_delay=0.01, grace=1.0).resolve(sources)[0], '高')
+        self.assertEqual(self.resolver(hedge_delay=5).resolve(sources, mode='best')[0], '高')
+        self.assertEqual(self.resolver(hedge_delay=0.01).resolve(sources)[0], '低')
+
+    def test_reports_all_errors_and_timeout(self):
+        with self.assertRaises(Exception) as context:
+            self.resolver().resolve({'甲': source(Exception('404')), '乙': source(Exception('412'))})
+        self.assertIn('甲：404', str(context.exception))
+        self.assertIn('乙：412', str(context.exception))
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with self.assertRaises(Exception) as context:
+            self.resolver(timeout=0.1).resolve({'卡住': lambda: release.wait(5)})
+        self.assertEqual(str(context.exception), '解析超时')
+
+    def test_health_board_ranking(self):
+        board = HealthBoard()
+        board.record('慢', True, 2.0)
+        board.record('快', True, 0.2)
+        self.assertEqual(board.ranked(['慢', '新', '快']), ['快', '新', '慢'])
+        # 连续失败的接口冷却，排在最后
+        for _ in range(3):
+            board.record('快', False, 0.1)
+        self.assertEqual(board.ranked(['快', '慢']), ['慢', '快'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import io
+import json
+import time
+import unittest
+from unittest import mock
+
+import requests
+from requests.adapters import BaseAdapter
+
+from bilidown import rate_limit
+from bilidown.api_cache import CachingAdapter, install_api_cache
+from bilidown.rate_limit import AdaptiveRateLimiter, RateLimitedAdapter, TokenBucket, install_rate_limiter
+
+VIEW_URL = 'https://api.bilibili.com/x/web-interface/view?bvid=BV1xx411c7mD'
+
+
+class _Delegate(BaseAdapter):
+    """依次返回预设的 (状态码, JSON) 响应"""
+
+    def __init__(self, replies):
+        super().__init__()
+        self.replies = list(replies)
+        self.sent = []
+
+    def send(self, request, **kwargs):
+        self.sent.append(time.monotonic())
+        status, body = self.replies.pop(0)
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(body).encode('utf-8')
+        response.raw = io.BytesIO(response._content)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        # 暂停时间缩短到测试可以接受的长度
+        for name, value in (('BASE_PAUSE', 0.05), ('MAX_PAUSE', 0.2)):
+            patch = mock.patch.object(rate_limit, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.limiter = AdaptiveRateLimiter({'https://api.bilibili.com/': (1000, 1000)}, (1000, 1000))
+
+    def session(self, replies, max_retries=rate_limit.MAX_RETRIES):
+        delegate = _Delegate(replies)
+        session = requests.Session()
+        session.mount('https://api.bilibili.com/', RateLimitedAdapter(delegate, self.limiter, max_retries))
+        return session, delegate
+
+    def test_412_backs_off_pauses_and_retries(self):
+        session, delegate = self.session([(412, {}), (200, {'code': -352}), (200, {'code': 0})])
+        response = session.get(VIEW_URL)
+        self.assertEqual(response.json(), {'code': 0})
+        self.assertEqual(len(delegate.sent), 3)
+        # 连续两次风控：速率两次减半，第二次暂停时间翻倍
+        self.assertEqual(self.limiter.factor, 0.25)
+        self.assertEqual(self.limiter.throttled, 2)
+        self.assertGreaterEqual(delegate.sent[1] - delegate.sent[0], 0.05)
+        self.assertGreaterEqual(delegate.sent[2] - delegate.sent[1], 0.1)
+        # 成功后连续计数清零
+        self.assertEqual(self.limiter.strikes, 0)
+
+    def test_gives_up_after_max_retries(self):
+        session, delegate = self.session([(412, {})] * 3, max_retries=2)
+        self.assertEqual(session.get(VIEW_URL).status_code, 412)
+        self.assertEqual(len(delegate.sent), 3)
+        self.assertEqual((self.limiter.factor, self.limiter.throttled), (0.125, 3))
+
+    def test_stream_and_error_bodies_are_not_inspected(self):
+        session, delegate = self.session([(200, {'code': -352}), (404, {'code': -352})])
+        self.assertEqual(session.get(VIEW_URL, stream=True).status_code, 200)
+        self.assertEqual(session.get(VIEW_URL).status_code, 404)
+        self.assertEqual(self.limiter.throttled, 0)
+
+    def test_concurrent_rejections_halve_once(self):
+        sent = [self.limiter.acquire(VIEW_URL) for _ in range(3)]
+        for sent_at in sent:
+            self.limiter.penalize(sent_at)
+        self.assertEqual(self.limiter.factor, 0.5)
+        self.assertEqual((self.limiter.throttled, self.limiter.strikes), (3, 1))
+        # 降速之后发出的请求再被拒才会继续降速
+        self.limiter.penalize(self.limiter.acquire(VIEW_URL))
+        self.assertEqual(self.limiter.factor, 0.25)
+
+    def test_factor_floor_and_recovery(self):
+        for _ in range(10):
+            self.limiter.penalize()
+        self.assertEqual(self.limiter.factor, rate_limit.MIN_FACTOR)
+        self.assertLessEqual(self.limiter.stats()['paused'], 0.2)
+        self.limiter.reward()
+        # 距离上次调整不到 RECOVERY_INTERVAL，不回升
+        self.assertEqual(self.limiter.factor, rate_limit.MIN_FACTOR)
+        with mock.patch.object(rate_limit, 'RECOVERY_INTERVAL', 0):
+            self.limiter.reward()
+            self.assertAlmostEqual(self.limiter.factor, rate_limit.MIN_FACTOR + rate_limit.RECOVERY_STEP)
+            for _ in range(20):
+                self.limiter.reward()
+        self.assertEqual(self.limiter.factor, 1.0)
+
+    def test_token_bucket_allows_burst_then_paces(self):
+        bucket = TokenBucket(20, 2)
+        self.assertEqual([bucket.reserve(), bucket.reserve()], [0.0, 0.0])
+        self.assertAlmostEqual(bucket.reserve(), 0.05, delta=0.01)
+        # 速率减半后预支的等待时间按减半后的速率计算
+        self.assertAlmostEqual(bucket.reserve(0.5), 0.2, delta=0.02)
+        bucket.drain()
+        self.assertLessEqual(bucket.tokens, 0)
+
+    def test_installed_below_api_cache(self):
+        session = requests.Session()
+        install_api_cache(session, cache_dir=False)
+        limiter = AdaptiveRateLimiter()
+        install_rate_limiter(session, limiter)
+        install_rate_limiter(session, limiter)
+        # 有缓存的接口限速在缓存之下，其余接口直接挂限速适配器，重复安装不会套两层
+        adapter = session.get_adapter(VIEW_URL)
+        self.assertIsInstance(adapter, CachingAdapter)
+        self.assertIsInstance(adapter.delegate, RateLimitedAdapter)
+        self.assertNotIsInstance(adapter.delegate.delegate, RateLimitedAdapter)
+        adapter = session.get_adapter('https://api.bilibili.com/x/player/playurl?cid=1')
+        self.assertIsInstance(adapter, RateLimitedAdapter)
+        self.assertNotIsInstance(adapter.delegate, RateLimitedAdapter)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from bilidown.resume import PartManifest, manifest_path, part_path
+from bilidown.segmented import SegmentedDownloader
+from tests.rangeserver import RangeServer
+
+IDENTITY = {'bvid': 'BV1xx411c7mD', 'cid': 1, 'quality': 80}
+
+
+class ManifestRangesTest(unittest.TestCase):
+    def manifest(self, total=100, completed=None):
+        return PartManifest('unused', IDENTITY, total, completed)
+
+    def test_empty_manifest_is_all_missing(self):
+        manifest = self.manifest()
+        self.assertEqual(manifest.missing_ranges(), [(0, 99)])
+        self.assertEqual(manifest.completed_size, 0)
+
+    def test_add_range_merges_overlapping_and_adjacent(self):
+        manifest = self.manifest()
+        manifest.add_range(10, 20)
+        manifest.add_range(30, 40)
+        manifest.add_range(20, 30)  # 恰好相接，三段合成一段
+        self.assertEqual(manifest.completed, [[10, 40]])
+        manifest.add_range(5, 15)
+        manifest.add_range(35, 50)
+        self.assertEqual(manifest.completed, [[5, 50]])
+        self.assertEqual(manifest.completed_size, 45)
+
+    def test_add_range_covering_several_ranges(self):
+        manifest = self.manifest(completed=[(0, 5), (10, 15), (20, 25), (60, 70)])
+        manifest.add_range(3, 22)
+        self.assertEqual(manifest.completed, [[0, 25], [60, 70]])
+
+    def test_add_range_inside_existing_and_empty(self):
+        manifest = self.manifest(completed=[(10, 50)])
+        manifest.add_range(20, 30)
+        manifest.add_range(40, 40)
+        manifest.add_range(60, 55)
+        self.assertEqual(manifest.completed, [[10, 50]])
+
+    def test_out_of_order_adds_stay_sorted(self):
+        manifest = self.manifest()
+        for start in (80, 0, 40, 20, 60):
+            manifest.add_range(start, start + 10)
+        self.assertEqual(manifest.completed, [[0, 10], [20, 30], [40, 50], [60, 70], [80, 90]])
+        self.assertEqual(manifest.missing_ranges(), [(10, 19), (30, 39), (50, 59), (70, 79), (90, 99)])
+
+    def test_missing_ranges_are_inclusive_and_complement_completed(self):
+        manifest = self.manifest(completed=[(0, 10), (50, 100)])
+        self.assertEqual(manifest.missing_ranges(), [(10, 49)])
+        manifest.add_range(10, 50)
+        self.assertEqual(manifest.missing_ranges(), [])
+
+
+class ManifestFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'video.m4s')
+        with open(part_path(self.filename), 'wb') as f:
+            f.truncate(100)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_round_trip(self):
+        manifest = PartManifest(self.filename, IDENTITY, 100, [(0, 30), (60, 70)])
+        manifest.save()
+        loaded = PartManifest.load(self.filename, IDENTITY, 100)
+        self.assertEqual(loaded.completed, [[0, 30], [60, 70]])
+        self.assertFalse(os.path.exists(manifest_path(self.filename) + '.tmp'))
+
+    def test_rejects_other_stream_or_size(self):
+        PartManifest(self.filename, IDENTITY, 100, [(0, 30)]).save()
+        self.assertIsNone(PartManifest.load(self.filename, dict(IDENTITY, quality=64), 100))
+        self.assertIsNone(PartManifest.load(self.filename, IDENTITY, 200))
+
+    def test_rejects_part_file_of_wrong_size(self):
+        PartManifest(self.filename, IDENTITY, 100, [(0, 30)]).save()
+        with open(part_path(self.filename), 'ab') as f:
+            f.write(b'x')
+        self.assertIsNone(PartManifest.load(self.filename, IDENTITY, 100))
+
+    def test_rejects_corrupt_manifest(self):
+        with open(manifest_path(self.filename), 'w', encoding='utf-8') as f:
+            f.write('{"version": 1, "completed": [')
+        self.assertIsNone(PartManifest.load(self.filename, IDENTITY, 100))
+
+
+class ResumeDownloadTest(unittest.TestCase):
+    def test_resume_downloads_only_missing_ranges(self):
+        data = os.urandom(3 * 1024 * 1024)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        filename = os.path.join(directory, 'video.m4s')
+        server = RangeServer({'/v': data})
+        self.addCleanup(server.close)
+        session = requests.Session()
+        self.addCleanup(session.close)
+
+        # 模拟上次下载了开头1MB就中断：.part 里是正确的数据，清单记录了这一段
+        done = 1024 * 1024
+        with open(part_path(filename), 'wb') as f:
+            f.write(data[:done])
+            f.truncate(len(data))
+        PartManifest(filename, IDENTITY, len(data), [(0, done)]).save()
+
+        downloader = SegmentedDownloader(session, connections=2)
+        self.assertTrue(downloader.download(server.url + '/v', filename, identity=IDENTITY))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertFalse(os.path.exists(manifest_path(filename)))
+        for _, header in server.requests:
+            if header and header != 'bytes=0-0':
+                self.assertGreaterEqual(int(header.split('=')[1].split('-')[0]), done)
+
+    def test_different_identity_starts_over(self):
+        data = os.urandom(256 * 1024)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        filename = os.path.join(directory, 'video.m4s')
+        server = RangeServer({'/v': data})
+        self.addCleanup(server.close)
+        session = requests.Session()
+        self.addCleanup(session.close)
+
+        # 旧的 .part 属于另一个画质，内容不能沿用
+        with open(part_path(filename), 'wb') as f:
+            f.write(b'\0' * len(data))
+        PartManifest(filename, dict(IDENTITY, quality=16), len(data), [(0, len(data))]).save()
+
+        self.assertTrue(SegmentedDownloader(session).download(server.url + '/v', filename, identity=IDENTITY))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from bilidown.segmented import MIN_SEGMENT_SIZE, SEGMENTS_PER_CONNECTION, SegmentedDownloader, split_ranges
+from tests.rangeserver import RangeServer
+
+
+def covered(segments):
+    """把分段展开成字节位置的集合，同时检查没有重叠"""
+    positions = set()
+    for start, end in segments:
+        part = set(range(start, end + 1))
+        assert not positions & part, f"分段重叠：{start}-{end}"
+        positions |= part
+    return positions
+
+
+class SplitRangesTest(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(split_ranges([], 4), [])
+
+    def test_covers_every_byte_once(self):
+        ranges = [(0, 999), (1500, 1500), (2000, 4999)]
+        segments = split_ranges(ranges, 3, min_segment_size=100)
+        expected = set(range(0, 1000)) | {1500} | set(range(2000, 5000))
+        self.assertEqual(covered(segments), expected)
+        # 每段都落在某个原始区间内
+        for start, end in segments:
+            self.assertTrue(any(a <= start <= end <= b for a, b in ranges))
+
+    def test_segment_count_follows_connections(self):
+        segments = split_ranges([(0, 1_000_000 - 1)], 4, min_segment_size=1)
+        self.assertEqual(len(segments), 4 * SEGMENTS_PER_CONNECTION)
+
+    def test_min_segment_size(self):
+        segments = split_ranges([(0, 10 * 1024 - 1)], 8, min_segment_size=4 * 1024)
+        self.assertEqual(segments, [(0, 4095), (4096, 8191), (8192, 10239)])
+
+    def test_default_min_size_keeps_small_files_whole(self):
+        self.assertEqual(split_ranges([(0, 99)], 16), [(0, 99)])
+        self.assertGreaterEqual(MIN_SEGMENT_SIZE, 1024 * 1024)
+
+
+class SegmentedDownloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.data = os.urandom(5 * 1024 * 1024 + 123)
+        self.directory = tempfile.mkdtemp()
+        self.session = requests.Session()
+
+    def tearDown(self):
+        self.session.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def download(self, server, paths=('/v',), **kwargs):
+        filename = os.path.join(self.directory, 'video.m4s')
+        progress = []
+        downloader = SegmentedDownloader(self.session, connections=4)
+        urls = [server.url + path for path in paths]
+        result = downloader.download(urls if len(urls) > 1 else urls[0], filename,
+                                     progress_callback=lambda done, total: progress.append((done, total)), **kwargs)
+        return result, filename, progress
+
+    def test_parallel_download_matches_source(self):
+        server = RangeServer({'/v': self.data})
+        self.addCleanup(server.close)
+        result, filename, progress = self.download(server)
+        self.assertTrue(result)
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(progress[-1], (len(self.data), len(self.data)))
+        ranged = [header for _, header in server.requests if header and header != 'bytes=0-0']
+        self.assertGreater(len(ranged), 1)
+        self.assertFalse(os.path.exists(filename + '.part'))
+
+    def test_falls_back_to_single_connection_without_ranges(self):
+        server = RangeServer({'/v': self.data}, accept_ranges=False)
+        self.addCleanup(server.close)
+        result, filename, _ = self.download(server)
+        self.assertTrue(result)
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_single_connection_fails_over_on_error_status(self):
+        server = RangeServer({'/v': self.data, '/backup': self.data}, accept_ranges=False)
+        self.addCleanup(server.close)
+        server.errors['/v'] = [None, 403]  # 探测正常，下载时地址已过期
+        result, filename, progress = self.download(server, paths=('/v', '/backup'))
+        self.assertTrue(result)
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(progress[-1], (len(self.data), len(self.data)))
+
+    def test_single_connection_error_leaves_no_file(self):
+        server = RangeServer({'/v': self.data}, accept_ranges=False)
+        self.addCleanup(server.close)
+        server.errors['/v'] = [None, 404]
+        with self.assertRaises(Exception):
+            self.download(server)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_single_connection_truncated_body_is_not_saved(self):
+        server = RangeServer({'/v': self.data}, accept_ranges=False)
+        self.addCleanup(server.close)
+        server.fail_after = 1024 * 1024
+        with self.assertRaises(Exception):
+            self.download(server)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_cancel_before_start_keeps_part_file(self):
+        server = RangeServer({'/v': self.data})
+        self.addCleanup(server.close)
+        result, filename, _ = self.download(server, should_cancel=lambda: True)
+        self.assertFalse(result)
+        self.assertFalse(os.path.exists(filename))
+        self.assertTrue(os.path.exists(filename + '.part'))
+
+
+if __name__ == '__main__':
+    unittest.main()
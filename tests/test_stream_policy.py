@@ -0,0 +1,76 @@
+import unittest
+
+from bilidown.stream_policy import DOLBY_AUDIO_ID, HIRES_AUDIO_ID, StreamPolicy, codec_of, select_streams
+
+
+def video(qn, codecid, bandwidth):
+    return {'id': qn, 'codecid': codecid, 'bandwidth': bandwidth, 'width': 1920, 'height': 1080}
+
+
+# 一个100秒视频的典型 fnval=4048 返回：每个清晰度三种编码，码率 AVC > HEVC > AV1
+DASH = {
+    'duration': 100,
+    'video': [
+        video(80, 7, 3_000_000), video(80, 12, 1_800_000), video(80, 13, 1_500_000),
+        video(64, 7, 1_500_000), video(64, 12, 900_000), video(64, 13, 700_000),
+        video(32, 7, 700_000), video(32, 12, 400_000),
+    ],
+    'audio': [{'id': 30216, 'bandwidth': 64_000}, {'id': 30280, 'bandwidth': 192_000}],
+    'dolby': {'audio': [{'id': DOLBY_AUDIO_ID, 'bandwidth': 448_000}]},
+    'flac': {'audio': {'id': HIRES_AUDIO_ID, 'bandwidth': 1_000_000}},
+}
+
+
+class StreamPolicyTest(unittest.TestCase):
+    def select(self, **kwargs):
+        video, audio = StreamPolicy(**kwargs).select(DASH)
+        return (video['id'], video['codecid']), audio['id']
+
+    def test_default_is_best_avc_and_best_aac(self):
+        self.assertEqual(select_streams(DASH)[0]['codecid'], 7)
+        self.assertEqual(self.select(), ((80, 7), 30280))
+
+    def test_preferred_codec_with_fallback(self):
+        self.assertEqual(self.select(codec='av1'), ((80, 13), 30280))
+        # 32 没有 AV1，退回 AVC
+        self.assertEqual(self.select(codec='av1', max_quality=32), ((32, 7), 30280))
+
+    def test_max_quality_below_all_streams_takes_lowest(self):
+        self.assertEqual(self.select(max_quality=16), ((32, 7), 30280))
+
+    def test_max_bandwidth_lowers_quality(self):
+        self.assertEqual(self.select(codec='hevc', max_bandwidth=1_000_000), ((64, 12), 30280))
+
+    def test_max_size_budget_counts_audio(self):
+        # 限制 14MB：音频约2.4MB，视频只剩约11.6MB，即码率不超过约0.93Mbps
+        self.assertEqual(self.select(max_size=14_000_000), ((64, 12), 30280))
+
+    def test_unsatisfiable_limits_fall_back_to_cheapest(self):
+        self.assertEqual(self.select(max_bandwidth=1), ((32, 12), 30280))
+
+    def test_smallest_ignores_codec_preference(self):
+        self.assertEqual(self.select(codec='avc', smallest=True), ((80, 13), 30280))
+
+    def test_hires_audio_preferred_when_requested(self):
+        self.assertEqual(self.select(hires_audio=True)[1], HIRES_AUDIO_ID)
+        dash = dict(DASH, flac=None)
+        self.assertEqual(StreamPolicy(hires_audio=True).select(dash)[1]['id'], DOLBY_AUDIO_ID)
+
+    def test_missing_streams(self):
+        self.assertEqual(StreamPolicy().select({'video': [], 'audio': None}), (None, None))
+
+    def test_codec_from_codecs_string(self):
+        self.assertEqual(codec_of({'codecs': 'hvc1.1.6.L120.90'}), 12)
+        self.assertEqual(codec_of({'codecs': 'av01.0.08M.08'}), 13)
+        self.assertEqual(codec_of({'codecs': 'mp4a.40.2'}), 0)
+
+    def test_from_options(self):
+        policy = StreamPolicy.from_options({'codec': 'hevc', 'max_size_mb': 2, 'hires_audio': True}, quality=64)
+        self.assertEqual((policy.codec, policy.max_quality, policy.max_size, policy.hires_audio),
+                         ('hevc', 64, 2 * 1024 * 1024, True))
+        with self.assertRaises(ValueError):
+            StreamPolicy(codec='vp9')
+
+
+if __name__ == '__main__':
+    unittest.main()
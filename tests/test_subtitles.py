@@ -0,0 +1,108 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from bilidown.subtitles import ASS_HEADER, convert_subtitle, download_subtitles, save_subtitle, write_subtitle
+
+BODY = {'body': [
+    {'from': 0.0, 'to': 1.5, 'content': '第一句'},
+    {'from': 3661.5, 'to': 3663.004, 'content': 'a < b & c'},
+    {'from': 5, 'to': 6, 'content': '   '},
+    {'from': 'x', 'to': 7, 'content': '无效时间'},
+    'not a cue',
+    {'from': 10.006, 'to': 9, 'content': '{\\b1}第二行\n下一行'},
+]}
+
+
+class WriterTest(unittest.TestCase):
+    def test_srt(self):
+        self.assertEqual(convert_subtitle(BODY, 'srt'),
+                         "1\n00:00:00,000 --> 00:00:01,500\n第一句\n\n"
+                         "2\n01:01:01,500 --> 01:01:03,004\na < b & c\n\n"
+                         "3\n00:00:10,006 --> 00:00:10,006\n{\\b1}第二行\n下一行\n\n")
+
+    def test_vtt_escapes_markup(self):
+        text = convert_subtitle(BODY, 'vtt')
+        self.assertTrue(text.startswith("WEBVTT\n\n00:00:00.000 --> 00:00:01.500\n第一句\n\n"))
+        self.assertIn("01:01:01.500 --> 01:01:03.004\na &lt; b &amp; c\n\n", text)
+
+    def test_vtt_drops_blank_lines_inside_cue(self):
+        text = convert_subtitle([{'from': 1, 'to': 2, 'content': '上\n\n下'}], 'vtt')
+        self.assertTrue(text.endswith("00:00:01.000 --> 00:00:02.000\n上\n下\n\n"))
+
+    def test_ass_rounds_to_centiseconds_and_escapes(self):
+        text = convert_subtitle(BODY, 'ass')
+        self.assertTrue(text.startswith(ASS_HEADER))
+        events = text[len(ASS_HEADER):].splitlines()
+        self.assertEqual(events, [
+            "Dialogue: 0,0:00:00.00,0:00:01.50,Default,,0,0,0,,第一句",
+            "Dialogue: 0,1:01:01.50,1:01:03.00,Default,,0,0,0,,a < b & c",
+            "Dialogue: 0,0:00:10.01,0:00:10.01,Default,,0,0,0,,｛\\b1｝第二行\\N下一行",
+        ])
+
+    def test_accepts_wrapped_and_bare_lists(self):
+        cues = BODY['body']
+        for data in ({'data': {'body': cues}}, cues):
+            self.assertEqual(write_subtitle(data, io.StringIO(), 'srt'), 3)
+        with self.assertRaises(ValueError):
+            write_subtitle({'foo': 1}, io.StringIO())
+        with self.assertRaises(ValueError):
+            write_subtitle(BODY, io.StringIO(), 'sub')
+
+    def test_empty_subtitle_raises(self):
+        with self.assertRaises(Exception):
+            convert_subtitle({'body': []})
+
+
+class _Response:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class _Session:
+    def __init__(self, responses):
+        self.responses = responses
+
+    def get(self, url, timeout=None):
+        return self.responses[url]
+
+
+class SaveTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def test_empty_subtitle_leaves_no_file(self):
+        path = os.path.join(self.directory, 'v.zh-CN.srt')
+        with self.assertRaises(Exception):
+            save_subtitle({'body': [{'from': 0, 'to': 1, 'content': ' '}]}, path)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_download_keeps_track_order_and_reports_errors(self):
+        session = _Session({
+            'https://s/zh.json': _Response(200, BODY),
+            'https://s/en.json': _Response(404),
+        })
+        tracks = [
+            {'lan': 'zh-CN', 'subtitle_url': '//s/zh.json'},
+            {'lan': 'en-US', 'subtitle_url': 'https://s/en.json'},
+            {'lan': 'ai-zh', 'subtitle_url': ''},
+            {'lan': 'ja', 'subtitle_url': 'https://s/ja.json'},
+        ]
+        base = os.path.join(self.directory, 'v')
+        results = download_subtitles(session, tracks, base, 'vtt', languages=['zh-CN', 'en-US', 'ai-zh'])
+        self.assertEqual([r[0] for r in results], ['zh-CN', 'en-US', 'ai-zh'])
+        self.assertEqual(results[0][1:], (base + '.zh-CN.vtt', None))
+        self.assertIn('404', results[1][2])
+        self.assertIn('登录', results[2][2])
+        self.assertEqual(sorted(os.listdir(self.directory)), ['v.zh-CN.vtt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
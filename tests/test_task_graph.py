@@ -0,0 +1,94 @@
+import threading
+import time
+import unittest
+
+from bilidown.task_graph import TaskGraph
+
+
+class TaskGraphTest(unittest.TestCase):
+    def test_passes_dependency_results_in_order(self):
+        graph = TaskGraph()
+        graph.add('playurl', lambda: {'url': 'u'})
+        graph.add('video', lambda info: info['url'] + '.video', deps=['playurl'])
+        graph.add('audio', lambda info: info['url'] + '.audio', deps=['playurl'])
+        graph.add('merge', lambda video, audio: (video, audio), deps=['video', 'audio'])
+        results = graph.run()
+        self.assertEqual(results['merge'], ('u.video', 'u.audio'))
+
+    def test_dependencies_finish_before_dependents_start(self):
+        events = []
+        lock = threading.Lock()
+
+        def step(name, delay=0.0):
+            def run(*_):
+                with lock:
+                    events.append(('start', name))
+                time.sleep(delay)
+                with lock:
+                    events.append(('end', name))
+            return run
+
+        graph = TaskGraph(max_workers=4)
+        graph.add('a', step('a', 0.05))
+        graph.add('b', step('b', 0.01))
+        graph.add('c', step('c'), deps=['a', 'b'])
+        graph.run()
+        start_c = events.index(('start', 'c'))
+        self.assertLess(events.index(('end', 'a')), start_c)
+        self.assertLess(events.index(('end', 'b')), start_c)
+        # 没有依赖关系的 a、b 同时运行
+        self.assertLess(events.index(('start', 'b')), events.index(('end', 'a')))
+
+    def test_rejects_duplicates_and_unknown_dependencies(self):
+        graph = TaskGraph()
+        graph.add('a', lambda: None)
+        with self.assertRaises(Exception):
+            graph.add('a', lambda: None)
+        with self.assertRaises(Exception):
+            graph.add('b', lambda x: None, deps=['missing'])
+        self.assertIn('a', graph)
+        self.assertNotIn('b', graph)
+
+    def test_failure_stops_running_siblings_and_skips_dependents(self):
+        graph = TaskGraph(max_workers=2)
+        stopped = threading.Event()
+
+        def video():
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                if graph.failed:
+                    stopped.set()
+                    return None
+                time.sleep(0.01)
+
+        def audio():
+            time.sleep(0.05)
+            raise ValueError("音频流失败")
+
+        merged = []
+        graph.add('video', video)
+        graph.add('audio', audio)
+        graph.add('merge', lambda v, a: merged.append(True), deps=['video', 'audio'])
+        started = time.monotonic()
+        with self.assertRaises(ValueError):
+            graph.run()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertTrue(stopped.is_set())
+        self.assertEqual(merged, [])
+
+    def test_cancel_returns_finished_results(self):
+        graph = TaskGraph()
+        cancelled = threading.Event()
+
+        def first():
+            cancelled.set()
+            return 1
+
+        graph.add('first', first)
+        graph.add('second', lambda value: value + 1, deps=['first'])
+        results = graph.run(should_cancel=cancelled.is_set)
+        self.assertEqual(results, {'first': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import threading
+import unittest
+from unittest import mock
+
+from bilidown.telemetry import TelemetryHub, format_eta
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return 1700000000.0 + self.now
+
+
+class TelemetryHubTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        patch = mock.patch('bilidown.telemetry.time', self.clock)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.hub = TelemetryHub(half_life=1.0)
+
+    def tick(self, seconds=1.0):
+        self.clock.now += seconds
+        return self.hub.snapshot()
+
+    def test_speed_ignores_resumed_bytes_and_is_smoothed(self):
+        # 续传前已有的500字节不计入速度
+        self.hub.update('a', 'video', 500, 1000)
+        self.hub.snapshot()
+        self.hub.update('a', 'video', 700, 1000)
+        snapshot = self.tick()
+        self.assertEqual((snapshot.downloaded, snapshot.total, snapshot.speed), (700, 1000, 200))
+        self.assertEqual(snapshot.eta, 1.5)
+        self.assertEqual(snapshot.percent, 70)
+        # 半衰期1秒：停了1秒后速度减半
+        self.assertEqual(self.tick().speed, 100)
+        self.hub.update('a', 'video', 1000, 1000)
+        self.assertEqual(self.tick().speed, 200)
+
+    def test_finished_and_retired_jobs(self):
+        self.hub.register('a', '甲')
+        self.hub.register('b', '乙')
+        self.hub.snapshot()
+        self.hub.update('a', 'video', 0, 400)
+        self.hub.update('a', 'video', 400, 400)
+        self.hub.update('b', 'audio', 0, 300)
+        self.hub.update('b', 'audio', 100, 300)
+        self.tick()
+        self.hub.finish('a')
+        snapshot = self.tick()
+        self.assertEqual([(job.name, job.state, job.eta) for job in snapshot.jobs],
+                         [('甲', 'done', None), ('乙', 'running', 4.0)])
+        # 已结束任务的速度不计入合计
+        self.assertEqual(snapshot.speed, 50)
+        self.hub.retire('a')
+        snapshot = self.hub.snapshot()
+        self.assertEqual([job.key for job in snapshot.jobs], ['b'])
+        self.assertEqual((snapshot.downloaded, snapshot.total), (500, 700))
+        self.assertEqual(snapshot.to_dict()['jobs'][0]['key'], 'b')
+
+    def test_publishes_until_stopped_with_final_snapshot(self):
+        hub = TelemetryHub(interval=0.01)
+        published = threading.Semaphore(0)
+        snapshots = []
+
+        def on_snapshot(snapshot):
+            snapshots.append(snapshot)
+            published.release()
+
+        hub.subscribe(on_snapshot)
+        hub.start()
+        self.assertTrue(published.acquire(timeout=5))
+        hub.update('a', 'video', 10, 10)
+        hub.finish('a')
+        hub.stop()
+        hub.stop()
+        count = len(snapshots)
+        self.assertEqual(snapshots[-1].jobs[0].state, 'done')
+        hub.unsubscribe(on_snapshot)
+        hub.publish()
+        self.assertEqual(len(snapshots), count)
+
+    def test_format_eta(self):
+        self.assertEqual(format_eta(None), '--:--')
+        self.assertEqual(format_eta(125.9), '02:05')
+        self.assertEqual(format_eta(3723), '1:02:03')
+
+
+if __name__ == '__main__':
+    unittest.main()
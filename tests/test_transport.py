@@ -0,0 +1,114 @@
+import os
+import socket
+import unittest
+
+import requests
+
+from bilidown.transport import DnsCache, Http2Adapter, Transport, _Http2Body
+from tests.rangeserver import RangeServer
+
+
+class _Headers:
+    def multi_items(self):
+        return [('Content-Type', 'video/mp4'), ('Set-Cookie', 'a=1'), ('Set-Cookie', 'b=2')]
+
+
+class _Response:
+    """只提供 _Http2Body 用到的部分 httpx.Response 接口"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.headers = _Headers()
+        self.closed = False
+
+    def iter_bytes(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+class Http2BodyTest(unittest.TestCase):
+    def test_read_sizes_across_chunks(self):
+        data = os.urandom(100_000)
+        response = _Response([data[i:i + 1000] for i in range(0, len(data), 1000)])
+        body = _Http2Body(response)
+        parts = [body.read(30_000), body.read(30_000), body.read(1), body.read()]
+        self.assertEqual([len(p) for p in parts], [30_000, 30_000, 1, 39_999])
+        self.assertEqual(b''.join(parts), data)
+        self.assertIsInstance(parts[0], bytes)
+        self.assertFalse(response.closed)
+        self.assertEqual(body.read(10), b'')
+        self.assertTrue(response.closed)
+
+    def test_exposes_all_set_cookie_headers(self):
+        body = _Http2Body(_Response([]))
+        self.assertEqual(body._original_response.msg.get_all('Set-Cookie'), ['a=1', 'b=2'])
+
+    def test_adapter_streams_through_requests(self):
+        data = os.urandom(3 * 1024 * 1024)
+        server = RangeServer({'/v': data})
+        self.addCleanup(server.close)
+        adapter = Http2Adapter(requests.adapters.HTTPAdapter())
+        self.addCleanup(adapter.close)
+        session = requests.Session()
+        session.mount(server.url, adapter)
+        response = session.get(server.url + '/v', stream=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.iter_content(256 * 1024)), data)
+        self.assertEqual(session.get(server.url + '/v', headers={'Range': 'bytes=10-19'}).content, data[10:20])
+
+
+class DnsCacheTest(unittest.TestCase):
+    def resolver(self, calls):
+        def resolve(host, port, *args):
+            calls.append(host)
+            return socket.getaddrinfo('127.0.0.1', port, socket.AF_INET, socket.SOCK_STREAM)
+        return resolve
+
+    def test_caches_until_ttl(self):
+        calls = []
+        cache = DnsCache(ttl=60, resolver=self.resolver(calls))
+        first = cache.getaddrinfo('example.test', 443)
+        self.assertEqual(cache.getaddrinfo('example.test', 443), first)
+        self.assertEqual(calls, ['example.test'])
+        cache.getaddrinfo('example.test', 80)
+        self.assertEqual(len(calls), 2)
+        expired = DnsCache(ttl=0, resolver=self.resolver(calls))
+        expired.getaddrinfo('example.test', 443)
+        expired.getaddrinfo('example.test', 443)
+        self.assertEqual(len(calls), 4)
+
+    def test_transport_resolves_through_its_own_cache(self):
+        data = b'x' * 1000
+        server = RangeServer({'/v': data})
+        self.addCleanup(server.close)
+        port = server.url.rsplit(':', 1)[1]
+        calls = []
+        transport = Transport(http2=False)
+        transport.dns_cache.resolver = self.resolver(calls)
+        session = transport.mount(requests.Session())
+        self.addCleanup(session.close)
+        original = socket.getaddrinfo
+
+        self.assertEqual(session.get(f'http://bilidown.test:{port}/v').content, data)
+        adapter = transport.default
+        transport.resize(64)
+        # 连接池关闭后重新建立连接，解析结果来自缓存
+        self.assertIs(session.adapters['http://'], adapter)
+        self.assertEqual(adapter.poolmanager.connection_pool_kw['maxsize'], 64)
+        self.assertEqual(session.get(f'http://bilidown.test:{port}/v').content, data)
+        self.assertEqual(calls, ['bilidown.test'])
+        self.assertIs(socket.getaddrinfo, original)
+        # 没有挂载 Transport 的会话不经过缓存
+        with self.assertRaises(requests.ConnectionError):
+            requests.get(f'http://bilidown.test:{port}/v', timeout=5)
+
+    def test_resize_only_grows(self):
+        transport = Transport(pool_size=32, http2=False)
+        transport.resize(8)
+        self.assertEqual(transport.default._pool_maxsize, 32)
+
+
+if __name__ == '__main__':
+    unittest.main()
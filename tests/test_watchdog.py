@@ -0,0 +1,103 @@
+import importlib.util
+import threading
+import time
+import unittest
+
+from bilidown.watchdog import StallWatchdog
+
+HAS_QT = importlib.util.find_spec('PyQt6') is not None
+
+
+def blocking_call(seconds):
+    time.sleep(seconds)
+
+
+class StallWatchdogTest(unittest.TestCase):
+    def setUp(self):
+        self.reports = []
+        self.watchdog = StallWatchdog(threshold=0.05, interval=0.01,
+                                      report=lambda stalled, stack: self.reports.append((stalled, stack)))
+        self.watchdog.start()
+        self.addCleanup(self.watchdog.stop)
+
+    def beat_for(self, seconds):
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            time.sleep(0.01)
+            self.watchdog.beat()
+
+    def test_regular_beats_are_not_stalls(self):
+        self.beat_for(0.2)
+        self.assertEqual((self.reports, self.watchdog.stalls), ([], 0))
+
+    def test_reports_stall_with_blocking_stack(self):
+        self.beat_for(0.05)
+        blocking_call(0.3)
+        self.watchdog.beat()
+        self.assertEqual(self.watchdog.stalls, 1)
+        stalled, stack = self.reports[0]
+        self.assertGreater(stalled, 0.2)
+        self.assertEqual(self.watchdog.longest, stalled)
+        # 调用栈是卡顿进行中抓取的，指向阻塞的函数
+        self.assertIn('blocking_call', stack)
+        # 下一次卡顿重新抓取，不会沿用上一次的调用栈
+        self.beat_for(0.05)
+        time.sleep(0.2)
+        self.watchdog.beat()
+        self.assertEqual(self.watchdog.stalls, 2)
+        self.assertNotIn('blocking_call', self.reports[1][1])
+
+
+@unittest.skipUnless(HAS_QT, '需要 PyQt6')
+class RequestExecutorTest(unittest.TestCase):
+    def setUp(self):
+        from PyQt6.QtCore import QCoreApplication
+
+        import bilibili_downloader_qt
+
+        self.app = QCoreApplication.instance() or QCoreApplication([])
+        self.executor = bilibili_downloader_qt.RequestExecutor(max_threads=1)
+
+    def process_until(self, condition, timeout=5):
+        end = time.monotonic() + timeout
+        while not condition() and time.monotonic() < end:
+            self.app.processEvents()
+            time.sleep(0.01)
+
+    def test_newer_request_supersedes_older(self):
+        release = threading.Event()
+        ran = []
+        results = []
+
+        def slow():
+            release.wait(5)
+            ran.append('slow')
+            return 'slow'
+
+        def queued():
+            ran.append('queued')
+            return 'queued'
+
+        self.executor.submit('info', slow, results.append)
+        self.executor.submit('other', queued, results.append)
+        self.executor.submit('other', lambda: 'latest', results.append)
+        release.set()
+        self.process_until(lambda: len(results) == 2)
+        # 'other' 通道排队中的旧请求没有执行，只有最新的结果回到回调
+        self.assertEqual(sorted(results), ['latest', 'slow'])
+        self.assertNotIn('queued', ran)
+
+    def test_cancel_and_errors(self):
+        results = []
+        errors = []
+        self.executor.submit('info', lambda: 'dropped', results.append)
+        self.executor.cancel('info')
+        self.executor.submit('fail', lambda: 1 / 0, results.append, errors.append)
+        self.process_until(lambda: errors)
+        self.process_until(lambda: False, timeout=0.1)
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from bilidown.wbi import WbiSigner, mixin_key, sign
+
+# bilibili-API-collect 文档中的 WBI 签名示例
+IMG_KEY = '7cd084941338484aae1ad9425b84077c'
+SUB_KEY = '4932caff0ff746eab6f01bf08b70ac45'
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class _Session:
+    def __init__(self, data):
+        self.data = data
+        self.calls = 0
+
+    def get(self, url, timeout=None):
+        self.calls += 1
+        return _Response({'code': -101, 'data': self.data})
+
+
+class SignTest(unittest.TestCase):
+    def test_published_vector(self):
+        self.assertEqual(mixin_key(IMG_KEY, SUB_KEY), 'ea1db124af3c7062474693fa704f4ff8')
+        signed = sign({'foo': '114', 'bar': '514', 'zab': 1919810}, IMG_KEY, SUB_KEY, timestamp=1702204169)
+        self.assertEqual(signed['wts'], '1702204169')
+        self.assertEqual(signed['w_rid'], '8f6f2b5b3d485fe1886cec6a0be8c5d4')
+
+    def test_strips_reserved_characters_and_keeps_input(self):
+        params = {'keyword': "a(b)c!d'e*"}
+        signed = sign(params, IMG_KEY, SUB_KEY, timestamp=1702204169)
+        self.assertEqual(signed['keyword'], 'abcde')
+        self.assertEqual(params, {'keyword': "a(b)c!d'e*"})
+        self.assertEqual(signed['w_rid'], sign({'keyword': 'abcde'}, IMG_KEY, SUB_KEY, timestamp=1702204169)['w_rid'])
+
+
+class WbiSignerTest(unittest.TestCase):
+    def test_keys_from_nav_are_cached(self):
+        session = _Session({'wbi_img': {'img_url': f'https://i0.hdslb.com/bfs/wbi/{IMG_KEY}.png',
+                                        'sub_url': f'https://i0.hdslb.com/bfs/wbi/{SUB_KEY}.png'}})
+        signer = WbiSigner(session)
+        self.assertEqual(signer.keys(), (IMG_KEY, SUB_KEY))
+        self.assertIn('w_rid', signer.sign({'mid': 1}))
+        self.assertEqual(session.calls, 1)
+
+    def test_missing_keys_raise(self):
+        with self.assertRaises(Exception):
+            WbiSigner(_Session({})).keys()
+
+
+if __name__ == '__main__':
+    unittest.main()